@@ -0,0 +1,414 @@
+"""
+Snapshot colunar em memória das coletas (NumPy) para agregações ad hoc.
+
+Com ANALYTICS_ENGINE=numpy cada worker mantém as colunas usadas pelas
+agregações em arrays NumPy: dimensões (inclusive o posto) codificadas por dicionário (códigos
+inteiros de 1, 2 ou 4 bytes), preço e volume em float64 e a data da coleta em microssegundos
+desde a época (int64). O snapshot é carregado no startup e, antes de cada
+consulta, lê apenas as coletas novas (id maior que o último carregado); os
+agrupamentos viram np.bincount / ufunc.at sobre os códigos.
+
+O snapshot atende só as agregações de /kpis/aggregate que precisariam varrer
+as coletas (inclusive por posto). Os KPIs fixos e a série temporal continuam
+nos agregados e rollups mantidos na ingestão: respondem lendo poucas linhas
+por grupo, sem varrer a tabela, e já somam as coletas do arquivo frio, que o
+snapshot não tem.
+
+Fora da retenção (app.partitions) as coletas são append-only. Se os
+agregados (fuel_type_summary) contarem mais coletas do que o snapshot tem,
+alguma transação com id menor confirmou depois de um tail anterior; se
+contarem menos, meses foram removidos pela retenção. Nos dois casos o
+snapshot é recarregado por inteiro.
+"""
+import logging
+import os
+import threading
+from datetime import date, datetime, time
+from typing import Optional, Sequence
+
+import numpy as np
+from sqlmodel import Session, select, func
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.models import ArchivedFile, FuelCollection, FuelTypeSummary
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_ENGINE = os.getenv("ANALYTICS_ENGINE", "sql")  # "sql" ou "numpy"
+ANALYTICS_LOAD_BATCH_SIZE = int(os.getenv("ANALYTICS_LOAD_BATCH_SIZE", "100000"))
+
+# Dimensões codificadas por dicionário
+SNAPSHOT_DIMENSIONS = ["fuel_type", "vehicle_type", "state", "city", "store_id"]
+
+# Produto das cardinalidades até o qual o agrupamento usa bincount direto na
+# chave combinada; acima disso a chave é compactada com np.unique
+DENSE_GROUPS_LIMIT = 1 << 20
+
+_MICROSECONDS_PER_DAY = 86_400_000_000
+
+
+def _code_dtype(cardinality: int) -> np.dtype:
+    """Menor tipo inteiro que comporta os códigos do dicionário."""
+    if cardinality <= 1 << 8:
+        return np.dtype(np.uint8)
+    if cardinality <= 1 << 16:
+        return np.dtype(np.uint16)
+    return np.dtype(np.uint32)
+
+
+def _timestamp(value: date | datetime) -> int:
+    """Microssegundos desde a época (datas viram meia-noite)."""
+    if not isinstance(value, datetime):
+        value = datetime.combine(value, time.min)
+    return int(np.datetime64(value, "us").astype(np.int64))
+
+
+def _bucket_days(days: np.ndarray, granularity: str) -> np.ndarray:
+    """Início do período (dias desde a época) de cada dia."""
+    if granularity == "week":
+        # 1970-01-01 foi uma quinta-feira; semanas começam na segunda
+        return days - (days + 3) % 7
+    if granularity == "month":
+        return days.astype("datetime64[D]").astype("datetime64[M]").astype("datetime64[D]").astype(np.int64)
+    return days
+
+
+class _Dictionary:
+    """Codificação por dicionário de uma coluna de texto (valor <-> código)."""
+
+    def __init__(self):
+        self.values: list[str] = []
+        self.codes: dict[str, int] = {}
+
+    def encode(self, values: Sequence[str]) -> np.ndarray:
+        codes = self.codes
+
+        def code(value: str) -> int:
+            found = codes.get(value)
+            if found is None:
+                found = codes[value] = len(self.values)
+                self.values.append(value)
+            return found
+
+        return np.fromiter(map(code, values), dtype=np.int64, count=len(values))
+
+
+class _Columns:
+    """Arrays do snapshot; a capacidade dobra quando enche."""
+
+    def __init__(self, capacity: int = 1024):
+        self.size = 0
+        self.last_id = 0
+        self.dictionaries = {dimension: _Dictionary() for dimension in SNAPSHOT_DIMENSIONS}
+        self.arrays = {dimension: np.empty(capacity, dtype=np.uint8) for dimension in SNAPSHOT_DIMENSIONS}
+        self.arrays["collection_date"] = np.empty(capacity, dtype=np.int64)
+        self.arrays["sale_price"] = np.empty(capacity, dtype=np.float64)
+        self.arrays["volume_sold"] = np.empty(capacity, dtype=np.float64)
+
+    @property
+    def capacity(self) -> int:
+        return len(self.arrays["sale_price"])
+
+    def append(self, rows: Sequence[tuple]) -> int:
+        """
+        Acrescenta as linhas com id maior que o último carregado.
+
+        Só escreve além de size ou em arrays novos, então fatias [:size]
+        obtidas antes continuam válidas para quem está consultando.
+
+        Args:
+            rows: Tuplas (id, collection_date, dimensões..., sale_price,
+                volume_sold) em ordem crescente de id
+
+        Returns:
+            Quantidade de linhas acrescentadas
+        """
+        rows = [row for row in rows if row[0] > self.last_id]
+        if not rows:
+            return 0
+        columns = list(zip(*rows))
+        end = self.size + len(rows)
+        if end > self.capacity:
+            capacity = max(end, 2 * self.capacity)
+            for name, array in self.arrays.items():
+                grown = np.empty(capacity, dtype=array.dtype)
+                grown[:self.size] = array[:self.size]
+                self.arrays[name] = grown
+
+        values = {
+            "collection_date": np.array(columns[1], dtype="datetime64[us]").astype(np.int64),
+            "sale_price": np.array(columns[-2], dtype=np.float64),
+            "volume_sold": np.array(columns[-1], dtype=np.float64),
+        }
+        for position, dimension in enumerate(SNAPSHOT_DIMENSIONS, start=2):
+            dictionary = self.dictionaries[dimension]
+            values[dimension] = dictionary.encode(columns[position])
+            dtype = _code_dtype(len(dictionary.values))
+            if dtype.itemsize > self.arrays[dimension].dtype.itemsize:
+                self.arrays[dimension] = self.arrays[dimension].astype(dtype)
+
+        for name, array in values.items():
+            self.arrays[name][self.size:end] = array
+        self.size = end
+        self.last_id = rows[-1][0]
+        return len(rows)
+
+
+def _tail_statement(after_id: int):
+    """Próximo bloco de coletas com id maior que after_id"""
+    return select(
+        FuelCollection.id,
+        FuelCollection.collection_date,
+        *[getattr(FuelCollection, dimension) for dimension in SNAPSHOT_DIMENSIONS],
+        FuelCollection.sale_price,
+        FuelCollection.volume_sold,
+    ).where(FuelCollection.id > after_id).order_by(FuelCollection.id).limit(ANALYTICS_LOAD_BATCH_SIZE)
+
+
+def _expected_rows_statement():
+    """
+    Quantidade de coletas na tabela segundo os agregados (sem varrer a
+    tabela): os agregados também contam o arquivo frio, descontado pelo
+    manifesto
+    """
+    archived = select(func.coalesce(func.sum(ArchivedFile.row_count), 0)).scalar_subquery()
+    return select(func.coalesce(func.sum(FuelTypeSummary.total_records), 0) - archived)
+
+
+class ColumnarSnapshot:
+    """
+    Cópia colunar das coletas em memória, atualizada por tail do id.
+
+    Thread-safe: as consultas trabalham sobre uma visão [:size] dos arrays e
+    cópias dos dicionários, obtidas sob o lock; o tail só acrescenta depois
+    dela.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._columns = _Columns()
+        self._reloaded_at_count: Optional[int] = None
+
+    def _view(
+        self,
+        dimensions: Sequence[str] = (),
+        filters: Optional[dict[str, str]] = None
+    ) -> tuple[dict[str, np.ndarray], dict[str, tuple], dict[str, Optional[int]]]:
+        """
+        Visão consistente do snapshot, obtida sob o lock.
+
+        Returns:
+            Tupla (arrays [:size], valores dos dicionários das dimensões
+            pedidas, código de cada valor filtrado ou None se não existe)
+        """
+        with self._lock:
+            columns = self._columns
+            arrays = {name: array[:columns.size] for name, array in columns.arrays.items()}
+            labels = {dimension: tuple(columns.dictionaries[dimension].values) for dimension in dimensions}
+            codes = {dimension: columns.dictionaries[dimension].codes.get(value) for dimension, value in (filters or {}).items()}
+            return arrays, labels, codes
+
+    def _append(self, columns: _Columns, rows: Sequence[tuple]) -> int:
+        with self._lock:
+            return columns.append(rows)
+
+    def _needs_reload(self, expected: int) -> bool:
+        if self._columns.size >= expected or self._reloaded_at_count == expected:
+            return False
+        logger.warning(
+            "Snapshot analítico com %d coletas, agregados com %d: recarregando",
+            self._columns.size, expected
+        )
+        self._reloaded_at_count = expected
+        return True
+
+    def _shrunk(self, recount: int) -> bool:
+        # Recontagem depois do tail: cobre as coletas confirmadas durante a
+        # leitura, então sobrar linhas significa coletas removidas (retenção)
+        if self._columns.size <= recount:
+            return False
+        logger.warning(
+            "Snapshot analítico com %d coletas, agregados com %d após remoção: recarregando",
+            self._columns.size, recount
+        )
+        return True
+
+    def _replace(self, columns: _Columns):
+        with self._lock:
+            self._columns = columns
+
+    def refresh(self, session: Session) -> "ColumnarSnapshot":
+        """
+        Acrescenta as coletas novas (id maior que o último carregado).
+
+        Args:
+            session: Sessão do banco de dados
+
+        Returns:
+            O próprio snapshot, para encadear a consulta
+        """
+        expected = session.exec(_expected_rows_statement()).one()
+        columns = self._columns
+        while True:
+            rows = session.exec(_tail_statement(columns.last_id)).all()
+            self._append(columns, rows)
+            if len(rows) < ANALYTICS_LOAD_BATCH_SIZE:
+                break
+
+        shrunk = columns.size > expected and self._shrunk(session.exec(_expected_rows_statement()).one())
+        if shrunk or self._needs_reload(expected):
+            columns = _Columns()
+            while True:
+                rows = session.exec(_tail_statement(columns.last_id)).all()
+                columns.append(rows)
+                if len(rows) < ANALYTICS_LOAD_BATCH_SIZE:
+                    break
+            self._replace(columns)
+        return self
+
+    async def refresh_async(self, session: AsyncSession) -> "ColumnarSnapshot":
+        """Versão assíncrona de refresh."""
+        expected = (await session.exec(_expected_rows_statement())).one()
+        columns = self._columns
+        while True:
+            rows = (await session.exec(_tail_statement(columns.last_id))).all()
+            self._append(columns, rows)
+            if len(rows) < ANALYTICS_LOAD_BATCH_SIZE:
+                break
+
+        shrunk = columns.size > expected and self._shrunk((await session.exec(_expected_rows_statement())).one())
+        if shrunk or self._needs_reload(expected):
+            columns = _Columns()
+            while True:
+                rows = (await session.exec(_tail_statement(columns.last_id))).all()
+                columns.append(rows)
+                if len(rows) < ANALYTICS_LOAD_BATCH_SIZE:
+                    break
+            self._replace(columns)
+        return self
+
+    def aggregate(
+        self,
+        dimensions: Sequence[str],
+        metrics: Sequence[tuple[str, Optional[str]]],
+        filters: Optional[dict[str, Optional[str]]] = None,
+        since: Optional[date | datetime] = None,
+        until: Optional[date | datetime] = None,
+        bucket: Optional[str] = None
+    ) -> list[tuple]:
+        """
+        GROUP BY vetorizado sobre o snapshot.
+
+        Args:
+            dimensions: Dimensões de agrupamento (SNAPSHOT_DIMENSIONS)
+            metrics: Pares (função, coluna): ("count", None) ou função em
+                sum/avg/min/max e coluna em sale_price, volume_sold ou spend
+                (preço x volume)
+            filters: Filtros exatos por dimensão (valores vazios são ignorados)
+            since: Início do intervalo de collection_date (inclusive)
+            until: Fim do intervalo de collection_date (exclusivo)
+            bucket: Agrupar também pelo início do período ("day", "week", "month")
+
+        Returns:
+            Uma tupla (período, dimensões..., métricas...) por grupo com
+            coletas, sem ordem definida
+        """
+        filters = {dimension: value for dimension, value in (filters or {}).items() if value}
+        arrays, dictionaries, codes = self._view(dimensions, filters)
+
+        mask = None
+        for dimension, code in codes.items():
+            if code is None:
+                return []
+            condition = arrays[dimension] == code
+            mask = condition if mask is None else mask & condition
+        for bound, keep in ((since, np.greater_equal), (until, np.less)):
+            if bound is not None:
+                condition = keep(arrays["collection_date"], _timestamp(bound))
+                mask = condition if mask is None else mask & condition
+
+        def take(name: str) -> np.ndarray:
+            return arrays[name] if mask is None else arrays[name][mask]
+
+        # Chave de grupo: códigos de cada componente combinados em um inteiro
+        keys, sizes, labels = [], [], []
+        if bucket:
+            # Período calculado uma vez por dia do intervalo (tabela de consulta),
+            # não por coleta
+            days = take("collection_date") // _MICROSECONDS_PER_DAY
+            first = int(days.min()) if len(days) else 0
+            last = int(days.max()) if len(days) else 0
+            span = _bucket_days(np.arange(first, last + 1), bucket)
+            bucket_labels, day_codes = np.unique(span, return_inverse=True)
+            keys.append(day_codes[days - first])
+            sizes.append(len(bucket_labels))
+            labels.append(bucket_labels.astype("datetime64[D]").astype(object))
+        for dimension in dimensions:
+            values = dictionaries[dimension]
+            keys.append(take(dimension))
+            sizes.append(len(values))
+            labels.append(np.array(values, dtype=object))
+
+        rows = int(mask.sum()) if mask is not None else len(arrays["sale_price"])
+        groups = 1
+        for size in sizes:
+            groups *= size
+        if not keys:
+            group = np.zeros(rows, dtype=np.intp)
+            unique_keys = None
+        elif groups <= DENSE_GROUPS_LIMIT:
+            group = np.ravel_multi_index(keys, sizes)
+            unique_keys = None
+        else:
+            unique_keys, group = np.unique(np.ravel_multi_index(keys, sizes), return_inverse=True)
+            groups = len(unique_keys)
+
+        counts = np.bincount(group, minlength=groups)
+        present = np.flatnonzero(counts)
+
+        sums: dict[str, np.ndarray] = {}
+        results = []
+        for function, column in metrics:
+            if function == "count":
+                results.append(counts[present])
+                continue
+            if column == "spend":
+                values = take("sale_price") * take("volume_sold")
+            else:
+                values = take(column)
+            if function in ("sum", "avg"):
+                if column not in sums:
+                    sums[column] = np.bincount(group, weights=values, minlength=groups)[present]
+                results.append(sums[column] if function == "sum" else sums[column] / counts[present])
+            else:
+                ufunc, initial = (np.minimum, np.inf) if function == "min" else (np.maximum, -np.inf)
+                extremes = np.full(groups, initial)
+                ufunc.at(extremes, group, values)
+                results.append(extremes[present])
+
+        flat = present if unique_keys is None else unique_keys[present]
+        components = np.unravel_index(flat, sizes) if sizes else ()
+        decoded = [label[component].tolist() for label, component in zip(labels, components)]
+        return list(zip(*decoded, *[result.tolist() for result in results]))
+
+    def stats(self) -> dict:
+        """Tamanho do snapshot e memória ocupada pelos arrays."""
+        with self._lock:
+            columns = self._columns
+            used = sum(array[:columns.size].nbytes for array in columns.arrays.values())
+            return {
+                "rows": columns.size,
+                "last_id": columns.last_id,
+                "bytes_used": used,
+                "bytes_allocated": sum(array.nbytes for array in columns.arrays.values()),
+                "bytes_per_million_rows": round(used / columns.size * 1_000_000) if columns.size else 0,
+                "dictionaries": {dimension: len(d.values) for dimension, d in columns.dictionaries.items()},
+            }
+
+
+_snapshot: Optional[ColumnarSnapshot] = ColumnarSnapshot() if ANALYTICS_ENGINE == "numpy" else None
+
+
+def get_snapshot() -> Optional[ColumnarSnapshot]:
+    """Snapshot deste worker, ou None com ANALYTICS_ENGINE=sql (padrão)."""
+    return _snapshot
@@ -0,0 +1,383 @@
+"""
+Detecção online de coletas suspeitas na ingestão.
+
+Cada coleta é comparada com a média e o desvio padrão correntes do seu grupo
+em três regras:
+
+    price_store     preço por (combustível, posto)
+    price_city      preço por (combustível, estado, cidade)
+    volume_vehicle  volume por tipo de veículo
+
+e é sinalizada quando o z-score |valor - média| / desvio passa de
+ANOMALY_Z_THRESHOLD, com ao menos ANOMALY_MIN_SAMPLES coletas no grupo. A
+coleta é pontuada antes de entrar na média do grupo. As sinalizações vão para
+price_anomaly na mesma transação da ingestão (detect_anomalies, chamada junto
+com os agregados dos KPIs) e saem com os meses da retenção. A pontuação não
+executa comandos além desse INSERT, só quando há sinalizações: em
+benchmarks/bench_ingest_hook.py ela é ~0,5% do tempo de um /ingest de uma
+linha.
+
+Média e variância são mantidas pelo algoritmo de Welford: O(1) por coleta,
+sem consultar o banco. As estatísticas ficam em memória, por processo e por
+engine, e são carregadas na inicialização (load_group_stats, chamada por
+create_db_and_tables) com um GROUP BY por regra numa conexão própria, fora
+de qualquer transação de ingestão. Como os ids do esquema estrela, os
+valores de uma transação só entram nas estatísticas depois do commit. Entre
+cargas, cada worker só soma as próprias ingestões e os meses removidos pela
+retenção continuam na média; por isso, passado ANOMALY_STATS_RELOAD_SECONDS,
+o commit de uma ingestão dispara a recarga numa thread em background
+(reload_group_stats).
+"""
+import logging
+import math
+import os
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Mapping, Optional, Sequence
+from sqlalchemy import and_, delete, event, func, insert, select
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.pool import Pool
+from app.models import FuelFact, PriceAnomaly
+from app.star_schema import STAR_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+# |z| a partir do qual uma coleta é sinalizada
+ANOMALY_Z_THRESHOLD = float(os.getenv("ANOMALY_Z_THRESHOLD", "4"))
+
+# Coletas no grupo antes de a regra valer (média e desvio estáveis)
+ANOMALY_MIN_SAMPLES = int(os.getenv("ANOMALY_MIN_SAMPLES", "30"))
+
+# Intervalo (s) para recarregar as estatísticas do banco (0 desativa)
+ANOMALY_STATS_RELOAD_SECONDS = float(os.getenv("ANOMALY_STATS_RELOAD_SECONDS", "3600"))
+
+# Desvio mínimo, relativo à média: num posto de preço fixo, uma mudança de
+# centavos não é anomalia
+MIN_RELATIVE_STDDEV = 0.01
+
+
+@dataclass(frozen=True)
+class Check:
+    """Uma regra: o grupo (colunas da coleta) e a coluna medida"""
+    kind: str
+    keys: tuple[str, ...]
+    column: str
+
+    def group(self, row: Mapping) -> tuple:
+        return (self.kind,) + tuple(row[key] for key in self.keys)
+
+
+CHECKS = (
+    Check("price_store", ("fuel_type", "store_id"), "sale_price"),
+    Check("price_city", ("fuel_type", "state", "city"), "sale_price"),
+    Check("volume_vehicle", ("vehicle_type",), "volume_sold"),
+)
+KINDS = tuple(check.kind for check in CHECKS)
+
+
+class RunningStats:
+    """Contagem, média e soma dos quadrados dos desvios (Welford)"""
+    __slots__ = ("count", "mean", "m2")
+
+    def __init__(self, count: int = 0, mean: float = 0.0, m2: float = 0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def add(self, value: float):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def merge(self, other: "RunningStats"):
+        """Junta as estatísticas de outro conjunto de valores (Chan et al.)"""
+        if not other.count:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+
+    def copy(self) -> "RunningStats":
+        return RunningStats(self.count, self.mean, self.m2)
+
+    @property
+    def stddev(self) -> float:
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def z_score(self, value: float) -> float:
+        scale = max(self.stddev, abs(self.mean) * MIN_RELATIVE_STDDEV)
+        return (value - self.mean) / scale if scale > 0 else 0.0
+
+
+class GroupStats:
+    """Estatísticas confirmadas de todos os grupos de um banco (thread-safe)"""
+
+    def __init__(self):
+        self.loaded_at: Optional[float] = None
+        self._groups: dict[tuple, RunningStats] = {}
+        # Valores confirmados desde o início da carga em andamento
+        self._since_load: Optional[dict[tuple, RunningStats]] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self.loaded_at is not None
+
+    def start_load(self) -> bool:
+        """Marca o início de uma carga; False se já há uma em andamento"""
+        with self._lock:
+            if self._since_load is not None:
+                return False
+            self._since_load = {}
+            return True
+
+    def load(self, groups: dict[tuple, RunningStats]):
+        """Troca pelas estatísticas carregadas; os valores confirmados enquanto a carga rodava são somados"""
+        with self._lock:
+            for group, stats in (self._since_load or {}).items():
+                groups.setdefault(group, RunningStats()).merge(stats)
+            self._groups = groups
+            self._since_load = None
+            self.loaded_at = time.monotonic()
+
+    def abort_load(self):
+        with self._lock:
+            self._since_load = None
+
+    def needs_reload(self) -> bool:
+        """Se a última carga passou de ANOMALY_STATS_RELOAD_SECONDS (e nenhuma está rodando)"""
+        with self._lock:
+            return (
+                ANOMALY_STATS_RELOAD_SECONDS > 0
+                and self.loaded_at is not None
+                and self._since_load is None
+                and time.monotonic() - self.loaded_at >= ANOMALY_STATS_RELOAD_SECONDS
+            )
+
+    def get(self, group: tuple) -> RunningStats:
+        with self._lock:
+            stats = self._groups.get(group)
+            return stats.copy() if stats is not None else RunningStats()
+
+    def merge(self, increments: Mapping[tuple, RunningStats]):
+        with self._lock:
+            for group, stats in increments.items():
+                self._groups.setdefault(group, RunningStats()).merge(stats)
+                if self._since_load is not None:
+                    self._since_load.setdefault(group, RunningStats()).merge(stats)
+
+    def __len__(self) -> int:
+        return len(self._groups)
+
+
+# Um conjunto de estatísticas por engine (cada banco tem suas coletas)
+_stats: "weakref.WeakKeyDictionary[Engine, GroupStats]" = weakref.WeakKeyDictionary()
+_stats_lock = threading.Lock()
+
+# Valores da transação corrente, em connection.info
+_PENDING = "anomaly_pending_stats"
+
+
+def group_stats(engine: Engine) -> GroupStats:
+    """Estatísticas dos grupos no engine."""
+    with _stats_lock:
+        stats = _stats.get(engine)
+        if stats is None:
+            stats = _stats[engine] = GroupStats()
+        return stats
+
+
+@event.listens_for(Engine, "commit")
+def _merge_pending_stats(connection: Connection):
+    """Leva às estatísticas os valores da transação confirmada."""
+    pending = connection.info.pop(_PENDING, None)
+    if pending:
+        stats = group_stats(connection.engine)
+        stats.merge(pending)
+        if stats.needs_reload():
+            # Fora da transação de ingestão, numa conexão própria
+            threading.Thread(
+                target=_reload_in_background, args=(connection.engine,), daemon=True,
+                name="anomaly-stats-reload"
+            ).start()
+
+
+@event.listens_for(Engine, "rollback")
+@event.listens_for(Engine, "rollback_savepoint")
+def _discard_pending_stats(connection: Connection, *args):
+    # No rollback de um savepoint descarta também os valores anteriores a
+    # ele: as estatísticas só ficam com algumas coletas a menos
+    connection.info.pop(_PENDING, None)
+
+
+@event.listens_for(Pool, "reset")
+def _discard_pending_on_reset(dbapi_connection, connection_record, reset_state):
+    # Conexão devolvida ao pool sem commit/rollback explícito
+    connection_record.info.pop(_PENDING, None)
+
+
+def _load_groups(connection: Connection) -> dict[tuple, RunningStats]:
+    """
+    Estatísticas das coletas já gravadas, um GROUP BY por regra no fato.
+
+    A variância sai em duas passadas (média do grupo, depois a soma dos
+    quadrados dos desvios): soma dos quadrados - soma * média perde toda a
+    precisão quando o desvio é pequeno perto da média, caso dos preços. As
+    passadas agrupam pelas chaves inteiras do fato (STAR_COLUMNS); como um
+    posto pode ter mais de uma linha na dimensão, os grupos de chaves com os
+    mesmos atributos são juntados com RunningStats.merge.
+    """
+    fact = FuelFact.__table__
+    groups = {}
+    for check in CHECKS:
+        fact_columns = list(dict.fromkeys(STAR_COLUMNS[key][0] for key in check.keys))
+        keys = [fact.c[name] for name in fact_columns]
+        value = fact.c[check.column]
+        means = (
+            select(*keys, func.count().label("samples"), func.avg(value).label("mean"))
+            .group_by(*keys)
+            .subquery()
+        )
+        group_keys = [means.c[name] for name in fact_columns]
+        deviation = value - means.c.mean
+        inner = (
+            select(*group_keys, means.c.samples, means.c.mean, func.sum(deviation * deviation).label("m2"))
+            .join_from(fact, means, and_(*(column == group_key for column, group_key in zip(keys, group_keys))))
+            .group_by(*group_keys, means.c.samples, means.c.mean)
+            .subquery()
+        )
+        source, joined = inner, set()
+        for key in check.keys:
+            fact_column, dimension_column = STAR_COLUMNS[key]
+            if dimension_column.table not in joined:
+                source = source.join(dimension_column.table, dimension_column.table.c.id == inner.c[fact_column])
+                joined.add(dimension_column.table)
+        statement = select(
+            *(STAR_COLUMNS[key][1] for key in check.keys), inner.c.samples, inner.c.mean, inner.c.m2
+        ).select_from(source)
+        for *group, count, mean, m2 in connection.execute(statement):
+            stats = RunningStats(count, float(mean), float(m2 or 0.0))
+            existing = groups.get((check.kind, *group))
+            if existing is None:
+                groups[(check.kind, *group)] = stats
+            else:
+                existing.merge(stats)
+    return groups
+
+
+def reload_group_stats(engine: Engine) -> bool:
+    """
+    Recarrega do banco as estatísticas dos grupos.
+
+    Roda numa conexão própria: as varreduras completas não seguram os locks
+    de nenhuma transação de escrita. O que for confirmado enquanto a carga
+    roda é somado a ela (GroupStats.load).
+
+    Args:
+        engine: Engine do banco de dados
+
+    Returns:
+        Se a carga rodou (False: já havia outra em andamento)
+    """
+    stats = group_stats(engine)
+    if not stats.start_load():
+        return False
+    try:
+        with engine.connect() as connection:
+            groups = _load_groups(connection)
+            connection.rollback()
+    except BaseException:
+        stats.abort_load()
+        raise
+    stats.load(groups)
+    return True
+
+
+def load_group_stats(engine: Engine):
+    """
+    Carga inicial das estatísticas, uma vez por engine, antes de o processo
+    receber ingestões (create_db_and_tables).
+
+    Args:
+        engine: Engine do banco de dados
+    """
+    if not group_stats(engine).loaded:
+        reload_group_stats(engine)
+
+
+def _reload_in_background(engine: Engine):
+    try:
+        reload_group_stats(engine)
+    except Exception as e:
+        logger.warning(f"Falha ao recarregar as estatísticas de anomalia: {e}")
+
+
+def detect_anomalies(connection: Connection, rows: Sequence[Mapping]) -> list[dict]:
+    """
+    Pontua coletas recém-inseridas e grava as sinalizações em price_anomaly.
+
+    Deve ser chamada na mesma transação do INSERT e não lê a tabela de
+    coletas: sem load_group_stats, um grupo só conta as coletas ingeridas
+    pelo processo. As coletas são pontuadas
+    na ordem recebida, cada uma contra o grupo já somado das anteriores
+    (inclusive as do mesmo lote).
+
+    Args:
+        connection: Conexão da transação corrente
+        rows: Coletas inseridas, com id e todas as colunas de FuelCollection
+
+    Returns:
+        As sinalizações gravadas
+    """
+    if not rows:
+        return []
+    stats = group_stats(connection.engine)
+    pending: dict[tuple, RunningStats] = connection.info.setdefault(_PENDING, {})
+    current: dict[tuple, RunningStats] = {}
+    flags = []
+    for row in rows:
+        for check in CHECKS:
+            group = check.group(row)
+            running = current.get(group)
+            if running is None:
+                running = current[group] = stats.get(group)
+                if group in pending:
+                    running.merge(pending[group])
+            value = row[check.column]
+            if running.count >= ANOMALY_MIN_SAMPLES:
+                z_score = running.z_score(value)
+                if abs(z_score) >= ANOMALY_Z_THRESHOLD:
+                    flags.append({
+                        "collection_id": row["id"],
+                        "collection_date": row["collection_date"],
+                        "kind": check.kind,
+                        "fuel_type": row["fuel_type"],
+                        "store_id": row["store_id"],
+                        "city": row["city"],
+                        "state": row["state"],
+                        "vehicle_type": row["vehicle_type"],
+                        "value": value,
+                        "expected": running.mean,
+                        "stddev": running.stddev,
+                        "z_score": z_score,
+                        "samples": running.count,
+                    })
+            running.add(value)
+            pending.setdefault(group, RunningStats()).add(value)
+
+    if flags:
+        connection.execute(insert(PriceAnomaly.__table__), flags)
+    return flags
+
+
+def remove_anomalies(connection: Connection, start: datetime, end: datetime):
+    """Remove as sinalizações das coletas de um intervalo (início inclusivo, fim exclusivo)."""
+    connection.execute(delete(PriceAnomaly).where(
+        PriceAnomaly.collection_date >= start, PriceAnomaly.collection_date < end
+    ))
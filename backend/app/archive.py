@@ -0,0 +1,337 @@
+"""
+Arquivo frio das coletas antigas em arquivos Parquet.
+
+O job de arquivamento (`manage.py archive`) move as coletas dos meses
+anteriores a um corte da tabela quente para arquivos Parquet comprimidos
+(zstd) em ARCHIVE_DIR, um diretório por mês:
+
+    ARCHIVE_DIR/fuelcollection/month=2024-01/part-20250101T030000000000.parquet
+
+Cada arquivo é ordenado por (collection_date, id), gravado em row groups com
+estatísticas e registrado no manifesto (tabela archived_file) com o
+intervalo de datas e a quantidade de linhas. Com particionamento, o mês sai
+da tabela quente com DETACH + DROP da partição.
+
+Os agregados e rollups dos KPIs continuam contando as coletas arquivadas (o
+arquivamento não os desconta). A listagem, a contagem, o relatório por
+motorista e as agregações que leem coletas incluem o arquivo quando o
+intervalo pedido o alcança: o manifesto escolhe os arquivos do intervalo e
+o pyarrow lê só as colunas usadas, pulando row groups pelas estatísticas.
+
+Com ARCHIVE_DIR vazio o arquivo frio fica desativado e os serviços não
+consultam o manifesto.
+"""
+import logging
+import os
+from dataclasses import dataclass
+from datetime import date, datetime
+from functools import reduce
+from typing import Optional, Sequence
+from sqlalchemy import func, select as sql_select
+from sqlalchemy.engine import Connection, Engine
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.cache import invalidate_data_caches
+from app.models import ArchivedFile, FuelCollection
+from app.partitions import expired_months, lock_month, month_range, month_start, remove_month
+from app.search import SEARCH_COLUMNS, normalize_text
+from app.services.export_service import EXPORT_COLUMNS, parquet_schema
+from app.services.pagination import NEXT
+
+logger = logging.getLogger(__name__)
+
+# Diretório do arquivo frio (vazio desativa)
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "")
+
+# Codec de compressão dos arquivos Parquet
+ARCHIVE_COMPRESSION = os.getenv("ARCHIVE_COMPRESSION", "zstd")
+
+# Linhas por row group (unidade mínima lida quando o filtro de datas casa)
+ARCHIVE_ROW_GROUP_SIZE = 100000
+
+# Coluna normalizada (sem acentos, minúsculas) usada na busca por trecho
+SEARCH_COLUMN_SUFFIX = "_search"
+
+
+def archive_enabled() -> bool:
+    """Se o arquivo frio está configurado (ARCHIVE_DIR)."""
+    return bool(ARCHIVE_DIR)
+
+
+def archive_schema():
+    """Schema dos arquivos: colunas da exportação e as colunas de busca normalizadas."""
+    import pyarrow as pa
+
+    schema = parquet_schema()
+    for column in SEARCH_COLUMNS:
+        schema = schema.append(pa.field(column + SEARCH_COLUMN_SUFFIX, pa.string()))
+    return schema
+
+
+@dataclass(frozen=True)
+class ArchiveQuery:
+    """
+    Filtros de uma leitura do arquivo, equivalentes às condições WHERE dos
+    serviços.
+
+    equals compara colunas por igualdade; search busca um termo (já
+    normalizado com normalize_text) por trecho em city ou driver_name; start
+    é inclusivo e end exclusivo.
+    """
+    equals: tuple[tuple[str, str], ...] = ()
+    search: tuple[tuple[str, str], ...] = ()
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+
+    def expression(self, cursor: Optional[tuple[datetime, int, str]] = None):
+        """Expressão de filtro do pyarrow.dataset (None sem filtros)."""
+        import pyarrow.compute as pc
+        import pyarrow.dataset as ds
+
+        conditions = [ds.field(column) == value for column, value in self.equals]
+        conditions += [
+            pc.match_substring(ds.field(column + SEARCH_COLUMN_SUFFIX), term)
+            for column, term in self.search
+        ]
+        collection_date = ds.field("collection_date")
+        if self.start:
+            conditions.append(collection_date >= self.start)
+        if self.end:
+            conditions.append(collection_date < self.end)
+        if cursor:
+            key_date, key_id, direction = cursor
+            # A condição só na data permite pular row groups pelas estatísticas
+            if direction == NEXT:
+                conditions.append(collection_date <= key_date)
+                conditions.append((collection_date < key_date) | (ds.field("id") < key_id))
+            else:
+                conditions.append(collection_date >= key_date)
+                conditions.append((collection_date > key_date) | (ds.field("id") > key_id))
+        return reduce(lambda left, right: left & right, conditions) if conditions else None
+
+
+def listing_query(filters: dict[str, Optional[str]]) -> ArchiveQuery:
+    """ArchiveQuery dos filtros normalizados da listagem (normalize_filters)."""
+    return ArchiveQuery(
+        equals=tuple((column, filters[column]) for column in ("fuel_type", "vehicle_type") if filters[column]),
+        search=(("city", filters["city"]),) if filters["city"] else ()
+    )
+
+
+def archived_files_statement(query: ArchiveQuery):
+    """SELECT dos arquivos do manifesto que podem ter coletas do intervalo."""
+    statement = select(ArchivedFile).order_by(ArchivedFile.min_date)
+    if query.start:
+        statement = statement.where(ArchivedFile.max_date >= query.start)
+    if query.end:
+        statement = statement.where(ArchivedFile.min_date < query.end)
+    return statement
+
+
+def archived_files(session: Session, query: ArchiveQuery) -> list[ArchivedFile]:
+    """Arquivos do manifesto que podem ter coletas do intervalo (vazio se desativado)."""
+    if not archive_enabled():
+        return []
+    return session.exec(archived_files_statement(query)).all()
+
+
+async def archived_files_async(session: AsyncSession, query: ArchiveQuery) -> list[ArchivedFile]:
+    """Versão assíncrona de archived_files."""
+    if not archive_enabled():
+        return []
+    return (await session.exec(archived_files_statement(query))).all()
+
+
+def archived_rows_statement():
+    """Total de coletas arquivadas (soma do manifesto)."""
+    return sql_select(func.coalesce(func.sum(ArchivedFile.row_count), 0))
+
+
+def _dataset(paths: Sequence[str]):
+    import pyarrow.dataset as ds
+
+    return ds.dataset(
+        [os.path.join(ARCHIVE_DIR, path) for path in paths],
+        format="parquet",
+        schema=archive_schema()
+    )
+
+
+def count_archived(paths: Sequence[str], query: ArchiveQuery) -> int:
+    """Quantidade de coletas arquivadas que atendem aos filtros."""
+    if not paths:
+        return 0
+    return _dataset(paths).count_rows(filter=query.expression())
+
+
+def read_archived(
+    paths: Sequence[str],
+    query: ArchiveQuery,
+    limit: int,
+    cursor: Optional[tuple[datetime, int, str]] = None,
+    offset: int = 0
+) -> list[FuelCollection]:
+    """
+    Coletas arquivadas na ordem da listagem: (collection_date, id)
+    decrescente, ou crescente a partir de um cursor PREV.
+
+    Args:
+        paths: Arquivos do manifesto (archived_files_statement)
+        query: Filtros
+        limit: Quantidade máxima de coletas
+        cursor: (data, id, direção) do keyset, como em decode_cursor
+        offset: Coletas puladas antes da primeira devolvida
+
+    Returns:
+        FuelCollection transientes (fora da sessão)
+    """
+    import pyarrow.compute as pc
+
+    if not paths:
+        return []
+    order = "ascending" if cursor and cursor[2] != NEXT else "descending"
+    sort_keys = [("collection_date", order), ("id", order)]
+    table = _dataset(paths).to_table(columns=EXPORT_COLUMNS, filter=query.expression(cursor))
+    if table.num_rows > offset + limit:
+        table = table.take(pc.select_k_unstable(table, k=offset + limit, sort_keys=sort_keys))
+    table = table.sort_by(sort_keys).slice(offset, limit)
+    return [FuelCollection(**row) for row in table.to_pylist()]
+
+
+def aggregate_archived(
+    paths: Sequence[str],
+    query: ArchiveQuery,
+    keys: Sequence[str],
+    aggregations: Sequence[tuple[str, str]],
+    bucket: Optional[str] = None
+) -> list[dict]:
+    """
+    GROUP BY sobre as coletas arquivadas.
+
+    Args:
+        paths: Arquivos do manifesto
+        query: Filtros
+        keys: Colunas de agrupamento; "bucket" é o início do período
+        aggregations: (coluna, função do pyarrow: count, sum, min, max);
+            a coluna "spend" é preço x volume
+        bucket: Granularidade do período: "day", "week" (segunda-feira) ou "month"
+
+    Returns:
+        Um dicionário por grupo, com as chaves e "<coluna>_<função>"
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    if not paths:
+        return []
+    columns = {key for key in keys if key != "bucket"} | {column for column, _ in aggregations}
+    if "spend" in columns:
+        columns = (columns - {"spend"}) | {"sale_price", "volume_sold"}
+    if bucket:
+        columns.add("collection_date")
+    table = _dataset(paths).to_table(columns=sorted(columns), filter=query.expression())
+    if any(column == "spend" for column, _ in aggregations):
+        table = table.append_column("spend", pc.multiply(table["sale_price"], table["volume_sold"]))
+    if bucket:
+        table = table.append_column("bucket", pc.floor_temporal(
+            table["collection_date"], unit=bucket, week_starts_monday=True
+        ).cast(pa.date32()))
+    return table.group_by(list(keys)).aggregate(list(aggregations)).to_pylist()
+
+
+def _write_month(connection: Connection, month: date, path: str) -> Optional[tuple[int, datetime, datetime]]:
+    """Grava as coletas do mês em ordem (collection_date, id); None se não houver coletas."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    start, end = month_range(month)
+    columns = [FuelCollection.__table__.c[name] for name in EXPORT_COLUMNS]
+    statement = (
+        sql_select(*columns)
+        .where(FuelCollection.collection_date >= start, FuelCollection.collection_date < end)
+        .order_by(FuelCollection.collection_date, FuelCollection.id)
+        .execution_options(yield_per=ARCHIVE_ROW_GROUP_SIZE)
+    )
+    schema = archive_schema()
+    search_positions = [EXPORT_COLUMNS.index(column) for column in SEARCH_COLUMNS]
+    date_position = EXPORT_COLUMNS.index("collection_date")
+
+    writer = None
+    rows, first, last = 0, None, None
+    try:
+        for batch in connection.execute(statement).partitions():
+            values = list(zip(*batch))
+            values += [[normalize_text(value) for value in values[position]] for position in search_positions]
+            if writer is None:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                writer = pq.ParquetWriter(path, schema, compression=ARCHIVE_COMPRESSION)
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(values, schema)],
+                schema=schema
+            ), row_group_size=ARCHIVE_ROW_GROUP_SIZE)
+            rows += len(batch)
+            first = first or batch[0][date_position]
+            last = batch[-1][date_position]
+    finally:
+        if writer is not None:
+            writer.close()
+    return (rows, first, last) if rows else None
+
+
+def archive_collections(engine: Engine, before: date) -> list[ArchivedFile]:
+    """
+    Move para o arquivo frio as coletas dos meses anteriores a `before`.
+
+    Cada mês usa uma transação: bloqueia escritas no mês, grava o arquivo
+    (temporário, renomeado ao final), registra o manifesto e remove o mês da
+    tabela quente (DETACH + DROP da partição ou DELETE). Se a transação
+    falhar, o arquivo é apagado. Os agregados dos KPIs não mudam.
+
+    Args:
+        engine: Engine do banco de dados
+        before: Data de corte; os meses anteriores ao mês dela são arquivados
+
+    Returns:
+        Arquivos registrados no manifesto
+
+    Raises:
+        ValueError: Se ARCHIVE_DIR não estiver configurado
+    """
+    if not archive_enabled():
+        raise ValueError("Defina ARCHIVE_DIR para arquivar coletas")
+
+    with engine.connect() as connection:
+        months = expired_months(connection, month_start(before))
+
+    archived = []
+    for month in months:
+        relative = os.path.join(
+            FuelCollection.__tablename__, f"month={month:%Y-%m}", f"part-{datetime.utcnow():%Y%m%dT%H%M%S%f}.parquet"
+        )
+        path = os.path.join(ARCHIVE_DIR, relative)
+        temporary = path + ".tmp"
+        try:
+            with engine.begin() as connection:
+                lock_month(connection, month)
+                written = _write_month(connection, month, temporary)
+                if written is not None:
+                    os.replace(temporary, path)
+                    rows, first, last = written
+                    entry = ArchivedFile(
+                        month=month, path=relative, row_count=rows, size_bytes=os.path.getsize(path),
+                        min_date=first, max_date=last
+                    )
+                    connection.execute(ArchivedFile.__table__.insert().values(entry.model_dump(exclude={"id"})))
+                    archived.append(entry)
+                    logger.info(f"Arquivo frio: {relative} ({rows} coletas)")
+                # Meses sem coletas só têm a partição vazia removida
+                remove_month(connection, month)
+        except BaseException:
+            for leftover in (temporary, path):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+            raise
+
+    if months:
+        invalidate_data_caches()
+    return archived
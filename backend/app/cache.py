@@ -1,11 +1,45 @@
 """
 Redis cache configuration and utilities
+
+Dois níveis: L1 em memória de cada processo (app.local_cache) e L2 no Redis.
+
+As chaves do Redis são versionadas por namespace (primeiro segmento do
+prefixo, ex.: "kpi"): "kpi:avg_price:g<geração>:<args>". Invalidar um
+namespace é um único INCR na chave de geração; as entradas antigas deixam de
+ser lidas e expiram pelo TTL. Nenhum caminho usa KEYS (listagem e limpeza
+manual usam SCAN).
+
+O L1 é invalidado no próprio processo e, nos demais workers, por uma mensagem
+no canal pub/sub INVALIDATION_CHANNEL (InvalidationListener).
+
+No modo de resposta (@cached(..., response=True)) o valor cacheado é o corpo
+JSON final, serializado uma única vez com orjson; nos acertos os routers o
+devolvem direto em um Response, sem validação nem serialização do FastAPI.
 """
 import redis
+import redis.asyncio as redis_asyncio
+import asyncio
+import glob
+import inspect
 import json
+import logging
+import math
+import orjson
 import os
-from typing import Optional, Any
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextvars import ContextVar
+from typing import Iterable, Iterator, Optional, Any
 from functools import wraps
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session as OrmSession
+from app.local_cache import LocalCache, MISSING
+from app.single_flight import SingleFlight, AsyncSingleFlight
+
+logger = logging.getLogger(__name__)
 
 
 # Configuração do Redis
@@ -14,6 +48,56 @@ REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 # Cliente Redis global
 redis_client: Optional[redis.Redis] = None
 
+# Cliente Redis assíncrono global (API_MODE=async)
+async_redis_client: Optional[redis_asyncio.Redis] = None
+
+# Cache L1 (memória do processo): limites e TTL máximo das entradas
+CACHE_L1_MAX_ENTRIES = int(os.getenv("CACHE_L1_MAX_ENTRIES", "1000"))
+CACHE_L1_MAX_BYTES = int(os.getenv("CACHE_L1_MAX_BYTES", str(16 * 1024 * 1024)))
+CACHE_L1_TTL = float(os.getenv("CACHE_L1_TTL", "30"))
+
+# Canal pub/sub das mensagens de invalidação do L1 entre workers
+INVALIDATION_CHANNEL = "cache:invalidate"
+
+local_cache = LocalCache(
+    max_entries=CACHE_L1_MAX_ENTRIES,
+    max_bytes=CACHE_L1_MAX_BYTES,
+    ttl=CACHE_L1_TTL
+)
+
+# Lock distribuído de recálculo (um recálculo por chave entre workers)
+RECOMPUTE_LOCK_PREFIX = "cache:lock:"
+RECOMPUTE_LOCK_TTL = 30
+
+# Espera máxima por um valor sendo recalculado por outra chamada/worker
+RECOMPUTE_WAIT_SECONDS = 10
+RECOMPUTE_POLL_SECONDS = 0.05
+
+# Fator da expiração antecipada probabilística (0 desativa)
+EARLY_EXPIRATION_BETA = float(os.getenv("CACHE_EARLY_EXPIRATION_BETA", "1.0"))
+
+# Entradas de resposta pré-serializada: "raw:<expires_at>:<delta>\n<corpo JSON>"
+# (um JSON nunca começa com "r", então não colide com as demais entradas)
+RAW_ENTRY_MARKER = "raw:"
+
+# Versão dos dados: geração do namespace "data", incrementada a cada ingestão,
+# e o instante da última alteração (ETag/Last-Modified, ver app.http_cache)
+DATA_VERSION_NAMESPACE = "data"
+DATA_VERSION_KEY = "data:version"
+DATA_MODIFIED_KEY = "data:modified_at"
+
+# Marca, no contexto da requisição, que @cached devolveu um valor antigo
+_served_stale: ContextVar[bool] = ContextVar("cache_served_stale", default=False)
+
+_single_flight = SingleFlight()
+_async_single_flight = AsyncSingleFlight()
+
+# Recálculos em background dos valores antigos servidos por @cached
+CACHE_REFRESH_WORKERS = int(os.getenv("CACHE_REFRESH_WORKERS", "4"))
+_refresh_executor = ThreadPoolExecutor(max_workers=CACHE_REFRESH_WORKERS, thread_name_prefix="cache-refresh")
+_background_refreshes: set = set()
+_background_tasks: set = set()
+
 
 def get_redis_client() -> redis.Redis:
     """
@@ -30,6 +114,21 @@ def get_redis_client() -> redis.Redis:
     return redis_client
 
 
+def get_async_redis_client() -> redis_asyncio.Redis:
+    """
+    Obtém o cliente Redis assíncrono (singleton pattern)
+    """
+    global async_redis_client
+    if async_redis_client is None:
+        async_redis_client = redis_asyncio.from_url(
+            REDIS_URL,
+            decode_responses=True,
+            socket_connect_timeout=5,
+            socket_timeout=5
+        )
+    return async_redis_client
+
+
 def cache_key(*args, **kwargs) -> str:
     """
     Gera uma chave de cache única baseada nos argumentos
@@ -39,14 +138,260 @@ def cache_key(*args, **kwargs) -> str:
     return ":".join(key_parts)
 
 
-def cached(prefix: str, ttl: int = 300, skip_args: int = 0):
+# Prefixo das chaves de geração por namespace ("cache:gen:kpi")
+GENERATION_KEY_PREFIX = "cache:gen:"
+
+# Quantidade de chaves pedidas por iteração do SCAN
+SCAN_COUNT = 1000
+
+# Chaves que não são cache e nunca são removidas pela limpeza manual
+# (ex.: stream da fila de ingestão assíncrona)
+PROTECTED_KEY_PREFIXES = ("ingest:",)
+
+
+def cache_namespace(prefix: str) -> str:
+    """Namespace de invalidação de um prefixo ("kpi:avg_price" -> "kpi")."""
+    return prefix.split(":", 1)[0]
+
+
+def _generation_key(namespace: str) -> str:
+    return f"{GENERATION_KEY_PREFIX}{namespace}"
+
+
+def _initial_generation() -> int:
+    # Semente baseada no relógio: se a chave de geração se perder (flush,
+    # eviction), a nova geração não coincide com entradas antigas ainda vivas
+    return int(time.time() * 1000)
+
+
+def get_generation(client: redis.Redis, namespace: str) -> str:
+    """
+    Geração atual de um namespace (criada na primeira leitura).
+    
+    Args:
+        client: Cliente Redis
+        namespace: Namespace de invalidação (ex: "kpi")
+    
+    Returns:
+        Geração atual, como string
+    """
+    key = _generation_key(namespace)
+    generation = client.get(key)
+    if generation is None:
+        client.set(key, _initial_generation(), nx=True)
+        generation = client.get(key)
+    return generation
+
+
+async def get_generation_async(client: redis_asyncio.Redis, namespace: str) -> str:
+    """Versão assíncrona de get_generation."""
+    key = _generation_key(namespace)
+    generation = await client.get(key)
+    if generation is None:
+        await client.set(key, _initial_generation(), nx=True)
+        generation = await client.get(key)
+    return generation
+
+
+def versioned_key(prefix: str, generation: str, *args, **kwargs) -> str:
+    """Chave completa: prefixo, geração do namespace e argumentos."""
+    return f"{prefix}:g{generation}:{cache_key(*args, **kwargs)}"
+
+
+def _jsonable(result: Any) -> Any:
+    """Converte o resultado (inclusive listas de modelos Pydantic) para tipos JSON."""
+    if isinstance(result, list) and len(result) > 0:
+        if hasattr(result[0], 'model_dump'):
+            return [item.model_dump() for item in result]
+    elif hasattr(result, 'model_dump'):
+        return result.model_dump()
+    return result
+
+
+def encode_response(result: Any) -> bytes:
+    """
+    Serializa o resultado no corpo JSON da resposta HTTP.
+    
+    Args:
+        result: Modelo Pydantic, lista de modelos ou tipos JSON
+    
+    Returns:
+        JSON em bytes (orjson; datas em ISO 8601, como o FastAPI)
+    """
+    return orjson.dumps(_jsonable(result))
+
+
+def _encode_entry(result: Any, ttl: float, delta: float) -> str:
+    """
+    Serializa a entrada do Redis: valor, expiração lógica e custo do cálculo.
+    
+    O custo (delta, em segundos) alimenta a expiração antecipada probabilística.
+    Corpos de resposta (bytes) são gravados como estão, após um cabeçalho de
+    uma linha, para que o acerto não precise fazer parse do JSON.
+    """
+    if isinstance(result, bytes):
+        return f"{RAW_ENTRY_MARKER}{time.time() + ttl}:{round(delta, 6)}\n{result.decode()}"
+    return json.dumps(
+        {"value": _jsonable(result), "expires_at": time.time() + ttl, "delta": round(delta, 6)},
+        default=str
+    )
+
+
+def _decode_entry(raw: str) -> tuple[Any, float, float]:
+    """Lê uma entrada do Redis; entradas sem envelope nunca expiram logicamente."""
+    if raw.startswith(RAW_ENTRY_MARKER):
+        header, body = raw.split("\n", 1)
+        expires_at, delta = header[len(RAW_ENTRY_MARKER):].split(":")
+        return body.encode(), float(expires_at), float(delta)
+    entry = json.loads(raw)
+    if isinstance(entry, dict) and entry.keys() == {"value", "expires_at", "delta"}:
+        return entry["value"], entry["expires_at"], entry["delta"]
+    return entry, math.inf, 0.0
+
+
+def _needs_refresh(expires_at: float, delta: float, beta: Optional[float] = None) -> bool:
+    """
+    Se a entrada deve ser recalculada agora.
+    
+    Expirada logicamente: sempre. Antes disso, expiração antecipada
+    probabilística (XFetch): a chance de recalcular cresce à medida que a
+    expiração se aproxima, proporcional ao custo do cálculo, espalhando os
+    recálculos no tempo em vez de concentrá-los no instante da expiração.
+    """
+    beta = EARLY_EXPIRATION_BETA if beta is None else beta
+    now = time.time()
+    if now >= expires_at:
+        return True
+    if beta <= 0 or delta <= 0:
+        return False
+    return now - delta * beta * math.log(1.0 - random.random()) >= expires_at
+
+
+def _lock_key(key: str) -> str:
+    return f"{RECOMPUTE_LOCK_PREFIX}{key}"
+
+
+def _release_lock(client: redis.Redis, key: str, token: str):
+    if client.get(_lock_key(key)) == token:
+        client.delete(_lock_key(key))
+
+
+def _recompute(client: redis.Redis, key: str, compute, ttl: int, stale_ttl: int, stale: Any) -> tuple[Any, Optional[int]]:
+    """
+    Recalcula um valor com lock distribuído (um recálculo por chave entre workers).
+    
+    Sem o lock: devolve o valor antigo, se houver, ou espera o valor calculado
+    pelo outro worker (até RECOMPUTE_WAIT_SECONDS) antes de calcular por conta
+    própria.
+    
+    Returns:
+        Tupla (valor, tamanho da entrada gravada ou None se o valor não é novo)
+    """
+    token = uuid.uuid4().hex
+    if not client.set(_lock_key(key), token, nx=True, ex=RECOMPUTE_LOCK_TTL):
+        if stale is not MISSING:
+            return stale, None
+        deadline = time.monotonic() + RECOMPUTE_WAIT_SECONDS
+        while time.monotonic() < deadline:
+            time.sleep(RECOMPUTE_POLL_SECONDS)
+            raw = client.get(key)
+            if raw is not None:
+                return _decode_entry(raw)[0], len(raw)
+        token = None
+    
+    try:
+        start = time.perf_counter()
+        result = compute()
+        encoded = _encode_entry(result, ttl, time.perf_counter() - start)
+        client.set(key, encoded, ex=ttl + stale_ttl)
+        return result, len(encoded)
+    finally:
+        if token is not None:
+            _release_lock(client, key, token)
+
+
+async def _recompute_async(client: redis_asyncio.Redis, key: str, compute, ttl: int, stale_ttl: int, stale: Any) -> tuple[Any, Optional[int]]:
+    """Versão assíncrona de _recompute."""
+    token = uuid.uuid4().hex
+    if not await client.set(_lock_key(key), token, nx=True, ex=RECOMPUTE_LOCK_TTL):
+        if stale is not MISSING:
+            return stale, None
+        deadline = time.monotonic() + RECOMPUTE_WAIT_SECONDS
+        while time.monotonic() < deadline:
+            await asyncio.sleep(RECOMPUTE_POLL_SECONDS)
+            raw = await client.get(key)
+            if raw is not None:
+                return _decode_entry(raw)[0], len(raw)
+        token = None
+    
+    try:
+        start = time.perf_counter()
+        result = await compute()
+        encoded = _encode_entry(result, ttl, time.perf_counter() - start)
+        await client.set(key, encoded, ex=ttl + stale_ttl)
+        return result, len(encoded)
+    finally:
+        if token is not None and await client.get(_lock_key(key)) == token:
+            await client.delete(_lock_key(key))
+
+
+def _detached_args(args: tuple, skip_args: int, session_type: type) -> tuple[tuple, list]:
+    """
+    Troca as sessões de banco dos argumentos fora da chave por sessões novas
+    no mesmo engine: o recálculo em background termina depois que a
+    requisição já fechou a sua sessão.
+    
+    Returns:
+        Tupla (argumentos, sessões abertas que o chamador deve fechar)
+    """
+    detached, sessions = list(args), []
+    for index, arg in enumerate(args[:skip_args]):
+        if isinstance(arg, session_type) and arg.bind is not None:
+            detached[index] = type(arg)(arg.bind)
+            sessions.append(detached[index])
+    return tuple(detached), sessions
+
+
+def wait_background_refreshes(timeout: Optional[float] = None):
+    """Espera os recálculos em background de @cached em andamento."""
+    wait(list(_background_refreshes), timeout=timeout)
+
+
+async def wait_background_refreshes_async(timeout: Optional[float] = None):
+    """Espera os recálculos em background de @async_cached em andamento."""
+    if _background_tasks:
+        await asyncio.wait(list(_background_tasks), timeout=timeout)
+
+
+def cached(prefix: str, ttl: int = 300, skip_args: int = 0, stale_ttl: int = 0, response: bool = False):
     """
     Decorator para cachear resultado de funções
     
+    Consulta primeiro o L1 (memória do processo), depois o Redis (L2). O
+    resultado é guardado nos dois níveis; no L1 fica o objeto já
+    deserializado, sem round trip nem json.loads nos acertos.
+    
+    Proteção contra stampede: numa falha, apenas uma chamada por chave
+    recalcula (single-flight no processo + lock no Redis entre workers); as
+    demais esperam o resultado. Havendo valor antigo, nenhuma chamada espera:
+    o valor é devolvido na hora e o recálculo roda em background (uma thread
+    de _refresh_executor por chave, com sessões de banco próprias, ver
+    _detached_args). Com stale_ttl > 0, o valor expirado (ou o da geração
+    anterior, após uma invalidação) continua sendo servido por até stale_ttl
+    segundos enquanto é recalculado. Perto da expiração, o recálculo pode ser
+    antecipado de forma probabilística (XFetch), também em background.
+    
+    Com response=True a função decorada passa a devolver o corpo JSON da
+    resposta em bytes (encode_response), que é o que fica nos dois níveis:
+    o acerto não faz json.loads, validação nem nova serialização.
+    
     Args:
         prefix: Prefixo da chave no Redis (ex: "kpi:avg_price")
         ttl: Tempo de vida do cache em segundos (padrão: 5 minutos)
         skip_args: Número de argumentos a ignorar na chave (ex: session)
+        stale_ttl: Janela (s) em que o valor antigo pode ser servido
+            durante o recálculo (0 desativa)
+        response: Cachear o corpo JSON pré-serializado em vez do objeto
     
     Exemplo:
         @cached("kpi:avg_price", ttl=600, skip_args=1)  # Ignora primeiro arg (session)
@@ -56,61 +401,448 @@ def cached(prefix: str, ttl: int = 300, skip_args: int = 0):
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
+            # Remove os primeiros argumentos (geralmente session)
+            cache_args = args[skip_args:]
+            
+            def compute():
+                result = func(*args, **kwargs)
+                return encode_response(result) if response else result
+            
+            # L1: memória do processo
+            local_key = f"{prefix}:{cache_key(*cache_args, **kwargs)}"
+            value = local_cache.get(prefix, local_key)
+            if value is not MISSING:
+                return value
+            epoch = local_cache.epoch
+            
             try:
-                # Remove os primeiros argumentos (geralmente session)
-                cache_args = args[skip_args:]
-                
-                # Gera chave única
-                key = f"{prefix}:{cache_key(*cache_args, **kwargs)}"
+                # Gera chave única na geração atual do namespace
+                client = get_redis_client()
+                generation = get_generation(client, cache_namespace(prefix))
+                key = versioned_key(prefix, generation, *cache_args, **kwargs)
                 
                 # Tenta buscar do cache
-                client = get_redis_client()
-                cached_value = client.get(key)
+                stale = MISSING
+                raw = client.get(key)
+                if raw is not None:
+                    value, expires_at, delta = _decode_entry(raw)
+                    if not _needs_refresh(expires_at, delta):
+                        # Cache hit - retorna valor deserializado
+                        local_cache.record_l2(prefix, hit=True)
+                        local_cache.set(prefix, local_key, value, len(raw), expires_at - time.time(), epoch)
+                        return value
+                    stale = value
+                elif stale_ttl:
+                    # Após uma invalidação, o valor da geração anterior serve como antigo
+                    previous = client.get(versioned_key(prefix, int(generation) - 1, *cache_args, **kwargs))
+                    if previous is not None:
+                        stale = _decode_entry(previous)[0]
                 
-                if cached_value is not None:
-                    # Cache hit - retorna valor deserializado
-                    return json.loads(cached_value)
+                # Cache miss - uma única chamada recalcula
+                local_cache.record_l2(prefix, hit=False)
+                if stale is not MISSING:
+                    # Serve o valor antigo e recalcula em background
+                    def refresh():
+                        background_args, sessions = _detached_args(args, skip_args, OrmSession)
+                        
+                        def compute_detached():
+                            result = func(*background_args, **kwargs)
+                            return encode_response(result) if response else result
+                        
+                        try:
+                            value, size = _recompute(client, key, compute_detached, ttl, stale_ttl, stale)
+                            if size is not None:
+                                local_cache.set(prefix, local_key, value, size, ttl, epoch)
+                        finally:
+                            for session in sessions:
+                                session.close()
+                    
+                    future = _single_flight.start(key, refresh, _refresh_executor)
+                    if future is not None:
+                        _background_refreshes.add(future)
+                        future.add_done_callback(_background_refreshes.discard)
+                    _served_stale.set(True)
+                    return stale
+                value, size = _single_flight.do(
+                    key,
+                    lambda: _recompute(client, key, compute, ttl, stale_ttl, MISSING),
+                    timeout=RECOMPUTE_WAIT_SECONDS
+                )
+                if size is not None:
+                    local_cache.set(prefix, local_key, value, size, ttl, epoch)
+                return value
                 
-                # Cache miss - executa função
-                result = func(*args, **kwargs)
+            except (redis.RedisError, redis.ConnectionError) as e:
+                # Se Redis falhar, executa função normalmente (sem L1: as
+                # invalidações entre workers dependem do Redis)
+                print(f"Redis error: {e}")
+                return compute()
+        
+        return wrapper
+    return decorator
+
+
+def async_cached(prefix: str, ttl: int = 300, skip_args: int = 0, stale_ttl: int = 0, response: bool = False):
+    """
+    Versão de @cached para funções assíncronas, com o cliente redis.asyncio.
+    
+    Usa o mesmo formato de chave, o mesmo L1 e as mesmas proteções contra
+    stampede de @cached, então os modos sync e async compartilham as
+    entradas do cache. O recálculo de um valor antigo roda em uma task do
+    event loop.
+    
+    Args:
+        prefix: Prefixo da chave no Redis
+        ttl: Tempo de vida do cache em segundos
+        skip_args: Número de argumentos a ignorar na chave (ex: session)
+        stale_ttl: Janela (s) em que o valor antigo pode ser servido
+            durante o recálculo (0 desativa)
+        response: Cachear o corpo JSON pré-serializado em vez do objeto
+    """
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            cache_args = args[skip_args:]
+            
+            async def compute():
+                result = await func(*args, **kwargs)
+                return encode_response(result) if response else result
+            
+            local_key = f"{prefix}:{cache_key(*cache_args, **kwargs)}"
+            value = local_cache.get(prefix, local_key)
+            if value is not MISSING:
+                return value
+            epoch = local_cache.epoch
+            
+            try:
+                client = get_async_redis_client()
+                generation = await get_generation_async(client, cache_namespace(prefix))
+                key = versioned_key(prefix, generation, *cache_args, **kwargs)
                 
-                # Converte para dict se for lista de Pydantic models
-                serializable_result = result
-                if isinstance(result, list) and len(result) > 0:
-                    if hasattr(result[0], 'model_dump'):
-                        serializable_result = [item.model_dump() for item in result]
-                elif hasattr(result, 'model_dump'):
-                    serializable_result = result.model_dump()
+                stale = MISSING
+                raw = await client.get(key)
+                if raw is not None:
+                    value, expires_at, delta = _decode_entry(raw)
+                    if not _needs_refresh(expires_at, delta):
+                        local_cache.record_l2(prefix, hit=True)
+                        local_cache.set(prefix, local_key, value, len(raw), expires_at - time.time(), epoch)
+                        return value
+                    stale = value
+                elif stale_ttl:
+                    previous = await client.get(versioned_key(prefix, int(generation) - 1, *cache_args, **kwargs))
+                    if previous is not None:
+                        stale = _decode_entry(previous)[0]
                 
-                # Salva no cache
-                client.setex(
+                local_cache.record_l2(prefix, hit=False)
+                if stale is not MISSING:
+                    async def refresh():
+                        background_args, sessions = _detached_args(args, skip_args, AsyncSession)
+                        
+                        async def compute_detached():
+                            result = await func(*background_args, **kwargs)
+                            return encode_response(result) if response else result
+                        
+                        try:
+                            value, size = await _recompute_async(client, key, compute_detached, ttl, stale_ttl, stale)
+                            if size is not None:
+                                local_cache.set(prefix, local_key, value, size, ttl, epoch)
+                        finally:
+                            for session in sessions:
+                                await session.close()
+                    
+                    task = _async_single_flight.start(key, refresh)
+                    if task is not None:
+                        _background_tasks.add(task)
+                        task.add_done_callback(_background_tasks.discard)
+                    _served_stale.set(True)
+                    return stale
+                value, size = await _async_single_flight.do(
                     key,
-                    ttl,
-                    json.dumps(serializable_result, default=str)
+                    lambda: _recompute_async(client, key, compute, ttl, stale_ttl, MISSING),
+                    timeout=RECOMPUTE_WAIT_SECONDS
                 )
-                
-                return result
+                if size is not None:
+                    local_cache.set(prefix, local_key, value, size, ttl, epoch)
+                return value
                 
             except (redis.RedisError, redis.ConnectionError) as e:
                 # Se Redis falhar, executa função normalmente
                 print(f"Redis error: {e}")
-                return func(*args, **kwargs)
+                return await compute()
         
         return wrapper
     return decorator
 
 
-def invalidate_cache(pattern: str):
+def cached_response(func, prefix: str, ttl: int = 300, skip_args: int = 0, stale_ttl: int = 0):
     """
-    Invalida chaves de cache que correspondem ao padrão
+    Variante de resposta (corpo JSON em bytes) de uma função de serviço.
+    
+    Aplica @cached(..., response=True), ou @async_cached para corrotinas, à
+    função original: se ela já for cacheada, o decorator existente é
+    removido (inspect.unwrap) para não cachear o mesmo resultado duas vezes.
     
     Args:
-        pattern: Padrão de chave (ex: "kpi:*" invalida todos os KPIs)
+        func: Função de serviço que devolve os modelos da resposta
+        prefix: Prefixo da chave no Redis (distinto do da função original)
+        ttl: Tempo de vida do cache em segundos
+        skip_args: Número de argumentos a ignorar na chave (ex: session)
+        stale_ttl: Janela (s) em que o valor antigo pode ser servido
+    
+    Exemplo:
+        get_avg_price_by_fuel_json = cached_response(
+            get_avg_price_by_fuel, "kpi:avg_price_json", ttl=600, skip_args=1
+        )
     """
+    func = inspect.unwrap(func)
+    decorator = async_cached if inspect.iscoroutinefunction(func) else cached
+    return decorator(prefix, ttl=ttl, skip_args=skip_args, stale_ttl=stale_ttl, response=True)(func)
+
+
+def served_stale() -> bool:
+    """
+    Se alguma chamada cacheada no contexto atual (requisição) devolveu um
+    valor antigo, anterior à versão atual dos dados (stale-while-revalidate).
+    """
+    return _served_stale.get()
+
+
+def _parse_data_version(generation: str, modified_at: Optional[str]) -> tuple[str, Optional[float]]:
+    return generation, float(modified_at) if modified_at is not None else None
+
+
+def get_data_version() -> Optional[tuple[str, Optional[float]]]:
+    """
+    Versão atual dos dados e instante da última alteração.
+    
+    Fica no L1 até a próxima ingestão (invalidada pelo pub/sub como as
+    demais entradas), então a leitura normalmente não vai ao Redis.
+    
+    Returns:
+        Tupla (versão, timestamp da última alteração ou None), ou None se o
+        Redis estiver indisponível
+    """
+    value = local_cache.get(DATA_VERSION_KEY, DATA_VERSION_KEY)
+    if value is not MISSING:
+        return value
+    epoch = local_cache.epoch
+    try:
+        client = get_redis_client()
+        generation = get_generation(client, DATA_VERSION_NAMESPACE)
+        value = _parse_data_version(generation, client.get(DATA_MODIFIED_KEY))
+    except (redis.RedisError, redis.ConnectionError) as e:
+        print(f"Redis error: {e}")
+        return None
+    local_cache.set(DATA_VERSION_KEY, DATA_VERSION_KEY, value, 64, epoch=epoch)
+    return value
+
+
+async def get_data_version_async() -> Optional[tuple[str, Optional[float]]]:
+    """Versão assíncrona de get_data_version."""
+    value = local_cache.get(DATA_VERSION_KEY, DATA_VERSION_KEY)
+    if value is not MISSING:
+        return value
+    epoch = local_cache.epoch
+    try:
+        client = get_async_redis_client()
+        generation = await get_generation_async(client, DATA_VERSION_NAMESPACE)
+        value = _parse_data_version(generation, await client.get(DATA_MODIFIED_KEY))
+    except (redis.RedisError, redis.ConnectionError) as e:
+        print(f"Redis error: {e}")
+        return None
+    local_cache.set(DATA_VERSION_KEY, DATA_VERSION_KEY, value, 64, epoch=epoch)
+    return value
+
+
+def bump_data_version():
+    """
+    Incrementa a versão dos dados e registra o instante da alteração.
+    
+    A versão só cresce: um INCR na geração do namespace "data" (semeada pelo
+    relógio se a chave se perder, como as demais gerações).
+    """
+    pattern = f"{DATA_VERSION_NAMESPACE}:*"
+    invalidate_local(pattern)
     try:
         client = get_redis_client()
-        keys = client.keys(pattern)
-        if keys:
-            client.delete(*keys)
+        client.set(DATA_MODIFIED_KEY, time.time())
+        client.incr(_generation_key(DATA_VERSION_NAMESPACE))
+        publish_invalidation(client, pattern)
     except (redis.RedisError, redis.ConnectionError) as e:
         print(f"Redis error on invalidation: {e}")
+
+
+def invalidate_local(pattern: str) -> int:
+    """Remove do L1 deste processo as entradas que correspondem ao padrão."""
+    return local_cache.invalidate(pattern)
+
+
+def publish_invalidation(client: redis.Redis, pattern: str):
+    """Avisa os demais workers para removerem o padrão dos seus L1."""
+    client.publish(INVALIDATION_CHANNEL, pattern)
+
+
+class InvalidationListener:
+    """
+    Thread que recebe as mensagens de invalidação do pub/sub e limpa o L1.
+    
+    Ao (re)conectar, o L1 inteiro é descartado: mensagens publicadas
+    enquanto a inscrição estava fora do ar foram perdidas.
+    """
+    
+    def __init__(self, cache: LocalCache = local_cache, reconnect_seconds: float = 5.0):
+        self.cache = cache
+        self.reconnect_seconds = reconnect_seconds
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    def start(self):
+        """Inicia a thread (daemon) de escuta."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="cache-invalidation", daemon=True)
+        self._thread.start()
+    
+    def stop(self, timeout: float = 2.0):
+        """Interrompe a escuta."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+    
+    def _run(self):
+        failing = False
+        while not self._stop.is_set():
+            pubsub = None
+            try:
+                pubsub = get_redis_client().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                self.cache.invalidate("*")
+                failing = False
+                while not self._stop.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message["type"] == "message":
+                        self.cache.invalidate(message["data"])
+            except (redis.RedisError, redis.ConnectionError) as e:
+                if not failing:
+                    logger.warning(f"Pub/sub de invalidação indisponível: {e}")
+                    failing = True
+                self.cache.invalidate("*")
+                self._stop.wait(self.reconnect_seconds)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except (redis.RedisError, redis.ConnectionError):
+                        pass
+
+
+def scan_keys(client: redis.Redis, pattern: str = "*") -> Iterator[str]:
+    """
+    Itera as chaves que correspondem ao padrão com SCAN (não bloqueia o Redis).
+    
+    Args:
+        client: Cliente Redis
+        pattern: Padrão de chave (ex: "kpi:*")
+    """
+    return client.scan_iter(match=pattern, count=SCAN_COUNT)
+
+
+def invalidate_cache(pattern: str) -> int:
+    """
+    Remove chaves de cache que correspondem ao padrão, via SCAN + UNLINK.
+    
+    Uso administrativo (/cache/clear). A invalidação na ingestão usa
+    invalidate_namespace, que é O(1).
+    
+    Args:
+        pattern: Padrão de chave (ex: "kpi:*" remove todos os KPIs)
+    
+    Returns:
+        Quantidade de chaves removidas
+    """
+    removed = 0
+    invalidate_local(pattern)
+    try:
+        client = get_redis_client()
+        publish_invalidation(client, pattern)
+        batch = []
+        for key in scan_keys(client, pattern):
+            if key.startswith(PROTECTED_KEY_PREFIXES):
+                continue
+            batch.append(key)
+            if len(batch) >= SCAN_COUNT:
+                removed += client.unlink(*batch)
+                batch = []
+        if batch:
+            removed += client.unlink(*batch)
+    except (redis.RedisError, redis.ConnectionError) as e:
+        print(f"Redis error on invalidation: {e}")
+    return removed
+
+
+def invalidate_namespace(namespace: str):
+    """
+    Invalida todas as entradas de um namespace com um único INCR.
+    
+    Args:
+        namespace: Namespace de invalidação (ex: "kpi")
+    """
+    pattern = f"{namespace}:*"
+    invalidate_local(pattern)
+    try:
+        client = get_redis_client()
+        client.incr(_generation_key(namespace))
+        publish_invalidation(client, pattern)
+    except (redis.RedisError, redis.ConnectionError) as e:
+        print(f"Redis error on invalidation: {e}")
+
+
+def invalidate_entries(prefix: str, entries: Iterable[tuple]) -> int:
+    """
+    Invalida entradas específicas de um prefixo, sem afetar as demais do
+    namespace.
+    
+    Remove cada entrada do L1 deste processo e do Redis (na geração atual do
+    namespace) e avisa os demais workers, com uma mensagem de pub/sub por
+    entrada: para muitas entradas, invalidate_namespace é mais barato.
+    
+    Args:
+        prefix: Prefixo da função cacheada (ex: "driver:profile")
+        entries: Argumentos de cada entrada, como na chamada da função
+            (sem os argumentos ignorados por skip_args)
+    
+    Returns:
+        Quantidade de chaves removidas do Redis
+    """
+    entries = list(entries)
+    if not entries:
+        return 0
+    patterns = [glob.escape(f"{prefix}:{cache_key(*args)}") for args in entries]
+    for pattern in patterns:
+        invalidate_local(pattern)
+    try:
+        client = get_redis_client()
+        generation = get_generation(client, cache_namespace(prefix))
+        removed = client.unlink(*[versioned_key(prefix, generation, *args) for args in entries])
+        for pattern in patterns:
+            publish_invalidation(client, pattern)
+        return removed
+    except (redis.RedisError, redis.ConnectionError) as e:
+        print(f"Redis error on invalidation: {e}")
+        return 0
+
+
+# Namespaces dos caches derivados das coletas
+DATA_CACHE_NAMESPACES = ["kpi", "count", "collections"]
+
+
+def invalidate_data_caches():
+    """
+    Invalida os caches derivados das coletas (KPIs, contagens e páginas) e
+    incrementa a versão dos dados.
+    
+    Chamada uma vez após cada ingestão (registro, lote, carga ou flush da
+    fila): um INCR por namespace, independente do tamanho do cache.
+    """
+    for namespace in DATA_CACHE_NAMESPACES:
+        invalidate_namespace(namespace)
+    bump_data_version()
@@ -1,6 +1,11 @@
 from sqlmodel import create_engine, SQLModel, Session
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 import os
 import logging
+from typing import Optional
+from app.search import setup_search, register_search_engine
+from app.migrations import apply_migrations
+from app.anomalies import load_group_stats
 
 logger = logging.getLogger(__name__)
 
@@ -10,12 +15,53 @@ if not DATABASE_URL:
     logger.error("A variável de ambiente DATABASE_URL não foi definida!")
     raise ValueError("DATABASE_URL must be set.")
 
+# "sync" (handlers def + Session) ou "async" (handlers async + AsyncSession)
+API_MODE = os.getenv("API_MODE", "sync")
+
 # Cria o objeto Engine para conexão
 engine = create_engine(DATABASE_URL, echo=True)
+# f_unaccent (SQLite) em todas as conexões, inclusive as abertas pelas
+# migrações: os triggers da busca no fato a usam
+register_search_engine(engine)
+
+# Drivers assíncronos equivalentes aos drivers síncronos
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+async_engine: Optional[AsyncEngine] = None
+
+
+def async_database_url(url: str) -> str:
+    """Converte a URL síncrona para o driver assíncrono (asyncpg/aiosqlite)."""
+    scheme, _, rest = url.partition("://")
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}://{rest}"
+
+
+def get_async_engine() -> AsyncEngine:
+    """
+    Obtém o engine assíncrono (criado na primeira chamada).
+    
+    Usado apenas com API_MODE=async; requer asyncpg (PostgreSQL) ou
+    aiosqlite (SQLite).
+    """
+    global async_engine
+    if async_engine is None:
+        async_engine = create_async_engine(async_database_url(DATABASE_URL))
+        register_search_engine(async_engine.sync_engine)
+    return async_engine
 
 
 def create_db_and_tables():
-    """Cria as tabelas no DB se elas não existirem."""
+    """Cria as tabelas no DB se elas não existirem e aplica as migrações pendentes."""
     logger.info("Tentando criar tabelas no DB...")
     SQLModel.metadata.create_all(engine)
+    # Migrações antes da busca: a migração 8 troca a tabela de coletas pela
+    # view, e o setup_search cria os índices e triggers de busca no esquema estrela
+    apply_migrations(engine)
+    setup_search(engine)
+    # Estatísticas das anomalias fora das transações de ingestão
+    load_group_stats(engine)
     logger.info("Tabelas criadas ou já existentes.")
@@ -1,6 +1,7 @@
-from typing import Generator
+from typing import AsyncGenerator, Generator
 from sqlmodel import Session
-from app.database import engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.database import engine, get_async_engine
 
 
 def get_session() -> Generator[Session, None, None]:
@@ -18,3 +19,14 @@ def get_session() -> Generator[Session, None, None]:
     """
     with Session(engine) as session:
         yield session
+
+
+async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
+    """
+    Dependência do FastAPI para injetar sessão assíncrona (API_MODE=async).
+    
+    Yields:
+        AsyncSession: Sessão assíncrona do SQLModel
+    """
+    async with AsyncSession(get_async_engine(), expire_on_commit=False) as session:
+        yield session
@@ -0,0 +1,119 @@
+"""
+GET condicional (ETag / Last-Modified) a partir da versão dos dados.
+
+A versão (app.cache.get_data_version) só muda quando há ingestão. As rotas de
+leitura recebem a versão por dependência: se o cliente já tem a versão atual
+(If-None-Match / If-Modified-Since), a dependência responde 304 antes de o
+handler tocar no banco ou serializar qualquer coisa. Caso contrário, o handler
+devolve a resposta com os cabeçalhos de validação (conditional_headers).
+"""
+from dataclasses import dataclass
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import HTTPException, Request, status
+
+from app.cache import get_data_version, get_data_version_async, served_stale
+
+
+@dataclass(frozen=True)
+class DataVersion:
+    """Versão dos dados usada como validador HTTP"""
+    version: str
+    modified_at: Optional[float] = None
+
+    @property
+    def etag(self) -> str:
+        # Fraco: mesma versão dos dados, conteúdo semanticamente equivalente
+        return f'W/"{self.version}"'
+
+    @property
+    def last_modified(self) -> Optional[str]:
+        if self.modified_at is None:
+            return None
+        return formatdate(int(self.modified_at), usegmt=True)
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Comparação fraca do If-None-Match (lista de ETags ou "*")."""
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+def _not_modified_since(if_modified_since: str, modified_at: Optional[float]) -> bool:
+    if modified_at is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+    # Last-Modified tem resolução de segundos
+    return int(modified_at) <= since
+
+
+def is_not_modified(request: Request, version: DataVersion) -> bool:
+    """
+    Se a cópia do cliente ainda corresponde à versão atual dos dados.
+
+    If-None-Match tem precedência; If-Modified-Since só é avaliado na ausência
+    dele (RFC 9110).
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, version.etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        return _not_modified_since(if_modified_since, version.modified_at)
+    return False
+
+
+def conditional_headers(version: Optional[DataVersion]) -> dict[str, str]:
+    """
+    Cabeçalhos de validação da resposta.
+
+    Sem versão (Redis indisponível) ou quando o cache serviu um valor antigo
+    durante o recálculo, nenhum validador é enviado: o conteúdo pode não
+    corresponder à versão atual.
+
+    Args:
+        version: Versão lida pela dependência check_not_modified
+
+    Returns:
+        ETag, Last-Modified e Cache-Control (revalidar a cada uso)
+    """
+    if version is None or served_stale():
+        return {}
+    headers = {"ETag": version.etag, "Cache-Control": "no-cache"}
+    if version.last_modified is not None:
+        headers["Last-Modified"] = version.last_modified
+    return headers
+
+
+def _check(request: Request, data_version: Optional[tuple]) -> Optional[DataVersion]:
+    if data_version is None:
+        return None
+    version = DataVersion(*data_version)
+    if is_not_modified(request, version):
+        raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED, headers=conditional_headers(version))
+    return version
+
+
+def check_not_modified(request: Request) -> Optional[DataVersion]:
+    """
+    Dependência do FastAPI: responde 304 se o cliente já tem a versão atual.
+
+    Returns:
+        Versão atual dos dados (para conditional_headers) ou None se o Redis
+        estiver indisponível
+
+    Raises:
+        HTTPException: 304 Not Modified
+    """
+    return _check(request, get_data_version())
+
+
+async def check_not_modified_async(request: Request) -> Optional[DataVersion]:
+    """Versão assíncrona de check_not_modified (API_MODE=async)."""
+    return _check(request, await get_data_version_async())
@@ -0,0 +1,468 @@
+"""
+Fila durável para ingestão assíncrona (write-behind)
+
+No modo INGEST_MODE=async o POST /ingest apenas valida e enfileira a coleta;
+um worker iniciado no lifespan da aplicação esvazia a fila em lotes.
+
+Itens lidos por um worker que caiu (ou travou) sem confirmá-los voltam a ser
+entregues depois de INGEST_CLAIM_IDLE_SECONDS, para qualquer worker. Cada
+item conta as suas entregas; itens que o banco recusa vão para a fila de
+mortos (dead letter), sem travar os demais.
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Callable, Optional, Protocol
+import redis
+from app.cache import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+# Configuração da ingestão assíncrona
+INGEST_MODE = os.getenv("INGEST_MODE", "sync")  # "sync" ou "async"
+INGEST_QUEUE_BACKEND = os.getenv("INGEST_QUEUE_BACKEND", "redis")  # "redis" ou "sqlite"
+INGEST_QUEUE_SQLITE_PATH = os.getenv("INGEST_QUEUE_SQLITE_PATH", "ingest_queue.db")
+FLUSH_BATCH_SIZE = int(os.getenv("INGEST_FLUSH_BATCH_SIZE", "500"))
+FLUSH_INTERVAL_SECONDS = float(os.getenv("INGEST_FLUSH_INTERVAL_SECONDS", "0.5"))
+# Tempo sem confirmação após o qual um item lido é retomado por outro worker
+CLAIM_IDLE_SECONDS = float(os.getenv("INGEST_CLAIM_IDLE_SECONDS", "60"))
+
+# Intervalo entre consultas da fila SQLite enquanto espera itens novos
+SQLITE_POLL_SECONDS = 0.05
+# Entregas após as quais um item que continua falhando vai para a fila de mortos
+MAX_DELIVERIES = int(os.getenv("INGEST_MAX_DELIVERIES", "5"))
+
+REDIS_STREAM = "ingest:stream"
+REDIS_GROUP = "ingest-flushers"
+REDIS_DEAD_LETTER_STREAM = "ingest:dead"
+
+
+@dataclass
+class QueueEntry:
+    """Item lido da fila"""
+    entry_id: str
+    tracking_id: str
+    payload: dict
+    enqueued_at: float
+    # Quantas vezes o item já foi entregue a um worker (incluindo esta)
+    deliveries: int = 1
+
+
+class IngestQueue(Protocol):
+    """Interface comum das filas de ingestão"""
+
+    def enqueue(self, payload: dict) -> str: ...
+
+    def read_batch(self, max_items: int, block_seconds: float) -> list[QueueEntry]: ...
+
+    def ack(self, entries: list[QueueEntry]) -> None: ...
+
+    def release(self, entries: list[QueueEntry]) -> None: ...
+
+    def dead_letter(self, entries: list[QueueEntry], reason: str) -> None: ...
+
+    def depth(self) -> int: ...
+
+    def dead_letter_depth(self) -> int: ...
+
+    def oldest_enqueued_at(self) -> Optional[float]: ...
+
+
+class RedisStreamQueue:
+    """
+    Fila sobre Redis Streams com consumer group.
+
+    Itens lidos e não confirmados há mais de CLAIM_IDLE_SECONDS (worker caiu
+    no meio do flush; o nome do consumidor muda a cada processo) são
+    retomados com XAUTOCLAIM por qualquer worker. Itens recusados vão para o
+    stream ingest:dead.
+    """
+
+    def __init__(
+        self,
+        client: redis.Redis,
+        stream: str = REDIS_STREAM,
+        group: str = REDIS_GROUP,
+        dead_letter_stream: str = REDIS_DEAD_LETTER_STREAM,
+        claim_idle_seconds: float = CLAIM_IDLE_SECONDS
+    ):
+        self.client = client
+        self.stream = stream
+        self.group = group
+        self.dead_letter_stream = dead_letter_stream
+        self.claim_idle_seconds = claim_idle_seconds
+        self.consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self._recovering = False
+        self._group_ready = False
+        self._next_claim_at = 0.0
+
+    def _ensure_group(self):
+        if self._group_ready:
+            return
+        try:
+            self.client.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            # Grupo já existe
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._group_ready = True
+
+    def enqueue(self, payload: dict) -> str:
+        tracking_id = uuid.uuid4().hex
+        self.client.xadd(self.stream, {
+            "tracking_id": tracking_id,
+            "data": json.dumps(payload, default=str),
+            "enqueued_at": repr(time.time()),
+        })
+        return tracking_id
+
+    def read_batch(self, max_items: int, block_seconds: float) -> list[QueueEntry]:
+        self._ensure_group()
+        if self._recovering:
+            # Primeiro relê as entregas pendentes deste consumidor
+            response = self.client.xreadgroup(self.group, self.consumer, {self.stream: "0"}, count=max_items)
+            entries = self._with_deliveries(self._parse(response))
+            if entries:
+                return entries
+            self._recovering = False
+        entries = self._claim_stale(max_items)
+        if entries:
+            return entries
+        response = self.client.xreadgroup(
+            self.group, self.consumer, {self.stream: ">"},
+            count=max_items, block=max(int(block_seconds * 1000), 1)
+        )
+        return self._parse(response)
+
+    def _claim_stale(self, max_items: int) -> list[QueueEntry]:
+        """
+        Retoma itens de outros consumidores parados há mais de
+        claim_idle_seconds. A varredura roda no máximo a cada meio intervalo,
+        ou no ciclo seguinte se ainda havia itens a retomar.
+        """
+        now = time.monotonic()
+        if now < self._next_claim_at:
+            return []
+        _, messages, *_ = self.client.xautoclaim(
+            self.stream, self.group, self.consumer,
+            min_idle_time=int(self.claim_idle_seconds * 1000), start_id="0-0", count=max_items
+        )
+        entries = self._with_deliveries(self._parse([(self.stream, messages)]))
+        if len(messages) < max_items:
+            self._next_claim_at = now + self.claim_idle_seconds / 2
+        if entries:
+            logger.warning(f"Fila de ingestão: {len(entries)} itens retomados de workers parados")
+        return entries
+
+    def _with_deliveries(self, entries: list[QueueEntry]) -> list[QueueEntry]:
+        """Preenche a contagem de entregas de itens relidos (XPENDING)"""
+        if not entries:
+            return entries
+        pending = self.client.xpending_range(
+            self.stream, self.group, min=entries[0].entry_id, max=entries[-1].entry_id,
+            count=len(entries), consumername=self.consumer
+        )
+        deliveries = {item["message_id"]: item["times_delivered"] for item in pending}
+        for entry in entries:
+            entry.deliveries = deliveries.get(entry.entry_id, entry.deliveries)
+        return entries
+
+    @staticmethod
+    def _parse(response) -> list[QueueEntry]:
+        entries = []
+        for _, messages in response or []:
+            for entry_id, fields in messages:
+                if not fields:
+                    continue
+                entries.append(QueueEntry(
+                    entry_id=entry_id,
+                    tracking_id=fields["tracking_id"],
+                    payload=json.loads(fields["data"]),
+                    enqueued_at=float(fields["enqueued_at"]),
+                ))
+        return entries
+
+    def ack(self, entries: list[QueueEntry]) -> None:
+        if not entries:
+            return
+        ids = [entry.entry_id for entry in entries]
+        pipe = self.client.pipeline()
+        pipe.xack(self.stream, self.group, *ids)
+        pipe.xdel(self.stream, *ids)
+        pipe.execute()
+
+    def release(self, entries: list[QueueEntry]) -> None:
+        """Após uma falha no flush, os itens pendentes são relidos no próximo ciclo"""
+        self._recovering = True
+
+    def dead_letter(self, entries: list[QueueEntry], reason: str) -> None:
+        """Move os itens para o stream de mortos, com o motivo e as entregas"""
+        if not entries:
+            return
+        ids = [entry.entry_id for entry in entries]
+        pipe = self.client.pipeline()
+        for entry in entries:
+            pipe.xadd(self.dead_letter_stream, {
+                "tracking_id": entry.tracking_id,
+                "data": json.dumps(entry.payload, default=str),
+                "enqueued_at": repr(entry.enqueued_at),
+                "deliveries": entry.deliveries,
+                "reason": reason,
+                "failed_at": repr(time.time()),
+            })
+        pipe.xack(self.stream, self.group, *ids)
+        pipe.xdel(self.stream, *ids)
+        pipe.execute()
+
+    def depth(self) -> int:
+        return self.client.xlen(self.stream)
+
+    def dead_letter_depth(self) -> int:
+        return self.client.xlen(self.dead_letter_stream)
+
+    def oldest_enqueued_at(self) -> Optional[float]:
+        oldest = self.client.xrange(self.stream, count=1)
+        if not oldest:
+            return None
+        return float(oldest[0][1]["enqueued_at"])
+
+
+class SQLiteQueue:
+    """
+    Fila durável em um arquivo SQLite.
+
+    Substituto do Redis Stream para testes e ambientes sem Redis. Um item
+    lido fica reservado (claimed_at) por CLAIM_IDLE_SECONDS; sem confirmação
+    nesse prazo volta a ser entregue. Itens recusados vão para a tabela
+    ingest_dead_letter.
+    """
+
+    def __init__(self, path: str = INGEST_QUEUE_SQLITE_PATH, claim_idle_seconds: float = CLAIM_IDLE_SECONDS):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ingest_queue ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "tracking_id TEXT NOT NULL, "
+            "payload TEXT NOT NULL, "
+            "enqueued_at REAL NOT NULL, "
+            "claimed_by TEXT, "
+            "claimed_at REAL, "
+            "deliveries INTEGER NOT NULL DEFAULT 0)"
+        )
+        # Arquivos de fila criados antes da contagem de entregas
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(ingest_queue)")}
+        if "claimed_at" not in columns:
+            self._conn.execute("ALTER TABLE ingest_queue ADD COLUMN claimed_at REAL")
+            self._conn.execute("ALTER TABLE ingest_queue ADD COLUMN deliveries INTEGER NOT NULL DEFAULT 0")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ingest_dead_letter ("
+            "id INTEGER PRIMARY KEY, "
+            "tracking_id TEXT NOT NULL, "
+            "payload TEXT NOT NULL, "
+            "enqueued_at REAL NOT NULL, "
+            "deliveries INTEGER NOT NULL, "
+            "reason TEXT NOT NULL, "
+            "failed_at REAL NOT NULL)"
+        )
+        self.consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self.claim_idle_seconds = claim_idle_seconds
+
+    def enqueue(self, payload: dict) -> str:
+        tracking_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO ingest_queue (tracking_id, payload, enqueued_at) VALUES (?, ?, ?)",
+                (tracking_id, json.dumps(payload, default=str), time.time())
+            )
+        return tracking_id
+
+    def read_batch(self, max_items: int, block_seconds: float) -> list[QueueEntry]:
+        # Sem notificação de novos itens: consulta a cada SQLITE_POLL_SECONDS
+        # até block_seconds, como o BLOCK do XREADGROUP
+        deadline = time.monotonic() + block_seconds
+        while True:
+            entries = self._claim(max_items)
+            remaining = deadline - time.monotonic()
+            if entries or remaining <= 0:
+                return entries
+            time.sleep(min(SQLITE_POLL_SECONDS, remaining))
+
+    def _claim(self, max_items: int) -> list[QueueEntry]:
+        now = time.time()
+        with self._lock:
+            # Livres ou reservados por um worker que não confirmou no prazo
+            rows = self._conn.execute(
+                "UPDATE ingest_queue SET claimed_by = ?, claimed_at = ?, deliveries = deliveries + 1 "
+                "WHERE id IN ("
+                "SELECT id FROM ingest_queue WHERE claimed_at IS NULL OR claimed_at < ? ORDER BY id LIMIT ?"
+                ") RETURNING id, tracking_id, payload, enqueued_at, deliveries",
+                (self.consumer, now, now - self.claim_idle_seconds, max_items)
+            ).fetchall()
+        rows.sort(key=lambda row: row[0])
+        return [
+            QueueEntry(
+                entry_id=str(row[0]), tracking_id=row[1], payload=json.loads(row[2]),
+                enqueued_at=row[3], deliveries=row[4]
+            )
+            for row in rows
+        ]
+
+    def ack(self, entries: list[QueueEntry]) -> None:
+        if not entries:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM ingest_queue WHERE id = ?",
+                [(int(entry.entry_id),) for entry in entries]
+            )
+
+    def release(self, entries: list[QueueEntry]) -> None:
+        """Devolve itens à fila após uma falha no flush"""
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE ingest_queue SET claimed_by = NULL, claimed_at = NULL WHERE id = ?",
+                [(int(entry.entry_id),) for entry in entries]
+            )
+
+    def dead_letter(self, entries: list[QueueEntry], reason: str) -> None:
+        """Move os itens para ingest_dead_letter, com o motivo e as entregas"""
+        if not entries:
+            return
+        ids = [(int(entry.entry_id),) for entry in entries]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT INTO ingest_dead_letter "
+                "SELECT id, tracking_id, payload, enqueued_at, deliveries, ?, ? FROM ingest_queue WHERE id = ?",
+                [(reason, time.time(), row_id) for (row_id,) in ids]
+            )
+            self._conn.executemany("DELETE FROM ingest_queue WHERE id = ?", ids)
+            self._conn.execute("COMMIT")
+
+    def depth(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM ingest_queue").fetchone()[0]
+
+    def dead_letter_depth(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM ingest_dead_letter").fetchone()[0]
+
+    def oldest_enqueued_at(self) -> Optional[float]:
+        with self._lock:
+            return self._conn.execute("SELECT MIN(enqueued_at) FROM ingest_queue").fetchone()[0]
+
+
+# Fila global (singleton)
+ingest_queue: Optional[IngestQueue] = None
+
+
+def get_ingest_queue() -> IngestQueue:
+    """
+    Obtém a fila de ingestão configurada (singleton pattern)
+    """
+    global ingest_queue
+    if ingest_queue is None:
+        if INGEST_QUEUE_BACKEND == "sqlite":
+            ingest_queue = SQLiteQueue(INGEST_QUEUE_SQLITE_PATH)
+        else:
+            ingest_queue = RedisStreamQueue(get_redis_client())
+    return ingest_queue
+
+
+# Métricas do flusher em memória
+flush_metrics = {
+    "batches": 0,
+    "flushed_records": 0,
+    "errors": 0,
+    "last_flush_latency_ms": 0.0,
+    "total_flush_time_ms": 0.0,
+    "last_flush_at": None,
+}
+
+
+def record_flush(count: int, latency_seconds: float):
+    """Registra a execução de um lote do flusher"""
+    latency_ms = latency_seconds * 1000
+    flush_metrics["batches"] += 1
+    flush_metrics["flushed_records"] += count
+    flush_metrics["last_flush_latency_ms"] = round(latency_ms, 2)
+    flush_metrics["total_flush_time_ms"] += latency_ms
+    flush_metrics["last_flush_at"] = time.time()
+
+
+def record_flush_error():
+    """Registra uma falha do flusher"""
+    flush_metrics["errors"] += 1
+
+
+def get_queue_metrics(queue: Optional[IngestQueue] = None) -> dict:
+    """
+    Retorna profundidade da fila, atraso (lag) e latência do flusher
+    """
+    queue = queue or get_ingest_queue()
+    oldest = queue.oldest_enqueued_at()
+    batches = flush_metrics["batches"]
+    return {
+        "mode": INGEST_MODE,
+        "backend": type(queue).__name__,
+        "depth": queue.depth(),
+        "dead_letter": queue.dead_letter_depth(),
+        "lag_seconds": round(time.time() - oldest, 3) if oldest is not None else 0.0,
+        "batches": batches,
+        "flushed_records": flush_metrics["flushed_records"],
+        "errors": flush_metrics["errors"],
+        "last_flush_latency_ms": flush_metrics["last_flush_latency_ms"],
+        "avg_flush_latency_ms": round(flush_metrics["total_flush_time_ms"] / batches, 2) if batches else 0.0,
+    }
+
+
+class IngestFlusher:
+    """
+    Worker em background que esvazia a fila em lotes.
+
+    Cada ciclo grava até FLUSH_BATCH_SIZE itens; quando a fila está vazia
+    espera FLUSH_INTERVAL_SECONDS, limitando o atraso por tempo e o lote
+    por tamanho.
+    """
+
+    def __init__(self, flush: Callable[[], int], interval_seconds: float = FLUSH_INTERVAL_SECONDS):
+        self.flush = flush
+        self.interval_seconds = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def start(self):
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+        logger.info("Flusher da fila de ingestão iniciado")
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                flushed = await asyncio.to_thread(self.flush)
+            except Exception as e:
+                record_flush_error()
+                logger.error(f"Erro no flusher da fila de ingestão: {e}")
+                flushed = 0
+            if flushed == 0:
+                await asyncio.sleep(self.interval_seconds)
+
+    async def stop(self):
+        """Interrompe o loop e grava o que restou na fila"""
+        self._stopping = True
+        if self._task is not None:
+            await self._task
+        try:
+            while await asyncio.to_thread(self.flush):
+                pass
+        except Exception as e:
+            logger.error(f"Itens mantidos na fila ao encerrar o flusher: {e}")
+        logger.info("Flusher da fila de ingestão encerrado")
@@ -0,0 +1,317 @@
+"""
+Rankings (top N) de motoristas, postos e veículos
+
+Cada ranking é um conjunto ordenado por dia de coleta (Redis sorted set),
+alimentado após o commit de cada ingestão: ZINCRBY para totais (gasto,
+volume) e ZADD GT para máximos (maior preço), O(log n) por membro. As janelas
+(hoje, 7 e 30 dias) juntam os conjuntos dos dias na leitura (ZUNIONSTORE com
+SUM ou MAX); a união fica pronta por LEADERBOARD_WINDOW_CACHE_SECONDS. Os
+conjuntos diários expiram depois da maior janela.
+
+Com LEADERBOARD_BACKEND=memory os conjuntos ficam na memória do processo e o
+top N sai de um heap (testes e instalações sem Redis). Se o Redis falhar, a
+ingestão segue e os rankings ficam defasados até o rebuild
+(python manage.py rebuild-leaderboards).
+"""
+import hashlib
+import heapq
+import logging
+import math
+import operator
+import os
+import threading
+import time
+from dataclasses import dataclass
+from functools import reduce
+from datetime import date, datetime, timedelta
+from typing import Iterable, Mapping, Optional, Protocol
+import redis
+from sqlmodel import Session, select, func
+from app.cache import get_redis_client, scan_keys
+from app.models import FuelCollection
+from app.services.summary_service import bucket_expression
+
+logger = logging.getLogger(__name__)
+
+LEADERBOARD_BACKEND = os.getenv("LEADERBOARD_BACKEND", "redis")  # "redis" ou "memory"
+WINDOW_CACHE_SECONDS = max(1, int(os.getenv("LEADERBOARD_WINDOW_CACHE_SECONDS", "10")))
+
+KEY_PREFIX = "leaderboard:"
+
+# Janelas de leitura: quantidade de dias (incluindo hoje)
+WINDOWS = {"today": 1, "7d": 7, "30d": 30}
+RETENTION_DAYS = max(WINDOWS.values())
+
+
+@dataclass(frozen=True)
+class Board:
+    """
+    Um ranking: o membro (coluna da coleta), o valor de cada coleta (produto
+    das colunas) e como os valores se combinam ("sum" ou "max").
+    """
+    name: str
+    member: str
+    columns: tuple[str, ...]
+    aggregate: str
+    per_fuel: bool = False
+
+    def score(self, row: Mapping) -> float:
+        return math.prod(row[column] for column in self.columns)
+
+    def key(self, day: date, fuel_type: Optional[str] = None) -> str:
+        fuel = f"{fuel_type}:" if self.per_fuel else ""
+        return f"{KEY_PREFIX}{self.name}:{fuel}{day:%Y-%m-%d}"
+
+
+BOARDS = {
+    board.name: board
+    for board in [
+        Board("drivers-spend", "driver_cpf", ("sale_price", "volume_sold"), "sum"),
+        Board("stations-volume", "store_id", ("volume_sold",), "sum"),
+        Board("stations-price", "store_id", ("sale_price",), "max", per_fuel=True),
+        Board("vehicles-volume", "vehicle_plate", ("volume_sold",), "sum"),
+    ]
+}
+
+
+class LeaderboardStore(Protocol):
+    """Interface comum dos conjuntos ordenados dos rankings"""
+
+    def apply(self, aggregate: str, scores: dict[str, dict[str, float]], expire_at: dict[str, int]) -> None: ...
+
+    def top(self, keys: list[str], aggregate: str, limit: int) -> list[tuple[str, float]]: ...
+
+    def clear(self) -> None: ...
+
+
+class RedisLeaderboardStore:
+    """Conjuntos ordenados no Redis; uma ida ao servidor por lote (pipeline)"""
+
+    def __init__(self, client: redis.Redis):
+        self.client = client
+
+    def apply(self, aggregate: str, scores: dict[str, dict[str, float]], expire_at: dict[str, int]) -> None:
+        pipe = self.client.pipeline(transaction=False)
+        for key, members in scores.items():
+            if aggregate == "sum":
+                for member, score in members.items():
+                    pipe.zincrby(key, score, member)
+            else:
+                pipe.zadd(key, members, gt=True)
+            pipe.expireat(key, expire_at[key])
+        pipe.execute()
+
+    def top(self, keys: list[str], aggregate: str, limit: int) -> list[tuple[str, float]]:
+        if len(keys) == 1:
+            key = keys[0]
+        else:
+            digest = hashlib.sha1("|".join(keys).encode()).hexdigest()[:16]
+            key = f"{KEY_PREFIX}union:{aggregate}:{digest}"
+            if not self.client.exists(key):
+                pipe = self.client.pipeline()
+                pipe.zunionstore(key, keys, aggregate=aggregate.upper())
+                pipe.expire(key, WINDOW_CACHE_SECONDS)
+                pipe.execute()
+        return [(member, float(score)) for member, score in self.client.zrevrange(key, 0, limit - 1, withscores=True)]
+
+    def clear(self) -> None:
+        batch = list(scan_keys(self.client, f"{KEY_PREFIX}*"))
+        if batch:
+            self.client.unlink(*batch)
+
+
+class MemoryLeaderboardStore:
+    """Substituto em memória: dicionários por dia e heap para o top N"""
+
+    def __init__(self):
+        self._sets: dict[str, dict[str, float]] = {}
+        self._expire_at: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def apply(self, aggregate: str, scores: dict[str, dict[str, float]], expire_at: dict[str, int]) -> None:
+        with self._lock:
+            now = time.time()
+            for key in [key for key, expires in self._expire_at.items() if expires <= now]:
+                self._sets.pop(key, None)
+                self._expire_at.pop(key)
+            for key, members in scores.items():
+                current = self._sets.setdefault(key, {})
+                for member, score in members.items():
+                    if aggregate == "sum":
+                        current[member] = current.get(member, 0.0) + score
+                    else:
+                        current[member] = max(current.get(member, score), score)
+                self._expire_at[key] = expire_at[key]
+
+    def top(self, keys: list[str], aggregate: str, limit: int) -> list[tuple[str, float]]:
+        with self._lock:
+            merged: dict[str, float] = {}
+            for key in keys:
+                for member, score in self._sets.get(key, {}).items():
+                    if member in merged:
+                        merged[member] = merged[member] + score if aggregate == "sum" else max(merged[member], score)
+                    else:
+                        merged[member] = score
+        # Mesma ordem do ZREVRANGE: maior valor e, no empate, maior membro
+        return heapq.nlargest(limit, merged.items(), key=lambda item: (item[1], item[0]))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sets.clear()
+            self._expire_at.clear()
+
+
+# Store global (singleton)
+leaderboard_store: Optional[LeaderboardStore] = None
+
+
+def get_leaderboard_store() -> LeaderboardStore:
+    """
+    Obtém o store dos rankings configurado (singleton pattern)
+    """
+    global leaderboard_store
+    if leaderboard_store is None:
+        if LEADERBOARD_BACKEND == "memory":
+            leaderboard_store = MemoryLeaderboardStore()
+        else:
+            leaderboard_store = RedisLeaderboardStore(get_redis_client())
+    return leaderboard_store
+
+
+def _today() -> date:
+    # As coletas são gravadas em UTC (datetime.utcnow)
+    return datetime.utcnow().date()
+
+
+def _expire_at(day: date) -> int:
+    """Fim da última janela que ainda lê o dia (timestamp UTC)"""
+    end = datetime.combine(day + timedelta(days=RETENTION_DAYS + 1), datetime.min.time())
+    return int((end - datetime(1970, 1, 1)).total_seconds())
+
+
+def _apply(store: LeaderboardStore, board: Board, scores: dict[str, dict[str, float]], days: dict[str, date]):
+    store.apply(board.aggregate, scores, {key: _expire_at(day) for key, day in days.items()})
+
+
+def record_collections(rows: Iterable[Mapping], today: Optional[date] = None):
+    """
+    Soma coletas recém-gravadas aos rankings.
+
+    Chamada após o commit da ingestão. Os valores são combinados por dia e
+    membro antes de ir ao store (um comando por membro e dia, não por
+    coleta); coletas mais antigas que a maior janela são ignoradas. Falhas
+    do Redis não interrompem a ingestão.
+
+    Args:
+        rows: Coletas gravadas (dicionários com as colunas de FuelCollection)
+        today: Dia de referência (padrão: hoje, em UTC)
+    """
+    first_day = (today or _today()) - timedelta(days=RETENTION_DAYS - 1)
+    scores: dict[str, dict[str, dict[str, float]]] = {name: {} for name in BOARDS}
+    days: dict[str, date] = {}
+    for row in rows:
+        day = row["collection_date"].date()
+        if day < first_day:
+            continue
+        for board in BOARDS.values():
+            key = board.key(day, row["fuel_type"])
+            days[key] = day
+            members = scores[board.name].setdefault(key, {})
+            member, score = row[board.member], board.score(row)
+            if board.aggregate == "sum":
+                members[member] = members.get(member, 0.0) + score
+            else:
+                members[member] = max(members.get(member, score), score)
+    if not days:
+        return
+    try:
+        store = get_leaderboard_store()
+        for board in BOARDS.values():
+            if scores[board.name]:
+                _apply(store, board, scores[board.name], days)
+    except (redis.RedisError, redis.ConnectionError) as e:
+        logger.warning(f"Rankings não atualizados (rode rebuild-leaderboards): {e}")
+
+
+def window_keys(board: Board, window: str, fuel_type: Optional[str] = None, today: Optional[date] = None) -> list[str]:
+    """
+    Chaves dos dias de uma janela.
+
+    Raises:
+        ValueError: Se a janela for desconhecida
+    """
+    if window not in WINDOWS:
+        raise ValueError(f"Janela inválida: {window} (use {', '.join(WINDOWS)})")
+    last_day = today or _today()
+    return [board.key(last_day - timedelta(days=offset), fuel_type) for offset in range(WINDOWS[window])]
+
+
+def top(
+    board_name: str,
+    window: str,
+    limit: int,
+    fuel_type: Optional[str] = None,
+    today: Optional[date] = None
+) -> list[tuple[str, float]]:
+    """
+    Os `limit` primeiros membros de um ranking na janela.
+
+    Args:
+        board_name: Nome do ranking (chave de BOARDS)
+        window: "today", "7d" ou "30d"
+        limit: Quantidade de membros
+        fuel_type: Combustível (rankings por combustível)
+        today: Último dia da janela (padrão: hoje, em UTC)
+
+    Returns:
+        Pares (membro, valor) em ordem decrescente de valor
+    """
+    board = BOARDS[board_name]
+    return get_leaderboard_store().top(window_keys(board, window, fuel_type, today), board.aggregate, limit)
+
+
+def rebuild_leaderboards(session: Session, today: Optional[date] = None) -> int:
+    """
+    Recalcula os rankings a partir da tabela de coletas.
+
+    Um GROUP BY por dia (e combustível) e membro por ranking, só sobre os
+    dias da maior janela. Os conjuntos existentes são apagados antes:
+    coletas gravadas durante o rebuild podem ficar de fora (rode fora do
+    pico).
+
+    Args:
+        session: Sessão do banco de dados
+        today: Dia de referência (padrão: hoje, em UTC)
+
+    Returns:
+        Quantidade de pares (dia, membro) gravados
+    """
+    today = today or _today()
+    first_day = today - timedelta(days=RETENTION_DAYS - 1)
+    day = bucket_expression(session.get_bind().dialect.name, "day", FuelCollection.collection_date)
+    store = get_leaderboard_store()
+    store.clear()
+
+    written = 0
+    for board in BOARDS.values():
+        member = getattr(FuelCollection, board.member)
+        value = reduce(operator.mul, [getattr(FuelCollection, column) for column in board.columns])
+        aggregate = func.sum(value) if board.aggregate == "sum" else func.max(value)
+        keys = [day, FuelCollection.fuel_type] if board.per_fuel else [day]
+        statement = (
+            select(*keys, member, aggregate)
+            .where(FuelCollection.collection_date >= datetime.combine(first_day, datetime.min.time()))
+            .group_by(*keys, member)
+        )
+        scores: dict[str, dict[str, float]] = {}
+        days: dict[str, date] = {}
+        for row in session.exec(statement).all():
+            bucket, fuel_type = row[0], row[1] if board.per_fuel else None
+            key = board.key(bucket, fuel_type)
+            days[key] = bucket
+            scores.setdefault(key, {})[row[-2]] = row[-1]
+            written += 1
+        if scores:
+            _apply(store, board, scores, days)
+    logger.info(f"Rankings recalculados: {written} pares (dia, membro)")
+    return written
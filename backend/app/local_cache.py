@@ -0,0 +1,186 @@
+"""
+Cache em memória do processo (L1), na frente do Redis (L2).
+
+LRU limitado por quantidade de entradas e por bytes, com TTL por entrada e
+estatísticas por prefixo. A coerência entre workers é feita por mensagens de
+invalidação no pub/sub do Redis (ver app.cache); o TTL curto do L1 limita a
+janela de inconsistência se uma mensagem se perder.
+"""
+import fnmatch
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+# Sentinela de ausência (None é um valor cacheável)
+MISSING = object()
+
+
+@dataclass
+class PrefixStats:
+    """Contadores de um prefixo de cache (ex: "kpi:avg_price")"""
+    l1_hits: int = 0
+    l1_misses: int = 0
+    l2_hits: int = 0
+    l2_misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    invalidations: int = 0
+
+    def as_dict(self) -> dict:
+        l1_total = self.l1_hits + self.l1_misses
+        l2_total = self.l2_hits + self.l2_misses
+        return {
+            "l1_hits": self.l1_hits,
+            "l1_misses": self.l1_misses,
+            "l1_hit_ratio": round(self.l1_hits / l1_total, 4) if l1_total else 0.0,
+            "l2_hits": self.l2_hits,
+            "l2_misses": self.l2_misses,
+            "l2_hit_ratio": round(self.l2_hits / l2_total, 4) if l2_total else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+@dataclass
+class _Entry:
+    value: Any
+    size: int
+    expires_at: float
+    prefix: str = field(default="")
+
+
+class LocalCache:
+    """
+    LRU em memória, thread-safe, com TTL e limite de bytes.
+
+    As chaves têm o formato "<prefixo>:<argumentos>"; o prefixo é informado
+    em cada operação para agrupar as estatísticas.
+    """
+
+    def __init__(self, max_entries: int = 1000, max_bytes: int = 16 * 1024 * 1024, ttl: float = 30.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats: dict[str, PrefixStats] = {}
+        # Incrementado a cada invalidação; descarta valores calculados antes dela
+        self._epoch = 0
+
+    def _prefix_stats(self, prefix: str) -> PrefixStats:
+        stats = self._stats.get(prefix)
+        if stats is None:
+            stats = self._stats[prefix] = PrefixStats()
+        return stats
+
+    def _remove(self, key: str) -> _Entry:
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        return entry
+
+    @property
+    def epoch(self) -> int:
+        """Época atual; passe para set() o valor lido antes de calcular o resultado."""
+        return self._epoch
+
+    def get(self, prefix: str, key: str) -> Any:
+        """
+        Busca uma entrada válida.
+
+        Returns:
+            Valor armazenado ou MISSING
+        """
+        with self._lock:
+            stats = self._prefix_stats(prefix)
+            entry = self._entries.get(key)
+            if entry is None:
+                stats.l1_misses += 1
+                return MISSING
+            if entry.expires_at <= time.monotonic():
+                self._remove(key)
+                stats.expirations += 1
+                stats.l1_misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            stats.l1_hits += 1
+            return entry.value
+
+    def set(self, prefix: str, key: str, value: Any, size: int, ttl: Optional[float] = None,
+            epoch: Optional[int] = None):
+        """
+        Armazena uma entrada, removendo as menos usadas se exceder os limites.
+
+        Args:
+            prefix: Prefixo da chave (para estatísticas)
+            key: Chave completa
+            value: Valor a armazenar
+            size: Tamanho aproximado em bytes (JSON serializado)
+            ttl: TTL em segundos (limitado ao TTL do L1)
+            epoch: Época lida antes de calcular o valor; se houve invalidação
+                desde então, o valor é descartado
+        """
+        if size > self.max_bytes:
+            return
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        with self._lock:
+            if epoch is not None and epoch != self._epoch:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(value, size, time.monotonic() + ttl, prefix)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+                self._prefix_stats(evicted.prefix).evictions += 1
+
+    def invalidate(self, pattern: str = "*") -> int:
+        """
+        Remove as entradas cujas chaves correspondem ao padrão glob.
+
+        Returns:
+            Quantidade de entradas removidas
+        """
+        with self._lock:
+            self._epoch += 1
+            if pattern == "*":
+                keys = list(self._entries)
+            else:
+                keys = [key for key in self._entries if fnmatch.fnmatchcase(key, pattern)]
+            for key in keys:
+                entry = self._remove(key)
+                self._prefix_stats(entry.prefix).invalidations += 1
+            return len(keys)
+
+    def record_l2(self, prefix: str, hit: bool):
+        """Registra um acerto ou falha no Redis (L2) para o prefixo."""
+        with self._lock:
+            stats = self._prefix_stats(prefix)
+            if hit:
+                stats.l2_hits += 1
+            else:
+                stats.l2_misses += 1
+
+    def clear(self):
+        """Remove todas as entradas e zera as estatísticas."""
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+            self._bytes = 0
+            self._stats.clear()
+
+    def stats(self) -> dict:
+        """Ocupação do L1 e contadores por prefixo."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "prefixes": {prefix: stats.as_dict() for prefix, stats in sorted(self._stats.items())},
+            }
@@ -0,0 +1,289 @@
+"""
+Migrações versionadas do esquema.
+
+O create_all só cria tabelas que ainda não existem: não altera nem remove
+índices de tabelas já criadas. Os índices das coletas (da tabela larga até a
+migração 8, depois do fato do esquema estrela) são mantidos aqui, como uma
+lista ordenada de migrações com os comandos de cada banco. As versões
+aplicadas ficam em schema_migrations, então cada migração roda uma
+única vez por banco (os comandos também são idempotentes).
+
+No PostgreSQL os índices são criados com CREATE INDEX CONCURRENTLY (sem
+bloquear escritas), fora de transação, e um advisory lock impede que dois
+workers apliquem migrações ao mesmo tempo. Passos que dependem dos dados
+(ex.: partições por mês) são funções que recebem a conexão.
+"""
+import logging
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Callable
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from app.models import FuelFact
+from app.partitions import partition_table
+from app.services.driver_profile_service import rebuild_driver_profiles
+from app.star_schema import STAR_VIEW, backfill_star_schema, star_view_sql
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_TABLE = "schema_migrations"
+
+# Chave do pg_advisory_lock das migrações
+MIGRATIONS_LOCK_KEY = 7340211
+
+
+@dataclass(frozen=True)
+class Migration:
+    """Uma versão do esquema: comandos por banco (lista vazia = nada a fazer)"""
+    version: int
+    description: str
+    postgresql: list[str | Callable[[Connection], None]] = field(default_factory=list)
+    sqlite: list[str | Callable[[Connection], None]] = field(default_factory=list)
+    # CREATE INDEX CONCURRENTLY não roda dentro de transação
+    transactional: bool = True
+
+
+def _index(name: str, columns: str, concurrently: bool = False, using: str = "", table: str = "fuelcollection") -> str:
+    options = "CONCURRENTLY " if concurrently else ""
+    method = f"USING {using} " if using else ""
+    return f"CREATE INDEX {options}IF NOT EXISTS {name} ON {table} {method}({columns})"
+
+
+# Índices de FuelCollection criados pelo create_all até a versão 1; recriados
+# aqui para bancos novos (em bancos existentes o IF NOT EXISTS não faz nada)
+_BASELINE_INDEXES = [
+    ("ix_fuelcollection_store_id", "store_id"),
+    ("ix_fuelcollection_fuel_type", "fuel_type"),
+    ("ix_fuelcollection_vehicle_type", "vehicle_type"),
+    # Chave da paginação por cursor e da exportação: (collection_date, id)
+    ("ix_fuelcollection_collection_date_id", "collection_date, id"),
+    # Relatório e histórico por motorista (CPF exato, mais recentes primeiro)
+    ("ix_fuelcollection_driver_cpf_date_id", "driver_cpf, collection_date, id"),
+]
+
+# Listagem filtrada por igualdade e ordenada por (collection_date, id): o
+# filtro vira o prefixo do índice e a ordenação sai do próprio índice (lido
+# de trás para frente no DESC), sem ordenar as linhas filtradas
+_LISTING_INDEXES = [
+    ("ix_fuelcollection_fuel_type_date_id", "fuel_type, collection_date, id"),
+    ("ix_fuelcollection_vehicle_type_date_id", "vehicle_type, collection_date, id"),
+    ("ix_fuelcollection_fuel_vehicle_date_id", "fuel_type, vehicle_type, collection_date, id"),
+]
+
+# Os índices simples são prefixos dos compostos acima
+_REDUNDANT_INDEXES = ["ix_fuelcollection_fuel_type", "ix_fuelcollection_vehicle_type"]
+
+_BRIN_INDEX = ("ix_fuelcollection_collection_date_brin", "collection_date")
+
+# Remoção dos meses da retenção e do arquivo frio no fato
+_STAR_FACT_INDEX = "CREATE INDEX IF NOT EXISTS ix_fuel_fact_collection_date ON fuel_fact (collection_date)"
+
+# Os índices da tabela larga no fato, para as consultas da view fuelcollection:
+# o filtro pelo nome do combustível (ou CPF) vira um código (ou poucas chaves)
+# na dimensão, que é o prefixo do índice, e a ordenação sai do próprio índice
+_FACT_INDEXES = [
+    ("ix_fuel_fact_collection_date_id", "collection_date, id"),
+    ("ix_fuel_fact_driver_date_id", "driver_key, collection_date, id"),
+    ("ix_fuel_fact_store_key", "store_key"),
+    ("ix_fuel_fact_fuel_date_id", "fuel_code, collection_date, id"),
+    ("ix_fuel_fact_vehicle_type_date_id", "vehicle_type_code, collection_date, id"),
+    ("ix_fuel_fact_fuel_vehicle_date_id", "fuel_code, vehicle_type_code, collection_date, id"),
+]
+
+_FACT_BRIN_INDEX = ("ix_fuel_fact_collection_date_brin", "collection_date")
+
+# Sequência dos ids das coletas no fato; continua a de fuelcollection
+_FACT_SEQUENCE = "fuel_fact_id_seq"
+
+# Chaves estrangeiras do fato para as dimensões: o LIKE do particionamento
+# não as copia (na partição antiga as existentes são reaproveitadas)
+_FACT_FOREIGN_KEYS = [
+    f"ALTER TABLE fuel_fact ADD FOREIGN KEY ({key.parent.name}) "
+    f"REFERENCES {key.column.table.name} ({key.column.name})"
+    for key in sorted(FuelFact.__table__.foreign_keys, key=lambda key: key.parent.name)
+]
+
+
+def _fact_sequence(connection: Connection):
+    """Sequência dos ids do fato, continuando a da tabela larga (apagada com ela)."""
+    connection.execute(text(f"CREATE SEQUENCE IF NOT EXISTS {_FACT_SEQUENCE} OWNED BY fuel_fact.id"))
+    connection.execute(text(f"ALTER TABLE fuel_fact ALTER COLUMN id SET DEFAULT nextval('{_FACT_SEQUENCE}')"))
+    connection.execute(text(
+        f"SELECT setval('{_FACT_SEQUENCE}', greatest("
+        "(SELECT coalesce(max(id), 0) FROM fuel_fact), "
+        "(SELECT last_value FROM fuelcollection_id_seq), 1))"
+    ))
+
+
+MIGRATIONS = [
+    Migration(
+        1,
+        "Índices base da tabela de coletas",
+        postgresql=[_index(name, columns, concurrently=True) for name, columns in _BASELINE_INDEXES],
+        sqlite=[_index(name, columns) for name, columns in _BASELINE_INDEXES],
+        transactional=False,
+    ),
+    Migration(
+        2,
+        "Índices compostos da listagem por combustível/veículo e data",
+        postgresql=(
+            [_index(name, columns, concurrently=True) for name, columns in _LISTING_INDEXES]
+            + [f"DROP INDEX CONCURRENTLY IF EXISTS {name}" for name in _REDUNDANT_INDEXES]
+        ),
+        sqlite=(
+            [_index(name, columns) for name, columns in _LISTING_INDEXES]
+            + [f"DROP INDEX IF EXISTS {name}" for name in _REDUNDANT_INDEXES]
+        ),
+        transactional=False,
+    ),
+    Migration(
+        3,
+        "BRIN em collection_date para consultas por intervalo (PostgreSQL)",
+        # Coletas chegam em ordem de data: poucos KB resumem milhões de linhas
+        postgresql=[_index(*_BRIN_INDEX, concurrently=True, using="brin")],
+        transactional=False,
+    ),
+    Migration(
+        4,
+        "Particionamento mensal da tabela de coletas (PostgreSQL)",
+        # Índices na tabela particionada são criados em cada partição; o
+        # CONCURRENTLY não é suportado nela. Os índices de busca (pg_trgm)
+        # são recriados pelo setup_search, que roda depois das migrações
+        postgresql=[partial(partition_table, table="fuelcollection")] + [
+            _index(name, columns)
+            for name, columns in _BASELINE_INDEXES + _LISTING_INDEXES
+            if name not in _REDUNDANT_INDEXES
+        ] + [_index(*_BRIN_INDEX, using="brin")],
+    ),
+    Migration(
+        5,
+        "Esquema estrela: dimensões, fato enxuto e view de compatibilidade",
+        # As tabelas vêm do create_all; o preenchimento copia a tabela de coletas
+        postgresql=[
+            backfill_star_schema,
+            _STAR_FACT_INDEX,
+            star_view_sql("CREATE OR REPLACE VIEW"),
+        ],
+        sqlite=[
+            backfill_star_schema,
+            _STAR_FACT_INDEX,
+            star_view_sql("CREATE VIEW IF NOT EXISTS"),
+        ],
+    ),
+    Migration(
+        6,
+        "Perfis incrementais por motorista (CPF)",
+        # As tabelas vêm do create_all; o preenchimento agrupa as coletas e o arquivo frio
+        postgresql=[rebuild_driver_profiles],
+        sqlite=[rebuild_driver_profiles],
+    ),
+    Migration(
+        7,
+        "Índices do fato para as consultas sobre as coletas",
+        postgresql=(
+            [_index(name, columns, concurrently=True, table="fuel_fact") for name, columns in _FACT_INDEXES]
+            + [_index(*_FACT_BRIN_INDEX, concurrently=True, using="brin", table="fuel_fact")]
+            + ["DROP INDEX CONCURRENTLY IF EXISTS ix_fuel_fact_collection_date"]
+        ),
+        sqlite=(
+            [_index(name, columns, table="fuel_fact") for name, columns in _FACT_INDEXES]
+            + ["DROP INDEX IF EXISTS ix_fuel_fact_collection_date"]
+        ),
+        transactional=False,
+    ),
+    Migration(
+        8,
+        "Coletas só no esquema estrela: fuelcollection vira uma view",
+        # Copia as coletas gravadas desde a migração 5 (o preenchimento é
+        # idempotente), apaga a tabela larga, com as partições, índices e
+        # triggers, e a recria como view. Os índices de busca passam para as
+        # dimensões (setup_search, que roda depois das migrações)
+        postgresql=[
+            backfill_star_schema,
+            _fact_sequence,
+            "DROP TABLE fuelcollection",
+            f"DROP VIEW IF EXISTS {STAR_VIEW}",
+            star_view_sql("CREATE VIEW", view="fuelcollection"),
+        ],
+        sqlite=[
+            backfill_star_schema,
+            "DROP TABLE fuelcollection",
+            f"DROP VIEW IF EXISTS {STAR_VIEW}",
+            star_view_sql("CREATE VIEW", view="fuelcollection"),
+        ],
+    ),
+    Migration(
+        9,
+        "Particionamento mensal do fato das coletas (PostgreSQL)",
+        # Como na migração 4: a retenção e o arquivo frio removem os meses
+        # com DETACH PARTITION, sem DELETE por intervalo no fato
+        postgresql=[partition_table] + _FACT_FOREIGN_KEYS + [
+            _index(name, columns, table="fuel_fact") for name, columns in _FACT_INDEXES
+        ] + [_index(*_FACT_BRIN_INDEX, using="brin", table="fuel_fact")],
+    ),
+]
+
+
+def _ensure_migrations_table(connection: Connection):
+    connection.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} ("
+        "version INTEGER PRIMARY KEY, "
+        "description VARCHAR(200) NOT NULL, "
+        "applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP)"
+    ))
+
+
+def applied_versions(connection: Connection) -> set[int]:
+    """Versões já registradas em schema_migrations."""
+    _ensure_migrations_table(connection)
+    return set(connection.execute(text(f"SELECT version FROM {MIGRATIONS_TABLE}")).scalars())
+
+
+def _run(connection: Connection, migration: Migration):
+    for statement in getattr(migration, connection.dialect.name, []):
+        if callable(statement):
+            statement(connection)
+        else:
+            connection.execute(text(statement))
+    connection.execute(
+        text(f"INSERT INTO {MIGRATIONS_TABLE} (version, description) VALUES (:version, :description)"),
+        {"version": migration.version, "description": migration.description}
+    )
+
+
+def _apply(engine: Engine, migration: Migration):
+    if migration.transactional:
+        with engine.begin() as connection:
+            _run(connection, migration)
+        return
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        _run(connection, migration)
+
+
+def apply_migrations(engine: Engine) -> list[int]:
+    """
+    Aplica, em ordem, as migrações ainda não registradas.
+
+    Chamada na criação das tabelas (depois do create_all); é idempotente.
+
+    Args:
+        engine: Engine do banco de dados
+
+    Returns:
+        Versões aplicadas nesta chamada
+    """
+    postgresql = engine.dialect.name == "postgresql"
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as lock:
+        if postgresql:
+            lock.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATIONS_LOCK_KEY})
+        try:
+            applied = applied_versions(lock)
+            pending = [migration for migration in MIGRATIONS if migration.version not in applied]
+            for migration in pending:
+                logger.info(f"Aplicando migração {migration.version}: {migration.description}")
+                _apply(engine, migration)
+            return [migration.version for migration in pending]
+        finally:
+            if postgresql:
+                lock.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATIONS_LOCK_KEY})
@@ -1,3 +1,14 @@
 from .fuel_collection import FuelCollection, FuelCollectionBase
+from .kpi_summary import FuelTypeSummary, VehicleTypeSummary, KpiRollup
+from .archived_file import ArchivedFile
+from .driver_profile import DriverProfile, DriverFuelProfile
+from .price_anomaly import PriceAnomaly
+from .star_schema import (
+    StoreDimension, DriverDimension, VehicleDimension, FuelTypeCode, VehicleTypeCode, FuelFact,
+)
 
-__all__ = ["FuelCollection", "FuelCollectionBase"]
+__all__ = [
+    "FuelCollection", "FuelCollectionBase", "FuelTypeSummary", "VehicleTypeSummary", "KpiRollup", "ArchivedFile",
+    "DriverProfile", "DriverFuelProfile", "PriceAnomaly",
+    "StoreDimension", "DriverDimension", "VehicleDimension", "FuelTypeCode", "VehicleTypeCode", "FuelFact",
+]
@@ -0,0 +1,23 @@
+from datetime import date, datetime
+from typing import Optional
+from sqlmodel import Field, SQLModel
+
+
+class ArchivedFile(SQLModel, table=True):
+    """
+    Manifesto do arquivo frio: um arquivo Parquet com as coletas de um mês
+    removidas da tabela quente (app.archive).
+
+    Um mês pode ter mais de um arquivo quando coletas atrasadas são
+    arquivadas depois; path é relativo a ARCHIVE_DIR.
+    """
+    __tablename__ = "archived_file"
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    month: date
+    path: str = Field(max_length=300)
+    row_count: int
+    size_bytes: int
+    min_date: datetime
+    max_date: datetime
+    archived_at: datetime = Field(default_factory=datetime.utcnow)
@@ -0,0 +1,32 @@
+from datetime import datetime
+from typing import Optional
+from sqlmodel import Field, SQLModel
+
+
+class DriverProfile(SQLModel, table=True):
+    """
+    Perfil incremental de um motorista: uma linha por CPF com os totais, o
+    primeiro e o último abastecimento e o combustível favorito.
+    """
+    __tablename__ = "driver_profile"
+
+    driver_cpf: str = Field(primary_key=True, max_length=11)
+    driver_name: str
+    refuel_count: int = Field(default=0)
+    total_spent: float = Field(default=0)
+    total_volume: float = Field(default=0)
+    first_refuel: datetime
+    last_refuel: datetime
+    # Id da coleta mais recente: desempate do nome quando as datas coincidem
+    last_collection_id: int
+    favorite_fuel: Optional[str] = None
+
+
+class DriverFuelProfile(SQLModel, table=True):
+    """Abastecimentos de um motorista por combustível (base do combustível favorito)"""
+    __tablename__ = "driver_fuel_profile"
+
+    driver_cpf: str = Field(primary_key=True, max_length=11)
+    fuel_type: str = Field(primary_key=True)
+    refuel_count: int = Field(default=0)
+    last_refuel: datetime
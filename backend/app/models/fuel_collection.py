@@ -5,22 +5,29 @@ from sqlmodel import Field, SQLModel
 
 class FuelCollectionBase(SQLModel):
     """Modelo base com campos comuns"""
-    store_id: str = Field(index=True, max_length=50)
+    store_id: str = Field(max_length=50)
     store_name: str
     city: str
     state: str
     collection_date: datetime = Field(default_factory=datetime.utcnow, nullable=False)
-    fuel_type: str = Field(index=True, description="Gasolina, Etanol, Diesel S10")
+    fuel_type: str = Field(description="Gasolina, Etanol, Diesel S10")
     sale_price: float = Field(ge=0)
     volume_sold: float = Field(ge=0)
     driver_name: str
     driver_cpf: str = Field(max_length=11)
     vehicle_plate: str = Field(max_length=10)
-    vehicle_type: str = Field(index=True, description="Carro, Carreta, etc.")
+    vehicle_type: str = Field(description="Carro, Carreta, etc.")
 
 
 class FuelCollection(FuelCollectionBase, table=True):
-    """Tabela principal de coletas de combustível no PostgreSQL"""
+    """
+    Coletas de combustível no formato largo: view sobre o esquema estrela
+    (fuel_fact e dimensões, app.star_schema).
+
+    O create_all só cria a tabela em bancos novos, e a migração 8 a troca
+    pela view. As coletas adicionadas ou removidas pela sessão são gravadas
+    no fato (app.services.summary_service), sem INSERT/DELETE na view.
+    """
     __tablename__ = "fuelcollection"
     
     id: Optional[int] = Field(default=None, primary_key=True)
@@ -0,0 +1,42 @@
+from datetime import date
+from sqlmodel import Field, SQLModel
+
+
+class FuelTypeSummary(SQLModel, table=True):
+    """Agregado incremental por tipo de combustível (soma de preços, volume e contagem)"""
+    __tablename__ = "fuel_type_summary"
+    
+    fuel_type: str = Field(primary_key=True)
+    total_records: int = Field(default=0)
+    sum_price: float = Field(default=0)
+    sum_volume: float = Field(default=0)
+
+
+class VehicleTypeSummary(SQLModel, table=True):
+    """Agregado incremental por tipo de veículo (soma de preços, volume e contagem)"""
+    __tablename__ = "vehicle_type_summary"
+    
+    vehicle_type: str = Field(primary_key=True)
+    total_records: int = Field(default=0)
+    sum_price: float = Field(default=0)
+    sum_volume: float = Field(default=0)
+
+
+class KpiRollup(SQLModel, table=True):
+    """
+    Agregado incremental por período e dimensões (soma de preços, volume e contagem).
+    
+    Cada coleta soma em três linhas, uma por granularidade ("day", "week",
+    "month"); bucket é o início do período (semanas começam na segunda-feira).
+    """
+    __tablename__ = "kpi_rollup"
+    
+    granularity: str = Field(primary_key=True, max_length=5)
+    bucket: date = Field(primary_key=True)
+    fuel_type: str = Field(primary_key=True)
+    state: str = Field(primary_key=True)
+    city: str = Field(primary_key=True)
+    vehicle_type: str = Field(primary_key=True)
+    total_records: int = Field(default=0)
+    sum_price: float = Field(default=0)
+    sum_volume: float = Field(default=0)
@@ -0,0 +1,28 @@
+from datetime import datetime
+from typing import Optional
+from sqlmodel import Field, SQLModel
+
+
+class PriceAnomaly(SQLModel, table=True):
+    """
+    Coleta sinalizada pelo detector da ingestão: valor muito distante da média
+    do grupo (posto, cidade ou tipo de veículo). Uma linha por regra violada.
+    """
+    __tablename__ = "price_anomaly"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    collection_id: int = Field(index=True)
+    # Data da coleta: chave da paginação e da retenção
+    collection_date: datetime = Field(index=True)
+    # price_store, price_city ou volume_vehicle
+    kind: str = Field(index=True)
+    fuel_type: str
+    store_id: str = Field(max_length=50)
+    city: str
+    state: str
+    vehicle_type: str
+    value: float
+    expected: float
+    stddev: float
+    z_score: float
+    samples: int
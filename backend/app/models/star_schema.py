@@ -0,0 +1,75 @@
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import Column, ForeignKey, Integer, SmallInteger, UniqueConstraint
+from sqlmodel import Field, SQLModel
+
+# SMALLINT autoincremental; no SQLite só INTEGER PRIMARY KEY gera o id sozinho
+_SMALL_ID = SmallInteger().with_variant(Integer, "sqlite")
+
+
+class StoreDimension(SQLModel, table=True):
+    """
+    Dimensão de postos: uma linha por store_id e combinação de atributos
+    (nome, cidade, estado), para que cada coleta mantenha os do seu momento.
+    """
+    __tablename__ = "dim_store"
+    __table_args__ = (UniqueConstraint("store_id", "store_name", "city", "state"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    store_id: str = Field(max_length=50, index=True)
+    store_name: str
+    city: str
+    state: str
+
+
+class DriverDimension(SQLModel, table=True):
+    """Dimensão de motoristas: uma linha por CPF e nome"""
+    __tablename__ = "dim_driver"
+    __table_args__ = (UniqueConstraint("cpf", "name"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    cpf: str = Field(max_length=11, index=True)
+    name: str
+
+
+class VehicleDimension(SQLModel, table=True):
+    """Dimensão de veículos: uma linha por placa"""
+    __tablename__ = "dim_vehicle"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    plate: str = Field(max_length=10, unique=True)
+
+
+class FuelTypeCode(SQLModel, table=True):
+    """Código (smallint) de cada tipo de combustível"""
+    __tablename__ = "dim_fuel_type"
+
+    id: Optional[int] = Field(default=None, sa_column=Column(_SMALL_ID, primary_key=True))
+    name: str = Field(max_length=30, unique=True)
+
+
+class VehicleTypeCode(SQLModel, table=True):
+    """Código (smallint) de cada tipo de veículo"""
+    __tablename__ = "dim_vehicle_type"
+
+    id: Optional[int] = Field(default=None, sa_column=Column(_SMALL_ID, primary_key=True))
+    name: str = Field(max_length=30, unique=True)
+
+
+class FuelFact(SQLModel, table=True):
+    """
+    Fato enxuto do esquema estrela e única cópia das coletas: uma linha por
+    coleta (o id é o de FuelCollection), só com chaves inteiras, data e medidas.
+    """
+    __tablename__ = "fuel_fact"
+    # Índices mantidos pelas migrações versionadas (app.migrations)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    collection_date: datetime = Field(nullable=False)
+    store_key: int = Field(foreign_key="dim_store.id")
+    driver_key: int = Field(foreign_key="dim_driver.id")
+    vehicle_key: int = Field(foreign_key="dim_vehicle.id")
+    fuel_code: int = Field(sa_column=Column(SmallInteger, ForeignKey("dim_fuel_type.id"), nullable=False))
+    vehicle_type_code: int = Field(sa_column=Column(SmallInteger, ForeignKey("dim_vehicle_type.id"), nullable=False))
+    sale_price: float
+    volume_sold: float
@@ -0,0 +1,346 @@
+"""
+Particionamento mensal das coletas e política de retenção.
+
+No PostgreSQL o fato do esquema estrela (fuel_fact, a única cópia das
+coletas; fuelcollection é uma view sobre ele) é particionado por intervalo de
+collection_date, uma partição por mês (fuel_fact_y2024m01), mais uma partição
+DEFAULT para coletas fora dos meses criados. A conversão da tabela existente
+é a migração 9 (app.migrations), que anexa a tabela antiga como a partição
+dos meses anteriores à conversão; as partições dos próximos meses são criadas
+na subida da API e pelo comando `manage.py maintain-partitions`. A migração 4
+fazia o mesmo com a antiga tabela larga, apagada pela migração 8.
+
+A retenção remove meses inteiros: DETACH PARTITION (e DROP TABLE) é uma
+operação de catálogo O(1), em vez de DELETEs em lote seguidos de VACUUM. Nos
+bancos sem particionamento (SQLite) o mesmo mês é removido com um DELETE
+por intervalo. Em ambos os casos os agregados dos KPIs são corrigidos na
+mesma transação.
+"""
+import logging
+import os
+import re
+from datetime import date, datetime, time
+from typing import Optional
+from sqlalchemy import func, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import SQLAlchemyError
+from app.models import FuelFact
+from app.cache import invalidate_data_caches
+from app.services.driver_profile_service import invalidate_driver_profiles
+from app.services.summary_service import remove_collections
+from app.star_schema import remove_facts
+
+logger = logging.getLogger(__name__)
+
+TABLE = FuelFact.__tablename__
+DEFAULT_PARTITION = f"{TABLE}_default"
+
+# Tabela anterior ao particionamento, anexada com os meses antigos (migração 9)
+LEGACY_PARTITION = f"{TABLE}_legacy"
+
+# Meses futuros com partição criada antecipadamente (além do mês corrente)
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+
+# Meses completos mantidos pela retenção, além do corrente (0 desativa)
+PARTITION_RETENTION_MONTHS = int(os.getenv("PARTITION_RETENTION_MONTHS", "0"))
+
+# "drop" apaga as partições antigas; "detach" as mantém como tabelas avulsas
+PARTITION_RETENTION_MODE = os.getenv("PARTITION_RETENTION_MODE", "drop")
+
+RETENTION_MODES = ("drop", "detach")
+
+
+def month_start(value: date | datetime) -> date:
+    """Primeiro dia do mês da data."""
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    """Primeiro dia do mês `months` meses depois (ou antes, se negativo)."""
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date, table: str = TABLE) -> str:
+    """Nome da partição do mês (fuel_fact_y2024m01)."""
+    return f"{table}_y{month.year}m{month.month:02d}"
+
+
+def is_partitioned(connection: Connection) -> bool:
+    """Se a tabela de coletas é particionada (sempre False fora do PostgreSQL)."""
+    if connection.dialect.name != "postgresql":
+        return False
+    return connection.execute(
+        text("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table))"),
+        {"table": TABLE}
+    ).scalar()
+
+
+def list_partitions(connection: Connection, table: str = TABLE) -> list[date]:
+    """Meses com partição anexada à tabela de coletas, em ordem."""
+    names = connection.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = to_regclass(:table)"
+        ),
+        {"table": table}
+    ).scalars()
+    months = []
+    for name in names:
+        match = re.fullmatch(rf"{table}_y(\d{{4}})m(\d{{2}})", name)
+        if match:
+            months.append(date(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+def create_partition(connection: Connection, month: date, table: str = TABLE):
+    """Cria a partição do mês, se ainda não existir."""
+    connection.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {partition_name(month, table)} PARTITION OF {table} "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    ))
+
+
+def partition_table(connection: Connection, table: str = TABLE):
+    """
+    Converte a tabela de coletas em uma tabela particionada por mês.
+
+    Passo das migrações 4 (tabela larga) e 9 (fato), no PostgreSQL,
+    executado na transação da migração: a
+    tabela atual é renomeada e a particionada é criada com as mesmas colunas
+    e a sequência de ids. As coletas anteriores ao mês corrente não são
+    copiadas: a tabela antiga é anexada como a partição LEGACY_PARTITION
+    (de MINVALUE até o início do mês corrente), o que só exige verificar o
+    intervalo e criar o índice único (id, collection_date). As coletas a
+    partir do mês corrente saem dela para as partições mensais, um mês por
+    comando, e as posteriores à última partição criada para a DEFAULT. A
+    chave primária passa a ser (id, collection_date), pois precisa conter a
+    chave de particionamento. Os índices (e as chaves estrangeiras do fato)
+    são recriados pelos comandos seguintes da migração, que reaproveitam os
+    da tabela antiga.
+
+    A partição antiga não tem meses próprios: a retenção e o arquivo frio
+    removem os seus meses com DELETE.
+
+    Args:
+        connection: Conexão da transação da migração
+        table: Tabela convertida (padrão: o fato)
+    """
+    legacy = f"{table}_legacy"
+    current = month_start(date.today())
+    connection.execute(text(f"ALTER TABLE {table} RENAME TO {legacy}"))
+    connection.execute(text(f"ALTER TABLE {legacy} RENAME CONSTRAINT {table}_pkey TO {legacy}_pkey"))
+    # Os nomes de índice são globais: os da tabela particionada seriam
+    # ignorados pelo IF NOT EXISTS se os da tabela antiga os mantivessem
+    indexes = connection.execute(
+        text("SELECT indexname FROM pg_indexes WHERE tablename = :table AND indexname LIKE :prefix"),
+        {"table": legacy, "prefix": f"%{table}%"}
+    ).scalars().all()
+    for index in indexes:
+        if index != f"{legacy}_pkey":
+            connection.execute(text(f"ALTER INDEX {index} RENAME TO {index.replace(table, legacy, 1)}"))
+
+    connection.execute(text(
+        f"CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS, PRIMARY KEY (id, collection_date)) "
+        f"PARTITION BY RANGE (collection_date)"
+    ))
+    # A sequência dos ids seria apagada junto com a tabela antiga
+    connection.execute(text(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id"))
+    connection.execute(text(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT"))
+
+    move = text(
+        f"WITH moved AS (DELETE FROM {legacy} "
+        f"WHERE collection_date >= :start AND collection_date < :end RETURNING *) "
+        f"INSERT INTO {table} SELECT * FROM moved"
+    )
+    month = current
+    while month <= add_months(current, PARTITION_MONTHS_AHEAD):
+        create_partition(connection, month, table)
+        start, end = month_range(month)
+        connection.execute(move, {"start": start, "end": end})
+        month = add_months(month, 1)
+    # Coletas com data além das partições criadas vão para a DEFAULT
+    connection.execute(move, {"start": datetime.combine(month, time.min), "end": datetime.max})
+
+    # A partição precisa de um índice único com a chave primária da tabela
+    connection.execute(text(f"CREATE UNIQUE INDEX {legacy}_id_date_key ON {legacy} (id, collection_date)"))
+    connection.execute(text(
+        f"ALTER TABLE {table} ATTACH PARTITION {legacy} "
+        f"FOR VALUES FROM (MINVALUE) TO ('{current.isoformat()}')"
+    ))
+
+
+def ensure_partitions(
+    engine: Engine,
+    months_ahead: int = PARTITION_MONTHS_AHEAD,
+    today: Optional[date] = None
+) -> list[date]:
+    """
+    Cria as partições do mês corrente e dos próximos meses que ainda não existem.
+
+    Sem efeito quando a tabela não é particionada. Idempotente; chamada na
+    subida da API e pelo comando de manutenção.
+
+    Args:
+        engine: Engine do banco de dados
+        months_ahead: Meses futuros a criar além do corrente
+        today: Data de referência (padrão: hoje)
+
+    Returns:
+        Meses cujas partições foram criadas
+    """
+    if engine.dialect.name != "postgresql":
+        return []
+    current = month_start(today or date.today())
+    with engine.connect() as connection:
+        if not is_partitioned(connection):
+            return []
+        existing = set(list_partitions(connection))
+
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if month in existing:
+            continue
+        try:
+            with engine.begin() as connection:
+                create_partition(connection, month)
+            created.append(month)
+        except SQLAlchemyError as e:
+            # Ex.: a partição DEFAULT já tem coletas desse mês
+            logger.warning(f"Não foi possível criar a partição {partition_name(month)}: {e}")
+    if created:
+        logger.info(f"Partições criadas: {', '.join(partition_name(month) for month in created)}")
+    return created
+
+
+def month_range(month: date) -> tuple[datetime, datetime]:
+    """Início (inclusive) e fim (exclusive) do mês."""
+    return datetime.combine(month, time.min), datetime.combine(add_months(month, 1), time.min)
+
+
+def expired_months(connection: Connection, cutoff: date) -> list[date]:
+    """
+    Meses anteriores ao corte com partição própria ou com coletas na tabela.
+
+    Coletas atrasadas de um mês cuja partição já foi removida caem na
+    partição DEFAULT e também entram na lista.
+    """
+    months = set()
+    if is_partitioned(connection):
+        months.update(month for month in list_partitions(connection) if month < cutoff)
+    oldest = connection.execute(select(func.min(FuelFact.collection_date))).scalar()
+    if oldest is not None:
+        month = month_start(oldest)
+        while month < cutoff:
+            months.add(month)
+            month = add_months(month, 1)
+    return sorted(months)
+
+
+def month_partition(connection: Connection, month: date) -> Optional[str]:
+    """Nome da partição própria do mês, se estiver anexada à tabela de coletas."""
+    if not is_partitioned(connection):
+        return None
+    return partition_name(month) if month in list_partitions(connection) else None
+
+
+def lock_month(connection: Connection, month: date):
+    """
+    Bloqueia escritas nas coletas do mês até o fim da transação.
+
+    Evita que coletas atrasadas entrem entre a leitura do mês e a remoção.
+    No PostgreSQL particionado bloqueia a partição do mês (ou a DEFAULT e a
+    antiga, LEGACY_PARTITION, se existir); sem particionamento não faz nada.
+    """
+    if not is_partitioned(connection):
+        return
+    tables = [month_partition(connection, month)]
+    if not tables[0]:
+        tables = [DEFAULT_PARTITION]
+        if connection.execute(text("SELECT to_regclass(:table)"), {"table": LEGACY_PARTITION}).scalar():
+            tables.append(LEGACY_PARTITION)
+    connection.execute(text(f"LOCK TABLE {', '.join(tables)} IN SHARE MODE"))
+
+
+def remove_month(connection: Connection, month: date, drop: bool = True) -> bool:
+    """
+    Remove as coletas do mês (não altera os agregados).
+
+    Com partição própria do fato: DETACH PARTITION e, se `drop`, DROP TABLE
+    (a view fuelcollection deixa de ver o mês junto). Sem ela: DELETE do
+    intervalo do mês no fato.
+
+    Returns:
+        Se o mês tinha partição própria
+    """
+    partition = month_partition(connection, month)
+    if partition:
+        connection.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {partition}"))
+        if drop:
+            connection.execute(text(f"DROP TABLE {partition}"))
+        return True
+    remove_facts(connection, *month_range(month))
+    return False
+
+
+def apply_retention(
+    engine: Engine,
+    keep_months: int = PARTITION_RETENTION_MONTHS,
+    mode: str = PARTITION_RETENTION_MODE,
+    today: Optional[date] = None
+) -> list[date]:
+    """
+    Remove as coletas dos meses anteriores à janela de retenção.
+
+    Mantém o mês corrente e os `keep_months` meses completos anteriores. Com
+    particionamento, cada mês expirado é desanexado (DETACH PARTITION) e, no
+    modo "drop", apagado; no modo "detach" a tabela avulsa fica disponível
+    para arquivamento. Coletas sem partição própria (DEFAULT, ou a tabela sem
+    particionamento) são removidas com DELETE, somente no modo "drop". Cada
+    mês usa uma transação, que também desconta as coletas removidas dos
+    agregados dos KPIs.
+
+    Args:
+        engine: Engine do banco de dados
+        keep_months: Meses completos mantidos (0 desativa a retenção)
+        mode: "drop" ou "detach"
+        today: Data de referência (padrão: hoje)
+
+    Returns:
+        Meses removidos
+
+    Raises:
+        ValueError: Se o modo for inválido ou "detach" sem particionamento
+    """
+    if mode not in RETENTION_MODES:
+        raise ValueError(f"Modo de retenção inválido: {mode} (use {', '.join(RETENTION_MODES)})")
+    if keep_months <= 0:
+        return []
+
+    cutoff = add_months(month_start(today or date.today()), -keep_months)
+    with engine.connect() as connection:
+        partitioned = is_partitioned(connection)
+        months = expired_months(connection, cutoff)
+    if not partitioned and mode == "detach":
+        raise ValueError("O modo detach requer a tabela particionada (PostgreSQL)")
+
+    removed_months = []
+    for month in months:
+        start, end = month_range(month)
+        with engine.begin() as connection:
+            if mode == "detach" and not month_partition(connection, month):
+                logger.warning(f"Retenção: {partition_name(month)} sem partição própria, mantido no modo detach")
+                continue
+            # Bloqueia escritas atrasadas no mês entre a contagem e a remoção
+            lock_month(connection, month)
+            removed = remove_collections(connection, start, end)
+            remove_month(connection, month, drop=mode == "drop")
+        removed_months.append(month)
+        logger.info(f"Retenção: {partition_name(month)} removido ({removed} coletas, modo {mode})")
+
+    if removed_months:
+        invalidate_data_caches()
+        invalidate_driver_profiles()
+    return removed_months
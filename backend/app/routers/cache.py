@@ -1,8 +1,8 @@
 """
 Router para monitoramento e debug do cache Redis
 """
-from fastapi import APIRouter
-from app.cache import get_redis_client, invalidate_cache
+from fastapi import APIRouter, Query
+from app.cache import get_redis_client, invalidate_cache, scan_keys, local_cache
 import redis
 
 router = APIRouter(prefix="/cache", tags=["Cache"])
@@ -31,12 +31,21 @@ def check_redis_health():
 def get_cache_stats():
     """
     Retorna estatísticas do cache
+    
+    - redis: contadores globais do servidor (L2)
+    - l1: ocupação do cache em memória deste worker
+    - prefixes: acertos/falhas de L1 e L2, evicções e invalidações por prefixo
+      (contadores deste worker)
     """
+    l1_stats = local_cache.stats()
+    prefixes = l1_stats.pop("prefixes")
+    stats = {"l1": l1_stats, "prefixes": prefixes}
+    
     try:
         client = get_redis_client()
         info = client.info("stats")
         
-        return {
+        stats.update({
             "total_connections_received": info.get("total_connections_received"),
             "total_commands_processed": info.get("total_commands_processed"),
             "keyspace_hits": info.get("keyspace_hits", 0),
@@ -46,23 +55,37 @@ def get_cache_stats():
                 max(info.get("keyspace_hits", 0) + info.get("keyspace_misses", 0), 1) * 100, 
                 2
             )
-        }
+        })
     except (redis.RedisError, redis.ConnectionError) as e:
-        return {"error": str(e)}
+        stats["error"] = str(e)
+    
+    return stats
 
 
 @router.get("/keys")
-def list_cache_keys():
+def list_cache_keys(
+    pattern: str = Query("*", description="Padrão de chave (ex: kpi:*)"),
+    limit: int = Query(1000, ge=1, le=10000, description="Máximo de chaves retornadas")
+):
     """
-    Lista todas as chaves armazenadas no cache
+    Lista as chaves armazenadas no cache (via SCAN, até `limit` chaves)
     """
     try:
         client = get_redis_client()
-        keys = client.keys("*")
+        keys = []
+        for key in scan_keys(client, pattern):
+            keys.append(key)
+            if len(keys) >= limit:
+                break
         
-        result = {}
+        # TTLs em um único round trip
+        pipeline = client.pipeline(transaction=False)
         for key in keys:
-            ttl = client.ttl(key)
+            pipeline.ttl(key)
+        ttls = pipeline.execute()
+        
+        result = {}
+        for key, ttl in zip(keys, ttls):
             result[key] = {
                 "ttl_seconds": ttl,
                 "expires_in": f"{ttl // 60}min {ttl % 60}s" if ttl > 0 else "expired/no expiry"
@@ -70,6 +93,7 @@ def list_cache_keys():
         
         return {
             "total_keys": len(keys),
+            "truncated": len(keys) >= limit,
             "keys": result
         }
     except (redis.RedisError, redis.ConnectionError) as e:
@@ -86,10 +110,11 @@ def clear_cache(pattern: str = "*"):
                  Exemplos: "kpi:*", "kpi:avg_price:*"
     """
     try:
-        invalidate_cache(pattern)
+        removed = invalidate_cache(pattern)
         return {
             "status": "success",
-            "message": f"Cache cleared for pattern: {pattern}"
+            "message": f"Cache cleared for pattern: {pattern}",
+            "removed_keys": removed
         }
     except (redis.RedisError, redis.ConnectionError) as e:
         return {"error": str(e)}
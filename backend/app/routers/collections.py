@@ -1,10 +1,11 @@
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, Query, Response
 from sqlmodel import Session
-from typing import Optional
+from typing import Literal, Optional
 
 from app.dependencies import get_session
+from app.http_cache import DataVersion, check_not_modified, conditional_headers
 from app.schemas import PaginatedResponse
-from app.services.collection_service import get_collections as get_collections_service
+from app.services.collection_service import get_collections_json
 
 router = APIRouter(prefix="/collections", tags=["Consultas"])
 
@@ -16,6 +17,10 @@ def get_collections(
     fuel_type: Optional[str] = Query(None, description="Filtrar por tipo de combustível"),
     city: Optional[str] = Query(None, description="Filtrar por cidade"),
     vehicle_type: Optional[str] = Query(None, description="Filtrar por tipo de veículo"),
+    cursor: Optional[str] = Query(None, description="Cursor de next_cursor/prev_cursor (paginação por keyset)"),
+    include_total: bool = Query(True, description="Contar o total de registros filtrados"),
+    count_mode: Literal["exact", "estimate"] = Query("exact", description="Total exato (cacheado) ou estimado pelo planner"),
+    version: Optional[DataVersion] = Depends(check_not_modified),
     session: Session = Depends(get_session)
 ):
     """
@@ -25,12 +30,28 @@ def get_collections(
     - fuel_type: Gasolina, Etanol, Diesel S10
     - city: Nome da cidade
     - vehicle_type: Carro, Moto, Caminhão Leve, Carreta, Ônibus
+    
+    Paginação:
+    - page: paginação por número de página (compatibilidade)
+    - cursor: paginação por keyset usando next_cursor/prev_cursor da resposta;
+      o custo de cada página não cresce com a profundidade
+    - include_total=false: omite a contagem total (ideal para scroll infinito)
+    - count_mode=estimate: usa a estimativa do planner para conjuntos grandes;
+      total_is_exact indica se o total é exato
+    
+    Envia ETag/Last-Modified da versão dos dados; com If-None-Match da
+    versão atual responde 304 sem consultar o banco.
     """
-    return get_collections_service(
-        session=session,
+    body = get_collections_json(
+        session,
         page=page,
         page_size=page_size,
         fuel_type=fuel_type,
         city=city,
-        vehicle_type=vehicle_type
+        vehicle_type=vehicle_type,
+        cursor=cursor,
+        include_total=include_total,
+        count_mode=count_mode
     )
+    return Response(content=body, media_type="application/json", headers=conditional_headers(version))
+
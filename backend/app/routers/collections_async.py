@@ -0,0 +1,45 @@
+"""
+Versão assíncrona do router de consultas (API_MODE=async).
+"""
+from fastapi import APIRouter, Depends, Query, Response
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import Literal, Optional
+
+from app.dependencies import get_async_session
+from app.http_cache import DataVersion, check_not_modified_async, conditional_headers
+from app.schemas import PaginatedResponse
+from app.services.collection_service import get_collections_json_async
+
+router = APIRouter(prefix="/collections", tags=["Consultas"])
+
+
+@router.get("", response_model=PaginatedResponse)
+async def get_collections(
+    page: int = Query(1, ge=1, description="Número da página"),
+    page_size: int = Query(10, ge=1, le=100, description="Tamanho da página"),
+    fuel_type: Optional[str] = Query(None, description="Filtrar por tipo de combustível"),
+    city: Optional[str] = Query(None, description="Filtrar por cidade"),
+    vehicle_type: Optional[str] = Query(None, description="Filtrar por tipo de veículo"),
+    cursor: Optional[str] = Query(None, description="Cursor de next_cursor/prev_cursor (paginação por keyset)"),
+    include_total: bool = Query(True, description="Contar o total de registros filtrados"),
+    count_mode: Literal["exact", "estimate"] = Query("exact", description="Total exato (cacheado) ou estimado pelo planner"),
+    version: Optional[DataVersion] = Depends(check_not_modified_async),
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    Retorna listagem paginada de coletas com filtros opcionais.
+    
+    Mesmos parâmetros e resposta da versão síncrona; ver GET /collections.
+    """
+    body = await get_collections_json_async(
+        session,
+        page=page,
+        page_size=page_size,
+        fuel_type=fuel_type,
+        city=city,
+        vehicle_type=vehicle_type,
+        cursor=cursor,
+        include_total=include_total,
+        count_mode=count_mode
+    )
+    return Response(content=body, media_type="application/json", headers=conditional_headers(version))
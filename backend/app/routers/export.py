@@ -0,0 +1,42 @@
+from datetime import datetime
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session
+from typing import Literal, Optional
+
+from app.dependencies import get_session
+from app.services.collection_service import filter_conditions
+from app.services.count_service import normalize_filters
+from app.services.export_service import EXPORT_FORMATS, export_collections, export_file_name
+
+router = APIRouter(prefix="/collections", tags=["Consultas"])
+
+
+@router.get("/export")
+def export_collections_file(
+    format: Literal["csv", "ndjson", "parquet"] = Query("csv", description="Formato do arquivo"),
+    fuel_type: Optional[str] = Query(None, description="Filtrar por tipo de combustível"),
+    city: Optional[str] = Query(None, description="Filtrar por cidade"),
+    vehicle_type: Optional[str] = Query(None, description="Filtrar por tipo de veículo"),
+    start_date: Optional[datetime] = Query(None, description="Coletas a partir desta data (ISO 8601)"),
+    end_date: Optional[datetime] = Query(None, description="Coletas até esta data (ISO 8601)"),
+    gzip: bool = Query(False, description="Comprimir o arquivo em gzip"),
+    session: Session = Depends(get_session)
+):
+    """
+    Exporta as coletas filtradas em streaming (CSV, NDJSON ou Parquet).
+    
+    Aceita os mesmos filtros da listagem, mais período. As linhas são lidas
+    com cursor no servidor e enviadas em blocos, em ordem de collection_date,
+    com memória constante independente do tamanho da exportação.
+    """
+    bind = session.get_bind()
+    conditions = filter_conditions(
+        bind, normalize_filters(fuel_type, city, vehicle_type), start_date, end_date
+    )
+    media_type = "application/gzip" if gzip else EXPORT_FORMATS[format][0]
+    return StreamingResponse(
+        export_collections(bind, conditions, file_format=format, gzip=gzip),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{export_file_name(format, gzip)}"'}
+    )
@@ -1,18 +1,80 @@
-from fastapi import APIRouter, Depends, status
+import glob
+import io
+import os
+import tempfile
+import time
+import uuid
+from typing import Any, Literal
+from fastapi import APIRouter, Body, Depends, HTTPException, Path, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse
 from sqlmodel import Session
 
 from app.dependencies import get_session
-from app.schemas import FuelCollectionCreate, FuelCollectionRead
-from app.services.ingest_service import create_fuel_collection
+from app.schemas import FuelCollectionCreate, FuelCollectionRead, BatchIngestResponse, BulkIngestSummary, IngestAccepted
+from app.services.ingest_service import create_fuel_collection, create_fuel_collections_batch, enqueue_fuel_collection
+from app.ingest_queue import INGEST_MODE, get_ingest_queue
+from app.services.bulk_ingest_service import DEFAULT_CHUNK_SIZE, load_stream
 
 router = APIRouter(prefix="", tags=["Ingestão"])
 
+# Diretório onde ficam os arquivos de linhas rejeitadas da carga em massa
+BULK_REJECTS_DIR = os.getenv("BULK_REJECTS_DIR", tempfile.gettempdir())
 
-@router.post("/ingest", response_model=FuelCollectionRead, status_code=status.HTTP_201_CREATED)
+# Horas que um arquivo de rejeições fica disponível para download
+BULK_REJECTS_RETENTION_HOURS = float(os.getenv("BULK_REJECTS_RETENTION_HOURS", "24"))
+
+# Acima deste tamanho o upload é mantido em disco, não em memória
+UPLOAD_SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+
+def _reject_path(reject_id: str) -> str:
+    """Caminho do arquivo de rejeições de uma carga (o id não sai do servidor como caminho)"""
+    return os.path.join(BULK_REJECTS_DIR, f"rejects-{reject_id}.csv")
+
+
+def _remove_reject_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def purge_expired_rejects(now: float | None = None) -> int:
+    """
+    Remove os arquivos de rejeições mais antigos que BULK_REJECTS_RETENTION_HOURS.
+
+    Chamada a cada carga em massa; não há outro ponto que limpe o diretório.
+
+    Returns:
+        Quantidade de arquivos removidos
+    """
+    cutoff = (now or time.time()) - BULK_REJECTS_RETENTION_HOURS * 3600
+    removed = 0
+    for path in glob.glob(_reject_path("*")):
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+@router.post(
+    "/ingest",
+    response_model=FuelCollectionRead,
+    status_code=status.HTTP_201_CREATED,
+    responses={status.HTTP_202_ACCEPTED: {"model": IngestAccepted, "description": "Coleta enfileirada (INGEST_MODE=async)"}}
+)
 def ingest_data(collection: FuelCollectionCreate, session: Session = Depends(get_session)):
     """
     Recebe e salva os dados brutos de abastecimento no banco de dados.
     
+    Com INGEST_MODE=async a coleta é apenas validada e enfileirada, e a
+    resposta é 202 Accepted com um tracking_id; a gravação é feita em lote
+    pelo flusher em background.
+    
     Args:
         collection: Dados da coleta a ser criada
         session: Sessão do banco de dados (injetada)
@@ -20,4 +82,105 @@ def ingest_data(collection: FuelCollectionCreate, session: Session = Depends(get
     Returns:
         FuelCollectionRead com os dados da coleta criada
     """
+    if INGEST_MODE == "async":
+        accepted = enqueue_fuel_collection(collection, get_ingest_queue())
+        return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=accepted.model_dump())
     return create_fuel_collection(collection, session)
+
+
+@router.post("/ingest/batch", response_model=BatchIngestResponse, status_code=status.HTTP_201_CREATED)
+def ingest_batch(
+    collections: list[dict[str, Any]] = Body(..., description="Lista de coletas no formato de /ingest"),
+    session: Session = Depends(get_session)
+):
+    """
+    Recebe um lote de coletas e salva os itens válidos em uma única transação.
+    
+    Cada item é validado individualmente: itens inválidos são devolvidos
+    em `errors` (com a posição no lote) sem abortar a inserção dos demais.
+    
+    Args:
+        collections: Lista de coletas no mesmo formato de POST /ingest
+        session: Sessão do banco de dados (injetada)
+    
+    Returns:
+        BatchIngestResponse com os itens inseridos e os erros por item
+    """
+    return create_fuel_collections_batch(collections, session)
+
+
+@router.post("/ingest/bulk", response_model=BulkIngestSummary)
+async def ingest_bulk(
+    request: Request,
+    file_format: Literal["csv", "ndjson"] = Query("csv", alias="format", description="Formato do corpo: csv ou ndjson"),
+    chunk_size: int = Query(DEFAULT_CHUNK_SIZE, ge=100, le=100000, description="Linhas por bloco/transação"),
+    session: Session = Depends(get_session)
+):
+    """
+    Carga em massa de um arquivo CSV (com cabeçalho) ou NDJSON enviado no corpo.
+    
+    O corpo é recebido em streaming (em disco acima de 8 MB), validado por
+    colunas em blocos e gravado com COPY no PostgreSQL. As linhas rejeitadas
+    são gravadas em um arquivo CSV; o resumo devolve o seu identificador
+    (reject_file), baixado em GET /ingest/bulk/rejects/{reject_file} por
+    BULK_REJECTS_RETENTION_HOURS horas. Se a carga falhar o arquivo é removido.
+    
+    Exemplo:
+        curl -X POST "http://localhost:8000/ingest/bulk?format=csv" \\
+             -H "Content-Type: text/csv" --data-binary @coletas.csv
+    """
+    purge_expired_rejects()
+    with tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_BYTES) as upload:
+        async for chunk in request.stream():
+            upload.write(chunk)
+        upload.seek(0)
+        
+        reject_id = uuid.uuid4().hex
+        reject_path = _reject_path(reject_id)
+        text = io.TextIOWrapper(upload, encoding="utf-8-sig", newline="")
+        try:
+            with open(reject_path, "w", encoding="utf-8", newline="") as reject_file:
+                summary = await run_in_threadpool(
+                    load_stream,
+                    session,
+                    text,
+                    file_format,
+                    chunk_size,
+                    reject_file,
+                    reject_id
+                )
+        except UnicodeDecodeError:
+            _remove_reject_file(reject_path)
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="O arquivo deve estar codificado em UTF-8."
+            )
+        except BaseException:
+            # O resumo com o id do arquivo não chega ao cliente
+            _remove_reject_file(reject_path)
+            raise
+        finally:
+            text.detach()
+    
+    # Sem rejeições não há motivo para manter o arquivo
+    if summary.rejected == 0:
+        _remove_reject_file(reject_path)
+        summary.reject_file = None
+    
+    return summary
+
+
+@router.get("/ingest/bulk/rejects/{reject_id}", response_class=FileResponse)
+def download_bulk_rejects(
+    reject_id: str = Path(..., pattern=r"^[0-9a-f]{32}$", description="reject_file do resumo da carga")
+):
+    """
+    Baixa o CSV com as linhas rejeitadas de uma carga em massa.
+    """
+    path = _reject_path(reject_id)
+    if not os.path.exists(path):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Arquivo de rejeições não encontrado."
+        )
+    return FileResponse(path, media_type="text/csv", filename=f"rejects-{reject_id}.csv")
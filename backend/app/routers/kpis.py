@@ -1,33 +1,135 @@
-from fastapi import APIRouter, Depends
+from datetime import date
+from fastapi import APIRouter, Depends, Query, Response
 from sqlmodel import Session
+from typing import Literal, Optional
 
 from app.dependencies import get_session
-from app.schemas import AvgPriceByFuel, VolumeByVehicle
-from app.services.kpi_service import get_avg_price_by_fuel as get_avg_price_service
-from app.services.kpi_service import get_volume_by_vehicle as get_volume_service
+from app.http_cache import DataVersion, check_not_modified, conditional_headers
+from app.schemas import AvgPriceByFuel, VolumeByVehicle, TimeseriesPoint, AggregateResponse
+from app.services.kpi_service import get_avg_price_by_fuel_json, get_volume_by_vehicle_json, get_timeseries_json
+from app.services.aggregate_service import build_aggregate_query, get_aggregate_json, DEFAULT_AGGREGATE_LIMIT, MAX_AGGREGATE_LIMIT
 
 router = APIRouter(prefix="/kpis", tags=["KPIs"])
 
 
 @router.get("/avg-price-by-fuel", response_model=list[AvgPriceByFuel])
-def get_avg_price_by_fuel(session: Session = Depends(get_session)):
+def get_avg_price_by_fuel(
+    version: Optional[DataVersion] = Depends(check_not_modified),
+    session: Session = Depends(get_session)
+):
     """
     Retorna a média de preço por tipo de combustível.
     
-    Utiliza agregação SQL (AVG, GROUP BY) para calcular o preço médio
-    de cada tipo de combustível baseado em todos os registros.
+    Calculado a partir dos agregados por combustível mantidos a cada
+    ingestão (soma de preços / contagem), sobre todos os registros.
+    
+    Envia ETag/Last-Modified da versão dos dados; com If-None-Match da
+    versão atual responde 304 sem consultar o banco.
     """
-    return get_avg_price_service(session)
+    # Corpo JSON pré-serializado e cacheado: sem validação/serialização no acerto
+    body = get_avg_price_by_fuel_json(session)
+    return Response(content=body, media_type="application/json", headers=conditional_headers(version))
 
 
 @router.get("/volume-by-vehicle", response_model=list[VolumeByVehicle])
-def get_volume_by_vehicle(session: Session = Depends(get_session)):
+def get_volume_by_vehicle(
+    version: Optional[DataVersion] = Depends(check_not_modified),
+    session: Session = Depends(get_session)
+):
     """
     Retorna o volume total consumido agrupado por tipo de veículo.
     
-    Utiliza agregação SQL (SUM, GROUP BY) para calcular quanto cada
-    tipo de veículo consumiu ao longo do tempo.
+    Lido dos agregados por tipo de veículo mantidos a cada ingestão,
+    sobre todo o histórico.
     
     Útil para responder: \"Quanto as carretas consumiram vs. carros?\"
     """
-    return get_volume_service(session)
+    body = get_volume_by_vehicle_json(session)
+    return Response(content=body, media_type="application/json", headers=conditional_headers(version))
+
+
+@router.get("/timeseries", response_model=list[TimeseriesPoint])
+def get_timeseries(
+    start: date = Query(..., description="Primeiro dia do intervalo (ISO 8601)"),
+    end: date = Query(..., description="Último dia do intervalo (ISO 8601)"),
+    granularity: Literal["day", "week", "month"] = Query("day", description="Tamanho do período"),
+    group_by: list[Literal["fuel_type", "state", "city", "vehicle_type"]] = Query([], description="Dimensões de agrupamento"),
+    fuel_type: Optional[str] = Query(None, description="Filtrar por tipo de combustível"),
+    state: Optional[str] = Query(None, description="Filtrar por estado (UF)"),
+    city: Optional[str] = Query(None, description="Filtrar por cidade"),
+    vehicle_type: Optional[str] = Query(None, description="Filtrar por tipo de veículo"),
+    version: Optional[DataVersion] = Depends(check_not_modified),
+    session: Session = Depends(get_session)
+):
+    """
+    Série temporal de preço médio e volume por período.
+    
+    Respondida apenas pelos rollups por período (dia, semana, mês) mantidos a
+    cada ingestão: a latência não depende do tamanho da tabela de coletas.
+    
+    - granularity: day, week (semanas começam na segunda-feira) ou month
+    - group_by: dimensões de agrupamento, repetível
+      (ex: ?group_by=fuel_type&group_by=state)
+    - fuel_type, state, city, vehicle_type: filtros exatos
+    
+    Útil para responder: "Como o preço da gasolina evoluiu por mês em SP?"
+    """
+    body = get_timeseries_json(
+        session,
+        start=start,
+        end=end,
+        granularity=granularity,
+        group_by=group_by,
+        fuel_type=fuel_type,
+        state=state,
+        city=city,
+        vehicle_type=vehicle_type
+    )
+    return Response(content=body, media_type="application/json", headers=conditional_headers(version))
+
+
+@router.get("/aggregate", response_model=AggregateResponse)
+def get_aggregate(
+    dimensions: list[Literal["fuel_type", "vehicle_type", "state", "city", "store_id"]] = Query([], description="Dimensões de agrupamento"),
+    metrics: list[str] = Query(..., description="Métricas: count ou <função>:<coluna> (ex: avg:sale_price)"),
+    bucket: Optional[Literal["day", "week", "month"]] = Query(None, description="Agrupar também por período"),
+    start: Optional[date] = Query(None, description="Primeiro dia do intervalo (ISO 8601)"),
+    end: Optional[date] = Query(None, description="Último dia do intervalo (ISO 8601)"),
+    fuel_type: Optional[str] = Query(None, description="Filtrar por tipo de combustível"),
+    vehicle_type: Optional[str] = Query(None, description="Filtrar por tipo de veículo"),
+    state: Optional[str] = Query(None, description="Filtrar por estado (UF)"),
+    city: Optional[str] = Query(None, description="Filtrar por cidade"),
+    store_id: Optional[str] = Query(None, description="Filtrar por posto"),
+    order_by: Optional[str] = Query(None, description="Métrica de ordenação (padrão: a primeira)"),
+    limit: int = Query(DEFAULT_AGGREGATE_LIMIT, ge=1, le=MAX_AGGREGATE_LIMIT, description="Quantidade máxima de grupos (top-N)"),
+    version: Optional[DataVersion] = Depends(check_not_modified),
+    session: Session = Depends(get_session)
+):
+    """
+    Agregação genérica: dimensões e métricas de uma lista branca em um único
+    GROUP BY, com top-N.
+    
+    - dimensions (repetível): fuel_type, vehicle_type, state, city, store_id
+    - bucket: agrupa também por período (day, week, month); exige start e end
+    - metrics (repetível): count ou <função>:<coluna>, com função em
+      avg/sum/min/max e coluna em sale_price, volume_sold ou spend
+      (preço x volume). Ex: ?dimensions=state&metrics=avg:sale_price
+    - order_by + limit: top-N pela métrica (decrescente); truncated indica corte
+    
+    Combinações de cardinalidade ilimitada (cidade com posto, cidade/posto com
+    período) são rejeitadas com 400. Quando possível a consulta é respondida
+    pelos rollups por período (source=rollup); o resultado é cacheado pela
+    consulta normalizada e invalidado a cada ingestão.
+    """
+    query = build_aggregate_query(
+        dimensions,
+        metrics,
+        bucket=bucket,
+        start=start,
+        end=end,
+        filters={"fuel_type": fuel_type, "vehicle_type": vehicle_type, "state": state, "city": city, "store_id": store_id},
+        order_by=order_by,
+        limit=limit
+    )
+    body = get_aggregate_json(session, query)
+    return Response(content=body, media_type="application/json", headers=conditional_headers(version))
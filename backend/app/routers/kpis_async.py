@@ -0,0 +1,111 @@
+"""
+Versão assíncrona do router de KPIs (API_MODE=async).
+"""
+from datetime import date
+from fastapi import APIRouter, Depends, Query, Response
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import Literal, Optional
+
+from app.dependencies import get_async_session
+from app.http_cache import DataVersion, check_not_modified_async, conditional_headers
+from app.schemas import AvgPriceByFuel, VolumeByVehicle, TimeseriesPoint, AggregateResponse
+from app.services.kpi_service import (
+    get_avg_price_by_fuel_json_async,
+    get_volume_by_vehicle_json_async,
+    get_timeseries_json_async,
+)
+from app.services.aggregate_service import build_aggregate_query, get_aggregate_json_async, DEFAULT_AGGREGATE_LIMIT, MAX_AGGREGATE_LIMIT
+
+router = APIRouter(prefix="/kpis", tags=["KPIs"])
+
+
+@router.get("/avg-price-by-fuel", response_model=list[AvgPriceByFuel])
+async def get_avg_price_by_fuel(
+    version: Optional[DataVersion] = Depends(check_not_modified_async),
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    Retorna a média de preço por tipo de combustível.
+    """
+    body = await get_avg_price_by_fuel_json_async(session)
+    return Response(content=body, media_type="application/json", headers=conditional_headers(version))
+
+
+@router.get("/volume-by-vehicle", response_model=list[VolumeByVehicle])
+async def get_volume_by_vehicle(
+    version: Optional[DataVersion] = Depends(check_not_modified_async),
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    Retorna o volume total consumido agrupado por tipo de veículo.
+    """
+    body = await get_volume_by_vehicle_json_async(session)
+    return Response(content=body, media_type="application/json", headers=conditional_headers(version))
+
+
+@router.get("/timeseries", response_model=list[TimeseriesPoint])
+async def get_timeseries(
+    start: date = Query(..., description="Primeiro dia do intervalo (ISO 8601)"),
+    end: date = Query(..., description="Último dia do intervalo (ISO 8601)"),
+    granularity: Literal["day", "week", "month"] = Query("day", description="Tamanho do período"),
+    group_by: list[Literal["fuel_type", "state", "city", "vehicle_type"]] = Query([], description="Dimensões de agrupamento"),
+    fuel_type: Optional[str] = Query(None, description="Filtrar por tipo de combustível"),
+    state: Optional[str] = Query(None, description="Filtrar por estado (UF)"),
+    city: Optional[str] = Query(None, description="Filtrar por cidade"),
+    vehicle_type: Optional[str] = Query(None, description="Filtrar por tipo de veículo"),
+    version: Optional[DataVersion] = Depends(check_not_modified_async),
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    Série temporal de preço médio e volume por período.
+    
+    Mesmos parâmetros e resposta da versão síncrona; ver GET /kpis/timeseries.
+    """
+    body = await get_timeseries_json_async(
+        session,
+        start=start,
+        end=end,
+        granularity=granularity,
+        group_by=group_by,
+        fuel_type=fuel_type,
+        state=state,
+        city=city,
+        vehicle_type=vehicle_type
+    )
+    return Response(content=body, media_type="application/json", headers=conditional_headers(version))
+
+
+@router.get("/aggregate", response_model=AggregateResponse)
+async def get_aggregate(
+    dimensions: list[Literal["fuel_type", "vehicle_type", "state", "city", "store_id"]] = Query([], description="Dimensões de agrupamento"),
+    metrics: list[str] = Query(..., description="Métricas: count ou <função>:<coluna> (ex: avg:sale_price)"),
+    bucket: Optional[Literal["day", "week", "month"]] = Query(None, description="Agrupar também por período"),
+    start: Optional[date] = Query(None, description="Primeiro dia do intervalo (ISO 8601)"),
+    end: Optional[date] = Query(None, description="Último dia do intervalo (ISO 8601)"),
+    fuel_type: Optional[str] = Query(None, description="Filtrar por tipo de combustível"),
+    vehicle_type: Optional[str] = Query(None, description="Filtrar por tipo de veículo"),
+    state: Optional[str] = Query(None, description="Filtrar por estado (UF)"),
+    city: Optional[str] = Query(None, description="Filtrar por cidade"),
+    store_id: Optional[str] = Query(None, description="Filtrar por posto"),
+    order_by: Optional[str] = Query(None, description="Métrica de ordenação (padrão: a primeira)"),
+    limit: int = Query(DEFAULT_AGGREGATE_LIMIT, ge=1, le=MAX_AGGREGATE_LIMIT, description="Quantidade máxima de grupos (top-N)"),
+    version: Optional[DataVersion] = Depends(check_not_modified_async),
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    Agregação genérica sobre as coletas.
+    
+    Mesmos parâmetros e resposta da versão síncrona; ver GET /kpis/aggregate.
+    """
+    query = build_aggregate_query(
+        dimensions,
+        metrics,
+        bucket=bucket,
+        start=start,
+        end=end,
+        filters={"fuel_type": fuel_type, "vehicle_type": vehicle_type, "state": state, "city": city, "store_id": store_id},
+        order_by=order_by,
+        limit=limit
+    )
+    body = await get_aggregate_json_async(session, query)
+    return Response(content=body, media_type="application/json", headers=conditional_headers(version))
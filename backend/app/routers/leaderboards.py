@@ -0,0 +1,62 @@
+from fastapi import APIRouter, Depends, Query
+from sqlmodel import Session
+from typing import Literal
+
+from app.dependencies import get_session
+from app.schemas import LeaderboardResponse
+from app.services.leaderboard_service import get_leaderboard, DEFAULT_LEADERBOARD_LIMIT, MAX_LEADERBOARD_LIMIT
+
+router = APIRouter(prefix="/leaderboards", tags=["Rankings"])
+
+Window = Literal["today", "7d", "30d"]
+
+
+@router.get("/drivers/spend", response_model=LeaderboardResponse)
+def get_drivers_by_spend(
+    window: Window = Query("7d", description="Janela: hoje, 7 ou 30 dias"),
+    limit: int = Query(DEFAULT_LEADERBOARD_LIMIT, ge=1, le=MAX_LEADERBOARD_LIMIT, description="Quantidade de posições"),
+    session: Session = Depends(get_session)
+):
+    """
+    Motoristas que mais gastaram (R$) na janela.
+    
+    Lido dos rankings mantidos a cada ingestão, sem varrer as coletas.
+    """
+    return get_leaderboard(session, "drivers-spend", window, limit)
+
+
+@router.get("/stations/volume", response_model=LeaderboardResponse)
+def get_stations_by_volume(
+    window: Window = Query("7d", description="Janela: hoje, 7 ou 30 dias"),
+    limit: int = Query(DEFAULT_LEADERBOARD_LIMIT, ge=1, le=MAX_LEADERBOARD_LIMIT, description="Quantidade de posições"),
+    session: Session = Depends(get_session)
+):
+    """
+    Postos com maior volume vendido (litros) na janela.
+    """
+    return get_leaderboard(session, "stations-volume", window, limit)
+
+
+@router.get("/stations/price", response_model=LeaderboardResponse)
+def get_stations_by_price(
+    fuel_type: str = Query(..., description="Tipo de combustível"),
+    window: Window = Query("7d", description="Janela: hoje, 7 ou 30 dias"),
+    limit: int = Query(DEFAULT_LEADERBOARD_LIMIT, ge=1, le=MAX_LEADERBOARD_LIMIT, description="Quantidade de posições"),
+    session: Session = Depends(get_session)
+):
+    """
+    Postos mais caros para o combustível: maior preço praticado na janela.
+    """
+    return get_leaderboard(session, "stations-price", window, limit, fuel_type=fuel_type)
+
+
+@router.get("/vehicles/volume", response_model=LeaderboardResponse)
+def get_vehicles_by_volume(
+    window: Window = Query("7d", description="Janela: hoje, 7 ou 30 dias"),
+    limit: int = Query(DEFAULT_LEADERBOARD_LIMIT, ge=1, le=MAX_LEADERBOARD_LIMIT, description="Quantidade de posições"),
+    session: Session = Depends(get_session)
+):
+    """
+    Veículos (placas) da frota que mais abasteceram (litros) na janela.
+    """
+    return get_leaderboard(session, "vehicles-volume", window, limit)
@@ -6,6 +6,9 @@ from sqlmodel import Session, select
 from app.dependencies import get_session
 from app.cache import get_redis_client
 from app.middleware import get_metrics, reset_metrics
+from app.ingest_queue import INGEST_MODE, get_queue_metrics
+from app.analytics import get_snapshot
+import sqlite3
 import redis
 
 router = APIRouter(tags=["Observability"])
@@ -61,6 +64,8 @@ def get_app_metrics():
     - Tempo médio por endpoint
     - Status codes
     - Cache hit rate
+    - Fila de ingestão (profundidade, atraso e latência do flush), no modo assíncrono
+    - Snapshot analítico (linhas e memória), com ANALYTICS_ENGINE=numpy
     """
     app_metrics = get_metrics()
     
@@ -77,11 +82,25 @@ def get_app_metrics():
             "hits": hits,
             "misses": misses,
             "hit_rate": round((hits / total * 100) if total > 0 else 0, 2),
-            "total_keys": len(client.keys("*"))
+            # DBSIZE é O(1); KEYS bloquearia o Redis
+            "total_keys": client.dbsize()
         }
     except (redis.RedisError, redis.ConnectionError):
         app_metrics["cache"] = {"status": "unavailable"}
     
+    # Adiciona métricas da fila de ingestão assíncrona
+    if INGEST_MODE == "async":
+        try:
+            app_metrics["ingest_queue"] = get_queue_metrics()
+        except (redis.RedisError, sqlite3.Error):
+            # Redis fora do ar ou falha na fila SQLite de fallback
+            app_metrics["ingest_queue"] = {"status": "unavailable"}
+    
+    # Adiciona o tamanho do snapshot colunar deste worker
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        app_metrics["analytics_snapshot"] = snapshot.stats()
+    
     return app_metrics
 
 
@@ -1,16 +1,30 @@
-from fastapi import APIRouter, Depends, Query
+from datetime import datetime
+from fastapi import APIRouter, Depends, Query, Response
 from sqlmodel import Session
+from typing import Literal, Optional
 
 from app.dependencies import get_session
-from app.schemas import DriverReport
-from app.services.report_service import get_driver_report as get_driver_report_service
+from app.http_cache import DataVersion, check_not_modified, conditional_headers
+from app.schemas import DriverReport, AnomalyPage
+from app.services.report_service import (
+    get_driver_report as get_driver_report_service,
+    get_anomalies as get_anomalies_service,
+    DEFAULT_HISTORY_PAGE_SIZE,
+    DEFAULT_ANOMALY_PAGE_SIZE,
+)
 
 router = APIRouter(prefix="/reports", tags=["Relatórios"])
 
 
 @router.get("/drivers", response_model=DriverReport)
 def get_driver_report(
+    response: Response,
     search: str = Query(..., description="CPF (11 dígitos) ou Nome do motorista"),
+    start_date: Optional[datetime] = Query(None, description="Abastecimentos a partir desta data (ISO 8601)"),
+    end_date: Optional[datetime] = Query(None, description="Abastecimentos até esta data (ISO 8601)"),
+    cursor: Optional[str] = Query(None, description="Cursor de next_cursor/prev_cursor do histórico"),
+    page_size: int = Query(DEFAULT_HISTORY_PAGE_SIZE, ge=1, le=500, description="Tamanho da página do histórico"),
+    version: Optional[DataVersion] = Depends(check_not_modified),
     session: Session = Depends(get_session)
 ):
     """
@@ -21,6 +35,60 @@ def get_driver_report(
     - Total gasto (R$)
     - Volume total abastecido
     - Combustível favorito
-    - Histórico completo de abastecimentos
+    - Datas do primeiro e do último abastecimento
+    - Histórico de abastecimentos paginado por cursor (next_cursor/prev_cursor)
+    
+    start_date/end_date restringem totais e histórico ao período informado.
+    
+    Envia ETag/Last-Modified da versão dos dados; com If-None-Match da
+    versão atual responde 304 sem consultar o banco.
+    """
+    response.headers.update(conditional_headers(version))
+    return get_driver_report_service(
+        search,
+        session,
+        start_date=start_date,
+        end_date=end_date,
+        cursor=cursor,
+        page_size=page_size
+    )
+
+
+@router.get("/anomalies", response_model=AnomalyPage)
+def get_anomalies(
+    response: Response,
+    kind: Optional[Literal["price_store", "price_city", "volume_vehicle"]] = Query(None, description="Regra: preço no posto, preço na cidade ou volume do veículo"),
+    fuel_type: Optional[str] = Query(None, description="Tipo de combustível"),
+    store_id: Optional[str] = Query(None, description="Identificador do posto"),
+    city: Optional[str] = Query(None, description="Cidade"),
+    state: Optional[str] = Query(None, description="Estado (UF)"),
+    start_date: Optional[datetime] = Query(None, description="Coletas a partir desta data (ISO 8601)"),
+    end_date: Optional[datetime] = Query(None, description="Coletas até esta data (ISO 8601)"),
+    min_z_score: Optional[float] = Query(None, ge=0, description="|z-score| mínimo"),
+    cursor: Optional[str] = Query(None, description="Cursor de next_cursor/prev_cursor"),
+    page_size: int = Query(DEFAULT_ANOMALY_PAGE_SIZE, ge=1, le=500, description="Tamanho da página"),
+    version: Optional[DataVersion] = Depends(check_not_modified),
+    session: Session = Depends(get_session)
+):
+    """
+    Lista as coletas sinalizadas na ingestão, das mais recentes para as mais antigas.
+    
+    Cada coleta é comparada, ao ser gravada, com a média e o desvio padrão
+    correntes do preço no posto e na cidade (por combustível) e do volume
+    por tipo de veículo. Cada sinalização traz o valor, a média e o desvio
+    do grupo e o z-score.
     """
-    return get_driver_report_service(search, session)
+    response.headers.update(conditional_headers(version))
+    return get_anomalies_service(
+        session,
+        kind=kind,
+        fuel_type=fuel_type,
+        store_id=store_id,
+        city=city,
+        state=state,
+        start_date=start_date,
+        end_date=end_date,
+        min_z_score=min_z_score,
+        cursor=cursor,
+        page_size=page_size
+    )
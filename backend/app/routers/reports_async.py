@@ -0,0 +1,80 @@
+"""
+Versão assíncrona do router de relatórios (API_MODE=async).
+"""
+from datetime import datetime
+from fastapi import APIRouter, Depends, Query, Response
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import Literal, Optional
+
+from app.dependencies import get_async_session
+from app.http_cache import DataVersion, check_not_modified_async, conditional_headers
+from app.schemas import DriverReport, AnomalyPage
+from app.services.report_service import (
+    get_driver_report_async, get_anomalies_async, DEFAULT_HISTORY_PAGE_SIZE, DEFAULT_ANOMALY_PAGE_SIZE,
+)
+
+router = APIRouter(prefix="/reports", tags=["Relatórios"])
+
+
+@router.get("/drivers", response_model=DriverReport)
+async def get_driver_report(
+    response: Response,
+    search: str = Query(..., description="CPF (11 dígitos) ou Nome do motorista"),
+    start_date: Optional[datetime] = Query(None, description="Abastecimentos a partir desta data (ISO 8601)"),
+    end_date: Optional[datetime] = Query(None, description="Abastecimentos até esta data (ISO 8601)"),
+    cursor: Optional[str] = Query(None, description="Cursor de next_cursor/prev_cursor do histórico"),
+    page_size: int = Query(DEFAULT_HISTORY_PAGE_SIZE, ge=1, le=500, description="Tamanho da página do histórico"),
+    version: Optional[DataVersion] = Depends(check_not_modified_async),
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    Retorna relatório completo de um motorista específico.
+    
+    Mesmos parâmetros e resposta da versão síncrona; ver GET /reports/drivers.
+    """
+    response.headers.update(conditional_headers(version))
+    return await get_driver_report_async(
+        search,
+        session,
+        start_date=start_date,
+        end_date=end_date,
+        cursor=cursor,
+        page_size=page_size
+    )
+
+
+@router.get("/anomalies", response_model=AnomalyPage)
+async def get_anomalies(
+    response: Response,
+    kind: Optional[Literal["price_store", "price_city", "volume_vehicle"]] = Query(None, description="Regra: preço no posto, preço na cidade ou volume do veículo"),
+    fuel_type: Optional[str] = Query(None, description="Tipo de combustível"),
+    store_id: Optional[str] = Query(None, description="Identificador do posto"),
+    city: Optional[str] = Query(None, description="Cidade"),
+    state: Optional[str] = Query(None, description="Estado (UF)"),
+    start_date: Optional[datetime] = Query(None, description="Coletas a partir desta data (ISO 8601)"),
+    end_date: Optional[datetime] = Query(None, description="Coletas até esta data (ISO 8601)"),
+    min_z_score: Optional[float] = Query(None, ge=0, description="|z-score| mínimo"),
+    cursor: Optional[str] = Query(None, description="Cursor de next_cursor/prev_cursor"),
+    page_size: int = Query(DEFAULT_ANOMALY_PAGE_SIZE, ge=1, le=500, description="Tamanho da página"),
+    version: Optional[DataVersion] = Depends(check_not_modified_async),
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    Lista as coletas sinalizadas na ingestão.
+    
+    Mesmos parâmetros e resposta da versão síncrona; ver GET /reports/anomalies.
+    """
+    response.headers.update(conditional_headers(version))
+    return await get_anomalies_async(
+        session,
+        kind=kind,
+        fuel_type=fuel_type,
+        store_id=store_id,
+        city=city,
+        state=state,
+        start_date=start_date,
+        end_date=end_date,
+        min_z_score=min_z_score,
+        cursor=cursor,
+        page_size=page_size
+    )
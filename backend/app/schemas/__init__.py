@@ -1,12 +1,25 @@
 from .fuel_collection import FuelCollectionCreate
-from .responses import FuelCollectionRead, PaginatedResponse
-from .kpis import AvgPriceByFuel, VolumeByVehicle, DriverReport
+from .responses import FuelCollectionRead, PaginatedResponse, BatchItemError, BatchIngestResponse
+from .responses import BulkRejectedRow, BulkIngestSummary, IngestAccepted
+from .kpis import AvgPriceByFuel, VolumeByVehicle, DriverReport, TimeseriesPoint, AggregateResponse
+from .kpis import LeaderboardEntry, LeaderboardResponse, PriceAnomalyRead, AnomalyPage
 
 __all__ = [
     "FuelCollectionCreate",
     "FuelCollectionRead",
     "PaginatedResponse",
+    "BatchItemError",
+    "BatchIngestResponse",
+    "BulkRejectedRow",
+    "BulkIngestSummary",
+    "IngestAccepted",
     "AvgPriceByFuel",
     "VolumeByVehicle",
     "DriverReport",
+    "TimeseriesPoint",
+    "AggregateResponse",
+    "LeaderboardEntry",
+    "LeaderboardResponse",
+    "PriceAnomalyRead",
+    "AnomalyPage",
 ]
@@ -1,5 +1,6 @@
 from sqlmodel import SQLModel, Field
 from pydantic import field_validator, computed_field
+import math
 import re
 
 # Definição dos tipos de combustível e veículo para melhor tipagem e validação
@@ -9,7 +10,7 @@ VEHICLE_TYPES = ["Carro", "Moto", "Caminhão Leve", "Carreta", "Ônibus"]
 
 class FuelCollectionCreate(SQLModel):
     """Schema para criação de nova coleta"""
-    store_id: str
+    store_id: str = Field(max_length=50)
     store_name: str
     city: str
     state: str
@@ -18,7 +19,7 @@ class FuelCollectionCreate(SQLModel):
     volume_sold: float = Field(ge=0, description="Volume em litros")
     driver_name: str
     driver_cpf: str = Field(min_length=11, max_length=11, description="CPF com 11 dígitos")
-    vehicle_plate: str
+    vehicle_plate: str = Field(max_length=10)
     vehicle_type: str
     
     @field_validator('driver_cpf')
@@ -29,6 +30,14 @@ class FuelCollectionCreate(SQLModel):
             raise ValueError('CPF deve conter exatamente 11 dígitos numéricos')
         return v
     
+    @field_validator('sale_price', 'volume_sold')
+    @classmethod
+    def validate_finite(cls, v: float) -> float:
+        """Recusa infinito (NaN já falha no ge=0)"""
+        if not math.isfinite(v):
+            raise ValueError('Deve ser um número finito')
+        return v
+    
     @field_validator('fuel_type')
     @classmethod
     def validate_fuel_type(cls, v: str) -> str:
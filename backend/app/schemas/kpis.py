@@ -1,3 +1,5 @@
+from datetime import date, datetime
+from typing import Any, Optional
 from sqlmodel import SQLModel, Field
 from app.schemas.responses import FuelCollectionRead
 
@@ -24,4 +26,73 @@ class DriverReport(SQLModel):
     total_spent: float = Field(description="Total gasto em R$")
     total_volume: float = Field(description="Volume total abastecido em litros")
     favorite_fuel: str = Field(description="Combustível mais utilizado")
-    refuels: list[FuelCollectionRead] = Field(description="Histórico de abastecimentos")
+    first_refuel: Optional[datetime] = Field(default=None, description="Data do primeiro abastecimento")
+    last_refuel: Optional[datetime] = Field(default=None, description="Data do último abastecimento")
+    refuels: list[FuelCollectionRead] = Field(description="Página do histórico de abastecimentos")
+    next_cursor: Optional[str] = Field(default=None, description="Cursor da próxima página do histórico")
+    prev_cursor: Optional[str] = Field(default=None, description="Cursor da página anterior do histórico")
+
+
+class TimeseriesPoint(SQLModel):
+    """Preço médio e volume de um período (e grupo, se houver agrupamento)"""
+    bucket: date = Field(description="Início do período (dia, segunda-feira da semana ou dia 1 do mês)")
+    fuel_type: Optional[str] = Field(default=None, description="Tipo de combustível (se agrupado)")
+    state: Optional[str] = Field(default=None, description="Estado (se agrupado)")
+    city: Optional[str] = Field(default=None, description="Cidade (se agrupado)")
+    vehicle_type: Optional[str] = Field(default=None, description="Tipo de veículo (se agrupado)")
+    avg_price: float = Field(description="Preço médio em R$/litro")
+    total_volume: float = Field(description="Volume total em litros")
+    total_records: int = Field(description="Número de registros computados")
+
+
+class AggregateResponse(SQLModel):
+    """Resultado de uma agregação genérica (/kpis/aggregate)"""
+    dimensions: list[str] = Field(description="Colunas de agrupamento (bucket = início do período)")
+    metrics: list[str] = Field(description="Colunas de métricas (ex: avg_sale_price, count)")
+    rows: list[dict[str, Any]] = Field(description="Um objeto por grupo, ordenado pela métrica de order_by (decrescente)")
+    truncated: bool = Field(description="Se havia mais grupos que o limit (top-N)")
+    source: str = Field(description="Origem dos dados: rollup (kpi_rollup), collections, snapshot (ANALYTICS_ENGINE=numpy) ou collections+archive (tabela e arquivo frio)")
+
+
+class LeaderboardEntry(SQLModel):
+    """Uma posição de um ranking"""
+    rank: int = Field(description="Posição (1 = maior valor)")
+    key: str = Field(description="CPF mascarado, CNPJ do posto ou placa")
+    name: Optional[str] = Field(default=None, description="Nome do motorista ou do posto")
+    city: Optional[str] = Field(default=None, description="Cidade do posto")
+    state: Optional[str] = Field(default=None, description="Estado do posto")
+    value: float = Field(description="Gasto (R$), volume (litros) ou maior preço (R$/litro)")
+
+
+class LeaderboardResponse(SQLModel):
+    """Top N de um ranking em uma janela de tempo"""
+    board: str = Field(description="Ranking")
+    window: str = Field(description="Janela: today, 7d ou 30d")
+    fuel_type: Optional[str] = Field(default=None, description="Combustível (rankings por combustível)")
+    entries: list[LeaderboardEntry]
+
+
+class PriceAnomalyRead(SQLModel):
+    """Coleta sinalizada pelo detector de anomalias da ingestão"""
+    id: int
+    collection_id: int = Field(description="Id da coleta sinalizada")
+    collection_date: datetime
+    kind: str = Field(description="Regra: price_store, price_city ou volume_vehicle")
+    fuel_type: str
+    store_id: str
+    city: str
+    state: str
+    vehicle_type: str
+    value: float = Field(description="Preço (R$/litro) ou volume (litros) da coleta")
+    expected: float = Field(description="Média do grupo antes da coleta")
+    stddev: float = Field(description="Desvio padrão do grupo antes da coleta")
+    z_score: float = Field(description="Distância da média em desvios padrão")
+    samples: int = Field(description="Coletas do grupo antes da coleta")
+
+
+class AnomalyPage(SQLModel):
+    """Página de coletas sinalizadas, das mais recentes para as mais antigas"""
+    page_size: int = Field(description="Tamanho da página")
+    data: list[PriceAnomalyRead]
+    next_cursor: Optional[str] = Field(default=None, description="Cursor da próxima página")
+    prev_cursor: Optional[str] = Field(default=None, description="Cursor da página anterior")
@@ -1,4 +1,5 @@
 from datetime import datetime
+from typing import Optional
 from sqlmodel import SQLModel, Field
 from pydantic import computed_field
 from app.models import FuelCollectionBase
@@ -21,7 +22,48 @@ class FuelCollectionRead(FuelCollectionBase):
 
 class PaginatedResponse(SQLModel):
     """Schema genérico para respostas paginadas"""
-    total: int = Field(description="Total de registros no banco")
-    page: int = Field(description="Página atual")
+    total: Optional[int] = Field(default=None, description="Total de registros no banco (omitido com include_total=false)")
+    total_is_exact: Optional[bool] = Field(default=None, description="Se o total é exato (false quando estimado pelo planner)")
+    page: Optional[int] = Field(default=None, description="Página atual (apenas na paginação por número)")
     page_size: int = Field(description="Tamanho da página")
     data: list[FuelCollectionRead] = Field(description="Lista de coletas")
+    next_cursor: Optional[str] = Field(default=None, description="Cursor da próxima página")
+    prev_cursor: Optional[str] = Field(default=None, description="Cursor da página anterior")
+
+
+class BatchItemError(SQLModel):
+    """Erro de validação de um item do lote"""
+    index: int = Field(description="Posição do item no lote enviado")
+    errors: list[dict] = Field(description="Erros de validação do item")
+
+
+class BatchIngestResponse(SQLModel):
+    """Resultado da ingestão em lote"""
+    received: int = Field(description="Total de itens recebidos")
+    inserted: int = Field(description="Total de itens inseridos")
+    rejected: int = Field(description="Total de itens rejeitados na validação")
+    data: list[FuelCollectionRead] = Field(description="Coletas inseridas")
+    errors: list[BatchItemError] = Field(description="Erros por item rejeitado")
+
+
+class BulkRejectedRow(SQLModel):
+    """Linha rejeitada na carga em massa"""
+    line: int = Field(description="Número da linha no arquivo de origem")
+    reason: str = Field(description="Motivo da rejeição")
+
+
+class BulkIngestSummary(SQLModel):
+    """Resumo de uma carga em massa"""
+    total_rows: int = Field(description="Total de linhas lidas")
+    inserted: int = Field(description="Total de linhas inseridas")
+    rejected: int = Field(description="Total de linhas rejeitadas")
+    elapsed_seconds: float = Field(description="Duração da carga em segundos")
+    rows_per_second: float = Field(description="Vazão da carga (linhas lidas por segundo)")
+    reject_file: Optional[str] = Field(default=None, description="Identificador (ou nome, na carga pela linha de comando) do arquivo com as linhas rejeitadas")
+    sample_errors: list[BulkRejectedRow] = Field(description="Amostra das primeiras rejeições")
+
+
+class IngestAccepted(SQLModel):
+    """Confirmação de coleta enfileirada (ingestão assíncrona)"""
+    tracking_id: str = Field(description="Identificador de acompanhamento do item na fila")
+    status: str = Field(default="queued", description="Situação do item")
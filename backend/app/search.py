@@ -0,0 +1,177 @@
+"""
+Busca por substring, sem acentos e sem diferenciar maiúsculas, em cidade e
+nome do motorista.
+
+fuelcollection é uma view sobre o esquema estrela (app.star_schema), então
+os índices ficam nas tabelas de origem. PostgreSQL: índices GIN pg_trgm sobre
+f_unaccent(coluna) nas dimensões (dim_store.city, dim_driver.name), usados
+pelo LIKE com curinga no início, que o planejador leva da view para a
+dimensão; sem permissão para criar as extensões, ILIKE sem índice e sem
+ignorar acentos. SQLite: tabela FTS5 com tokenizer trigram por coleta (rowid =
+id do fato) mantida por triggers no fato (permite testar a funcionalidade sem
+PostgreSQL).
+"""
+import logging
+import unicodedata
+import weakref
+from sqlalchemy import event, func, select, text, bindparam, column as sql_column, table as sql_table
+from sqlalchemy.engine import Engine
+from app.models import FuelCollection
+from app.star_schema import STAR_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+# Colunas de FuelCollection com busca textual
+SEARCH_COLUMNS = ["city", "driver_name"]
+
+SQLITE_FTS_TABLE = "fuelcollection_search"
+
+# Tamanho mínimo do termo para usar o índice de trigramas
+MIN_TRIGRAM_LENGTH = 3
+
+# Engines SQLite com a tabela FTS5 configurada
+_fts_engines = weakref.WeakSet()
+
+# Bancos PostgreSQL com f_unaccent criada (chave: _database_key); o engine
+# assíncrono do mesmo banco também a encontra
+_unaccent_databases: set[tuple] = set()
+
+
+def _database_key(engine: Engine) -> tuple:
+    url = engine.url
+    return (url.get_backend_name(), url.host, url.port, url.database)
+
+
+def normalize_text(value: str) -> str:
+    """Remove acentos, espaços nas pontas e converte para minúsculas ("São Paulo" -> "sao paulo")."""
+    decomposed = unicodedata.normalize("NFKD", value or "")
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower().strip()
+
+
+def _sqlite_unaccent(value):
+    return None if value is None else normalize_text(value)
+
+
+def _register_sqlite_function(dbapi_connection, connection_record=None):
+    dbapi_connection.create_function("f_unaccent", 1, _sqlite_unaccent, deterministic=True)
+
+
+POSTGRES_SETUP = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    # unaccent() não é IMMUTABLE; o wrapper permite usá-la em índices
+    "CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text AS "
+    "$$ SELECT lower(public.unaccent('public.unaccent'::regdictionary, $1)) $$ "
+    "LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT",
+] + [
+    f"CREATE INDEX IF NOT EXISTS ix_{column.table.name}_{column.name}_trgm "
+    f"ON {column.table.name} USING gin (f_unaccent({column.name}) gin_trgm_ops)"
+    for column in (STAR_COLUMNS[name][1] for name in SEARCH_COLUMNS)
+]
+
+# Coluna da busca na coleta do fato `new`/`old` (subconsulta na dimensão)
+_SEARCH_VALUES = ", ".join(
+    f"(SELECT f_unaccent({column.name}) FROM {column.table.name} WHERE id = new.{fact_column})"
+    for fact_column, column in (STAR_COLUMNS[name] for name in SEARCH_COLUMNS)
+)
+
+SQLITE_SETUP = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_FTS_TABLE} "
+    f"USING fts5({', '.join(SEARCH_COLUMNS)}, tokenize='trigram')",
+    f"CREATE TRIGGER IF NOT EXISTS fuel_fact_search_ai AFTER INSERT ON fuel_fact BEGIN "
+    f"INSERT INTO {SQLITE_FTS_TABLE} (rowid, city, driver_name) VALUES (new.id, {_SEARCH_VALUES}); END",
+    f"CREATE TRIGGER IF NOT EXISTS fuel_fact_search_ad AFTER DELETE ON fuel_fact BEGIN "
+    f"DELETE FROM {SQLITE_FTS_TABLE} WHERE rowid = old.id; END",
+    f"CREATE TRIGGER IF NOT EXISTS fuel_fact_search_au AFTER UPDATE OF store_key, driver_key ON fuel_fact BEGIN "
+    f"UPDATE {SQLITE_FTS_TABLE} SET (city, driver_name) = ({_SEARCH_VALUES}) WHERE rowid = new.id; END",
+    # Indexa coletas existentes antes da criação da tabela FTS5 (a view, ou
+    # a tabela larga antes da migração 8)
+    f"INSERT INTO {SQLITE_FTS_TABLE} (rowid, city, driver_name) "
+    f"SELECT id, f_unaccent(city), f_unaccent(driver_name) FROM fuelcollection "
+    f"WHERE id > (SELECT coalesce(max(rowid), 0) FROM {SQLITE_FTS_TABLE})",
+]
+
+
+def setup_search(engine: Engine):
+    """
+    Cria a infraestrutura de busca textual no banco.
+
+    Chamada na criação das tabelas; é idempotente.
+
+    Args:
+        engine: Engine do banco de dados
+    """
+    dialect = engine.dialect.name
+    if dialect == "postgresql":
+        try:
+            with engine.begin() as conn:
+                for statement in POSTGRES_SETUP:
+                    conn.execute(text(statement))
+        except Exception as e:
+            # Sem permissão para criar extensões a busca continua via ILIKE
+            # sem índice (text_search_condition não usa f_unaccent)
+            _unaccent_databases.discard(_database_key(engine))
+            logger.warning(f"Não foi possível configurar pg_trgm/unaccent: {e}")
+        else:
+            _unaccent_databases.add(_database_key(engine))
+    elif dialect == "sqlite":
+        register_search_engine(engine)
+        with engine.begin() as conn:
+            # Conexões já abertas (ex.: StaticPool) não passam pelo evento connect
+            _register_sqlite_function(conn.connection.driver_connection)
+            for statement in SQLITE_SETUP:
+                conn.execute(text(statement))
+
+
+def register_search_engine(engine: Engine):
+    """
+    Habilita a busca FTS5 em outro engine do mesmo banco SQLite.
+
+    Não cria tabelas (feito por setup_search); apenas registra a função
+    f_unaccent nas novas conexões. Usado pelo engine assíncrono
+    (async_engine.sync_engine). Sem efeito nos demais bancos.
+
+    Args:
+        engine: Engine síncrono (ou sync_engine de um AsyncEngine)
+    """
+    if engine.dialect.name != "sqlite" or engine in _fts_engines:
+        return
+    event.listen(engine, "connect", _register_sqlite_function)
+    _fts_engines.add(engine)
+
+
+def _escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def text_search_condition(bind: Engine, column, term: str):
+    """
+    Condição WHERE de busca por substring, sem acentos e sem caixa.
+
+    Args:
+        bind: Engine da sessão (session.get_bind())
+        column: Coluna de FuelCollection (city ou driver_name)
+        term: Termo digitado pelo usuário
+
+    Returns:
+        Expressão SQL para usar em .where()
+    """
+    normalized = normalize_text(term)
+    pattern = f"%{_escape_like(normalized)}%"
+    dialect = bind.dialect.name
+
+    if dialect == "postgresql" and _database_key(bind) in _unaccent_databases:
+        return func.f_unaccent(column).like(pattern, escape="\\")
+
+    if dialect == "sqlite" and bind in _fts_engines:
+        if len(normalized) >= MIN_TRIGRAM_LENGTH:
+            fts = sql_table(SQLITE_FTS_TABLE, sql_column("rowid"))
+            phrase = '"' + normalized.replace('"', '""') + '"'
+            match = text(f"{SQLITE_FTS_TABLE} MATCH :query").bindparams(
+                bindparam("query", f"{column.key} : {phrase}", unique=True)
+            )
+            return FuelCollection.id.in_(select(fts.c.rowid).where(match))
+        return func.f_unaccent(column).like(pattern, escape="\\")
+
+    # Sem f_unaccent (ou outro banco): ignora só a caixa, não os acentos
+    return column.ilike(f"%{_escape_like(term.strip())}%", escape="\\")
@@ -1 +1,4 @@
 # Services layer - Business logic
+
+# Registra os eventos que mantêm os agregados dos KPIs em dia
+from app.services import summary_service  # noqa: F401
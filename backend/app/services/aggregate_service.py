@@ -0,0 +1,501 @@
+"""
+Agregações genéricas sobre as coletas: dimensões e métricas de uma lista
+branca compiladas em um único SELECT ... GROUP BY.
+
+Quando todas as dimensões, métricas e filtros existem nos rollups por período
+(kpi_rollup) e o intervalo de datas se alinha a uma granularidade, a consulta
+lê os rollups em vez das coletas. Com ANALYTICS_ENGINE=numpy, as demais
+consultas são calculadas no snapshot colunar em memória (app.analytics).
+Sem ele, leem o fato do esquema estrela (app.star_schema):
+agrupam pelos códigos dos tipos e pela chave do posto e só juntam as
+dimensões aos grupos.
+
+Quando o intervalo alcança o arquivo frio (app.archive), as consultas que não
+saem dos rollups (que já contam as coletas arquivadas) somam estados
+parciais (contagem, soma, mínimo e máximo) da tabela e dos arquivos Parquet
+do intervalo e só então calculam as médias.
+"""
+import asyncio
+import hashlib
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import Optional, Sequence
+from fastapi import HTTPException, status
+# select do SQLAlchemy: com uma única coluna, o do SQLModel devolveria escalares
+from sqlalchemy import Float, func, select, type_coerce
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.analytics import SNAPSHOT_DIMENSIONS, ColumnarSnapshot, get_snapshot
+from app.archive import ArchiveQuery, aggregate_archived, archived_files, archived_files_async
+from app.cache import cached_response
+from app.models import FuelFact, KpiRollup
+from app.schemas import AggregateResponse
+from app.services.summary_service import (
+    ROLLUP_DIMENSIONS,
+    ROLLUP_GRANULARITIES,
+    bucket_expression,
+    bucket_start,
+    count_buckets,
+)
+from app.star_schema import grouped_facts, star_condition
+
+# Dimensões de agrupamento permitidas (além do período, "bucket")
+AGGREGATE_DIMENSIONS = ["fuel_type", "vehicle_type", "state", "city", "store_id"]
+
+# Dimensões de cardinalidade alta (cresce com a base de postos)
+HIGH_CARDINALITY_DIMENSIONS = {"city", "store_id"}
+
+# Funções e colunas das métricas; "spend" = preço x volume
+AGGREGATE_FUNCTIONS = ["avg", "sum", "min", "max"]
+AGGREGATE_COLUMNS = ["sale_price", "volume_sold", "spend"]
+
+# Limites da consulta
+MAX_AGGREGATE_DIMENSIONS = 3
+MAX_AGGREGATE_BUCKETS = 1000
+DEFAULT_AGGREGATE_LIMIT = 100
+MAX_AGGREGATE_LIMIT = 1000
+
+# Colunas dos rollups que respondem cada métrica (soma, contagem)
+_ROLLUP_SUMS = {"sale_price": "sum_price", "volume_sold": "sum_volume"}
+
+
+@dataclass(frozen=True)
+class AggregateQuery:
+    """
+    Consulta de agregação normalizada.
+
+    Duas consultas equivalentes (mesmas dimensões e métricas em outra ordem,
+    filtros vazios omitidos) produzem a mesma instância e a mesma chave de
+    cache.
+    """
+    dimensions: tuple[str, ...]
+    metrics: tuple[str, ...]
+    bucket: Optional[str] = None
+    start: Optional[date] = None
+    end: Optional[date] = None
+    filters: tuple[tuple[str, str], ...] = ()
+    order_by: Optional[str] = None
+    limit: int = DEFAULT_AGGREGATE_LIMIT
+
+    def __str__(self) -> str:
+        # Usado por cache_key: chave curta derivada da consulta normalizada
+        return hashlib.sha1(repr(self).encode()).hexdigest()
+
+
+def _bad_request(detail: str):
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+
+
+def _parse_metric(metric: str) -> tuple[str, Optional[str]]:
+    """Separa função e coluna da métrica (ex: avg:sale_price); count não tem coluna."""
+    if metric == "count":
+        return "count", None
+    function, _, column = metric.partition(":")
+    if function not in AGGREGATE_FUNCTIONS or column not in AGGREGATE_COLUMNS:
+        _bad_request(
+            f"Métrica inválida: {metric}. Use count ou <função>:<coluna> com função em "
+            f"{AGGREGATE_FUNCTIONS} e coluna em {AGGREGATE_COLUMNS}"
+        )
+    return function, column
+
+
+def _metric_name(metric: str) -> str:
+    """Nome da métrica no resultado (ex: avg:sale_price vira avg_sale_price)."""
+    return metric.replace(":", "_")
+
+
+def build_aggregate_query(
+    dimensions: Sequence[str],
+    metrics: Sequence[str],
+    bucket: Optional[str] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    filters: Optional[dict[str, Optional[str]]] = None,
+    order_by: Optional[str] = None,
+    limit: int = DEFAULT_AGGREGATE_LIMIT
+) -> AggregateQuery:
+    """
+    Valida e normaliza uma consulta de agregação.
+
+    Rejeita combinações de cardinalidade ilimitada: mais de uma dimensão de
+    cardinalidade alta (cidade, posto), dimensão de cardinalidade alta junto
+    com o período, e período sem intervalo de datas (ou com períodos demais).
+
+    Args:
+        dimensions: Dimensões de agrupamento (AGGREGATE_DIMENSIONS)
+        metrics: "count" ou "<função>:<coluna>" (ex: "avg:sale_price")
+        bucket: Agrupar também por período: "day", "week" ou "month"
+        start: Primeiro dia do intervalo
+        end: Último dia do intervalo
+        filters: Filtros exatos por dimensão
+        order_by: Métrica de ordenação (decrescente); padrão: a primeira
+        limit: Quantidade máxima de grupos (top-N)
+
+    Returns:
+        AggregateQuery normalizada
+
+    Raises:
+        HTTPException: 400 se a consulta for inválida ou ilimitada
+    """
+    unknown = [d for d in dimensions if d not in AGGREGATE_DIMENSIONS]
+    if unknown:
+        _bad_request(f"Dimensões inválidas: {unknown}. Use {AGGREGATE_DIMENSIONS}")
+    dimensions = tuple(d for d in AGGREGATE_DIMENSIONS if d in dimensions)
+    if len(dimensions) > MAX_AGGREGATE_DIMENSIONS:
+        _bad_request(f"No máximo {MAX_AGGREGATE_DIMENSIONS} dimensões por consulta")
+
+    if not metrics:
+        _bad_request("Informe ao menos uma métrica")
+    for metric in metrics:
+        _parse_metric(metric)
+    metrics = tuple(sorted(set(metrics)))
+
+    if bucket is not None and bucket not in ROLLUP_GRANULARITIES:
+        _bad_request(f"Período inválido: {bucket}. Use {list(ROLLUP_GRANULARITIES)}")
+    if start and end and start > end:
+        _bad_request("start deve ser anterior ou igual a end")
+
+    high_cardinality = HIGH_CARDINALITY_DIMENSIONS.intersection(dimensions)
+    if len(high_cardinality) > 1:
+        _bad_request(f"Combine no máximo uma dimensão de cardinalidade alta ({sorted(HIGH_CARDINALITY_DIMENSIONS)})")
+    if bucket:
+        if high_cardinality:
+            _bad_request(f"Agrupar por {sorted(high_cardinality)[0]} e por período não é permitido; filtre ou use /kpis/timeseries")
+        if not (start and end):
+            _bad_request("Agrupar por período exige start e end")
+        buckets = count_buckets(start, end, bucket)
+        if buckets > MAX_AGGREGATE_BUCKETS:
+            _bad_request(f"Intervalo com {buckets} períodos; o máximo é {MAX_AGGREGATE_BUCKETS}")
+
+    if order_by is None:
+        order_by = metrics[0]
+    elif order_by not in metrics:
+        _bad_request("order_by deve ser uma das métricas pedidas")
+    if not 1 <= limit <= MAX_AGGREGATE_LIMIT:
+        _bad_request(f"limit deve estar entre 1 e {MAX_AGGREGATE_LIMIT}")
+
+    filters = tuple(sorted(
+        (column, value.strip()) for column, value in (filters or {}).items()
+        if value and value.strip()
+    ))
+    for column, _ in filters:
+        if column not in AGGREGATE_DIMENSIONS:
+            _bad_request(f"Filtro inválido: {column}")
+
+    return AggregateQuery(dimensions, metrics, bucket, start, end, filters, order_by, limit)
+
+
+def _rollup_granularity(query: AggregateQuery) -> Optional[str]:
+    """
+    Granularidade dos rollups que responde a consulta exatamente, ou None.
+
+    Exige dimensões, filtros e métricas presentes nos rollups, período
+    compatível e intervalo alinhado ao início/fim dos períodos.
+    """
+    used = set(query.dimensions) | {column for column, _ in query.filters}
+    if not used.issubset(ROLLUP_DIMENSIONS):
+        return None
+    for metric in query.metrics:
+        function, column = _parse_metric(metric)
+        if function not in ("count", "sum", "avg") or (column and column not in _ROLLUP_SUMS):
+            return None
+
+    # Semanas não cabem em meses (e vice-versa): só o próprio período ou dias
+    candidates = ("month", "week", "day") if query.bucket is None else (query.bucket, "day")
+    for granularity in candidates:
+        start_aligned = query.start is None or bucket_start(query.start, granularity) == query.start
+        end_aligned = query.end is None or bucket_start(query.end + timedelta(days=1), granularity) == query.end + timedelta(days=1)
+        if start_aligned and end_aligned:
+            return granularity
+    return None
+
+
+def _rollup_statement(query: AggregateQuery, granularity: str, dialect: str):
+    """SELECT sobre kpi_rollup na granularidade escolhida."""
+    columns = []
+    if query.bucket:
+        bucket = KpiRollup.bucket if query.bucket == granularity else bucket_expression(dialect, query.bucket, KpiRollup.bucket)
+        columns.append(bucket.label("bucket"))
+    columns += [getattr(KpiRollup, d).label(d) for d in query.dimensions]
+
+    for metric in query.metrics:
+        function, column = _parse_metric(metric)
+        if function == "count":
+            expression = func.sum(KpiRollup.total_records)
+        elif function == "sum":
+            expression = func.sum(getattr(KpiRollup, _ROLLUP_SUMS[column]))
+        else:
+            expression = func.sum(getattr(KpiRollup, _ROLLUP_SUMS[column])) / type_coerce(func.sum(KpiRollup.total_records), Float)
+        columns.append(expression.label(_metric_name(metric)))
+
+    conditions = [KpiRollup.granularity == granularity]
+    if query.start:
+        conditions.append(KpiRollup.bucket >= query.start)
+    if query.end:
+        conditions.append(KpiRollup.bucket <= query.end)
+    conditions += [getattr(KpiRollup, column) == value for column, value in query.filters]
+    statement = select(*columns).where(*conditions)
+    groups = (["bucket"] if query.bucket else []) + list(query.dimensions)
+    return statement.group_by(*groups) if groups else statement
+
+
+def _fact_target(column: str):
+    """Coluna do fato de uma métrica ("spend" = preço x volume)."""
+    fact = FuelFact.__table__
+    if column == "spend":
+        return fact.c.sale_price * fact.c.volume_sold
+    return fact.c[column]
+
+
+def _fact_conditions(query: AggregateQuery) -> list:
+    """Filtros e intervalo de datas sobre o fato."""
+    fact = FuelFact.__table__
+    conditions = [star_condition(column, value) for column, value in query.filters]
+    if query.start:
+        conditions.append(fact.c.collection_date >= datetime.combine(query.start, time.min))
+    if query.end:
+        conditions.append(fact.c.collection_date < datetime.combine(query.end + timedelta(days=1), time.min))
+    return conditions
+
+
+def _collections_partials(query: AggregateQuery, dialect: str):
+    """SELECT ... GROUP BY dos estados parciais (_partials) sobre as coletas."""
+    leading = []
+    if query.bucket:
+        leading.append(bucket_expression(dialect, query.bucket, FuelFact.__table__.c.collection_date).label("bucket"))
+    return grouped_facts(
+        leading,
+        query.dimensions,
+        [(f"{column}_{function}", function, _fact_target(column)) for column, function in _partials(query)],
+        _fact_conditions(query)
+    )
+
+
+def _collections_statement(query: AggregateQuery, dialect: str):
+    """Métricas calculadas a partir dos estados parciais das coletas."""
+    partials = _collections_partials(query, dialect).subquery()
+    groups = (["bucket"] if query.bucket else []) + list(query.dimensions)
+    columns = [partials.c[group].label(group) for group in groups]
+    for metric in query.metrics:
+        function, column = _parse_metric(metric)
+        if function == "count":
+            expression = partials.c.id_count
+        elif function == "avg":
+            expression = partials.c[f"{column}_sum"] / type_coerce(partials.c[f"{column}_count"], Float)
+        else:
+            expression = partials.c[f"{column}_{function}"]
+        columns.append(expression.label(_metric_name(metric)))
+    return select(*columns)
+
+
+def _aggregate_statement(query: AggregateQuery, dialect: str):
+    """
+    Compila a consulta em um único SELECT agrupado, ordenado pela métrica
+    (decrescente) e limitado a limit + 1 grupos (para detectar o corte).
+
+    Returns:
+        Tupla (statement, origem: "rollup" ou "collections")
+    """
+    granularity = _rollup_granularity(query)
+    if granularity:
+        statement, source = _rollup_statement(query, granularity, dialect), "rollup"
+    else:
+        statement, source = _collections_statement(query, dialect), "collections"
+
+    groups = (["bucket"] if query.bucket else []) + list(query.dimensions)
+    statement = statement.order_by(
+        func.coalesce(_metric_column(statement, query.order_by), 0).desc(), *groups
+    ).limit(query.limit + 1)
+    return statement, source
+
+
+def _metric_column(statement, metric: str):
+    return statement.selected_columns[_metric_name(metric)]
+
+
+def _aggregate_response(query: AggregateQuery, rows: list, source: str) -> AggregateResponse:
+    names = (["bucket"] if query.bucket else []) + list(query.dimensions) + [_metric_name(m) for m in query.metrics]
+    truncated = len(rows) > query.limit
+    result = []
+    for row in rows[:query.limit]:
+        item = dict(zip(names, row))
+        # Sem nenhuma coleta no filtro, o agregado global vem com contagem 0
+        if not query.dimensions and not query.bucket and all(item[n] in (None, 0) for n in names):
+            continue
+        for name, value in item.items():
+            if isinstance(value, float):
+                item[name] = round(value, 2)
+        result.append(item)
+    return AggregateResponse(
+        dimensions=(["bucket"] if query.bucket else []) + list(query.dimensions),
+        metrics=[_metric_name(m) for m in query.metrics],
+        rows=result,
+        truncated=truncated,
+        source=source
+    )
+
+
+def _use_snapshot(query: AggregateQuery) -> Optional[ColumnarSnapshot]:
+    """Snapshot colunar, se ativo e se a consulta varreria a tabela de coletas."""
+    snapshot = get_snapshot()
+    if snapshot is None or _rollup_granularity(query):
+        return None
+    used = set(query.dimensions) | {column for column, _ in query.filters}
+    return snapshot if used.issubset(SNAPSHOT_DIMENSIONS) else None
+
+
+def _top_rows(query: AggregateQuery, rows: list[tuple]) -> list[tuple]:
+    """Ordena como _aggregate_statement (métrica decrescente, grupos) e corta em limit + 1."""
+    groups = (1 if query.bucket else 0) + len(query.dimensions)
+    position = groups + query.metrics.index(query.order_by)
+    rows.sort(key=lambda row: row[:groups])
+    rows.sort(key=lambda row: row[position] or 0, reverse=True)
+    return rows[:query.limit + 1]
+
+
+def _aggregate_from_snapshot(snapshot: ColumnarSnapshot, query: AggregateQuery) -> list[tuple]:
+    """Mesmas linhas de _aggregate_statement, calculadas no snapshot colunar"""
+    rows = snapshot.aggregate(
+        query.dimensions,
+        [_parse_metric(metric) for metric in query.metrics],
+        filters=dict(query.filters),
+        since=query.start,
+        until=query.end + timedelta(days=1) if query.end else None,
+        bucket=query.bucket
+    )
+    return _top_rows(query, rows)
+
+
+def _archive_query(query: AggregateQuery) -> Optional[ArchiveQuery]:
+    """Filtros da consulta no arquivo frio, ou None se os rollups a respondem."""
+    if _rollup_granularity(query):
+        return None
+    return ArchiveQuery(
+        equals=query.filters,
+        start=datetime.combine(query.start, time.min) if query.start else None,
+        end=datetime.combine(query.end + timedelta(days=1), time.min) if query.end else None
+    )
+
+
+def _partials(query: AggregateQuery) -> list[tuple[str, str]]:
+    """
+    Estados parciais (coluna, função) que somados entre tabela e arquivo
+    reconstroem as métricas; a média vira soma e contagem.
+    """
+    partials = []
+    for metric in query.metrics:
+        function, column = _parse_metric(metric)
+        if function == "count":
+            needed = [("id", "count")]
+        elif function == "avg":
+            needed = [(column, "sum"), (column, "count")]
+        else:
+            needed = [(column, function)]
+        partials += [partial for partial in needed if partial not in partials]
+    return partials
+
+
+def _combine(function: str, current, value):
+    """Junta dois estados parciais da mesma função (None = sem valores)."""
+    if current is None or value is None:
+        return value if current is None else current
+    if function == "min":
+        return min(current, value)
+    if function == "max":
+        return max(current, value)
+    return current + value
+
+
+def _merge_partials(query: AggregateQuery, rows: list, archived: list[dict]) -> list[tuple]:
+    """
+    Soma os estados parciais da tabela e do arquivo por grupo e calcula as
+    métricas, nas mesmas linhas de _aggregate_statement.
+    """
+    groups = (["bucket"] if query.bucket else []) + list(query.dimensions)
+    names = [f"{column}_{function}" for column, function in _partials(query)]
+    functions = [function for _, function in _partials(query)]
+
+    merged: dict[tuple, list] = {}
+    sources = [tuple(row) for row in rows]
+    sources += [tuple(group[key] for key in groups + names) for group in archived]
+    for row in sources:
+        key, values = row[:len(groups)], row[len(groups):]
+        current = merged.get(key)
+        merged[key] = list(values) if current is None else [
+            _combine(function, left, right) for function, left, right in zip(functions, current, values)
+        ]
+
+    result = []
+    for key, values in merged.items():
+        partial = dict(zip(names, values))
+        metrics = []
+        for metric in query.metrics:
+            function, column = _parse_metric(metric)
+            if function == "count":
+                metrics.append(partial["id_count"] or 0)
+            elif function == "avg":
+                count = partial[f"{column}_count"]
+                metrics.append(partial[f"{column}_sum"] / count if count else None)
+            else:
+                metrics.append(partial[f"{column}_{function}"])
+        result.append(key + tuple(metrics))
+    return _top_rows(query, result)
+
+
+def _aggregate_archived(paths: list[str], archive_query: ArchiveQuery, query: AggregateQuery) -> list[dict]:
+    """Estados parciais de _partials calculados nos arquivos do arquivo frio."""
+    return aggregate_archived(
+        paths, archive_query, (["bucket"] if query.bucket else []) + list(query.dimensions),
+        _partials(query), bucket=query.bucket
+    )
+
+
+def get_aggregate(session: Session, query: AggregateQuery) -> AggregateResponse:
+    """
+    Executa uma consulta de agregação normalizada.
+
+    Args:
+        session: Sessão do banco de dados
+        query: Consulta validada (build_aggregate_query)
+
+    Returns:
+        AggregateResponse com os grupos, se o top-N cortou grupos e a origem
+        dos dados (rollups, tabela de coletas, snapshot ou tabela e arquivo frio)
+    """
+    dialect = session.get_bind().dialect.name
+    archive_query = _archive_query(query)
+    paths = [f.path for f in archived_files(session, archive_query)] if archive_query else []
+    if paths:
+        rows = session.exec(_collections_partials(query, dialect)).all()
+        archived = _aggregate_archived(paths, archive_query, query)
+        return _aggregate_response(query, _merge_partials(query, rows, archived), "collections+archive")
+
+    snapshot = _use_snapshot(query)
+    if snapshot is not None:
+        return _aggregate_response(query, _aggregate_from_snapshot(snapshot.refresh(session), query), "snapshot")
+    statement, source = _aggregate_statement(query, dialect)
+    return _aggregate_response(query, session.exec(statement).all(), source)
+
+
+async def get_aggregate_async(session: AsyncSession, query: AggregateQuery) -> AggregateResponse:
+    """Versão assíncrona de get_aggregate."""
+    dialect = session.get_bind().dialect.name
+    archive_query = _archive_query(query)
+    paths = [f.path for f in await archived_files_async(session, archive_query)] if archive_query else []
+    if paths:
+        rows = (await session.exec(_collections_partials(query, dialect))).all()
+        archived = await asyncio.to_thread(_aggregate_archived, paths, archive_query, query)
+        return _aggregate_response(query, _merge_partials(query, rows, archived), "collections+archive")
+
+    snapshot = _use_snapshot(query)
+    if snapshot is not None:
+        await snapshot.refresh_async(session)
+        rows = await asyncio.to_thread(_aggregate_from_snapshot, snapshot, query)
+        return _aggregate_response(query, rows, "snapshot")
+    statement, source = _aggregate_statement(query, dialect)
+    return _aggregate_response(query, (await session.exec(statement)).all(), source)
+
+
+# Cacheado pela chave da consulta normalizada (invalidada a cada ingestão com os demais KPIs)
+get_aggregate_json = cached_response(get_aggregate, "kpi:aggregate", ttl=600, skip_args=1, stale_ttl=60)
+get_aggregate_json_async = cached_response(get_aggregate_async, "kpi:aggregate", ttl=600, skip_args=1, stale_ttl=60)
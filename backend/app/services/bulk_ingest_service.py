@@ -0,0 +1,356 @@
+"""
+Carga em massa de coletas a partir de arquivos CSV ou NDJSON.
+
+O arquivo é lido em blocos de tamanho fixo; cada bloco é validado coluna a
+coluna (sem construir um modelo Pydantic por linha) e as linhas válidas são
+gravadas no fato do esquema estrela com COPY FROM STDIN no PostgreSQL ou
+executemany nos demais bancos.
+A memória usada depende apenas do tamanho do bloco, não do tamanho do arquivo.
+"""
+import csv
+import io
+import json
+import math
+import re
+import time
+import logging
+from datetime import datetime
+from typing import Iterable, Iterator, Optional, TextIO
+from sqlmodel import Session
+from sqlalchemy import text
+from app.models import FuelFact
+from app.schemas import BulkIngestSummary, BulkRejectedRow
+from app.schemas.fuel_collection import FUEL_TYPES, VEHICLE_TYPES
+from app.cache import invalidate_data_caches
+from app.services.driver_profile_service import invalidate_driver_profiles
+from app.leaderboards import record_collections
+from app.services.summary_service import apply_ingested_rows
+from app.star_schema import fact_rows, store_collections
+
+logger = logging.getLogger(__name__)
+
+# Tamanho padrão do bloco (linhas) lido, validado e gravado por vez
+DEFAULT_CHUNK_SIZE = 10000
+
+# Quantidade de rejeições devolvidas como amostra no resumo
+MAX_SAMPLE_ERRORS = 20
+
+TEXT_COLUMNS = [
+    "store_id", "store_name", "city", "state", "fuel_type",
+    "driver_name", "driver_cpf", "vehicle_plate", "vehicle_type",
+]
+NUMERIC_COLUMNS = ["sale_price", "volume_sold"]
+REQUIRED_COLUMNS = TEXT_COLUMNS + NUMERIC_COLUMNS
+
+# Colunas das linhas validadas, na ordem das tuplas recebidas por load_rows
+LOAD_COLUMNS = REQUIRED_COLUMNS + ["collection_date"]
+
+# Limites de tamanho das colunas do modelo (evita abortar o COPY inteiro)
+MAX_LENGTHS = {"store_id": 50, "vehicle_plate": 10}
+
+CPF_PATTERN = re.compile(r"\d{11}")
+
+
+def iter_csv_chunks(stream: Iterable[str], chunk_size: int) -> Iterator[tuple[list[int], dict[str, list]]]:
+    """
+    Lê um CSV com cabeçalho e devolve blocos em formato colunar.
+
+    Args:
+        stream: Linhas de texto do arquivo
+        chunk_size: Quantidade de linhas por bloco
+
+    Yields:
+        Tupla (números das linhas, dicionário coluna -> valores)
+    """
+    reader = csv.DictReader(stream)
+    line_numbers: list[int] = []
+    records: list[dict] = []
+    for record in reader:
+        line_numbers.append(reader.line_num)
+        records.append(record)
+        if len(records) >= chunk_size:
+            yield line_numbers, _to_columns(records)
+            line_numbers, records = [], []
+    if records:
+        yield line_numbers, _to_columns(records)
+
+
+def iter_ndjson_chunks(stream: Iterable[str], chunk_size: int) -> Iterator[tuple[list[int], dict[str, list]]]:
+    """
+    Lê um arquivo NDJSON (um objeto JSON por linha) em blocos colunares.
+
+    Linhas que não são objetos JSON válidos entram no bloco com todos os
+    campos vazios e são rejeitadas pela validação.
+
+    Args:
+        stream: Linhas de texto do arquivo
+        chunk_size: Quantidade de linhas por bloco
+
+    Yields:
+        Tupla (números das linhas, dicionário coluna -> valores)
+    """
+    line_numbers: list[int] = []
+    records: list[dict] = []
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            record = None
+        line_numbers.append(line_number)
+        records.append(record if isinstance(record, dict) else {})
+        if len(records) >= chunk_size:
+            yield line_numbers, _to_columns(records)
+            line_numbers, records = [], []
+    if records:
+        yield line_numbers, _to_columns(records)
+
+
+def _to_columns(records: list[dict]) -> dict[str, list]:
+    """Transpõe uma lista de registros para o formato colunar."""
+    return {
+        column: [record.get(column) for record in records]
+        for column in LOAD_COLUMNS
+    }
+
+
+def _parse_floats(values: list) -> list[Optional[float]]:
+    """Converte uma coluna para float (aceita vírgula decimal); inválidos viram None."""
+    parsed = []
+    for value in values:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            parsed.append(float(value))
+            continue
+        try:
+            parsed.append(float(str(value).strip().replace(",", ".")))
+        except (TypeError, ValueError):
+            parsed.append(None)
+    return parsed
+
+
+def _parse_dates(values: list, default: datetime) -> list[Optional[datetime]]:
+    """Converte uma coluna de datas ISO 8601; vazios usam a data padrão e inválidos viram None."""
+    parsed = []
+    for value in values:
+        if value is None or value == "":
+            parsed.append(default)
+            continue
+        try:
+            parsed.append(datetime.fromisoformat(str(value)))
+        except ValueError:
+            parsed.append(None)
+    return parsed
+
+
+def validate_columns(columns: dict[str, list]) -> tuple[dict[str, list], list[Optional[str]]]:
+    """
+    Valida um bloco inteiro coluna a coluna.
+
+    Aplica as mesmas regras de FuelCollectionCreate (CPF com 11 dígitos,
+    FUEL_TYPES, VEHICLE_TYPES, preço e volume finitos e não negativos), mas
+    uma coluna por vez, sem instanciar um modelo por linha.
+
+    Args:
+        columns: Dicionário coluna -> valores brutos
+
+    Returns:
+        Tupla (colunas normalizadas, motivo da rejeição por linha ou None)
+    """
+    size = len(columns["store_id"])
+    reasons: list[Optional[str]] = [None] * size
+
+    def reject(mask: Iterable[bool], reason: str):
+        for i, bad in enumerate(mask):
+            if bad and reasons[i] is None:
+                reasons[i] = reason
+
+    normalized: dict[str, list] = {}
+    for column in TEXT_COLUMNS:
+        values = ["" if v is None else str(v).strip() for v in columns[column]]
+        reject((v == "" for v in values), f"{column} é obrigatório")
+        if column in MAX_LENGTHS:
+            limit = MAX_LENGTHS[column]
+            reject((len(v) > limit for v in values), f"{column} excede {limit} caracteres")
+        normalized[column] = values
+
+    reject(
+        (CPF_PATTERN.fullmatch(v) is None for v in normalized["driver_cpf"]),
+        "CPF deve conter exatamente 11 dígitos numéricos"
+    )
+    fuel_types = set(FUEL_TYPES)
+    reject(
+        (v not in fuel_types for v in normalized["fuel_type"]),
+        f"Tipo de combustível deve ser um de: {FUEL_TYPES}"
+    )
+    vehicle_types = set(VEHICLE_TYPES)
+    reject(
+        (v not in vehicle_types for v in normalized["vehicle_type"]),
+        f"Tipo de veículo deve ser um de: {VEHICLE_TYPES}"
+    )
+
+    for column in NUMERIC_COLUMNS:
+        values = _parse_floats(columns[column])
+        reject((v is None for v in values), f"{column} deve ser numérico")
+        # float() aceita "nan" e "inf" (NaN passaria até pelo v < 0)
+        reject((v is not None and not math.isfinite(v) for v in values), f"{column} deve ser um número finito")
+        reject((v is not None and v < 0 for v in values), f"{column} não pode ser negativo")
+        normalized[column] = values
+
+    dates = _parse_dates(columns["collection_date"], default=datetime.utcnow())
+    reject((v is None for v in dates), "collection_date deve estar no formato ISO 8601")
+    normalized["collection_date"] = dates
+
+    return normalized, reasons
+
+
+def _valid_rows(columns: dict[str, list], reasons: list[Optional[str]]) -> list[tuple]:
+    """Monta as tuplas (na ordem de LOAD_COLUMNS) das linhas aprovadas."""
+    ordered = [columns[column] for column in LOAD_COLUMNS]
+    return [
+        row for row, reason in zip(zip(*ordered), reasons)
+        if reason is None
+    ]
+
+
+def _copy_rows(session: Session, records: list[dict]):
+    """
+    Grava as linhas no fato com COPY FROM STDIN (PostgreSQL).
+
+    As dimensões são resolvidas antes (fact_rows). O COPY não devolve os ids
+    gerados: eles são reservados antes na sequência, com uma única consulta,
+    e gravados junto com as linhas.
+    """
+    connection = session.connection()
+    facts = fact_rows(connection, records)
+    ids = connection.execute(
+        text("SELECT nextval(pg_get_serial_sequence(:table, 'id')) FROM generate_series(1, :count)"),
+        {"table": FuelFact.__tablename__, "count": len(records)}
+    ).scalars().all()
+
+    columns = list(facts[0])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row_id, record, fact in zip(ids, records, facts):
+        record["id"] = row_id
+        writer.writerow([row_id] + [
+            value.isoformat() if isinstance(value, datetime) else value for value in fact.values()
+        ])
+    buffer.seek(0)
+
+    with connection.connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {FuelFact.__tablename__} (id, {', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+
+
+def load_rows(session: Session, rows: list[tuple]):
+    """
+    Grava um bloco de linhas já validadas no esquema estrela, com COPY no
+    PostgreSQL ou executemany nos demais bancos.
+
+    Os agregados dos KPIs são atualizados na mesma transação. Não faz
+    commit: quem chama controla a transação.
+    """
+    if not rows:
+        return
+    records = [dict(zip(LOAD_COLUMNS, row)) for row in rows]
+    if session.get_bind().dialect.name == "postgresql":
+        _copy_rows(session, records)
+    else:
+        store_collections(session.connection(), records)
+    apply_ingested_rows(session.connection(), records)
+
+
+def load_stream(
+    session: Session,
+    stream: Iterable[str],
+    file_format: str = "csv",
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    reject_file: Optional[TextIO] = None,
+    reject_file_name: Optional[str] = None
+) -> BulkIngestSummary:
+    """
+    Carrega um arquivo CSV ou NDJSON em blocos, com uma transação por bloco.
+
+    Args:
+        session: Sessão do banco de dados
+        stream: Linhas de texto do arquivo
+        file_format: "csv" ou "ndjson"
+        chunk_size: Quantidade de linhas por bloco
+        reject_file: Arquivo (texto) onde as linhas rejeitadas são gravadas em CSV
+        reject_file_name: Nome do arquivo de rejeições informado no resumo
+
+    Returns:
+        BulkIngestSummary com contagens, vazão e amostra de rejeições
+
+    Raises:
+        ValueError: Se o formato for desconhecido
+    """
+    if file_format == "csv":
+        chunks = iter_csv_chunks(stream, chunk_size)
+    elif file_format == "ndjson":
+        chunks = iter_ndjson_chunks(stream, chunk_size)
+    else:
+        raise ValueError(f"Formato não suportado: {file_format}")
+
+    reject_writer = None
+    if reject_file is not None:
+        reject_writer = csv.writer(reject_file)
+        reject_writer.writerow(["line", "reason"] + LOAD_COLUMNS)
+
+    total_rows = inserted = rejected = 0
+    cpfs: set[str] = set()
+    cpf_position = LOAD_COLUMNS.index("driver_cpf")
+    sample_errors: list[BulkRejectedRow] = []
+    start = time.perf_counter()
+
+    try:
+        for line_numbers, columns in chunks:
+            normalized, reasons = validate_columns(columns)
+            rows = _valid_rows(normalized, reasons)
+
+            try:
+                load_rows(session, rows)
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+
+            total_rows += len(line_numbers)
+            inserted += len(rows)
+            cpfs.update(row[cpf_position] for row in rows)
+            # Rankings por bloco: o Redis recebe um comando por membro e dia
+            record_collections(dict(zip(LOAD_COLUMNS, row)) for row in rows)
+
+            for i, reason in enumerate(reasons):
+                if reason is None:
+                    continue
+                rejected += 1
+                if len(sample_errors) < MAX_SAMPLE_ERRORS:
+                    sample_errors.append(BulkRejectedRow(line=line_numbers[i], reason=reason))
+                if reject_writer is not None:
+                    reject_writer.writerow(
+                        [line_numbers[i], reason] + [columns[column][i] for column in LOAD_COLUMNS]
+                    )
+
+            logger.info(f"Carga em massa: {total_rows} linhas lidas, {inserted} inseridas, {rejected} rejeitadas")
+    finally:
+        # Uma única invalidação por carga, também quando um bloco falha: os
+        # blocos anteriores já estão confirmados
+        if inserted:
+            invalidate_data_caches()
+            invalidate_driver_profiles(cpfs)
+
+    elapsed = time.perf_counter() - start
+
+    return BulkIngestSummary(
+        total_rows=total_rows,
+        inserted=inserted,
+        rejected=rejected,
+        elapsed_seconds=round(elapsed, 3),
+        rows_per_second=round(total_rows / elapsed, 1) if elapsed > 0 else float(total_rows),
+        reject_file=reject_file_name,
+        sample_errors=sample_errors
+    )
@@ -1,7 +1,52 @@
+import asyncio
+from datetime import datetime
 from sqlmodel import Session, select, func
+from sqlmodel.ext.asyncio.session import AsyncSession
 from typing import Optional
+from app.archive import archived_files, archived_files_async, listing_query, read_archived
 from app.models import FuelCollection
 from app.schemas import FuelCollectionRead, PaginatedResponse
+from app.services.pagination import (
+    apply_keyset, build_keyset_page, decode_cursor, encode_cursor, merge_keyset_rows, NEXT, PREV
+)
+from app.services.count_service import normalize_filters, count_collections, count_collections_async
+from app.search import text_search_condition
+from app.cache import cached_response
+
+# TTL das páginas cacheadas da listagem (invalidadas a cada ingestão)
+COLLECTIONS_PAGE_CACHE_TTL = 60
+
+
+def filter_conditions(
+    bind,
+    filters: dict[str, Optional[str]],
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None
+) -> list:
+    """
+    Monta as condições WHERE da listagem a partir dos filtros normalizados.
+    
+    Args:
+        bind: Engine da sessão (session.get_bind())
+        filters: Filtros normalizados (normalize_filters)
+        start_date: Coletas a partir desta data
+        end_date: Coletas até esta data
+    
+    Returns:
+        Lista de condições para usar em .where(*condições)
+    """
+    conditions = []
+    if filters["fuel_type"]:
+        conditions.append(FuelCollection.fuel_type == filters["fuel_type"])
+    if filters["city"]:
+        conditions.append(text_search_condition(bind, FuelCollection.city, filters["city"]))
+    if filters["vehicle_type"]:
+        conditions.append(FuelCollection.vehicle_type == filters["vehicle_type"])
+    if start_date:
+        conditions.append(FuelCollection.collection_date >= start_date)
+    if end_date:
+        conditions.append(FuelCollection.collection_date <= end_date)
+    return conditions
 
 
 def get_collections(
@@ -10,50 +55,207 @@ def get_collections(
     page_size: int = 10,
     fuel_type: Optional[str] = None,
     city: Optional[str] = None,
-    vehicle_type: Optional[str] = None
+    vehicle_type: Optional[str] = None,
+    cursor: Optional[str] = None,
+    include_total: bool = True,
+    count_mode: str = "exact"
 ) -> PaginatedResponse:
     """
     Busca coletas com filtros opcionais e paginação.
     
+    Com `cursor` a paginação é por keyset sobre (collection_date, id): cada
+    página é uma única consulta indexada, independente da profundidade.
+    Sem cursor, mantém a paginação por número de página (OFFSET).
+    
+    Quando a página alcança as datas do arquivo frio (app.archive), as
+    coletas arquivadas são intercaladas com as da tabela na mesma ordem.
+    
     Args:
         session: Sessão do banco de dados
-        page: Número da página (começa em 1)
+        page: Número da página (começa em 1), ignorado quando há cursor
         page_size: Quantidade de registros por página
         fuel_type: Filtro por tipo de combustível
-        city: Filtro por cidade (busca parcial)
+        city: Filtro por cidade (busca parcial, sem acentos)
         vehicle_type: Filtro por tipo de veículo
+        cursor: Cursor opaco recebido em next_cursor/prev_cursor
+        include_total: Se deve contar o total de registros filtrados
+        count_mode: "exact" (contagem exata, cacheada por filtros) ou
+            "estimate" (estimativa do planner para conjuntos grandes)
     
     Returns:
-        PaginatedResponse com total, page, page_size e data
+        PaginatedResponse com total, page, page_size, data e cursores
     """
-    # Construir a query base
-    statement = select(FuelCollection)
+    filters = normalize_filters(fuel_type, city, vehicle_type)
     
-    # Aplicar filtros se fornecidos
-    if fuel_type:
-        statement = statement.where(FuelCollection.fuel_type == fuel_type)
-    if city:
-        statement = statement.where(FuelCollection.city.ilike(f"%{city}%"))
-    if vehicle_type:
-        statement = statement.where(FuelCollection.vehicle_type == vehicle_type)
+    # Construir a query base com os filtros fornecidos
+    statement = select(FuelCollection).where(*filter_conditions(session.get_bind(), filters))
     
-    # Contar total de registros (antes da paginação)
-    count_statement = select(func.count()).select_from(statement.subquery())
-    total = session.exec(count_statement).one()
+    # Contar total de registros (antes da paginação), apenas se solicitado
+    total = None
+    total_is_exact = None
+    if include_total:
+        total, total_is_exact = count_collections(session, statement, filters, count_mode)
     
-    # Aplicar paginação
-    offset = (page - 1) * page_size
-    statement = statement.offset(offset).limit(page_size).order_by(FuelCollection.collection_date.desc())
+    page_statement, direction = _page_statement(statement, page, page_size, cursor)
+    rows = session.exec(page_statement).all()
+    
+    files = archived_files(session, listing_query(filters))
+    if files and _reaches_archive(rows, page_size, cursor, files):
+        horizon = _archive_horizon(files)
+        recent, skip, limit = [], 0, page_size + 1
+        if not cursor:
+            recent_count = session.exec(_recent_count_statement(statement, horizon)).one()
+            recent, skip, limit = _split_recent(rows, recent_count, page, page_size, horizon)
+            rows = session.exec(_older_statement(statement, horizon, skip + limit)).all()
+        archived = read_archived(
+            [f.path for f in files], listing_query(filters), skip + limit,
+            cursor=decode_cursor(cursor) if cursor else None
+        )
+        rows = recent + merge_keyset_rows(rows, archived, direction, limit, skip)
+    
+    return _paginated_response(rows, page, page_size, cursor, direction, total, total_is_exact)
+
+
+async def get_collections_async(
+    session: AsyncSession,
+    page: int = 1,
+    page_size: int = 10,
+    fuel_type: Optional[str] = None,
+    city: Optional[str] = None,
+    vehicle_type: Optional[str] = None,
+    cursor: Optional[str] = None,
+    include_total: bool = True,
+    count_mode: str = "exact"
+) -> PaginatedResponse:
+    """
+    Versão assíncrona de get_collections (mesmos parâmetros e resposta).
+    """
+    filters = normalize_filters(fuel_type, city, vehicle_type)
+    statement = select(FuelCollection).where(*filter_conditions(session.get_bind(), filters))
+    
+    total = None
+    total_is_exact = None
+    if include_total:
+        total, total_is_exact = await count_collections_async(session, statement, filters, count_mode)
+    
+    page_statement, direction = _page_statement(statement, page, page_size, cursor)
+    rows = (await session.exec(page_statement)).all()
     
-    # Executar query
-    results = session.exec(statement).all()
+    files = await archived_files_async(session, listing_query(filters))
+    if files and _reaches_archive(rows, page_size, cursor, files):
+        horizon = _archive_horizon(files)
+        recent, skip, limit = [], 0, page_size + 1
+        if not cursor:
+            recent_count = (await session.exec(_recent_count_statement(statement, horizon))).one()
+            recent, skip, limit = _split_recent(rows, recent_count, page, page_size, horizon)
+            rows = (await session.exec(_older_statement(statement, horizon, skip + limit))).all()
+        archived = await asyncio.to_thread(
+            read_archived, [f.path for f in files], listing_query(filters), skip + limit,
+            decode_cursor(cursor) if cursor else None
+        )
+        rows = recent + merge_keyset_rows(rows, archived, direction, limit, skip)
+    
+    return _paginated_response(rows, page, page_size, cursor, direction, total, total_is_exact)
+
+
+# Cada combinação de filtros, página/cursor e modo de contagem é uma entrada do
+# namespace "collections", invalidado a cada ingestão. Passe a sessão como
+# primeiro argumento posicional e os demais por nome.
+get_collections_json = cached_response(get_collections, "collections:page", ttl=COLLECTIONS_PAGE_CACHE_TTL, skip_args=1)
+get_collections_json_async = cached_response(get_collections_async, "collections:page", ttl=COLLECTIONS_PAGE_CACHE_TTL, skip_args=1)
+
+
+def _page_statement(statement, page: int, page_size: int, cursor: Optional[str]):
+    """SELECT da página (page_size + 1 linhas): keyset com cursor, OFFSET sem cursor."""
+    if cursor:
+        return apply_keyset(statement, cursor, page_size)
+    
+    offset = (page - 1) * page_size
+    statement = statement.order_by(
+        FuelCollection.collection_date.desc(), FuelCollection.id.desc()
+    ).offset(offset).limit(page_size + 1)
+    return statement, NEXT
+
+
+def _archive_horizon(files: list) -> datetime:
+    """Data da coleta arquivada mais recente; as coletas posteriores estão só na tabela."""
+    return max(f.max_date for f in files)
+
+
+def _reaches_archive(rows: list, page_size: int, cursor: Optional[str], files: list) -> bool:
+    """Se a página pode conter coletas arquivadas."""
+    horizon = _archive_horizon(files)
+    if cursor:
+        collection_date, _, direction = decode_cursor(cursor)
+        if direction == PREV:
+            # Voltando para coletas mais recentes que o cursor
+            return collection_date <= horizon
+    # Página completa só com coletas posteriores ao arquivo
+    return len(rows) <= page_size or rows[-1].collection_date <= horizon
+
+
+def _recent_count_statement(statement, horizon: datetime):
+    """Quantidade de coletas da tabela posteriores ao arquivo frio."""
+    recent = statement.where(FuelCollection.collection_date > horizon)
+    return select(func.count()).select_from(recent.subquery())
+
+
+def _older_statement(statement, horizon: datetime, limit: int):
+    """Coletas da tabela até a data do arquivo frio, na ordem da listagem."""
+    return statement.where(FuelCollection.collection_date <= horizon).order_by(
+        FuelCollection.collection_date.desc(), FuelCollection.id.desc()
+    ).limit(limit)
+
+
+def _split_recent(rows: list, recent_count: int, page: int, page_size: int, horizon: datetime):
+    """
+    Separa a parte da página (OFFSET) anterior ao arquivo frio.
+
+    As coletas posteriores ao arquivo vêm antes de todas as arquivadas; o
+    restante da página sai da intercalação das coletas mais antigas da
+    tabela com as arquivadas.
+
+    Returns:
+        Tupla (coletas recentes da página, linhas a pular na intercalação,
+        linhas a buscar na intercalação)
+    """
+    recent = [row for row in rows if row.collection_date > horizon]
+    skip = max(0, (page - 1) * page_size - recent_count)
+    return recent, skip, page_size + 1 - len(recent)
+
+
+def _paginated_response(
+    rows: list,
+    page: int,
+    page_size: int,
+    cursor: Optional[str],
+    direction: str,
+    total: Optional[int],
+    total_is_exact: Optional[bool]
+) -> PaginatedResponse:
+    """Recorta a página, calcula os cursores e monta a resposta."""
+    if cursor:
+        # Paginação por cursor (keyset)
+        rows, next_cursor, prev_cursor = build_keyset_page(rows, page_size, direction, has_cursor=True)
+        current_page = None
+    else:
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        
+        # Cursor para continuar a navegação por keyset a partir desta página
+        next_cursor = encode_cursor(rows[-1].collection_date, rows[-1].id, NEXT) if has_more else None
+        prev_cursor = None
+        current_page = page
     
     # Converter para FuelCollectionRead
-    data = [FuelCollectionRead.model_validate(r) for r in results]
+    data = [FuelCollectionRead.model_validate(r) for r in rows]
     
     return PaginatedResponse(
         total=total,
-        page=page,
+        total_is_exact=total_is_exact,
+        page=current_page,
         page_size=page_size,
-        data=data
+        data=data,
+        next_cursor=next_cursor,
+        prev_cursor=prev_cursor
     )
@@ -0,0 +1,198 @@
+"""
+Contagem do total de coletas filtradas para a paginação.
+
+Ordem de preferência:
+1. Filtros cobertos pelos agregados dos KPIs (nenhum filtro, só combustível
+   ou só tipo de veículo): contagem exata lida de uma linha de agregado.
+2. count_mode="estimate" no PostgreSQL: estimativa de linhas do planner
+   (EXPLAIN), quando grande o suficiente para que a diferença não importe.
+   O total sem filtros já vem exato dos agregados, então não depende de
+   pg_class.reltuples.
+3. COUNT(*) exato, cacheado no Redis pelo conjunto normalizado de filtros
+   e invalidado a cada ingestão.
+
+Os agregados já contam as coletas do arquivo frio (app.archive); nos passos
+2 e 3 elas são contadas nos arquivos Parquet e somadas ao total da tabela.
+"""
+import asyncio
+import json
+import logging
+from typing import Optional
+from sqlmodel import Session, select, func
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import text
+from app.archive import archived_files, archived_files_async, count_archived, listing_query
+from app.models import FuelTypeSummary, VehicleTypeSummary
+from app.cache import cached, async_cached
+from app.search import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# TTL da contagem exata cacheada (invalidada antes disso a cada ingestão)
+COUNT_CACHE_TTL = 300
+
+# Abaixo deste total a estimativa é descartada e a contagem exata é usada
+ESTIMATE_EXACT_THRESHOLD = 10000
+
+
+def normalize_filters(
+    fuel_type: Optional[str] = None,
+    city: Optional[str] = None,
+    vehicle_type: Optional[str] = None
+) -> dict[str, Optional[str]]:
+    """
+    Normaliza os filtros da listagem (espaços, vazios, acentos e caixa da
+    cidade) para que consultas equivalentes compartilhem a mesma chave de cache.
+    """
+    def clean(value: Optional[str]) -> Optional[str]:
+        value = (value or "").strip()
+        return value or None
+
+    city = clean(city)
+    return {
+        "fuel_type": clean(fuel_type),
+        "city": normalize_text(city) if city else None,
+        "vehicle_type": clean(vehicle_type),
+    }
+
+
+def _count_from_summaries(session: Session, filters: dict) -> Optional[int]:
+    """Contagem exata a partir dos agregados, quando os filtros permitem."""
+    if filters["city"] or (filters["fuel_type"] and filters["vehicle_type"]):
+        return None
+    if filters["fuel_type"]:
+        summary = session.get(FuelTypeSummary, filters["fuel_type"])
+        return summary.total_records if summary else 0
+    if filters["vehicle_type"]:
+        summary = session.get(VehicleTypeSummary, filters["vehicle_type"])
+        return summary.total_records if summary else 0
+    return session.exec(
+        select(func.coalesce(func.sum(FuelTypeSummary.total_records), 0))
+    ).one()
+
+
+def _estimate_count(session: Session, statement) -> Optional[int]:
+    """Estimativa de linhas do planner do PostgreSQL (None nos demais bancos)."""
+    bind = session.get_bind()
+    if bind.dialect.name != "postgresql":
+        return None
+
+    compiled = statement.compile(dialect=bind.dialect, compile_kwargs={"literal_binds": True})
+    # Savepoint: uma falha no EXPLAIN não invalida a transação da listagem
+    with session.begin_nested():
+        plan = session.execute(text(f"EXPLAIN (FORMAT JSON) {compiled}")).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+@cached("count:collections", ttl=COUNT_CACHE_TTL, skip_args=2)
+def _cached_exact_count(
+    session: Session,
+    statement,
+    fuel_type: Optional[str] = None,
+    city: Optional[str] = None,
+    vehicle_type: Optional[str] = None
+) -> int:
+    """COUNT(*) exato; a chave de cache são os filtros normalizados."""
+    total = session.exec(select(func.count()).select_from(statement.subquery())).one()
+    return total + _count_archived(session, fuel_type, city, vehicle_type)
+
+
+def _count_archived(
+    session: Session,
+    fuel_type: Optional[str],
+    city: Optional[str],
+    vehicle_type: Optional[str]
+) -> int:
+    """Coletas do arquivo frio que atendem aos filtros normalizados."""
+    query = listing_query({"fuel_type": fuel_type, "city": city, "vehicle_type": vehicle_type})
+    return count_archived([f.path for f in archived_files(session, query)], query)
+
+
+def count_collections(
+    session: Session,
+    statement,
+    filters: dict[str, Optional[str]],
+    count_mode: str = "exact"
+) -> tuple[int, bool]:
+    """
+    Conta as coletas de um SELECT filtrado.
+
+    Args:
+        session: Sessão do banco de dados
+        statement: SELECT de FuelCollection com os filtros aplicados
+        filters: Filtros normalizados (normalize_filters) usados no SELECT
+        count_mode: "exact" (contagem exata, cacheada) ou "estimate"
+
+    Returns:
+        Tupla (total, total é exato)
+    """
+    total = _count_from_summaries(session, filters)
+    if total is not None:
+        return total, True
+
+    if count_mode == "estimate":
+        try:
+            estimate = _estimate_count(session, statement)
+        except Exception as e:
+            logger.warning(f"Falha ao estimar contagem, usando contagem exata: {e}")
+            estimate = None
+        if estimate is not None and estimate >= ESTIMATE_EXACT_THRESHOLD:
+            return estimate + _count_archived(session, **filters), False
+
+    return _cached_exact_count(session, statement, **filters), True
+
+
+@async_cached("count:collections", ttl=COUNT_CACHE_TTL, skip_args=2)
+async def _cached_exact_count_async(
+    session: AsyncSession,
+    statement,
+    fuel_type: Optional[str] = None,
+    city: Optional[str] = None,
+    vehicle_type: Optional[str] = None
+) -> int:
+    """Versão assíncrona de _cached_exact_count (mesma chave de cache)."""
+    total = (await session.exec(select(func.count()).select_from(statement.subquery()))).one()
+    return total + await _count_archived_async(session, fuel_type, city, vehicle_type)
+
+
+async def _count_archived_async(
+    session: AsyncSession,
+    fuel_type: Optional[str],
+    city: Optional[str],
+    vehicle_type: Optional[str]
+) -> int:
+    """Versão assíncrona de _count_archived (leitura dos arquivos fora do event loop)."""
+    query = listing_query({"fuel_type": fuel_type, "city": city, "vehicle_type": vehicle_type})
+    files = await archived_files_async(session, query)
+    return await asyncio.to_thread(count_archived, [f.path for f in files], query)
+
+
+async def count_collections_async(
+    session: AsyncSession,
+    statement,
+    filters: dict[str, Optional[str]],
+    count_mode: str = "exact"
+) -> tuple[int, bool]:
+    """
+    Versão assíncrona de count_collections.
+
+    Os passos que só consultam o banco reaproveitam as funções síncronas via
+    run_sync (executadas no event loop, sem ocupar thread); apenas o cache
+    usa o cliente Redis assíncrono.
+    """
+    total = await session.run_sync(_count_from_summaries, filters)
+    if total is not None:
+        return total, True
+
+    if count_mode == "estimate":
+        try:
+            estimate = await session.run_sync(_estimate_count, statement)
+        except Exception as e:
+            logger.warning(f"Falha ao estimar contagem, usando contagem exata: {e}")
+            estimate = None
+        if estimate is not None and estimate >= ESTIMATE_EXACT_THRESHOLD:
+            return estimate + await _count_archived_async(session, **filters), False
+
+    return await _cached_exact_count_async(session, statement, **filters), True
@@ -0,0 +1,414 @@
+"""
+Perfil incremental por motorista (CPF).
+
+Cada ingestão atualiza, na mesma transação dos agregados dos KPIs
+(summary_service.apply_ingested_rows), a linha do motorista em
+driver_profile (contagem, total gasto, volume, primeiro e último
+abastecimento, nome mais recente) e as contagens por combustível em
+driver_fuel_profile, de onde sai o combustível favorito. O resumo do
+relatório por CPF passa a ser a leitura de uma linha pela chave primária.
+
+O resumo renderizado fica no cache por CPF (prefixo "driver:profile"): a
+ingestão invalida só as entradas dos CPFs gravados, sem tocar nas demais.
+"""
+import os
+from collections import defaultdict
+from datetime import datetime
+from typing import Callable, Iterable, Mapping, Optional
+from sqlalchemy import Table, and_, bindparam, case, delete, insert, literal, or_, select as sql_select, update
+from sqlalchemy.engine import Connection
+from sqlmodel import Session, func
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.cache import cache_namespace, invalidate_entries, invalidate_namespace
+from app.models import ArchivedFile, DriverFuelProfile, DriverProfile, FuelCollection
+
+# Prefixo e TTL (segundos) do resumo renderizado de cada motorista no cache
+PROFILE_CACHE_PREFIX = "driver:profile"
+PROFILE_CACHE_TTL = int(os.getenv("DRIVER_PROFILE_CACHE_TTL", "300"))
+
+# Acima desta quantidade de CPFs, invalida o namespace inteiro (um INCR)
+PROFILE_INVALIDATION_LIMIT = 1000
+
+# CPFs por UPDATE do combustível favorito (limite de parâmetros do IN)
+FAVORITE_BATCH_SIZE = 500
+
+# Colunas de driver_profile mantidas pela ingestão (o favorito é derivado)
+PROFILE_COLUMNS = [
+    "driver_cpf", "driver_name", "refuel_count", "total_spent", "total_volume",
+    "first_refuel", "last_refuel", "last_collection_id",
+]
+
+_PROFILE = DriverProfile.__table__
+_FUEL = DriverFuelProfile.__table__
+
+
+def _row_groups(rows: Iterable[Mapping]) -> Iterable[dict]:
+    """Cada coleta como um grupo de uma coleta só."""
+    for row in rows:
+        yield {
+            "driver_cpf": row["driver_cpf"],
+            "driver_name": row["driver_name"],
+            "fuel_type": row["fuel_type"],
+            "refuel_count": 1,
+            "total_spent": row["sale_price"] * row["volume_sold"],
+            "total_volume": row["volume_sold"],
+            "first_refuel": row["collection_date"],
+            "last_refuel": row["collection_date"],
+            "last_collection_id": row["id"],
+        }
+
+
+def _profile_increments(groups: Iterable[Mapping]) -> tuple[dict[tuple, dict], dict[tuple, dict]]:
+    """
+    Combina grupos de coletas (CPF, nome e combustível) em linhas de
+    driver_profile e de driver_fuel_profile.
+
+    Returns:
+        Tupla (perfis por (CPF,), perfis por (CPF, combustível))
+    """
+    profiles: dict[tuple, dict] = {}
+    fuels: dict[tuple, dict] = {}
+    for group in groups:
+        cpf = group["driver_cpf"]
+        profile = profiles.get((cpf,))
+        if profile is None:
+            profiles[(cpf,)] = {column: group[column] for column in PROFILE_COLUMNS}
+        else:
+            profile["refuel_count"] += group["refuel_count"]
+            profile["total_spent"] += group["total_spent"]
+            profile["total_volume"] += group["total_volume"]
+            profile["first_refuel"] = min(profile["first_refuel"], group["first_refuel"])
+            if (group["last_refuel"], group["last_collection_id"]) > (profile["last_refuel"], profile["last_collection_id"]):
+                profile["driver_name"] = group["driver_name"]
+                profile["last_refuel"] = group["last_refuel"]
+                profile["last_collection_id"] = group["last_collection_id"]
+
+        fuel = fuels.get((cpf, group["fuel_type"]))
+        if fuel is None:
+            fuels[(cpf, group["fuel_type"])] = {
+                "driver_cpf": cpf,
+                "fuel_type": group["fuel_type"],
+                "refuel_count": group["refuel_count"],
+                "last_refuel": group["last_refuel"],
+            }
+        else:
+            fuel["refuel_count"] += group["refuel_count"]
+            fuel["last_refuel"] = max(fuel["last_refuel"], group["last_refuel"])
+    return profiles, fuels
+
+
+def _merge_profile(incoming) -> dict:
+    """Valores de driver_profile após somar uma linha nova à existente."""
+    newer = or_(
+        incoming["last_refuel"] > _PROFILE.c.last_refuel,
+        and_(
+            incoming["last_refuel"] == _PROFILE.c.last_refuel,
+            incoming["last_collection_id"] > _PROFILE.c.last_collection_id,
+        ),
+    )
+    return {
+        "refuel_count": _PROFILE.c.refuel_count + incoming["refuel_count"],
+        "total_spent": _PROFILE.c.total_spent + incoming["total_spent"],
+        "total_volume": _PROFILE.c.total_volume + incoming["total_volume"],
+        "first_refuel": case(
+            (incoming["first_refuel"] < _PROFILE.c.first_refuel, incoming["first_refuel"]),
+            else_=_PROFILE.c.first_refuel,
+        ),
+        **{
+            column: case((newer, incoming[column]), else_=_PROFILE.c[column])
+            for column in ("driver_name", "last_refuel", "last_collection_id")
+        },
+    }
+
+
+def _merge_fuel(incoming) -> dict:
+    """Valores de driver_fuel_profile após somar uma linha nova à existente."""
+    return {
+        "refuel_count": _FUEL.c.refuel_count + incoming["refuel_count"],
+        "last_refuel": case(
+            (incoming["last_refuel"] > _FUEL.c.last_refuel, incoming["last_refuel"]),
+            else_=_FUEL.c.last_refuel,
+        ),
+    }
+
+
+def _upsert(
+    connection: Connection,
+    table: Table,
+    key_columns: list[str],
+    rows: dict[tuple, dict],
+    merge: Callable[[Mapping], dict],
+):
+    """
+    Grava as linhas, combinando com as existentes pela função `merge`.
+
+    INSERT ... ON CONFLICT DO UPDATE no PostgreSQL e no SQLite, com as
+    chaves em ordem (evita deadlocks entre lotes concorrentes), como
+    summary_service.upsert_increments.
+    """
+    if not rows:
+        return
+    ordered = [rows[key] for key in sorted(rows)]
+    dialect = connection.dialect.name
+
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        statement = dialect_insert(table)
+        statement = statement.on_conflict_do_update(index_elements=key_columns, set_=merge(statement.excluded))
+        connection.execute(statement, ordered)
+        return
+
+    # Demais bancos: UPDATE e, se nenhuma linha existir, INSERT
+    for row in ordered:
+        incoming = {column: literal(value, table.c[column].type) for column, value in row.items()}
+        result = connection.execute(
+            update(table)
+            .where(*[table.c[column] == row[column] for column in key_columns])
+            .values(merge(incoming))
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(table).values(row))
+
+
+def _refresh_favorites(connection: Connection, cpfs: Optional[list[str]] = None):
+    """
+    Recalcula o combustível favorito dos CPFs (todos, se None): o mais
+    abastecido e, no empate, o abastecido mais recentemente.
+    """
+    favorite = (
+        sql_select(_FUEL.c.fuel_type)
+        .where(_FUEL.c.driver_cpf == _PROFILE.c.driver_cpf)
+        .order_by(_FUEL.c.refuel_count.desc(), _FUEL.c.last_refuel.desc(), _FUEL.c.fuel_type)
+        .limit(1)
+        .scalar_subquery()
+    )
+    statement = update(_PROFILE).values(favorite_fuel=favorite)
+    if cpfs is None:
+        connection.execute(statement)
+        return
+    for start in range(0, len(cpfs), FAVORITE_BATCH_SIZE):
+        connection.execute(statement.where(_PROFILE.c.driver_cpf.in_(cpfs[start:start + FAVORITE_BATCH_SIZE])))
+
+
+def _apply_groups(connection: Connection, groups: Iterable[Mapping]) -> list[str]:
+    """Soma os grupos aos perfis; devolve os CPFs alterados, em ordem."""
+    profiles, fuels = _profile_increments(groups)
+    _upsert(connection, _PROFILE, ["driver_cpf"], profiles, _merge_profile)
+    _upsert(connection, _FUEL, ["driver_cpf", "fuel_type"], fuels, _merge_fuel)
+    return [cpf for cpf, in sorted(profiles)]
+
+
+def apply_driver_rows(connection: Connection, rows: list[Mapping]):
+    """
+    Soma coletas recém-inseridas aos perfis dos motoristas.
+
+    Deve ser chamada na mesma transação do INSERT (feito por
+    summary_service.apply_ingested_rows).
+
+    Args:
+        connection: Conexão da transação corrente
+        rows: Coletas inseridas (com id, CPF, nome, combustível, preço,
+              volume e data)
+    """
+    if rows:
+        _refresh_favorites(connection, _apply_groups(connection, _row_groups(rows)))
+
+
+def remove_driver_collections(connection: Connection, start: datetime, end: datetime):
+    """
+    Desconta dos perfis as coletas de um intervalo que serão removidas.
+
+    Deve ser chamada na mesma transação que remove as coletas (feito por
+    summary_service.remove_collections). Perfis que ficam sem coletas são
+    apagados. A retenção remove os meses mais antigos primeiro: o primeiro
+    abastecimento que caía no intervalo passa a ser o primeiro posterior a
+    ele; o último abastecimento, o nome e o combustível favorito dependem
+    das coletas restantes e não mudam.
+
+    Args:
+        connection: Conexão da transação corrente
+        start: Início do intervalo (inclusive)
+        end: Fim do intervalo (exclusive)
+    """
+    spend = FuelCollection.sale_price * FuelCollection.volume_sold
+    groups = connection.execute(
+        sql_select(
+            FuelCollection.driver_cpf,
+            FuelCollection.fuel_type,
+            func.count(FuelCollection.id),
+            func.sum(spend),
+            func.sum(FuelCollection.volume_sold),
+        )
+        .where(FuelCollection.collection_date >= start, FuelCollection.collection_date < end)
+        .group_by(FuelCollection.driver_cpf, FuelCollection.fuel_type)
+    ).all()
+    if not groups:
+        return
+
+    by_driver: dict[str, dict] = defaultdict(lambda: {"removed_count": 0, "removed_spent": 0.0, "removed_volume": 0.0})
+    for cpf, _, count, spent, volume in groups:
+        totals = by_driver[cpf]
+        totals["removed_count"] += count
+        totals["removed_spent"] += spent or 0
+        totals["removed_volume"] += volume or 0
+    cpfs = sorted(by_driver)
+
+    connection.execute(
+        update(_FUEL)
+        .where(_FUEL.c.driver_cpf == bindparam("cpf"), _FUEL.c.fuel_type == bindparam("fuel"))
+        .values(refuel_count=_FUEL.c.refuel_count - bindparam("removed_count")),
+        [{"cpf": cpf, "fuel": fuel, "removed_count": count} for cpf, fuel, count, _, _ in sorted(groups)],
+    )
+    connection.execute(
+        update(_PROFILE)
+        .where(_PROFILE.c.driver_cpf == bindparam("cpf"))
+        .values(
+            refuel_count=_PROFILE.c.refuel_count - bindparam("removed_count"),
+            total_spent=_PROFILE.c.total_spent - bindparam("removed_spent"),
+            total_volume=_PROFILE.c.total_volume - bindparam("removed_volume"),
+        ),
+        [{"cpf": cpf, **by_driver[cpf]} for cpf in cpfs],
+    )
+    connection.execute(delete(_FUEL).where(_FUEL.c.refuel_count <= 0))
+    connection.execute(delete(_PROFILE).where(_PROFILE.c.refuel_count <= 0))
+
+    next_refuel = (
+        sql_select(func.min(FuelCollection.collection_date))
+        .where(FuelCollection.driver_cpf == _PROFILE.c.driver_cpf, FuelCollection.collection_date >= end)
+        .scalar_subquery()
+    )
+    connection.execute(
+        update(_PROFILE)
+        .where(_PROFILE.c.first_refuel >= start, _PROFILE.c.first_refuel < end)
+        .values(first_refuel=func.coalesce(next_refuel, _PROFILE.c.first_refuel))
+    )
+    _refresh_favorites(connection, cpfs)
+
+
+def _archived_groups(connection: Connection) -> list[dict]:
+    """Grupos (CPF, nome, combustível) das coletas do arquivo frio."""
+    # Import local: app.archive depende deste módulo (via app.partitions)
+    from app.archive import ArchiveQuery, aggregate_archived, archive_enabled
+
+    if not archive_enabled():
+        return []
+    paths = connection.execute(sql_select(ArchivedFile.path)).scalars().all()
+    groups = aggregate_archived(
+        paths, ArchiveQuery(), ["driver_cpf", "driver_name", "fuel_type"],
+        [
+            ("id", "count"), ("id", "max"), ("spend", "sum"), ("volume_sold", "sum"),
+            ("collection_date", "min"), ("collection_date", "max"),
+        ],
+    )
+    return [
+        {
+            "driver_cpf": group["driver_cpf"],
+            "driver_name": group["driver_name"],
+            "fuel_type": group["fuel_type"],
+            "refuel_count": group["id_count"],
+            "total_spent": group["spend_sum"] or 0,
+            "total_volume": group["volume_sold_sum"] or 0,
+            "first_refuel": group["collection_date_min"],
+            "last_refuel": group["collection_date_max"],
+            "last_collection_id": group["id_max"],
+        }
+        for group in groups
+        if group["id_count"]
+    ]
+
+
+def rebuild_driver_profiles(connection: Connection):
+    """
+    Recalcula os perfis do zero a partir de FuelCollection e do arquivo frio.
+
+    Dois INSERT ... SELECT agrupados por CPF (o nome vem da coleta mais
+    recente, por ROW_NUMBER) e por CPF e combustível; as coletas arquivadas
+    entram como incrementos. Também serve de backfill (migração 6).
+
+    Args:
+        connection: Conexão da transação corrente
+    """
+    connection.execute(delete(_FUEL))
+    connection.execute(delete(_PROFILE))
+
+    ranked = sql_select(
+        FuelCollection.driver_cpf,
+        FuelCollection.driver_name,
+        FuelCollection.collection_date,
+        FuelCollection.id,
+        func.row_number().over(
+            partition_by=FuelCollection.driver_cpf,
+            order_by=(FuelCollection.collection_date.desc(), FuelCollection.id.desc()),
+        ).label("position"),
+    ).subquery()
+    totals = sql_select(
+        FuelCollection.driver_cpf,
+        func.count(FuelCollection.id).label("refuel_count"),
+        func.sum(FuelCollection.sale_price * FuelCollection.volume_sold).label("total_spent"),
+        func.sum(FuelCollection.volume_sold).label("total_volume"),
+        func.min(FuelCollection.collection_date).label("first_refuel"),
+    ).group_by(FuelCollection.driver_cpf).subquery()
+    connection.execute(insert(_PROFILE).from_select(
+        PROFILE_COLUMNS,
+        sql_select(
+            totals.c.driver_cpf, ranked.c.driver_name, totals.c.refuel_count, totals.c.total_spent,
+            totals.c.total_volume, totals.c.first_refuel, ranked.c.collection_date, ranked.c.id,
+        ).join_from(totals, ranked, and_(ranked.c.driver_cpf == totals.c.driver_cpf, ranked.c.position == 1)),
+    ))
+    connection.execute(insert(_FUEL).from_select(
+        ["driver_cpf", "fuel_type", "refuel_count", "last_refuel"],
+        sql_select(
+            FuelCollection.driver_cpf,
+            FuelCollection.fuel_type,
+            func.count(FuelCollection.id),
+            func.max(FuelCollection.collection_date),
+        ).group_by(FuelCollection.driver_cpf, FuelCollection.fuel_type),
+    ))
+    _apply_groups(connection, _archived_groups(connection))
+    _refresh_favorites(connection)
+
+
+def _profile_statement(cpf: str):
+    """Linha do perfil pela chave primária (colunas, sem o mapa de identidade da sessão)"""
+    return sql_select(_PROFILE).where(_PROFILE.c.driver_cpf == cpf)
+
+
+def read_driver_profile(session: Session, cpf: str):
+    """
+    Perfil de um motorista.
+
+    Args:
+        session: Sessão do banco de dados
+        cpf: CPF (11 dígitos)
+
+    Returns:
+        Linha de driver_profile ou None se o CPF não tiver coletas
+    """
+    return session.exec(_profile_statement(cpf)).first()
+
+
+async def read_driver_profile_async(session: AsyncSession, cpf: str):
+    """Versão assíncrona de read_driver_profile."""
+    return (await session.exec(_profile_statement(cpf))).first()
+
+
+def invalidate_driver_profiles(cpfs: Optional[Iterable[str]] = None):
+    """
+    Invalida o resumo cacheado dos motoristas.
+
+    Chamada após o commit de cada ingestão, com os CPFs gravados: só essas
+    entradas saem do cache. Sem CPFs (ex.: retenção) ou com mais de
+    PROFILE_INVALIDATION_LIMIT, invalida o namespace inteiro.
+
+    Args:
+        cpfs: CPFs alterados (None = todos)
+    """
+    if cpfs is not None:
+        cpfs = sorted(set(cpfs))
+        if len(cpfs) <= PROFILE_INVALIDATION_LIMIT:
+            invalidate_entries(PROFILE_CACHE_PREFIX, [(cpf,) for cpf in cpfs])
+            return
+    invalidate_namespace(cache_namespace(PROFILE_CACHE_PREFIX))
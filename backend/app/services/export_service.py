@@ -0,0 +1,231 @@
+"""
+Exportação em streaming das coletas filtradas (CSV, NDJSON ou Parquet).
+
+As linhas são lidas com cursor no servidor (yield_per) como tuplas, sem
+instanciar modelos, e convertidas em blocos de bytes enviados direto ao
+cliente. A leitura é dividida em segmentos por keyset sobre
+(collection_date, id): cada segmento usa sua própria transação curta, então
+uma exportação de dezenas de milhões de linhas não mantém uma transação
+aberta durante todo o download. A memória usada depende só do tamanho do
+bloco.
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import Iterable, Iterator, Optional
+from sqlalchemy import select, tuple_
+from sqlalchemy.engine import Engine, Row
+from sqlmodel import Session
+from app.models import FuelCollection
+
+# Linhas buscadas do cursor do servidor por vez
+EXPORT_BATCH_SIZE = 10000
+
+# Linhas lidas por transação antes de retomar pelo keyset em uma nova
+EXPORT_SEGMENT_SIZE = 200000
+
+EXPORT_COLUMNS = [
+    "id", "store_id", "store_name", "city", "state", "collection_date",
+    "fuel_type", "sale_price", "volume_sold", "driver_name", "driver_cpf",
+    "vehicle_plate", "vehicle_type",
+]
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+_DATE_INDEX = EXPORT_COLUMNS.index("collection_date")
+
+
+def iter_export_batches(
+    engine: Engine,
+    conditions: list,
+    batch_size: int = EXPORT_BATCH_SIZE,
+    segment_size: int = EXPORT_SEGMENT_SIZE
+) -> Iterator[list[Row]]:
+    """
+    Lê as coletas filtradas em ordem (collection_date, id) e em blocos.
+
+    Args:
+        engine: Engine do banco de dados
+        conditions: Condições WHERE (collection_service.filter_conditions)
+        batch_size: Linhas por bloco lido do cursor do servidor
+        segment_size: Linhas lidas por transação
+
+    Yields:
+        Blocos de tuplas na ordem de EXPORT_COLUMNS
+    """
+    columns = [FuelCollection.__table__.c[name] for name in EXPORT_COLUMNS]
+    key = tuple_(FuelCollection.collection_date, FuelCollection.id)
+    last_key = None
+
+    while True:
+        statement = select(*columns).where(*conditions)
+        if last_key is not None:
+            # A condição só na data poda as partições mensais já exportadas
+            statement = statement.where(key > tuple_(*last_key), FuelCollection.collection_date >= last_key[0])
+        statement = statement.order_by(
+            FuelCollection.collection_date, FuelCollection.id
+        ).limit(segment_size)
+
+        read = 0
+        with Session(engine) as session:
+            result = session.execute(statement.execution_options(yield_per=batch_size))
+            for batch in result.partitions():
+                read += len(batch)
+                last_key = (batch[-1][_DATE_INDEX], batch[-1][0])
+                yield batch
+
+        if read < segment_size:
+            return
+
+
+def _export_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def csv_chunks(batches: Iterable[list[Row]]) -> Iterator[bytes]:
+    """Converte os blocos em CSV com cabeçalho."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    yield buffer.getvalue().encode()
+
+    for batch in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(
+            row[:_DATE_INDEX] + (row[_DATE_INDEX].isoformat(),) + row[_DATE_INDEX + 1:]
+            for row in batch
+        )
+        yield buffer.getvalue().encode()
+
+
+def ndjson_chunks(batches: Iterable[list[Row]]) -> Iterator[bytes]:
+    """Converte os blocos em NDJSON (um objeto JSON por linha)."""
+    for batch in batches:
+        lines = [
+            json.dumps(dict(zip(EXPORT_COLUMNS, map(_export_value, row))), ensure_ascii=False)
+            for row in batch
+        ]
+        yield ("\n".join(lines) + "\n").encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Arquivo só de escrita que acumula bytes até serem retirados com take()."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: list[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def parquet_schema():
+    """Schema Arrow das colunas de EXPORT_COLUMNS (exportação e arquivo frio)."""
+    import pyarrow as pa
+
+    return pa.schema([
+        ("id", pa.int64()),
+        ("store_id", pa.string()),
+        ("store_name", pa.string()),
+        ("city", pa.string()),
+        ("state", pa.string()),
+        ("collection_date", pa.timestamp("us")),
+        ("fuel_type", pa.string()),
+        ("sale_price", pa.float64()),
+        ("volume_sold", pa.float64()),
+        ("driver_name", pa.string()),
+        ("driver_cpf", pa.string()),
+        ("vehicle_plate", pa.string()),
+        ("vehicle_type", pa.string()),
+    ])
+
+
+def parquet_chunks(batches: Iterable[list[Row]]) -> Iterator[bytes]:
+    """Converte os blocos em Parquet, um row group por bloco."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = parquet_schema()
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for batch in batches:
+            columns = list(zip(*batch))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema
+            ))
+            yield sink.take()
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Comprime um fluxo de blocos em gzip, sem acumular o arquivo inteiro."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_collections(
+    engine: Engine,
+    conditions: list,
+    file_format: str = "csv",
+    gzip: bool = False,
+    batch_size: int = EXPORT_BATCH_SIZE
+) -> Iterator[bytes]:
+    """
+    Gera o arquivo de exportação em blocos de bytes.
+
+    Args:
+        engine: Engine do banco de dados
+        conditions: Condições WHERE (collection_service.filter_conditions)
+        file_format: "csv", "ndjson" ou "parquet"
+        gzip: Se deve comprimir a saída em gzip
+        batch_size: Linhas por bloco lido do banco
+
+    Returns:
+        Iterador de blocos de bytes para um StreamingResponse
+
+    Raises:
+        ValueError: Se o formato for desconhecido
+    """
+    writers = {"csv": csv_chunks, "ndjson": ndjson_chunks, "parquet": parquet_chunks}
+    if file_format not in writers:
+        raise ValueError(f"Formato não suportado: {file_format}")
+
+    chunks = writers[file_format](iter_export_batches(engine, conditions, batch_size=batch_size))
+    return gzip_chunks(chunks) if gzip else chunks
+
+
+def export_file_name(file_format: str, gzip: bool = False, now: Optional[datetime] = None) -> str:
+    """Nome do arquivo sugerido no Content-Disposition."""
+    timestamp = (now or datetime.utcnow()).strftime("%Y%m%d%H%M%S")
+    extension = EXPORT_FORMATS[file_format][1]
+    return f"coletas_{timestamp}.{extension}" + (".gz" if gzip else "")
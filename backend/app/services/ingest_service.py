@@ -1,12 +1,33 @@
+import time
+from datetime import datetime
+from typing import Any
 from sqlmodel import Session
+from sqlalchemy import text
+from sqlalchemy.exc import DataError, DBAPIError, IntegrityError, StatementError
+from pydantic import ValidationError
 from app.models import FuelCollection
-from app.schemas import FuelCollectionCreate, FuelCollectionRead
-from app.cache import invalidate_cache
+from app.schemas import (
+    FuelCollectionCreate,
+    FuelCollectionRead,
+    BatchItemError,
+    BatchIngestResponse,
+    IngestAccepted,
+)
+from app.cache import invalidate_data_caches
+from app.services.driver_profile_service import invalidate_driver_profiles
+from app.leaderboards import record_collections
+from app.services.summary_service import apply_ingested_rows
+from app.star_schema import store_collections
+from app.ingest_queue import IngestQueue, FLUSH_BATCH_SIZE, FLUSH_INTERVAL_SECONDS, MAX_DELIVERIES, record_flush
 from fastapi import HTTPException, status
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Limite de itens aceitos em um único lote
+MAX_BATCH_SIZE = 5000
+
+
 
 def create_fuel_collection(
     collection: FuelCollectionCreate,
@@ -33,8 +54,10 @@ def create_fuel_collection(
         session.commit()
         session.refresh(db_collection)
         
-        # Invalida cache dos KPIs quando novos dados são inseridos
-        invalidate_cache("kpi:*")
+        # Invalida os caches de KPIs e contagens quando novos dados são inseridos
+        invalidate_data_caches()
+        invalidate_driver_profiles([db_collection.driver_cpf])
+        record_collections([db_collection.model_dump()])
         
         return FuelCollectionRead.model_validate(db_collection)
         
@@ -45,3 +68,251 @@ def create_fuel_collection(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Erro interno ao processar a ingestão dos dados."
         )
+
+
+def insert_collections(session: Session, rows: list[dict]) -> list[dict]:
+    """
+    Insere várias coletas no esquema estrela com um único INSERT no fato.
+    
+    Os agregados dos KPIs são atualizados na mesma transação. Não faz
+    commit: quem chama controla a transação.
+    
+    Args:
+        session: Sessão do banco de dados
+        rows: Dicionários com os campos de FuelCollection (já validados)
+    
+    Returns:
+        Os mesmos dicionários, completados com id e collection_date
+    """
+    if not rows:
+        return rows
+    
+    now = datetime.utcnow()
+    for row in rows:
+        row.setdefault("collection_date", now)
+    
+    connection = session.connection()
+    store_collections(connection, rows)
+    apply_ingested_rows(connection, rows)
+    
+    return rows
+
+
+def create_fuel_collections_batch(
+    payloads: list[dict[str, Any]],
+    session: Session
+) -> BatchIngestResponse:
+    """
+    Valida e insere um lote de coletas em uma única transação.
+    
+    Itens inválidos são reportados individualmente e não impedem a
+    inserção dos itens válidos. O cache dos KPIs é invalidado uma única
+    vez por lote.
+    
+    Args:
+        payloads: Lista de payloads no formato de FuelCollectionCreate
+        session: Sessão do banco de dados
+    
+    Returns:
+        BatchIngestResponse com os itens inseridos e os erros por item
+    
+    Raises:
+        HTTPException: Se o lote exceder o limite ou houver erro ao salvar
+    """
+    if len(payloads) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"O lote deve conter no máximo {MAX_BATCH_SIZE} itens."
+        )
+    
+    # Valida todos os itens, separando válidos de inválidos
+    rows = []
+    errors = []
+    for index, payload in enumerate(payloads):
+        try:
+            rows.append(FuelCollectionCreate.model_validate(payload).model_dump())
+        except ValidationError as e:
+            errors.append(BatchItemError(
+                index=index,
+                errors=[
+                    {"loc": list(err["loc"]), "msg": err["msg"], "type": err["type"]}
+                    for err in e.errors()
+                ]
+            ))
+    
+    try:
+        insert_collections(session, rows)
+        session.commit()
+    except Exception as e:
+        logger.error(f"Erro ao salvar lote: {e}")
+        session.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Erro interno ao processar a ingestão do lote."
+        )
+    
+    # Uma única invalidação por lote
+    if rows:
+        invalidate_data_caches()
+        invalidate_driver_profiles(row["driver_cpf"] for row in rows)
+        record_collections(rows)
+    
+    return BatchIngestResponse(
+        received=len(payloads),
+        inserted=len(rows),
+        rejected=len(errors),
+        data=[FuelCollectionRead.model_validate(row) for row in rows],
+        errors=errors
+    )
+
+
+def enqueue_fuel_collection(
+    collection: FuelCollectionCreate,
+    queue: IngestQueue
+) -> IngestAccepted:
+    """
+    Enfileira uma coleta já validada para gravação assíncrona.
+    
+    Args:
+        collection: Dados da coleta a ser criada
+        queue: Fila de ingestão
+    
+    Returns:
+        IngestAccepted com o tracking_id do item na fila
+    """
+    # A data da coleta é a do recebimento, não a da gravação
+    payload = collection.model_dump()
+    payload["collection_date"] = datetime.utcnow().isoformat()
+    tracking_id = queue.enqueue(payload)
+    return IngestAccepted(tracking_id=tracking_id)
+
+
+def flush_ingest_queue(
+    queue: IngestQueue,
+    session: Session,
+    max_items: int = FLUSH_BATCH_SIZE,
+    block_seconds: float = FLUSH_INTERVAL_SECONDS
+) -> int:
+    """
+    Lê um lote da fila e grava em FuelCollection em uma única transação.
+    
+    Os itens só são confirmados (removidos da fila) após o commit. Se o lote
+    falha com o banco no ar, ele é regravado item a item, para que um item
+    inválido vá para a fila de mortos sem travar a fila. Com o banco fora, o
+    lote inteiro volta para a fila para uma nova tentativa.
+    
+    Args:
+        queue: Fila de ingestão
+        session: Sessão do banco de dados
+        max_items: Tamanho máximo do lote
+        block_seconds: Tempo máximo de espera pelo primeiro item
+    
+    Returns:
+        Quantidade de coletas gravadas
+    """
+    entries = queue.read_batch(max_items, block_seconds)
+    if not entries:
+        return 0
+    
+    parsed = []
+    for entry in entries:
+        try:
+            row = dict(entry.payload)
+            row["collection_date"] = datetime.fromisoformat(row["collection_date"])
+        except (KeyError, TypeError, ValueError) as e:
+            queue.dead_letter([entry], f"Item ilegível: {e}")
+            continue
+        parsed.append((entry, row))
+    if not parsed:
+        return 0
+    entries = [entry for entry, _ in parsed]
+    rows = [row for _, row in parsed]
+    
+    start = time.perf_counter()
+    try:
+        # Cópias: uma tentativa desfeita não deixa ids nos itens
+        rows = insert_collections(session, [dict(row) for row in rows])
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        if not _database_available(session):
+            queue.release(entries)
+            raise
+        logger.warning(f"Lote da fila recusado ({e.__class__.__name__}); gravando item a item")
+        rows = _flush_entries_individually(queue, session, parsed)
+    else:
+        queue.ack(entries)
+    
+    if rows:
+        invalidate_data_caches()
+        invalidate_driver_profiles(row["driver_cpf"] for row in rows)
+        record_collections(rows)
+    record_flush(len(rows), time.perf_counter() - start)
+    
+    return len(rows)
+
+
+def _database_available(session: Session) -> bool:
+    """Distingue um lote recusado de um banco fora do ar"""
+    try:
+        session.exec(text("SELECT 1"))
+        session.rollback()
+        return True
+    except Exception:
+        session.rollback()
+        return False
+
+
+def _is_row_error(error: Exception) -> bool:
+    """Falha causada pelo conteúdo do item (tamanho, NOT NULL, tipo): repetir não adianta"""
+    if isinstance(error, (DataError, IntegrityError)):
+        return True
+    # Erro na conversão dos parâmetros, antes de chegar ao banco
+    return isinstance(error, StatementError) and not isinstance(error, DBAPIError)
+
+
+def _flush_entries_individually(queue: IngestQueue, session: Session, parsed: list[tuple]) -> list[dict]:
+    """
+    Grava um lote recusado item a item, uma transação por item.
+    
+    Itens recusados pelo conteúdo vão direto para a fila de mortos. Itens
+    com outras falhas voltam para a fila, a não ser que outros itens do lote
+    tenham sido gravados (a falha é do item) e eles já somem MAX_DELIVERIES
+    entregas. Se nenhum item foi gravado, o erro é propagado; se o banco
+    deixar de responder, os itens restantes voltam para a fila.
+    
+    Returns:
+        As coletas gravadas
+    """
+    inserted = []
+    failed = []
+    last_error = None
+    for position, (entry, row) in enumerate(parsed):
+        try:
+            written = insert_collections(session, [dict(row)])
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            reason = f"{e.__class__.__name__}: {getattr(e, 'orig', None) or e}"[:500]
+            if _is_row_error(e):
+                logger.error(f"Item {entry.tracking_id} movido para a fila de mortos: {reason}")
+                queue.dead_letter([entry], reason)
+                continue
+            if not _database_available(session):
+                queue.release([item for item, _ in failed] + [item for item, _ in parsed[position:]])
+                raise
+            failed.append((entry, reason))
+            last_error = e
+            continue
+        queue.ack([entry])
+        inserted.extend(written)
+    
+    for entry, reason in failed:
+        if inserted and entry.deliveries >= MAX_DELIVERIES:
+            logger.error(f"Item {entry.tracking_id} movido para a fila de mortos: {reason}")
+            queue.dead_letter([entry], reason)
+        else:
+            queue.release([entry])
+    if last_error is not None and not inserted:
+        raise last_error
+    return inserted
@@ -1,34 +1,28 @@
+from datetime import date
+from typing import Optional, Sequence
+from fastapi import HTTPException, status
 from sqlmodel import Session, select, func
-from app.models import FuelCollection
-from app.schemas import AvgPriceByFuel, VolumeByVehicle
-from app.cache import cached
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.models import FuelTypeSummary, VehicleTypeSummary, KpiRollup
+from app.schemas import AvgPriceByFuel, VolumeByVehicle, TimeseriesPoint
+from app.cache import cached, async_cached, cached_response
+from app.services.summary_service import ROLLUP_DIMENSIONS, bucket_start, count_buckets
 
+# Quantidade máxima de períodos em uma consulta de série temporal
+MAX_TIMESERIES_BUCKETS = 1000
 
-@cached("kpi:avg_price", ttl=600, skip_args=1)  # Cache de 10 minutos, ignora session
-def get_avg_price_by_fuel(session: Session) -> list[AvgPriceByFuel]:
-    """
-    Calcula a média de preço por tipo de combustível.
-    
-    Utiliza agregação SQL (AVG, GROUP BY) para calcular o preço médio
-    de cada tipo de combustível baseado em todos os registros.
-    
-    Args:
-        session: Sessão do banco de dados
-    
-    Returns:
-        Lista de AvgPriceByFuel com fuel_type, avg_price e total_records
-    """
-    # Query SQL com agregação
-    avg_price_col = func.avg(FuelCollection.sale_price).label("avg_price")
-    statement = select(
-        FuelCollection.fuel_type,
+
+def _avg_price_statement():
+    """Média = soma / contagem, uma linha por tipo de combustível"""
+    avg_price_col = (FuelTypeSummary.sum_price / FuelTypeSummary.total_records).label("avg_price")
+    return select(
+        FuelTypeSummary.fuel_type,
         avg_price_col,
-        func.count(FuelCollection.id).label("total_records")
-    ).group_by(FuelCollection.fuel_type).order_by(avg_price_col.desc())
-    
-    results = session.exec(statement).all()
-    
-    # Formatar resposta
+        FuelTypeSummary.total_records
+    ).where(FuelTypeSummary.total_records > 0).order_by(avg_price_col.desc())
+
+
+def _avg_price_response(results) -> list[AvgPriceByFuel]:
     return [
         AvgPriceByFuel(
             fuel_type=row[0],
@@ -39,36 +33,203 @@ def get_avg_price_by_fuel(session: Session) -> list[AvgPriceByFuel]:
     ]
 
 
-@cached("kpi:volume", ttl=600, skip_args=1)  # Cache de 10 minutos, ignora session
+def _volume_statement():
+    """Uma linha por tipo de veículo"""
+    return select(
+        VehicleTypeSummary.vehicle_type,
+        VehicleTypeSummary.sum_volume,
+        VehicleTypeSummary.total_records
+    ).where(VehicleTypeSummary.total_records > 0).order_by(VehicleTypeSummary.sum_volume.desc())
+
+
+def _volume_response(results) -> list[VolumeByVehicle]:
+    return [
+        VolumeByVehicle(
+            vehicle_type=row[0],
+            total_volume=round(row[1], 2),
+            total_records=row[2]
+        )
+        for row in results
+    ]
+
+
+@cached("kpi:avg_price", ttl=600, skip_args=1, stale_ttl=60)  # 10 min + 1 min servindo valor antigo, ignora session
+def get_avg_price_by_fuel(session: Session) -> list[AvgPriceByFuel]:
+    """
+    Calcula a média de preço por tipo de combustível.
+
+    Lê os agregados mantidos incrementalmente na ingestão (soma de preços
+    e contagem por combustível), sem varrer a tabela de coletas.
+
+    Args:
+        session: Sessão do banco de dados
+
+    Returns:
+        Lista de AvgPriceByFuel com fuel_type, avg_price e total_records
+    """
+    return _avg_price_response(session.exec(_avg_price_statement()).all())
+
+
+@cached("kpi:volume", ttl=600, skip_args=1, stale_ttl=60)  # 10 min + 1 min servindo valor antigo, ignora session
 def get_volume_by_vehicle(session: Session) -> list[VolumeByVehicle]:
     """
     Calcula o volume total consumido por tipo de veículo.
-    
-    Utiliza agregação SQL (SUM, GROUP BY) para calcular quanto cada
-    tipo de veículo consumiu ao longo do tempo.
-    
+
+    Lê os agregados mantidos incrementalmente na ingestão (soma de volume
+    e contagem por tipo de veículo), sem varrer a tabela de coletas.
+
     Args:
         session: Sessão do banco de dados
-    
+
     Returns:
         Lista de VolumeByVehicle com vehicle_type, total_volume e total_records
     """
-    # Query SQL com agregação
-    total_volume_col = func.sum(FuelCollection.volume_sold).label("total_volume")
-    statement = select(
-        FuelCollection.vehicle_type,
-        total_volume_col,
-        func.count(FuelCollection.id).label("total_records")
-    ).group_by(FuelCollection.vehicle_type).order_by(total_volume_col.desc())
-    
-    results = session.exec(statement).all()
-    
-    # Formatar resposta
-    return [
-        VolumeByVehicle(
-            vehicle_type=row[0],
-            total_volume=round(row[1], 2),
-            total_records=row[2]
+    return _volume_response(session.exec(_volume_statement()).all())
+
+
+@async_cached("kpi:avg_price", ttl=600, skip_args=1, stale_ttl=60)
+async def get_avg_price_by_fuel_async(session: AsyncSession) -> list[AvgPriceByFuel]:
+    """Versão assíncrona de get_avg_price_by_fuel (mesma chave de cache)."""
+    return _avg_price_response((await session.exec(_avg_price_statement())).all())
+
+
+@async_cached("kpi:volume", ttl=600, skip_args=1, stale_ttl=60)
+async def get_volume_by_vehicle_async(session: AsyncSession) -> list[VolumeByVehicle]:
+    """Versão assíncrona de get_volume_by_vehicle (mesma chave de cache)."""
+    return _volume_response((await session.exec(_volume_statement())).all())
+
+
+# Corpo JSON pré-serializado das respostas (routers), com chaves próprias
+get_avg_price_by_fuel_json = cached_response(
+    get_avg_price_by_fuel, "kpi:avg_price_json", ttl=600, skip_args=1, stale_ttl=60
+)
+get_volume_by_vehicle_json = cached_response(
+    get_volume_by_vehicle, "kpi:volume_json", ttl=600, skip_args=1, stale_ttl=60
+)
+get_avg_price_by_fuel_json_async = cached_response(
+    get_avg_price_by_fuel_async, "kpi:avg_price_json", ttl=600, skip_args=1, stale_ttl=60
+)
+get_volume_by_vehicle_json_async = cached_response(
+    get_volume_by_vehicle_async, "kpi:volume_json", ttl=600, skip_args=1, stale_ttl=60
+)
+
+
+def _timeseries_statement(
+    start: date,
+    end: date,
+    granularity: str,
+    group_by: Sequence[str],
+    filters: dict[str, Optional[str]]
+):
+    """Soma dos rollups por período (e grupos), restrita ao intervalo e aos filtros"""
+    if start > end:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="start deve ser anterior ou igual a end"
         )
-        for row in results
+    buckets = count_buckets(start, end, granularity)
+    if buckets > MAX_TIMESERIES_BUCKETS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Intervalo com {buckets} períodos; o máximo é {MAX_TIMESERIES_BUCKETS} (use uma granularidade maior)"
+        )
+    
+    groups = [getattr(KpiRollup, column) for column in group_by]
+    conditions = [
+        KpiRollup.granularity == granularity,
+        KpiRollup.bucket >= bucket_start(start, granularity),
+        KpiRollup.bucket <= end,
     ]
+    conditions += [getattr(KpiRollup, column) == value for column, value in filters.items() if value]
+    
+    return select(
+        KpiRollup.bucket,
+        *groups,
+        func.sum(KpiRollup.total_records),
+        func.sum(KpiRollup.sum_price),
+        func.sum(KpiRollup.sum_volume),
+    ).where(*conditions).group_by(KpiRollup.bucket, *groups).order_by(KpiRollup.bucket, *groups)
+
+
+def _timeseries_response(results, group_by: Sequence[str]) -> list[TimeseriesPoint]:
+    points = []
+    for row in results:
+        total_records, sum_price, sum_volume = row[-3:]
+        if not total_records:
+            continue
+        points.append(TimeseriesPoint(
+            bucket=row[0],
+            **dict(zip(group_by, row[1:-3])),
+            avg_price=round(sum_price / total_records, 2),
+            total_volume=round(sum_volume, 2),
+            total_records=total_records
+        ))
+    return points
+
+
+def get_timeseries(
+    session: Session,
+    start: date,
+    end: date,
+    granularity: str = "day",
+    group_by: Sequence[str] = (),
+    fuel_type: Optional[str] = None,
+    state: Optional[str] = None,
+    city: Optional[str] = None,
+    vehicle_type: Optional[str] = None
+) -> list[TimeseriesPoint]:
+    """
+    Série temporal de preço médio e volume, lida apenas dos rollups.
+    
+    O custo depende da quantidade de períodos e grupos, não do tamanho da
+    tabela de coletas.
+    
+    Args:
+        session: Sessão do banco de dados
+        start: Primeiro dia do intervalo (o período que o contém é incluído)
+        end: Último dia do intervalo
+        granularity: "day", "week" ou "month"
+        group_by: Dimensões de agrupamento (fuel_type, state, city, vehicle_type)
+        fuel_type: Filtro exato por tipo de combustível
+        state: Filtro exato por estado
+        city: Filtro exato por cidade
+        vehicle_type: Filtro exato por tipo de veículo
+    
+    Returns:
+        Lista de TimeseriesPoint ordenada por período e grupos
+    
+    Raises:
+        HTTPException: Se start > end ou o intervalo tiver períodos demais
+    """
+    group_by = _unique_dimensions(group_by)
+    filters = {"fuel_type": fuel_type, "state": state, "city": city, "vehicle_type": vehicle_type}
+    statement = _timeseries_statement(start, end, granularity, group_by, filters)
+    return _timeseries_response(session.exec(statement).all(), group_by)
+
+
+async def get_timeseries_async(
+    session: AsyncSession,
+    start: date,
+    end: date,
+    granularity: str = "day",
+    group_by: Sequence[str] = (),
+    fuel_type: Optional[str] = None,
+    state: Optional[str] = None,
+    city: Optional[str] = None,
+    vehicle_type: Optional[str] = None
+) -> list[TimeseriesPoint]:
+    """Versão assíncrona de get_timeseries (mesmos parâmetros e resposta)."""
+    group_by = _unique_dimensions(group_by)
+    filters = {"fuel_type": fuel_type, "state": state, "city": city, "vehicle_type": vehicle_type}
+    statement = _timeseries_statement(start, end, granularity, group_by, filters)
+    return _timeseries_response((await session.exec(statement)).all(), group_by)
+
+
+def _unique_dimensions(group_by: Sequence[str]) -> list[str]:
+    """Dimensões de agrupamento sem repetição, na ordem canônica."""
+    return [column for column in ROLLUP_DIMENSIONS if column in group_by]
+
+
+# Passe a sessão como primeiro argumento posicional e os demais por nome
+get_timeseries_json = cached_response(get_timeseries, "kpi:timeseries", ttl=600, skip_args=1, stale_ttl=60)
+get_timeseries_json_async = cached_response(get_timeseries_async, "kpi:timeseries", ttl=600, skip_args=1, stale_ttl=60)
@@ -0,0 +1,82 @@
+from datetime import date
+from typing import Optional
+from fastapi import HTTPException, status
+from sqlmodel import Session, select
+from app.leaderboards import BOARDS, top
+from app.models import DriverProfile, StoreDimension
+from app.schemas import LeaderboardEntry, LeaderboardResponse
+from app.schemas.fuel_collection import FUEL_TYPES
+
+# Tamanho padrão e máximo do top N
+DEFAULT_LEADERBOARD_LIMIT = 50
+MAX_LEADERBOARD_LIMIT = 500
+
+
+def get_leaderboard(
+    session: Session,
+    board: str,
+    window: str = "7d",
+    limit: int = DEFAULT_LEADERBOARD_LIMIT,
+    fuel_type: Optional[str] = None,
+    today: Optional[date] = None
+) -> LeaderboardResponse:
+    """
+    Top N de um ranking em uma janela de tempo.
+
+    As posições vêm dos conjuntos ordenados mantidos pela ingestão
+    (app.leaderboards); o banco só é lido para os nomes das N posições, pela
+    chave do perfil do motorista ou da dimensão de postos.
+
+    Args:
+        session: Sessão do banco de dados
+        board: Ranking (drivers-spend, stations-volume, stations-price, vehicles-volume)
+        window: "today", "7d" ou "30d"
+        limit: Quantidade de posições
+        fuel_type: Combustível (obrigatório nos rankings por combustível)
+        today: Último dia da janela (padrão: hoje, em UTC)
+
+    Returns:
+        LeaderboardResponse com as posições em ordem
+
+    Raises:
+        HTTPException: Se o combustível faltar ou for desconhecido
+    """
+    definition = BOARDS[board]
+    if definition.per_fuel and fuel_type not in FUEL_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Informe fuel_type: um de {FUEL_TYPES}"
+        )
+    ranking = top(board, window, limit, fuel_type if definition.per_fuel else None, today)
+    members = [member for member, _ in ranking]
+
+    if definition.member == "driver_cpf":
+        names = {
+            profile.driver_cpf: (profile.driver_name, None, None)
+            for profile in session.exec(select(DriverProfile).where(DriverProfile.driver_cpf.in_(members))).all()
+        } if members else {}
+    elif definition.member == "store_id":
+        names = {
+            store.store_id: (store.store_name, store.city, store.state)
+            for store in session.exec(select(StoreDimension).where(StoreDimension.store_id.in_(members))).all()
+        } if members else {}
+    else:
+        names = {}
+
+    entries = []
+    for rank, (member, value) in enumerate(ranking, start=1):
+        name, city, state = names.get(member, (None, None, None))
+        entries.append(LeaderboardEntry(
+            rank=rank,
+            key=f"{member[:3]}.***.***.{member[-2:]}" if definition.member == "driver_cpf" else member,
+            name=name,
+            city=city,
+            state=state,
+            value=round(value, 2),
+        ))
+    return LeaderboardResponse(
+        board=board,
+        window=window,
+        fuel_type=fuel_type if definition.per_fuel else None,
+        entries=entries
+    )
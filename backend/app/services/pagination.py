@@ -0,0 +1,138 @@
+"""
+Paginação por cursor (keyset) ordenada por (collection_date DESC, id DESC).
+
+O cursor é opaco para o cliente: codifica a data e o id da última (ou
+primeira) linha da página e a direção da navegação. Cada página é uma
+única consulta indexada, independente da profundidade.
+"""
+import base64
+import heapq
+import json
+from datetime import datetime
+from itertools import islice
+from typing import Optional
+from fastapi import HTTPException, status
+from sqlalchemy import tuple_
+from app.models import FuelCollection
+
+NEXT = "next"
+PREV = "prev"
+
+
+def encode_cursor(collection_date: datetime, row_id: int, direction: str = NEXT) -> str:
+    """Gera o cursor opaco a partir da chave de ordenação de uma linha."""
+    raw = json.dumps([collection_date.isoformat(), row_id, direction], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int, str]:
+    """
+    Decodifica um cursor gerado por encode_cursor.
+
+    Raises:
+        HTTPException: Se o cursor for inválido
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        date_iso, row_id, direction = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if direction not in (NEXT, PREV):
+            raise ValueError(direction)
+        return datetime.fromisoformat(date_iso), int(row_id), direction
+    except (ValueError, TypeError, json.JSONDecodeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor de paginação inválido."
+        )
+
+
+def apply_keyset(statement, cursor: Optional[str], page_size: int, model=FuelCollection):
+    """
+    Aplica o filtro e a ordenação do keyset a um SELECT de FuelCollection
+    (ou de outro modelo com collection_date e id).
+
+    Busca page_size + 1 linhas para saber se existe uma próxima página.
+
+    Args:
+        statement: SELECT com os filtros já aplicados
+        cursor: Cursor recebido do cliente (None para a primeira página)
+        page_size: Tamanho da página
+        model: Modelo consultado (padrão: FuelCollection)
+
+    Returns:
+        Tupla (statement, direção)
+    """
+    key = tuple_(model.collection_date, model.id)
+    direction = NEXT
+    if cursor:
+        collection_date, row_id, direction = decode_cursor(cursor)
+        # A condição só na data (redundante com a da tupla) permite ao
+        # PostgreSQL podar as partições mensais fora da página
+        if direction == NEXT:
+            statement = statement.where(
+                key < tuple_(collection_date, row_id), model.collection_date <= collection_date
+            )
+        else:
+            statement = statement.where(
+                key > tuple_(collection_date, row_id), model.collection_date >= collection_date
+            )
+
+    if direction == NEXT:
+        statement = statement.order_by(model.collection_date.desc(), model.id.desc())
+    else:
+        statement = statement.order_by(model.collection_date.asc(), model.id.asc())
+
+    return statement.limit(page_size + 1), direction
+
+
+def build_keyset_page(rows: list, page_size: int, direction: str, has_cursor: bool):
+    """
+    Recorta a página e calcula os cursores de navegação.
+
+    Args:
+        rows: Linhas retornadas por apply_keyset (até page_size + 1)
+        page_size: Tamanho da página
+        direction: Direção usada na consulta
+        has_cursor: Se a consulta partiu de um cursor (não é a primeira página)
+
+    Returns:
+        Tupla (linhas da página em ordem decrescente, next_cursor, prev_cursor)
+    """
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if direction == PREV:
+        rows = list(reversed(rows))
+
+    if not rows:
+        return rows, None, None
+
+    first, last = rows[0], rows[-1]
+    if direction == NEXT:
+        next_cursor = encode_cursor(last.collection_date, last.id, NEXT) if has_more else None
+        prev_cursor = encode_cursor(first.collection_date, first.id, PREV) if has_cursor else None
+    else:
+        next_cursor = encode_cursor(last.collection_date, last.id, NEXT)
+        prev_cursor = encode_cursor(first.collection_date, first.id, PREV) if has_more else None
+
+    return rows, next_cursor, prev_cursor
+
+
+def merge_keyset_rows(rows: list, other: list, direction: str, limit: int, offset: int = 0) -> list:
+    """
+    Intercala duas listas de coletas já ordenadas pela chave do keyset.
+
+    Usada para juntar as coletas da tabela com as do arquivo frio.
+
+    Args:
+        rows: Primeira lista, na ordem da direção
+        other: Segunda lista, na mesma ordem
+        direction: NEXT (decrescente) ou PREV (crescente)
+        limit: Quantidade máxima de linhas devolvidas
+        offset: Linhas da intercalação puladas antes da primeira devolvida
+
+    Returns:
+        Linhas intercaladas, na ordem da direção
+    """
+    merged = heapq.merge(
+        rows, other, key=lambda row: (row.collection_date, row.id), reverse=direction == NEXT
+    )
+    return list(islice(merged, offset, offset + limit))
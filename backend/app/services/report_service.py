@@ -1,70 +1,446 @@
-from sqlmodel import Session, select
-from app.models import FuelCollection
-from app.schemas import FuelCollectionRead, DriverReport
+import asyncio
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlmodel import Session, select, func
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.archive import ArchiveQuery, aggregate_archived, archived_files, archived_files_async, read_archived
+from app.cache import cached, async_cached
+from app.models import FuelCollection, PriceAnomaly
+from app.schemas import FuelCollectionRead, DriverReport, PriceAnomalyRead, AnomalyPage
+from app.search import normalize_text, text_search_condition
+from app.services.driver_profile_service import (
+    PROFILE_CACHE_PREFIX, PROFILE_CACHE_TTL, read_driver_profile, read_driver_profile_async,
+)
+from app.services.pagination import apply_keyset, build_keyset_page, decode_cursor, merge_keyset_rows
 from fastapi import HTTPException, status
 
+# Quantidade padrão de abastecimentos por página do histórico
+DEFAULT_HISTORY_PAGE_SIZE = 50
+
+# Quantidade padrão de sinalizações por página de /reports/anomalies
+DEFAULT_ANOMALY_PAGE_SIZE = 50
+
 
 def get_driver_report(
     search: str,
-    session: Session
+    session: Session,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    page_size: int = DEFAULT_HISTORY_PAGE_SIZE
 ) -> DriverReport:
     """
     Gera relatório completo de um motorista específico.
-    
-    Busca por CPF (exato) ou Nome (parcial) e retorna estatísticas
-    completas incluindo total de abastecimentos, gastos e combustível favorito.
-    
+
+    Busca por CPF (exato) ou Nome (parcial, sem acentos). Por CPF e sem
+    período, o resumo (totais, combustível favorito, primeiro e último
+    abastecimento) é o perfil incremental do motorista, lido pela chave
+    primária e cacheado por CPF. Nos demais casos é calculado no banco com
+    uma única consulta agrupada por combustível. O histórico é paginado por
+    cursor, então o custo não depende do tamanho do histórico do motorista.
+    Se o período alcança o arquivo frio, os totais e o histórico incluem as
+    coletas arquivadas.
+
     Args:
         search: CPF (11 dígitos) ou Nome do motorista
         session: Sessão do banco de dados
-    
+        start_date: Considerar apenas abastecimentos a partir desta data
+        end_date: Considerar apenas abastecimentos até esta data
+        cursor: Cursor do histórico recebido em next_cursor/prev_cursor
+        page_size: Quantidade de abastecimentos por página do histórico
+
     Returns:
-        DriverReport com estatísticas e histórico completo
-    
+        DriverReport com estatísticas e uma página do histórico
+
     Raises:
         HTTPException: Se nenhum registro for encontrado
     """
-    # Determinar se é CPF ou Nome
-    is_cpf = search.isdigit() and len(search) == 11
+    conditions = _driver_conditions(session.get_bind(), search, start_date, end_date)
+    query = _archive_query(search, start_date, end_date)
+    use_profile = _uses_profile(search, start_date, end_date)
     
-    # Construir query base
-    if is_cpf:
-        statement = select(FuelCollection).where(FuelCollection.driver_cpf == search)
+    if use_profile:
+        summary = get_driver_summary(session, search)
     else:
-        statement = select(FuelCollection).where(FuelCollection.driver_name.ilike(f"%{search}%"))
+        fuel_totals = session.exec(_fuel_totals_statement(conditions)).all()
+        latest = session.exec(_identity_statement(conditions)).first()
+    history_statement, direction = apply_keyset(
+        select(FuelCollection).where(*conditions), cursor, page_size
+    )
+    rows = session.exec(history_statement).all()
     
-    # Executar query
-    results = session.exec(statement.order_by(FuelCollection.collection_date.desc())).all()
+    paths = [f.path for f in archived_files(session, query)]
+    if paths:
+        if not use_profile:
+            fuel_totals, latest = _with_archived_totals(paths, query, fuel_totals, latest)
+        rows = _with_archived_history(paths, query, rows, cursor, page_size, direction)
+    if not use_profile:
+        summary = _summarize(fuel_totals, latest)
+    if summary is None:
+        _raise_not_found(search)
     
-    if not results:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Nenhum registro encontrado para: {search}"
+    return _build_report(summary, rows, page_size, direction, cursor)
+
+
+async def get_driver_report_async(
+    search: str,
+    session: AsyncSession,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    page_size: int = DEFAULT_HISTORY_PAGE_SIZE
+) -> DriverReport:
+    """
+    Versão assíncrona de get_driver_report (mesmos parâmetros e resposta).
+    """
+    conditions = _driver_conditions(session.get_bind(), search, start_date, end_date)
+    query = _archive_query(search, start_date, end_date)
+    use_profile = _uses_profile(search, start_date, end_date)
+    
+    if use_profile:
+        summary = await get_driver_summary_async(session, search)
+    else:
+        fuel_totals = (await session.exec(_fuel_totals_statement(conditions))).all()
+        latest = (await session.exec(_identity_statement(conditions))).first()
+    history_statement, direction = apply_keyset(
+        select(FuelCollection).where(*conditions), cursor, page_size
+    )
+    rows = (await session.exec(history_statement)).all()
+    
+    paths = [f.path for f in await archived_files_async(session, query)]
+    if paths:
+        if not use_profile:
+            fuel_totals, latest = await asyncio.to_thread(
+                _with_archived_totals, paths, query, fuel_totals, latest
+            )
+        rows = await asyncio.to_thread(
+            _with_archived_history, paths, query, rows, cursor, page_size, direction
         )
+    if not use_profile:
+        summary = _summarize(fuel_totals, latest)
+    if summary is None:
+        _raise_not_found(search)
     
-    # Calcular estatísticas
-    total_refuels = len(results)
-    total_spent = sum(r.sale_price * r.volume_sold for r in results)
-    total_volume = sum(r.volume_sold for r in results)
+    return _build_report(summary, rows, page_size, direction, cursor)
+
+
+@cached(PROFILE_CACHE_PREFIX, ttl=PROFILE_CACHE_TTL, skip_args=1)  # Ignora session
+def get_driver_summary(session: Session, cpf: str) -> Optional[dict]:
+    """
+    Resumo do relatório de um motorista a partir do seu perfil incremental.
     
-    # Calcular combustível favorito (mais utilizado)
-    fuel_counts = {}
-    for r in results:
-        fuel_counts[r.fuel_type] = fuel_counts.get(r.fuel_type, 0) + 1
-    favorite_fuel = max(fuel_counts, key=fuel_counts.get)
+    Uma leitura de driver_profile pela chave primária; o resultado fica no
+    cache por CPF e é invalidado só quando o CPF recebe coletas.
     
-    # Pegar dados do primeiro registro para nome e CPF
-    first_record = results[0]
+    Args:
+        session: Sessão do banco de dados
+        cpf: CPF (11 dígitos)
+    
+    Returns:
+        Campos do resumo de DriverReport, ou None se o CPF não tiver coletas
+    """
+    return _render_profile(read_driver_profile(session, cpf))
+
+
+@async_cached(PROFILE_CACHE_PREFIX, ttl=PROFILE_CACHE_TTL, skip_args=1)
+async def get_driver_summary_async(session: AsyncSession, cpf: str) -> Optional[dict]:
+    """Versão assíncrona de get_driver_summary (mesmas entradas do cache)."""
+    return _render_profile(await read_driver_profile_async(session, cpf))
+
+
+def _is_cpf(search: str) -> bool:
+    return search.isdigit() and len(search) == 11
+
+
+def _uses_profile(search: str, start_date: Optional[datetime], end_date: Optional[datetime]) -> bool:
+    """O perfil cobre todas as coletas do CPF: só serve sem período."""
+    return _is_cpf(search) and start_date is None and end_date is None
+
+
+def _mask_cpf(cpf: str) -> str:
+    return f"{cpf[:3]}.***.***.{cpf[-2:]}"
+
+
+def _render_profile(profile) -> Optional[dict]:
+    """Campos do resumo de DriverReport a partir da linha de driver_profile."""
+    if profile is None:
+        return None
+    return {
+        "driver_name": profile.driver_name,
+        "driver_cpf_masked": _mask_cpf(profile.driver_cpf),
+        "total_refuels": profile.refuel_count,
+        "total_spent": round(profile.total_spent, 2),
+        "total_volume": round(profile.total_volume, 2),
+        "favorite_fuel": profile.favorite_fuel,
+        "first_refuel": profile.first_refuel,
+        "last_refuel": profile.last_refuel,
+    }
+
+
+def _driver_conditions(
+    bind,
+    search: str,
+    start_date: Optional[datetime],
+    end_date: Optional[datetime]
+) -> list:
+    """Condições comuns aos totais e ao histórico (CPF exato ou nome parcial, período)."""
+    # Determinar se é CPF ou Nome
+    if _is_cpf(search):
+        conditions = [FuelCollection.driver_cpf == search]
+    else:
+        conditions = [text_search_condition(bind, FuelCollection.driver_name, search)]
+    if start_date:
+        conditions.append(FuelCollection.collection_date >= start_date)
+    if end_date:
+        conditions.append(FuelCollection.collection_date <= end_date)
+    return conditions
+
+
+def _fuel_totals_statement(conditions: list):
+    """Totais por combustível: uma linha por tipo de combustível"""
+    return select(
+        FuelCollection.fuel_type,
+        func.count(FuelCollection.id),
+        func.sum(FuelCollection.sale_price * FuelCollection.volume_sold),
+        func.sum(FuelCollection.volume_sold),
+        func.max(FuelCollection.collection_date),
+        func.min(FuelCollection.collection_date),
+    ).where(*conditions).group_by(FuelCollection.fuel_type)
+
+
+def _identity_statement(conditions: list):
+    """Nome, CPF e chave de ordenação do abastecimento mais recente"""
+    return (
+        select(
+            FuelCollection.driver_name, FuelCollection.driver_cpf,
+            FuelCollection.collection_date, FuelCollection.id
+        )
+        .where(*conditions)
+        .order_by(FuelCollection.collection_date.desc(), FuelCollection.id.desc())
+        .limit(1)
+    )
+
+
+def _archive_query(
+    search: str,
+    start_date: Optional[datetime],
+    end_date: Optional[datetime]
+) -> ArchiveQuery:
+    """Mesmos filtros de _driver_conditions para o arquivo frio."""
+    is_cpf = _is_cpf(search)
+    return ArchiveQuery(
+        equals=(("driver_cpf", search),) if is_cpf else (),
+        search=() if is_cpf else (("driver_name", normalize_text(search)),),
+        start=start_date,
+        # end_date é inclusivo; o fim do ArchiveQuery é exclusivo
+        end=end_date + timedelta(microseconds=1) if end_date else None
+    )
+
+
+def _with_archived_totals(
+    paths: list[str],
+    query: ArchiveQuery,
+    fuel_totals: list,
+    latest
+) -> tuple[list, object]:
+    """
+    Junta as coletas arquivadas aos totais por combustível e ao abastecimento
+    mais recente lidos da tabela.
+    """
+    totals = {row[0]: list(row) for row in fuel_totals}
+    for group in aggregate_archived(
+        paths, query, ["fuel_type"],
+        [
+            ("id", "count"), ("spend", "sum"), ("volume_sold", "sum"),
+            ("collection_date", "max"), ("collection_date", "min"),
+        ]
+    ):
+        current = totals.get(group["fuel_type"])
+        if current is None:
+            totals[group["fuel_type"]] = [
+                group["fuel_type"], group["id_count"], group["spend_sum"],
+                group["volume_sold_sum"], group["collection_date_max"], group["collection_date_min"],
+            ]
+        else:
+            current[1] += group["id_count"]
+            current[2] += group["spend_sum"]
+            current[3] += group["volume_sold_sum"]
+            current[4] = max(current[4], group["collection_date_max"])
+            current[5] = min(current[5], group["collection_date_min"])
+
+    archived_latest = read_archived(paths, query, 1)
+    candidates = [row for row in [latest] + archived_latest if row is not None]
+    latest = max(candidates, key=lambda row: (row.collection_date, row.id), default=None)
+    return [tuple(row) for row in totals.values()], latest
+
+
+def _with_archived_history(
+    paths: list[str],
+    query: ArchiveQuery,
+    rows: list,
+    cursor: Optional[str],
+    page_size: int,
+    direction: str
+) -> list:
+    """Junta as coletas arquivadas à página do histórico lida da tabela."""
+    archived = read_archived(
+        paths, query, page_size + 1, cursor=decode_cursor(cursor) if cursor else None
+    )
+    return merge_keyset_rows(rows, archived, direction, page_size + 1)
+
+
+def _raise_not_found(search: str):
+    raise HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail=f"Nenhum registro encontrado para: {search}"
+    )
+
+
+def _summarize(fuel_totals: list, latest) -> Optional[dict]:
+    """Campos do resumo de DriverReport a partir dos totais por combustível."""
+    if not fuel_totals:
+        return None
+    
+    # Combustível mais utilizado; no empate, o abastecido mais recentemente
+    favorite_fuel = max(fuel_totals, key=lambda row: (row[1], row[4]))[0]
+    
+    return {
+        "driver_name": latest.driver_name,
+        "driver_cpf_masked": _mask_cpf(latest.driver_cpf),
+        "total_refuels": sum(row[1] for row in fuel_totals),
+        "total_spent": round(sum(row[2] for row in fuel_totals), 2),
+        "total_volume": round(sum(row[3] for row in fuel_totals), 2),
+        "favorite_fuel": favorite_fuel,
+        "first_refuel": min(row[5] for row in fuel_totals),
+        "last_refuel": max(row[4] for row in fuel_totals),
+    }
+
+
+def _build_report(
+    summary: dict,
+    rows: list,
+    page_size: int,
+    direction: str,
+    cursor: Optional[str]
+) -> DriverReport:
+    """Monta o DriverReport a partir do resumo e da página do histórico."""
+    # Página do histórico (keyset sobre collection_date, id)
+    rows, next_cursor, prev_cursor = build_keyset_page(
+        rows, page_size, direction, has_cursor=bool(cursor)
+    )
     
     # Converter para FuelCollectionRead
-    refuels = [FuelCollectionRead.model_validate(r) for r in results]
+    refuels = [FuelCollectionRead.model_validate(r) for r in rows]
     
     return DriverReport(
-        driver_name=first_record.driver_name,
-        driver_cpf_masked=f"{first_record.driver_cpf[:3]}.***.***.{first_record.driver_cpf[-2:]}",
-        total_refuels=total_refuels,
-        total_spent=round(total_spent, 2),
-        total_volume=round(total_volume, 2),
-        favorite_fuel=favorite_fuel,
-        refuels=refuels
+        **summary,
+        refuels=refuels,
+        next_cursor=next_cursor,
+        prev_cursor=prev_cursor
+    )
+
+
+def get_anomalies(
+    session: Session,
+    kind: Optional[str] = None,
+    fuel_type: Optional[str] = None,
+    store_id: Optional[str] = None,
+    city: Optional[str] = None,
+    state: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    min_z_score: Optional[float] = None,
+    cursor: Optional[str] = None,
+    page_size: int = DEFAULT_ANOMALY_PAGE_SIZE
+) -> AnomalyPage:
+    """
+    Lista as coletas sinalizadas pelo detector da ingestão (app.anomalies).
+
+    As sinalizações são gravadas na ingestão; a listagem é uma consulta
+    filtrada em price_anomaly, paginada por cursor sobre (collection_date,
+    id), das mais recentes para as mais antigas.
+
+    Args:
+        session: Sessão do banco de dados
+        kind: Regra (price_store, price_city ou volume_vehicle)
+        fuel_type: Tipo de combustível
+        store_id: Identificador do posto
+        city: Cidade
+        state: Estado (UF)
+        start_date: Coletas a partir desta data
+        end_date: Coletas até esta data
+        min_z_score: |z-score| mínimo
+        cursor: Cursor recebido em next_cursor/prev_cursor
+        page_size: Quantidade de sinalizações por página
+
+    Returns:
+        AnomalyPage com uma página de sinalizações
+    """
+    statement, direction = apply_keyset(
+        _anomalies_statement(kind, fuel_type, store_id, city, state, start_date, end_date, min_z_score),
+        cursor, page_size, model=PriceAnomaly
+    )
+    return _build_anomaly_page(session.exec(statement).all(), page_size, direction, cursor)
+
+
+async def get_anomalies_async(
+    session: AsyncSession,
+    kind: Optional[str] = None,
+    fuel_type: Optional[str] = None,
+    store_id: Optional[str] = None,
+    city: Optional[str] = None,
+    state: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    min_z_score: Optional[float] = None,
+    cursor: Optional[str] = None,
+    page_size: int = DEFAULT_ANOMALY_PAGE_SIZE
+) -> AnomalyPage:
+    """
+    Versão assíncrona de get_anomalies (mesmos parâmetros e resposta).
+    """
+    statement, direction = apply_keyset(
+        _anomalies_statement(kind, fuel_type, store_id, city, state, start_date, end_date, min_z_score),
+        cursor, page_size, model=PriceAnomaly
+    )
+    return _build_anomaly_page((await session.exec(statement)).all(), page_size, direction, cursor)
+
+
+def _anomalies_statement(
+    kind: Optional[str],
+    fuel_type: Optional[str],
+    store_id: Optional[str],
+    city: Optional[str],
+    state: Optional[str],
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    min_z_score: Optional[float]
+):
+    """SELECT de price_anomaly com os filtros informados"""
+    statement = select(PriceAnomaly)
+    for column, value in (
+        (PriceAnomaly.kind, kind),
+        (PriceAnomaly.fuel_type, fuel_type),
+        (PriceAnomaly.store_id, store_id),
+        (PriceAnomaly.city, city),
+        (PriceAnomaly.state, state),
+    ):
+        if value is not None:
+            statement = statement.where(column == value)
+    if start_date:
+        statement = statement.where(PriceAnomaly.collection_date >= start_date)
+    if end_date:
+        statement = statement.where(PriceAnomaly.collection_date <= end_date)
+    if min_z_score is not None:
+        statement = statement.where(func.abs(PriceAnomaly.z_score) >= min_z_score)
+    return statement
+
+
+def _build_anomaly_page(rows: list, page_size: int, direction: str, cursor: Optional[str]) -> AnomalyPage:
+    rows, next_cursor, prev_cursor = build_keyset_page(rows, page_size, direction, has_cursor=bool(cursor))
+    return AnomalyPage(
+        page_size=page_size,
+        data=[PriceAnomalyRead.model_validate(row) for row in rows],
+        next_cursor=next_cursor,
+        prev_cursor=prev_cursor
     )
@@ -0,0 +1,452 @@
+"""
+Manutenção incremental das tabelas de agregados dos KPIs.
+
+Cada inserção em FuelCollection atualiza, na mesma transação, os totais por
+tipo de combustível e por tipo de veículo e os rollups por período (dia,
+semana e mês) x combustível x estado x cidade x veículo. Assim os KPIs leem
+O(grupos) linhas em vez de varrer a tabela de coletas.
+
+As coletas são gravadas no esquema estrela (app.star_schema.store_collections;
+fuelcollection é uma view) e em seguida passam por apply_ingested_rows, que
+também atualiza os perfis dos motoristas (driver_profile_service) e pontua as
+anomalias (app.anomalies). Inserções via ORM (session.add) são capturadas
+pelo evento before_flush; inserções via Core (lote, COPY, fila) chamam as
+duas funções.
+O recálculo e o desconto dos meses removidos agrupam o fato do esquema
+estrela (grouped_facts); a verificação de consistência lê a view de coletas.
+"""
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Iterable, Mapping, Optional
+from sqlalchemy import event, delete, insert, update, cast, literal, Date, Table
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session as OrmSession, make_transient_to_detached
+from sqlmodel import Session, select, func
+from app.models import ArchivedFile, FuelCollection, FuelFact, FuelTypeSummary, VehicleTypeSummary, KpiRollup
+from app.anomalies import detect_anomalies, remove_anomalies
+from app.star_schema import grouped_facts, store_collections
+from app.services.driver_profile_service import apply_driver_rows, remove_driver_collections
+
+logger = logging.getLogger(__name__)
+
+# Tolerância para comparar somas de ponto flutuante na verificação de consistência
+CONSISTENCY_TOLERANCE = 1e-6
+
+SUMMARY_COLUMNS = ["total_records", "sum_price", "sum_volume"]
+
+# Granularidades dos rollups por período
+ROLLUP_GRANULARITIES = ("day", "week", "month")
+
+# Dimensões dos rollups (além da granularidade e do período)
+ROLLUP_DIMENSIONS = ["fuel_type", "state", "city", "vehicle_type"]
+
+ROLLUP_KEY_COLUMNS = ["granularity", "bucket"] + ROLLUP_DIMENSIONS
+
+# Estados parciais de SUMMARY_COLUMNS nos GROUP BYs sobre o fato (grouped_facts)
+_SUMMARY_PARTIALS = [
+    ("total_records", "count", FuelFact.__table__.c.id),
+    ("sum_price", "sum", FuelFact.__table__.c.sale_price),
+    ("sum_volume", "sum", FuelFact.__table__.c.volume_sold),
+]
+
+
+def upsert_increments(
+    connection: Connection,
+    table: Table,
+    key_columns: list[str],
+    increments: dict[tuple, dict[str, float]],
+):
+    """
+    Soma incrementos em linhas de agregado, criando as que não existem.
+
+    Usa INSERT ... ON CONFLICT DO UPDATE no PostgreSQL e no SQLite. As
+    chaves são gravadas em ordem para evitar deadlocks entre lotes
+    concorrentes.
+
+    Args:
+        connection: Conexão da transação corrente
+        table: Tabela de agregado
+        key_columns: Colunas da chave primária
+        increments: Chave -> {coluna: incremento}
+    """
+    if not increments:
+        return
+
+    rows = [
+        {**dict(zip(key_columns, key)), **values}
+        for key, values in sorted(increments.items())
+    ]
+    value_columns = list(rows[0].keys() - set(key_columns))
+    dialect = connection.dialect.name
+
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        statement = dialect_insert(table).values(rows)
+        statement = statement.on_conflict_do_update(
+            index_elements=key_columns,
+            set_={column: table.c[column] + statement.excluded[column] for column in value_columns}
+        )
+        connection.execute(statement)
+        return
+
+    # Demais bancos: UPDATE e, se nenhuma linha existir, INSERT
+    for row in rows:
+        condition = [table.c[column] == row[column] for column in key_columns]
+        result = connection.execute(
+            update(table).where(*condition).values(
+                {column: table.c[column] + row[column] for column in value_columns}
+            )
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(table).values(row))
+
+
+def _summary_increments(rows: Iterable[Mapping], key: str) -> dict[tuple, dict[str, float]]:
+    """Agrupa as coletas por uma coluna e soma contagem, preço e volume."""
+    increments: dict[tuple, dict[str, float]] = defaultdict(lambda: dict.fromkeys(SUMMARY_COLUMNS, 0))
+    for row in rows:
+        group = increments[(row[key],)]
+        group["total_records"] += 1
+        group["sum_price"] += row["sale_price"]
+        group["sum_volume"] += row["volume_sold"]
+    return increments
+
+
+def bucket_start(value: datetime | date, granularity: str) -> date:
+    """
+    Início do período que contém a data.
+    
+    Args:
+        value: Data ou data/hora da coleta
+        granularity: "day", "week" (segunda-feira) ou "month"
+    """
+    day = value.date() if isinstance(value, datetime) else value
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+
+def count_buckets(start: date, end: date, granularity: str) -> int:
+    """Quantidade de períodos da granularidade entre start e end (inclusive)."""
+    first, last = bucket_start(start, granularity), bucket_start(end, granularity)
+    if granularity == "month":
+        return (last.year - first.year) * 12 + last.month - first.month + 1
+    days = (last - first).days
+    return days // 7 + 1 if granularity == "week" else days + 1
+
+
+def _rollup_increments(rows: Iterable[Mapping]) -> dict[tuple, dict[str, float]]:
+    """Agrupa as coletas por granularidade, período e dimensões."""
+    increments: dict[tuple, dict[str, float]] = defaultdict(lambda: dict.fromkeys(SUMMARY_COLUMNS, 0))
+    for row in rows:
+        dimensions = tuple(row[column] for column in ROLLUP_DIMENSIONS)
+        for granularity in ROLLUP_GRANULARITIES:
+            group = increments[(granularity, bucket_start(row["collection_date"], granularity)) + dimensions]
+            group["total_records"] += 1
+            group["sum_price"] += row["sale_price"]
+            group["sum_volume"] += row["volume_sold"]
+    return increments
+
+
+def apply_ingested_rows(connection: Connection, rows: list[Mapping]):
+    """
+    Atualiza os agregados e os perfis dos motoristas com coletas recém-gravadas
+    e sinaliza as anômalas.
+
+    Deve ser chamada na mesma transação que grava as coletas (store_collections
+    ou o COPY da carga em massa).
+
+    Args:
+        connection: Conexão da transação corrente (session.connection())
+        rows: Coletas gravadas (dicionários com o id e todas as colunas de
+              FuelCollection)
+    """
+    if not rows:
+        return
+    upsert_increments(
+        connection, FuelTypeSummary.__table__, ["fuel_type"],
+        _summary_increments(rows, "fuel_type")
+    )
+    upsert_increments(
+        connection, VehicleTypeSummary.__table__, ["vehicle_type"],
+        _summary_increments(rows, "vehicle_type")
+    )
+    upsert_increments(
+        connection, KpiRollup.__table__, ROLLUP_KEY_COLUMNS,
+        _rollup_increments(rows)
+    )
+    apply_driver_rows(connection, rows)
+    detect_anomalies(connection, rows)
+
+
+def remove_collections(connection: Connection, start: datetime, end: datetime) -> int:
+    """
+    Desconta dos agregados e dos perfis dos motoristas as coletas de um
+    intervalo que serão removidas e apaga as suas sinalizações de anomalia.
+
+    Deve ser chamada na mesma transação que remove as coletas (DELETE ou
+    DETACH da partição do mês). Um GROUP BY por dia e dimensões lê só o
+    intervalo (com particionamento, só a partição do mês); os totais entram
+    como incrementos negativos e as linhas de agregado que ficam sem coletas
+    são apagadas.
+
+    Args:
+        connection: Conexão da transação corrente
+        start: Início do intervalo (inclusive)
+        end: Fim do intervalo (exclusive)
+
+    Returns:
+        Quantidade de coletas descontadas
+    """
+    fact = FuelFact.__table__
+    day = bucket_expression(connection.dialect.name, "day", fact.c.collection_date).label("bucket")
+    groups = connection.execute(grouped_facts(
+        [day], ROLLUP_DIMENSIONS, _SUMMARY_PARTIALS,
+        [fact.c.collection_date >= start, fact.c.collection_date < end]
+    )).all()
+
+    by_fuel: dict[tuple, dict[str, float]] = defaultdict(lambda: dict.fromkeys(SUMMARY_COLUMNS, 0))
+    by_vehicle: dict[tuple, dict[str, float]] = defaultdict(lambda: dict.fromkeys(SUMMARY_COLUMNS, 0))
+    rollups: dict[tuple, dict[str, float]] = defaultdict(lambda: dict.fromkeys(SUMMARY_COLUMNS, 0))
+    removed = 0
+    for bucket, *keys, total_records, sum_price, sum_volume in groups:
+        group = dict(zip(ROLLUP_DIMENSIONS, keys))
+        targets = [by_fuel[(group["fuel_type"],)], by_vehicle[(group["vehicle_type"],)]] + [
+            rollups[(granularity, bucket_start(bucket, granularity)) + tuple(keys)]
+            for granularity in ROLLUP_GRANULARITIES
+        ]
+        for target in targets:
+            target["total_records"] -= total_records
+            target["sum_price"] -= sum_price
+            target["sum_volume"] -= sum_volume
+        removed += total_records
+
+    for table, key_columns, increments in (
+        (FuelTypeSummary.__table__, ["fuel_type"], by_fuel),
+        (VehicleTypeSummary.__table__, ["vehicle_type"], by_vehicle),
+        (KpiRollup.__table__, ROLLUP_KEY_COLUMNS, rollups),
+    ):
+        upsert_increments(connection, table, key_columns, increments)
+        connection.execute(delete(table).where(table.c.total_records <= 0))
+    remove_driver_collections(connection, start, end)
+    remove_anomalies(connection, start, end)
+    return removed
+
+
+@event.listens_for(OrmSession, "before_flush")
+def _store_flushed_collections(session: OrmSession, flush_context, instances):
+    """
+    Grava no fato as coletas adicionadas via ORM (session.add) e atualiza os
+    agregados; remove do fato as apagadas (session.delete).
+
+    fuelcollection é uma view: as coletas novas recebem o id do fato e entram
+    na sessão como persistentes, e as apagadas saem da sessão, sem INSERT ou
+    DELETE na view.
+    """
+    new = [obj for obj in session.new if isinstance(obj, FuelCollection)]
+    deleted = [obj for obj in session.deleted if isinstance(obj, FuelCollection)]
+    if not new and not deleted:
+        return
+    connection = session.connection()
+
+    if new:
+        columns = [column for column in FuelCollection.__table__.columns.keys() if column != "id"]
+        rows = [{column: getattr(obj, column) for column in columns} for obj in new]
+        store_collections(connection, rows)
+        apply_ingested_rows(connection, rows)
+        for obj, row in zip(new, rows):
+            session.expunge(obj)
+            obj.id = row["id"]
+            make_transient_to_detached(obj)
+            session.add(obj)
+
+    if deleted:
+        connection.execute(delete(FuelFact).where(FuelFact.id.in_([obj.id for obj in deleted])))
+        for obj in deleted:
+            session.expunge(obj)
+
+
+def _archived_groups(session: Session, keys: list[str], bucket: Optional[str] = None) -> list[dict]:
+    """
+    Contagem, soma de preço e de volume das coletas do arquivo frio por grupo.
+
+    Os agregados também contam as coletas arquivadas (app.archive), que não
+    estão mais na tabela de coletas.
+    """
+    # Import local: app.archive depende deste módulo (via app.partitions)
+    from app.archive import ArchiveQuery, aggregate_archived, archive_enabled
+
+    if not archive_enabled():
+        return []
+    paths = session.exec(select(ArchivedFile.path)).all()
+    groups = aggregate_archived(
+        paths, ArchiveQuery(), keys,
+        [("id", "count"), ("sale_price", "sum"), ("volume_sold", "sum")], bucket
+    )
+    return [
+        {
+            **{key: group[key] for key in keys},
+            "total_records": group["id_count"],
+            "sum_price": group["sale_price_sum"] or 0,
+            "sum_volume": group["volume_sold_sum"] or 0,
+        }
+        for group in groups
+        if group["id_count"]
+    ]
+
+
+def rebuild_summaries(session: Session):
+    """
+    Recalcula os agregados do zero a partir do fato do esquema estrela e do
+    arquivo frio.
+
+    Args:
+        session: Sessão do banco de dados
+    """
+    for model, column in (
+        (FuelTypeSummary, FuelCollection.fuel_type),
+        (VehicleTypeSummary, FuelCollection.vehicle_type),
+    ):
+        session.execute(delete(model))
+        session.execute(
+            insert(model).from_select(
+                [column.key] + SUMMARY_COLUMNS,
+                grouped_facts([], [column.key], _SUMMARY_PARTIALS)
+            )
+        )
+        upsert_increments(session.connection(), model.__table__, [column.key], {
+            (group[column.key],): {name: group[name] for name in SUMMARY_COLUMNS}
+            for group in _archived_groups(session, [column.key])
+        })
+    session.commit()
+    logger.info("Agregados dos KPIs recalculados")
+
+
+def bucket_expression(dialect: str, granularity: str, column):
+    """
+    Início do período calculado no banco (mesma regra de bucket_start).
+    
+    Args:
+        dialect: Nome do dialeto (session.get_bind().dialect.name)
+        granularity: "day", "week" ou "month"
+        column: Coluna de data ou data/hora
+    """
+    if dialect == "postgresql":
+        return cast(func.date_trunc(granularity, column), Date)
+    if dialect == "sqlite":
+        if granularity == "week":
+            # Próximo domingo (ou o próprio dia) menos 6 dias = segunda-feira
+            return func.date(column, "weekday 0", "-6 days", type_=Date)
+        if granularity == "month":
+            return func.date(column, "start of month", type_=Date)
+        return func.date(column, type_=Date)
+    raise NotImplementedError(f"Rollups por período não suportados no dialeto {dialect}")
+
+
+def rebuild_rollups(session: Session):
+    """
+    Recalcula do zero os rollups por período a partir do fato do esquema
+    estrela e do arquivo frio.
+    
+    Um INSERT ... SELECT agrupado por granularidade, executado no banco.
+    Também serve de backfill para coletas anteriores aos rollups.
+    
+    Args:
+        session: Sessão do banco de dados
+    """
+    dialect = session.get_bind().dialect.name
+    session.execute(delete(KpiRollup))
+    for granularity in ROLLUP_GRANULARITIES:
+        bucket = bucket_expression(dialect, granularity, FuelFact.__table__.c.collection_date).label("bucket")
+        groups = grouped_facts([bucket], ROLLUP_DIMENSIONS, _SUMMARY_PARTIALS).subquery()
+        session.execute(
+            insert(KpiRollup).from_select(
+                ROLLUP_KEY_COLUMNS + SUMMARY_COLUMNS,
+                select(literal(granularity), *groups.c)
+            )
+        )
+
+    archived: dict[tuple, dict[str, float]] = defaultdict(lambda: dict.fromkeys(SUMMARY_COLUMNS, 0))
+    for group in _archived_groups(session, ["bucket"] + ROLLUP_DIMENSIONS, bucket="day"):
+        dimensions = tuple(group[column] for column in ROLLUP_DIMENSIONS)
+        for granularity in ROLLUP_GRANULARITIES:
+            target = archived[(granularity, bucket_start(group["bucket"], granularity)) + dimensions]
+            for name in SUMMARY_COLUMNS:
+                target[name] += group[name]
+    upsert_increments(session.connection(), KpiRollup.__table__, ROLLUP_KEY_COLUMNS, archived)
+    session.commit()
+    logger.info("Rollups por período recalculados")
+
+
+def ensure_summaries_initialized(session: Session):
+    """
+    Recalcula os agregados e os rollups quando estão vazios mas já existem
+    coletas (primeira inicialização após a criação das tabelas de agregado).
+    """
+    has_collections = session.exec(select(FuelCollection.id).limit(1)).first() is not None
+    if not has_collections:
+        return
+    has_summary = session.exec(select(FuelTypeSummary.fuel_type).limit(1)).first() is not None
+    if not has_summary:
+        rebuild_summaries(session)
+    has_rollup = session.exec(select(KpiRollup.bucket).limit(1)).first() is not None
+    if not has_rollup:
+        rebuild_rollups(session)
+
+
+def check_summaries_consistency(session: Session) -> list[dict]:
+    """
+    Compara os agregados com o resultado de um GROUP BY sobre FuelCollection
+    somado aos grupos do arquivo frio.
+
+    Args:
+        session: Sessão do banco de dados
+
+    Returns:
+        Lista de divergências (vazia quando tudo está consistente)
+    """
+    mismatches = []
+    for model, column in (
+        (FuelTypeSummary, FuelCollection.fuel_type),
+        (VehicleTypeSummary, FuelCollection.vehicle_type),
+    ):
+        key = column.key
+        expected = {
+            row[0]: {"total_records": row[1], "sum_price": row[2], "sum_volume": row[3]}
+            for row in session.exec(
+                select(
+                    column,
+                    func.count(FuelCollection.id),
+                    func.sum(FuelCollection.sale_price),
+                    func.sum(FuelCollection.volume_sold),
+                ).group_by(column)
+            ).all()
+        }
+        for group in _archived_groups(session, [key]):
+            totals = expected.setdefault(group[key], dict.fromkeys(SUMMARY_COLUMNS, 0))
+            for name in SUMMARY_COLUMNS:
+                totals[name] += group[name]
+        actual = {
+            getattr(summary, key): {name: getattr(summary, name) for name in SUMMARY_COLUMNS}
+            for summary in session.exec(select(model)).all()
+            if summary.total_records
+        }
+        for group in sorted(expected.keys() | actual.keys()):
+            exp = expected.get(group, dict.fromkeys(SUMMARY_COLUMNS, 0))
+            act = actual.get(group, dict.fromkeys(SUMMARY_COLUMNS, 0))
+            for name in SUMMARY_COLUMNS:
+                if abs(exp[name] - act[name]) > CONSISTENCY_TOLERANCE * max(1, abs(exp[name])):
+                    mismatches.append({
+                        "table": model.__tablename__,
+                        key: group,
+                        "column": name,
+                        "expected": exp[name],
+                        "actual": act[name],
+                    })
+    return mismatches
@@ -0,0 +1,163 @@
+"""
+Single-flight em processo: chamadas concorrentes com a mesma chave esperam
+o resultado de uma única execução em vez de repetirem o trabalho.
+
+Usado por app.cache para que, em uma falha de cache, apenas uma thread (ou
+corrotina) por worker recalcule o valor, em primeiro plano (do) ou em
+background enquanto o valor antigo é servido (start).
+"""
+import asyncio
+import logging
+import threading
+from concurrent.futures import Executor, Future
+from typing import Any, Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Single-flight para código síncrono (threads do threadpool)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[str, _Call] = {}
+
+    def in_flight(self, key: str) -> bool:
+        """Se já existe uma execução em andamento para a chave."""
+        with self._lock:
+            return key in self._calls
+
+    def do(self, key: str, func: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        """
+        Executa func uma única vez por chave entre as chamadas concorrentes.
+
+        Args:
+            key: Chave que identifica o trabalho
+            func: Função sem argumentos a executar
+            timeout: Espera máxima (s) pelo resultado de outra thread; ao
+                esgotar, esta thread executa func por conta própria
+
+        Returns:
+            Resultado de func (ou a exceção da execução compartilhada)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if not call.done.wait(timeout):
+                return func()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        return self._run(key, call, func)
+
+    def _run(self, key: str, call: _Call, func: Callable[[], Any]) -> Any:
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def start(self, key: str, func: Callable[[], Any], executor: Executor) -> Optional[Future]:
+        """
+        Agenda func no executor, se ainda não há execução para a chave.
+
+        Chamadas de do() com a mesma chave esperam essa execução. Erros são
+        só registrados no log: ninguém espera o resultado.
+
+        Returns:
+            O Future da execução agendada, ou None se já havia uma em andamento
+        """
+        with self._lock:
+            if key in self._calls:
+                return None
+            call = self._calls[key] = _Call()
+
+        def run():
+            try:
+                self._run(key, call, func)
+            except Exception as e:
+                logger.warning(f"Falha na execução em background de {key}: {e}")
+
+        return executor.submit(run)
+
+
+class AsyncSingleFlight:
+    """Single-flight para corrotinas no mesmo event loop."""
+
+    def __init__(self):
+        self._calls: dict[str, asyncio.Future] = {}
+
+    def in_flight(self, key: str) -> bool:
+        """Se já existe uma execução em andamento para a chave."""
+        return key in self._calls
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]], timeout: Optional[float] = None) -> Any:
+        """
+        Versão assíncrona de SingleFlight.do.
+
+        Args:
+            key: Chave que identifica o trabalho
+            func: Função assíncrona sem argumentos
+            timeout: Espera máxima (s) pelo resultado de outra corrotina
+        """
+        future = self._calls.get(key)
+        if future is not None:
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), timeout)
+            except asyncio.TimeoutError:
+                return await func()
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        return await self._run(key, future, func)
+
+    async def _run(self, key: str, future: asyncio.Future, func: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            result = await func()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            # Evita o aviso de exceção não lida quando ninguém estava esperando
+            future.exception()
+            raise
+        finally:
+            self._calls.pop(key, None)
+
+    def start(self, key: str, func: Callable[[], Awaitable[Any]]) -> Optional[asyncio.Task]:
+        """
+        Versão assíncrona de SingleFlight.start: agenda func em uma task do
+        event loop corrente.
+
+        Returns:
+            A task agendada, ou None se já havia uma execução para a chave
+        """
+        if key in self._calls:
+            return None
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+
+        async def run():
+            try:
+                await self._run(key, future, func)
+            except Exception as e:
+                logger.warning(f"Falha na execução em background de {key}: {e}")
+
+        return asyncio.create_task(run())
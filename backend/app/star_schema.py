@@ -0,0 +1,466 @@
+"""
+Esquema estrela das coletas: dimensões com chaves inteiras e um fato enxuto.
+
+Uma coleta larga repete nome, cidade e estado do posto, nome e CPF do
+motorista, placa e os tipos de combustível e de veículo como texto. O
+esquema estrela guarda esses valores uma vez por chave natural:
+
+    dim_store         store_id -> id (nome, cidade, estado)
+    dim_driver        CPF -> id (nome)
+    dim_vehicle       placa -> id
+    dim_fuel_type     tipo de combustível -> código smallint
+    dim_vehicle_type  tipo de veículo -> código smallint
+
+e o fato fuel_fact tem uma linha por coleta só com as chaves, a data e as
+medidas. Postos e motoristas são dimensões do tipo 2: uma linha por chave e
+combinação de atributos, então uma mudança de nome ou de cidade cria uma
+linha nova e as coletas anteriores continuam com os atributos do seu
+momento.
+
+O fato é a única cópia das coletas: fuelcollection é uma view que junta fato
+e dimensões com as colunas da antiga tabela larga (migração 8,
+app.migrations), lida pela listagem, relatórios, exportação, busca e
+snapshot. A ingestão grava dimensões e fato (store_collections) na mesma
+transação dos agregados dos KPIs, e a retenção e o arquivo frio removem os
+meses do fato. Os GROUP BYs que varrem coletas (agregações de
+/kpis/aggregate, recálculo e desconto dos agregados) leem o fato
+(grouped_facts): agrupam pelas chaves inteiras e só juntam as dimensões aos
+grupos.
+
+Os ids das dimensões ficam em um cache LRU por processo e por engine: a
+ingestão só consulta o banco para chaves (ou combinações de atributos) novas.
+Os ids descobertos numa transação só entram no cache depois do commit, então
+um rollback não deixa ids inexistentes no cache.
+"""
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterable, Mapping, Optional, Sequence
+from sqlalchemy import and_, delete, event, exists, func, insert, select
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.pool import Pool
+from app.models import (
+    FuelCollection, StoreDimension, DriverDimension, VehicleDimension, FuelTypeCode, VehicleTypeCode, FuelFact,
+)
+from app.schemas.fuel_collection import FUEL_TYPES, VEHICLE_TYPES
+
+# Chaves por dimensão mantidas no cache de ids de cada processo
+STAR_ID_CACHE_SIZE = int(os.getenv("STAR_ID_CACHE_SIZE", "100000"))
+
+# Chaves por INSERT/SELECT ao resolver ids (limite de parâmetros do SQLite)
+STAR_LOOKUP_BATCH_SIZE = 500
+
+# View da migração 5; a migração 8 a troca pela própria fuelcollection
+STAR_VIEW = "fuelcollection_star"
+
+
+@dataclass(frozen=True)
+class Dimension:
+    """Uma dimensão: chave natural, atributos e a coluna do fato que a referencia"""
+    model: type
+    key: str
+    source: str
+    # (coluna da dimensão, coluna de FuelCollection)
+    attributes: tuple[tuple[str, str], ...]
+    fact_column: str
+    # Valores inseridos na ordem, para que os códigos dos conhecidos sejam estáveis
+    seed: tuple[str, ...] = ()
+
+    @property
+    def table(self):
+        return self.model.__table__
+
+    @property
+    def columns(self) -> tuple[str, ...]:
+        """Colunas que identificam uma linha: chave natural e atributos"""
+        return (self.key,) + tuple(name for name, _ in self.attributes)
+
+    @property
+    def sources(self) -> tuple[str, ...]:
+        """Colunas de FuelCollection correspondentes a `columns`"""
+        return (self.source,) + tuple(source for _, source in self.attributes)
+
+    def version(self, row: Mapping) -> tuple:
+        """Chave natural e atributos de uma coleta"""
+        return tuple(row[source] for source in self.sources)
+
+
+DIMENSIONS = [
+    Dimension(
+        StoreDimension, "store_id", "store_id",
+        (("store_name", "store_name"), ("city", "city"), ("state", "state")), "store_key"
+    ),
+    Dimension(DriverDimension, "cpf", "driver_cpf", (("name", "driver_name"),), "driver_key"),
+    Dimension(VehicleDimension, "plate", "vehicle_plate", (), "vehicle_key"),
+    Dimension(FuelTypeCode, "name", "fuel_type", (), "fuel_code", seed=tuple(FUEL_TYPES)),
+    Dimension(VehicleTypeCode, "name", "vehicle_type", (), "vehicle_type_code", seed=tuple(VEHICLE_TYPES)),
+]
+
+
+class DimensionIdCache:
+    """LRU thread-safe: (chave natural, atributos...) -> id de uma dimensão."""
+
+    def __init__(self, max_entries: int = STAR_ID_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[int]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def update(self, entries: Mapping[tuple, int]):
+        with self._lock:
+            for key, entry in entries.items():
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Um cache por engine (cada banco tem seus próprios ids)
+_caches: "weakref.WeakKeyDictionary[Engine, dict[str, DimensionIdCache]]" = weakref.WeakKeyDictionary()
+_caches_lock = threading.Lock()
+
+# Ids descobertos na transação corrente, em connection.info
+_PENDING = "star_schema_pending_ids"
+
+
+def id_cache(engine: Engine, dimension: Dimension) -> DimensionIdCache:
+    """Cache de ids da dimensão no engine."""
+    with _caches_lock:
+        caches = _caches.setdefault(engine, {})
+        cache = caches.get(dimension.table.name)
+        if cache is None:
+            cache = caches[dimension.table.name] = DimensionIdCache()
+        return cache
+
+
+def _pending(connection: Connection, dimension: Dimension) -> dict:
+    return connection.info.setdefault(_PENDING, {}).setdefault(dimension.table.name, {})
+
+
+@event.listens_for(Engine, "commit")
+def _promote_pending_ids(connection: Connection):
+    """Leva ao cache os ids descobertos na transação confirmada."""
+    pending = connection.info.pop(_PENDING, None)
+    if not pending:
+        return
+    for dimension in DIMENSIONS:
+        entries = pending.get(dimension.table.name)
+        if entries:
+            id_cache(connection.engine, dimension).update(entries)
+
+
+@event.listens_for(Engine, "rollback")
+@event.listens_for(Engine, "rollback_savepoint")
+def _discard_pending_ids(connection: Connection, *args):
+    # No rollback de um savepoint descarta também os ids anteriores a ele:
+    # só custa consultá-los de novo
+    connection.info.pop(_PENDING, None)
+
+
+@event.listens_for(Pool, "reset")
+def _discard_pending_on_reset(dbapi_connection, connection_record, reset_state):
+    # Conexão devolvida ao pool sem commit/rollback explícito
+    connection_record.info.pop(_PENDING, None)
+
+
+def _dialect_insert(connection: Connection, target):
+    if connection.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    return dialect_insert(target)
+
+
+def _insert_missing(connection: Connection, dimension: Dimension, versions: Sequence[tuple]):
+    """Insere as combinações de chave e atributos que a dimensão ainda não tem."""
+    target = dimension.table
+    rows = [dict(zip(dimension.columns, version)) for version in sorted(versions)]
+
+    if connection.dialect.name not in ("postgresql", "sqlite"):
+        existing = set(connection.execute(
+            select(*(target.c[name] for name in dimension.columns))
+            .where(target.c[dimension.key].in_({version[0] for version in versions}))
+        ).tuples())
+        new_rows = [row for row, version in zip(rows, sorted(versions)) if version not in existing]
+        if new_rows:
+            connection.execute(insert(target), new_rows)
+        return
+
+    connection.execute(
+        _dialect_insert(connection, target).values(rows)
+        .on_conflict_do_nothing(index_elements=list(dimension.columns))
+    )
+
+
+def dimension_ids(
+    connection: Connection,
+    dimension: Dimension,
+    versions: Iterable[tuple]
+) -> dict[tuple, int]:
+    """
+    Ids das combinações de chave natural e atributos de uma dimensão,
+    criando as que não existem.
+
+    Combinações no cache não vão ao banco; as demais são gravadas com
+    INSERT ... ON CONFLICT DO NOTHING e lidas de volta em lotes.
+
+    Args:
+        connection: Conexão da transação da ingestão
+        dimension: Dimensão (DIMENSIONS)
+        versions: Tuplas (chave natural, atributos...) na ordem de dimension.columns
+
+    Returns:
+        Combinação -> id
+    """
+    cache = id_cache(connection.engine, dimension)
+    pending = _pending(connection, dimension)
+    ids: dict[tuple, int] = {}
+    missing: list[tuple] = []
+    for version in dict.fromkeys(versions):
+        row_id = pending.get(version) or cache.get(version)
+        if row_id is not None:
+            ids[version] = row_id
+        else:
+            missing.append(version)
+
+    target = dimension.table
+    columns = [target.c[name] for name in dimension.columns]
+    for start in range(0, len(missing), STAR_LOOKUP_BATCH_SIZE):
+        batch = missing[start:start + STAR_LOOKUP_BATCH_SIZE]
+        _insert_missing(connection, dimension, batch)
+        wanted = set(batch)
+        for row_id, *version in connection.execute(
+            select(target.c.id, *columns).where(columns[0].in_({version[0] for version in batch}))
+        ):
+            version = tuple(version)
+            if version in wanted:
+                pending[version] = row_id
+                ids[version] = row_id
+    return ids
+
+
+def fact_rows(connection: Connection, rows: Sequence[Mapping]) -> list[dict]:
+    """
+    Linhas do fato (chaves das dimensões, data e medidas) de coletas largas,
+    criando nas dimensões as combinações que ainda não existem.
+
+    Args:
+        connection: Conexão da transação da ingestão
+        rows: Coletas com todas as colunas de FuelCollection (o id é ignorado)
+
+    Returns:
+        Uma linha do fato por coleta, na mesma ordem e sem id
+    """
+    keys = {
+        dimension: dimension_ids(connection, dimension, (dimension.version(row) for row in rows))
+        for dimension in DIMENSIONS
+    }
+    return [
+        {
+            "collection_date": row["collection_date"],
+            "sale_price": row["sale_price"],
+            "volume_sold": row["volume_sold"],
+            **{dimension.fact_column: keys[dimension][dimension.version(row)] for dimension in DIMENSIONS},
+        }
+        for row in rows
+    ]
+
+
+def store_collections(connection: Connection, rows: Sequence[dict]):
+    """
+    Grava coletas no esquema estrela e completa cada uma com o id gerado no fato.
+
+    Não faz commit: quem chama controla a transação.
+
+    Args:
+        connection: Conexão da transação corrente
+        rows: Coletas com todas as colunas de FuelCollection exceto o id
+              (recebem a chave "id")
+    """
+    if not rows:
+        return
+    facts = fact_rows(connection, rows)
+    fact = FuelFact.__table__
+    if connection.dialect.name == "sqlite":
+        # RETURNING em ordem faria um INSERT por linha no SQLite. Depois do
+        # INSERT a transação detém o lock de escrita do banco, e cada linha
+        # recebeu o maior id anterior + 1: os ids são os últimos len(facts)
+        connection.execute(insert(fact), facts)
+        last_id = connection.execute(select(func.max(fact.c.id))).scalar()
+        ids = range(last_id - len(facts) + 1, last_id + 1)
+    else:
+        ids = connection.execute(
+            insert(fact).returning(fact.c.id, sort_by_parameter_order=True), facts
+        ).scalars().all()
+    for row, row_id in zip(rows, ids):
+        row["id"] = row_id
+
+
+def remove_facts(connection: Connection, start: datetime, end: datetime):
+    """Remove as coletas de um intervalo (início inclusivo, fim exclusivo)."""
+    connection.execute(delete(FuelFact).where(
+        FuelFact.collection_date >= start, FuelFact.collection_date < end
+    ))
+
+
+def backfill_star_schema(connection: Connection):
+    """
+    Preenche o esquema estrela a partir da tabela larga fuelcollection.
+
+    Passo das migrações 5 e 8 (antes de a tabela virar view), executado no
+    banco com INSERT ... SELECT: cada
+    dimensão recebe as combinações de chave e atributos que ainda não tem e o
+    fato recebe as coletas que ainda não tem. Os códigos dos tipos conhecidos
+    são criados antes, na ordem de FUEL_TYPES e VEHICLE_TYPES. Idempotente.
+
+    Args:
+        connection: Conexão da transação da migração
+    """
+    source = FuelCollection.__table__
+    aliases = {}
+    for dimension in DIMENSIONS:
+        target = dimension.table
+        for value in dimension.seed:
+            seeded = connection.execute(select(target.c.id).where(target.c[dimension.key] == value)).first()
+            if seeded is None:
+                connection.execute(insert(target).values({dimension.key: value}))
+
+        columns = [source.c[name] for name in dimension.sources]
+        connection.execute(insert(target).from_select(
+            list(dimension.columns),
+            select(*columns)
+            .where(~exists().where(and_(*(
+                target.c[name] == column for name, column in zip(dimension.columns, columns)
+            ))))
+            .group_by(*columns)
+        ))
+        aliases[dimension] = target.alias()
+
+    facts = select(
+        source.c.id, source.c.collection_date, source.c.sale_price, source.c.volume_sold,
+        *(aliases[dimension].c.id for dimension in DIMENSIONS)
+    ).select_from(source)
+    for dimension in DIMENSIONS:
+        alias = aliases[dimension]
+        facts = facts.join(alias, and_(*(
+            alias.c[name] == source.c[column] for name, column in zip(dimension.columns, dimension.sources)
+        )))
+    fact = FuelFact.__table__
+    facts = facts.where(source.c.id.not_in(select(fact.c.id)))
+    connection.execute(insert(fact).from_select(
+        ["id", "collection_date", "sale_price", "volume_sold"]
+        + [dimension.fact_column for dimension in DIMENSIONS],
+        facts
+    ))
+
+
+def star_view_sql(create: str, view: str = STAR_VIEW) -> str:
+    """
+    CREATE VIEW das coletas largas sobre o esquema estrela (colunas de FuelCollection).
+
+    Todo fato tem as suas dimensões (chaves estrangeiras), então o LEFT JOIN
+    dá as mesmas linhas do JOIN; com ele o PostgreSQL e o SQLite removem as
+    dimensões cujas colunas a consulta não usa (ex.: contagens e filtros só
+    por data), e um filtro sobre a dimensão volta a ser um JOIN interno.
+
+    Args:
+        create: Início do comando ("CREATE VIEW IF NOT EXISTS" ou "CREATE OR REPLACE VIEW")
+        view: Nome da view (fuelcollection_star na migração 5, fuelcollection na 8)
+    """
+    return (
+        f"{create} {view} AS "
+        "SELECT f.id, s.store_id, s.store_name, s.city, s.state, f.collection_date, "
+        "ft.name AS fuel_type, f.sale_price, f.volume_sold, "
+        "d.name AS driver_name, d.cpf AS driver_cpf, v.plate AS vehicle_plate, vt.name AS vehicle_type "
+        "FROM fuel_fact f "
+        "LEFT JOIN dim_store s ON s.id = f.store_key "
+        "LEFT JOIN dim_driver d ON d.id = f.driver_key "
+        "LEFT JOIN dim_vehicle v ON v.id = f.vehicle_key "
+        "LEFT JOIN dim_fuel_type ft ON ft.id = f.fuel_code "
+        "LEFT JOIN dim_vehicle_type vt ON vt.id = f.vehicle_type_code"
+    )
+
+
+# Colunas de FuelCollection no esquema estrela: nome -> (chave no fato, coluna da dimensão)
+STAR_COLUMNS = {
+    source: (dimension.fact_column, dimension.table.c[name])
+    for dimension in DIMENSIONS
+    for name, source in zip(dimension.columns, dimension.sources)
+}
+
+# Recombinação de um estado parcial entre grupos: contagens e somas somam
+_REGROUP = {"count": "sum", "sum": "sum", "min": "min", "max": "max"}
+
+
+def star_condition(name: str, value):
+    """Filtro de igualdade por uma coluna de FuelCollection, resolvido na chave do fato."""
+    fact_column, dimension_column = STAR_COLUMNS[name]
+    return FuelFact.__table__.c[fact_column].in_(
+        select(dimension_column.table.c.id).where(dimension_column == value)
+    )
+
+
+def grouped_facts(
+    leading: Sequence,
+    names: Sequence[str],
+    partials: Sequence[tuple[str, str, object]],
+    conditions: Sequence = ()
+):
+    """
+    SELECT agrupado sobre o fato, com as colunas de agrupamento resolvidas
+    nas dimensões.
+
+    O GROUP BY sobre as coletas usa só as chaves inteiras do fato (e as
+    expressões de `leading`); as dimensões são juntadas aos grupos, que são
+    reagrupados pelos seus atributos. Como postos e motoristas têm uma linha
+    por combinação de atributos, um posto pode aparecer em mais de um grupo
+    interno.
+
+    Args:
+        leading: Expressões sobre o fato agrupadas antes das dimensões (ex.:
+                 período), já rotuladas
+        names: Colunas de FuelCollection (STAR_COLUMNS) de agrupamento
+        partials: (rótulo, função "count"/"sum"/"min"/"max", expressão sobre o fato)
+        conditions: Filtros sobre o fato (star_condition, intervalo de datas)
+
+    Returns:
+        SELECT com as colunas de `leading`, de `names` e dos estados parciais,
+        nessa ordem e com esses rótulos
+    """
+    fact = FuelFact.__table__
+    keys = list(leading) + [fact.c[column] for column in dict.fromkeys(STAR_COLUMNS[name][0] for name in names)]
+    inner = select(*keys, *(
+        getattr(func, function)(expression).label(label) for label, function, expression in partials
+    )).where(*conditions)
+    if keys:
+        inner = inner.group_by(*keys)
+    inner = inner.subquery()
+
+    source, joined, groups = inner, set(), [inner.c[label.name].label(label.name) for label in leading]
+    for name in names:
+        fact_column, dimension_column = STAR_COLUMNS[name]
+        if dimension_column.table not in joined:
+            source = source.join(dimension_column.table, dimension_column.table.c.id == inner.c[fact_column])
+            joined.add(dimension_column.table)
+        groups.append(dimension_column.label(name))
+
+    statement = select(*groups, *(
+        getattr(func, _REGROUP[function])(inner.c[label]).label(label) for label, function, _ in partials
+    )).select_from(source)
+    return statement.group_by(*groups) if groups else statement
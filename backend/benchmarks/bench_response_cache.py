@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark do custo de CPU por requisição no acerto e na falha de cache.
+
+Compara, para uma página de /collections e para a lista de KPIs:
+
+- acerto antes: json.loads da entrada do cache + validação pelo
+  response_model + serialização do FastAPI
+- acerto depois: corpo JSON pré-serializado devolvido em um Response
+- falha antes/depois: serialização do resultado pelo FastAPI x encode_response
+  (orjson)
+
+As requisições são feitas direto na aplicação ASGI, sem rede, banco nem
+Redis, para isolar o trabalho de parse, validação e serialização.
+
+Uso:
+    python benchmarks/bench_response_cache.py --requests 5000 --page-size 100
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fastapi import FastAPI, Response  # noqa: E402
+from app.cache import encode_response  # noqa: E402
+from app.schemas import AvgPriceByFuel, FuelCollectionRead, PaginatedResponse  # noqa: E402
+
+CITIES = ["São Paulo", "Rio de Janeiro", "Belo Horizonte", "Curitiba", "Salvador"]
+FUEL_TYPES = ["Gasolina", "Etanol", "Diesel S10"]
+VEHICLE_TYPES = ["Carro", "Moto", "Caminhão Leve", "Carreta", "Ônibus"]
+
+
+def build_page(page_size: int) -> PaginatedResponse:
+    """Página sintética de coletas"""
+    start = datetime(2024, 1, 1)
+    data = [
+        FuelCollectionRead(
+            id=i,
+            store_id=f"{i:014d}",
+            store_name=f"Posto {i}",
+            city=random.choice(CITIES),
+            state="SP",
+            collection_date=start + timedelta(minutes=i),
+            fuel_type=random.choice(FUEL_TYPES),
+            sale_price=round(random.uniform(4, 7), 2),
+            volume_sold=round(random.uniform(10, 500), 2),
+            driver_name=f"Motorista {i}",
+            driver_cpf=f"{i:011d}",
+            vehicle_plate=f"ABC{i % 10}D{i % 100:02d}",
+            vehicle_type=random.choice(VEHICLE_TYPES),
+        )
+        for i in range(1, page_size + 1)
+    ]
+    return PaginatedResponse(total=1_000_000, total_is_exact=True, page=1, page_size=page_size, data=data, next_cursor="abc")
+
+
+def encode_response_legacy(result):
+    """Serialização do @cached original (model_dump + json)"""
+    if isinstance(result, list):
+        return [item.model_dump(mode="json") for item in result]
+    return result.model_dump(mode="json")
+
+
+def build_app(page: PaginatedResponse, kpis: list[AvgPriceByFuel]) -> FastAPI:
+    """Aplicação com as duas variantes de cada endpoint"""
+    app = FastAPI()
+    # Entradas como ficavam no cache antes (JSON) e como ficam agora (corpo pronto)
+    page_json = json.dumps(encode_response_legacy(page))
+    kpis_json = json.dumps(encode_response_legacy(kpis))
+    page_body = encode_response(page)
+    kpis_body = encode_response(kpis)
+
+    @app.get("/hit/before/collections", response_model=PaginatedResponse)
+    def hit_before_collections():
+        return json.loads(page_json)
+
+    @app.get("/hit/after/collections", response_model=PaginatedResponse)
+    def hit_after_collections():
+        return Response(content=page_body, media_type="application/json")
+
+    @app.get("/hit/before/kpis", response_model=list[AvgPriceByFuel])
+    def hit_before_kpis():
+        return json.loads(kpis_json)
+
+    @app.get("/hit/after/kpis", response_model=list[AvgPriceByFuel])
+    def hit_after_kpis():
+        return Response(content=kpis_body, media_type="application/json")
+
+    @app.get("/miss/before/collections", response_model=PaginatedResponse)
+    def miss_before_collections():
+        return page
+
+    @app.get("/miss/after/collections", response_model=PaginatedResponse)
+    def miss_after_collections():
+        return Response(content=encode_response(page), media_type="application/json")
+
+    return app
+
+
+async def call(app: FastAPI, path: str) -> int:
+    """Uma requisição GET direto na aplicação ASGI; devolve o tamanho do corpo"""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+        "query_string": b"", "headers": [], "client": ("127.0.0.1", 1), "server": ("bench", 80),
+    }
+    body = bytearray()
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            body.extend(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return len(body)
+
+
+async def measure(app: FastAPI, path: str, requests: int) -> tuple[float, int]:
+    """CPU média por requisição (µs) e tamanho da resposta"""
+    size = await call(app, path)
+    for _ in range(50):  # Aquecimento
+        await call(app, path)
+    start = time.process_time()
+    for _ in range(requests):
+        await call(app, path)
+    return (time.process_time() - start) / requests * 1e6, size
+
+
+async def run(requests: int, page_size: int):
+    page = build_page(page_size)
+    kpis = [AvgPriceByFuel(fuel_type=fuel, avg_price=5.5, total_records=1000) for fuel in FUEL_TYPES]
+    app = build_app(page, kpis)
+
+    print(f"{'cenário':<22} {'antes (µs)':>11} {'depois (µs)':>12} {'ganho':>7} {'bytes':>8}")
+    for label, name in [
+        ("acerto /collections", "hit/{}/collections"),
+        ("acerto /kpis", "hit/{}/kpis"),
+        ("falha /collections", "miss/{}/collections"),
+    ]:
+        before, size = await measure(app, "/" + name.format("before"), requests)
+        after, _ = await measure(app, "/" + name.format("after"), requests)
+        print(f"{label:<22} {before:>11.1f} {after:>12.1f} {before / after:>6.1f}x {size:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU por requisição: cache de objetos x corpo pré-serializado")
+    parser.add_argument("--requests", type=int, default=5000, help="Requisições por cenário")
+    parser.add_argument("--page-size", type=int, default=100, help="Coletas por página")
+    args = parser.parse_args()
+
+    random.seed(42)
+    asyncio.run(run(args.requests, args.page_size))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,19 @@
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from sqlmodel import Session
 import logging
 
 # Importar módulos internos
-from app.database import create_db_and_tables
-from app.routers import ingest, collections, kpis, reports, cache, observability
+from app.database import create_db_and_tables, engine, API_MODE, get_async_engine
+from app.cache import get_async_redis_client, InvalidationListener
+from app.analytics import get_snapshot
+from app.partitions import ensure_partitions
+from app.ingest_queue import INGEST_MODE, IngestFlusher, get_ingest_queue
+from app.services.ingest_service import flush_ingest_queue
+from app.services.summary_service import ensure_summaries_initialized
+from app.routers import ingest, collections, kpis, reports, cache, observability, export, leaderboards
+from app.routers import collections_async, kpis_async, reports_async
 from app.middleware import MetricsMiddleware
 
 # Configuração de logging
@@ -21,8 +29,41 @@ async def lifespan(app: FastAPI):
     """
     logger.info("Iniciando aplicação e criando tabelas...")
     create_db_and_tables()
+    # Partições mensais dos próximos meses (PostgreSQL particionado)
+    ensure_partitions(engine)
+    with Session(engine) as session:
+        ensure_summaries_initialized(session)
+        # Snapshot colunar dos KPIs (ANALYTICS_ENGINE=numpy): carga inicial
+        snapshot = get_snapshot()
+        if snapshot is not None:
+            snapshot.refresh(session)
+            logger.info("Snapshot analítico carregado: %s", snapshot.stats())
+    
+    # Invalidações do cache L1 publicadas pelos demais workers
+    invalidation_listener = InvalidationListener()
+    invalidation_listener.start()
+    
+    # Ingestão assíncrona: worker que esvazia a fila em lotes
+    flusher = None
+    if INGEST_MODE == "async":
+        queue = get_ingest_queue()
+        
+        def flush() -> int:
+            with Session(engine) as session:
+                return flush_ingest_queue(queue, session)
+        
+        flusher = IngestFlusher(flush)
+        flusher.start()
+    
     yield
+    
     logger.info("Encerrando aplicação...")
+    if flusher is not None:
+        await flusher.stop()
+    invalidation_listener.stop()
+    if API_MODE == "async":
+        await get_async_engine().dispose()
+        await get_async_redis_client().aclose()
 
 
 # Criação da aplicação FastAPI
@@ -48,10 +89,20 @@ app.add_middleware(MetricsMiddleware)
 # Incluir os roteadores
 app.include_router(observability.router)
 app.include_router(ingest.router)
-app.include_router(collections.router)
-app.include_router(kpis.router)
-app.include_router(reports.router)
+app.include_router(export.router)
 app.include_router(cache.router)
+app.include_router(leaderboards.router)
+
+# Consultas, KPIs e relatórios: handlers async com AsyncSession e redis.asyncio
+# (API_MODE=async) ou handlers síncronos executados no threadpool (padrão)
+if API_MODE == "async":
+    app.include_router(collections_async.router)
+    app.include_router(kpis_async.router)
+    app.include_router(reports_async.router)
+else:
+    app.include_router(collections.router)
+    app.include_router(kpis.router)
+    app.include_router(reports.router)
 
 
 @app.get("/")
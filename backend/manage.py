@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Comandos de manutenção do V-Lab Fuel Monitor
+
+Uso:
+    python manage.py rebuild-summaries   # Recalcula os agregados dos KPIs
+    python manage.py check-summaries     # Compara agregados com a tabela de coletas
+    python manage.py rebuild-rollups     # Recalcula os rollups por período (backfill)
+    python manage.py migrate             # Aplica as migrações pendentes do esquema
+    python manage.py maintain-partitions # Cria as partições futuras e aplica a retenção
+    python manage.py archive --months 12 # Move os meses antigos para o arquivo frio (Parquet)
+    python manage.py rebuild-leaderboards # Recalcula os rankings (top N) a partir das coletas
+"""
+import argparse
+import logging
+import sys
+from datetime import date
+from sqlmodel import Session
+
+from app.archive import archive_collections
+from app.database import engine, create_db_and_tables
+from app.leaderboards import rebuild_leaderboards
+from app.migrations import MIGRATIONS, apply_migrations
+from app.partitions import (
+    PARTITION_MONTHS_AHEAD, PARTITION_RETENTION_MONTHS, PARTITION_RETENTION_MODE, RETENTION_MODES,
+    ensure_partitions, apply_retention, partition_name, add_months, month_start,
+)
+from app.services.summary_service import rebuild_summaries, rebuild_rollups, check_summaries_consistency
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def cmd_rebuild_summaries(args) -> int:
+    """Recalcula do zero os agregados por combustível e por veículo"""
+    with Session(engine) as session:
+        rebuild_summaries(session)
+    print("✅ Agregados dos KPIs recalculados")
+    return 0
+
+
+def cmd_check_summaries(args) -> int:
+    """Verifica se os agregados batem com um GROUP BY sobre as coletas"""
+    with Session(engine) as session:
+        mismatches = check_summaries_consistency(session)
+    if not mismatches:
+        print("✅ Agregados consistentes")
+        return 0
+    for mismatch in mismatches:
+        print(f"❌ {mismatch}")
+    print(f"\n{len(mismatches)} divergência(s). Rode: python manage.py rebuild-summaries")
+    return 1
+
+
+def cmd_rebuild_rollups(args) -> int:
+    """Recalcula do zero os rollups por período (dia, semana, mês)"""
+    with Session(engine) as session:
+        rebuild_rollups(session)
+    print("✅ Rollups por período recalculados")
+    return 0
+
+
+def cmd_migrate(args) -> int:
+    """Aplica as migrações pendentes e lista as versões do esquema"""
+    applied = apply_migrations(engine)
+    for migration in MIGRATIONS:
+        print(f"  {migration.version:>3}  {migration.description}")
+    if applied:
+        print(f"✅ Migrações aplicadas: {', '.join(map(str, applied))}")
+    else:
+        print("✅ Esquema atualizado, nenhuma migração pendente")
+    return 0
+
+
+def cmd_maintain_partitions(args) -> int:
+    """Cria as partições dos próximos meses e remove os meses fora da retenção"""
+    created = ensure_partitions(engine, months_ahead=args.months_ahead)
+    print(f"✅ Partições criadas: {', '.join(map(partition_name, created)) or 'nenhuma'}")
+    try:
+        removed = apply_retention(engine, keep_months=args.retention_months, mode=args.mode)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+    if args.retention_months <= 0:
+        print("ℹ️  Retenção desativada (PARTITION_RETENTION_MONTHS=0)")
+    else:
+        print(f"✅ Meses removidos ({args.mode}): {', '.join(map(partition_name, removed)) or 'nenhum'}")
+    return 0
+
+
+def cmd_archive(args) -> int:
+    """Move para o arquivo frio as coletas anteriores ao corte"""
+    before = args.before or add_months(month_start(date.today()), -args.months)
+    try:
+        archived = archive_collections(engine, before)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+    for entry in archived:
+        print(f"  {entry.month:%Y-%m}  {entry.row_count:>10} coletas  {entry.size_bytes / 1024:>10.1f} KiB  {entry.path}")
+    print(f"✅ Meses arquivados antes de {before:%Y-%m}: {len(archived)}")
+    return 0
+
+
+def cmd_rebuild_leaderboards(args) -> int:
+    """Recalcula os rankings dos últimos 30 dias a partir das coletas"""
+    with Session(engine) as session:
+        written = rebuild_leaderboards(session)
+    print(f"✅ Rankings recalculados: {written} pares (dia, membro)")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Comandos de manutenção do V-Lab Fuel Monitor")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    commands.add_parser(
+        "rebuild-summaries", help="Recalcula os agregados dos KPIs"
+    ).set_defaults(func=cmd_rebuild_summaries)
+    commands.add_parser(
+        "check-summaries", help="Compara os agregados com a tabela de coletas"
+    ).set_defaults(func=cmd_check_summaries)
+    commands.add_parser(
+        "rebuild-rollups", help="Recalcula os rollups por período (backfill)"
+    ).set_defaults(func=cmd_rebuild_rollups)
+    commands.add_parser(
+        "migrate", help="Aplica as migrações pendentes do esquema"
+    ).set_defaults(func=cmd_migrate)
+    partitions = commands.add_parser(
+        "maintain-partitions", help="Cria as partições futuras e aplica a retenção"
+    )
+    partitions.add_argument(
+        "--months-ahead", type=int, default=PARTITION_MONTHS_AHEAD,
+        help="Meses futuros com partição criada"
+    )
+    partitions.add_argument(
+        "--retention-months", type=int, default=PARTITION_RETENTION_MONTHS,
+        help="Meses completos mantidos além do corrente (0 desativa)"
+    )
+    partitions.add_argument(
+        "--mode", choices=RETENTION_MODES, default=PARTITION_RETENTION_MODE,
+        help="drop apaga as partições antigas; detach as mantém como tabelas avulsas"
+    )
+    partitions.set_defaults(func=cmd_maintain_partitions)
+    archive = commands.add_parser(
+        "archive", help="Move os meses antigos para o arquivo frio (Parquet)"
+    )
+    cutoff = archive.add_mutually_exclusive_group(required=True)
+    cutoff.add_argument(
+        "--before", type=date.fromisoformat,
+        help="Arquiva os meses anteriores ao mês desta data (AAAA-MM-DD)"
+    )
+    cutoff.add_argument(
+        "--months", type=int,
+        help="Meses completos mantidos na tabela além do corrente"
+    )
+    archive.set_defaults(func=cmd_archive)
+    commands.add_parser(
+        "rebuild-leaderboards", help="Recalcula os rankings (top N) a partir das coletas"
+    ).set_defaults(func=cmd_rebuild_leaderboards)
+    
+    return parser
+
+
+def main() -> int:
+    args = build_parser().parse_args()
+    
+    # Log de SQL por linha polui a saída dos comandos
+    engine.echo = False
+    create_db_and_tables()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,33 @@
+import fnmatch
+import threading
 import pytest
 from sqlmodel import create_engine, SQLModel, Session
 from sqlalchemy.pool import StaticPool
 from app.models import FuelCollection
+from app.search import setup_search
+from app.migrations import apply_migrations
+from app.cache import local_cache, _served_stale
+from app.leaderboards import MemoryLeaderboardStore
+
+
+@pytest.fixture(autouse=True)
+def clear_local_cache():
+    """Isola o cache L1 (memória do processo) entre os testes"""
+    local_cache.clear()
+    # Os testes chamam as funções cacheadas fora de uma requisição, no
+    # contexto da thread principal: a marca de valor antigo não pode vazar
+    token = _served_stale.set(False)
+    yield
+    _served_stale.reset(token)
+    local_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def leaderboard_store(monkeypatch):
+    """Rankings em memória, isolados por teste (a ingestão os alimenta)"""
+    store = MemoryLeaderboardStore()
+    monkeypatch.setattr("app.leaderboards.leaderboard_store", store)
+    return store
 
 
 @pytest.fixture(name="session")
@@ -17,8 +43,10 @@ def session_fixture():
         poolclass=StaticPool,
     )
     
-    # Criar todas as tabelas
+    # Criar todas as tabelas, a busca textual (FTS5) e os índices
     SQLModel.metadata.create_all(engine)
+    setup_search(engine)
+    apply_migrations(engine)
     
     # Criar sessão
     with Session(engine) as session:
@@ -98,3 +126,99 @@ def create_sample_collections(session):
     session.commit()
     
     return collections
+
+
+class FakeRedis:
+    """
+    Redis em memória com os comandos usados por app.cache (testes sem
+    servidor Redis). Conta as chamadas de cada comando em `calls`.
+    """
+    
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+        self.calls = {}
+        self.published = []
+        self._lock = threading.Lock()
+    
+    def _count(self, command):
+        with self._lock:
+            self.calls[command] = self.calls.get(command, 0) + 1
+    
+    def get(self, key):
+        self._count("get")
+        return self.data.get(key)
+    
+    def set(self, key, value, nx=False, ex=None):
+        self._count("set")
+        with self._lock:
+            if nx and key in self.data:
+                return None
+            self.data[key] = str(value)
+            if ex:
+                self.ttls[key] = ex
+            return True
+    
+    def delete(self, *keys):
+        self._count("delete")
+        return sum(self.data.pop(key, None) is not None for key in keys)
+    
+    def setex(self, key, ttl, value):
+        self._count("setex")
+        self.data[key] = str(value)
+        self.ttls[key] = ttl
+        return True
+    
+    def incr(self, key):
+        self._count("incr")
+        self.data[key] = str(int(self.data.get(key, 0)) + 1)
+        return int(self.data[key])
+    
+    def scan_iter(self, match="*", count=None):
+        self._count("scan")
+        return iter([key for key in list(self.data) if fnmatch.fnmatchcase(key, match)])
+    
+    def unlink(self, *keys):
+        self._count("unlink")
+        removed = 0
+        for key in keys:
+            if self.data.pop(key, None) is not None:
+                removed += 1
+            self.ttls.pop(key, None)
+        return removed
+    
+    def ttl(self, key):
+        return self.ttls.get(key, -1)
+    
+    def publish(self, channel, message):
+        self._count("publish")
+        self.published.append((channel, message))
+        return 0
+    
+    def keys(self, pattern="*"):
+        raise AssertionError("KEYS não deve ser usado")
+
+
+class FakeAsyncRedis:
+    """Interface assíncrona (redis.asyncio) sobre os mesmos dados de um FakeRedis"""
+    
+    def __init__(self, sync_client: FakeRedis):
+        self.sync = sync_client
+    
+    def __getattr__(self, name):
+        method = getattr(self.sync, name)
+        
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        
+        return call
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    """Substitui o cliente Redis de app.cache por um FakeRedis"""
+    client = FakeRedis()
+    async_client = FakeAsyncRedis(client)
+    monkeypatch.setattr("app.cache.get_redis_client", lambda: client)
+    monkeypatch.setattr("app.cache.get_async_redis_client", lambda: async_client)
+    return client
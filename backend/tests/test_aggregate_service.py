@@ -0,0 +1,204 @@
+import json
+import pytest
+from datetime import date, datetime
+from fastapi import HTTPException
+from app.models import FuelCollection
+from app.services.aggregate_service import build_aggregate_query, get_aggregate, get_aggregate_json
+from app.services.aggregate_service import _aggregate_response, _collections_statement, _rollup_granularity
+
+
+@pytest.fixture
+def aggregate_collections(session, sample_collection_data):
+    """Coletas em dias e meses diferentes, em dois estados e dois postos"""
+    rows = [
+        (datetime(2024, 1, 15, 10), "Gasolina", "SP", "São Paulo", "111", 6.00, 40.0),
+        (datetime(2024, 1, 15, 18), "Gasolina", "SP", "São Paulo", "111", 5.00, 60.0),
+        (datetime(2024, 1, 16, 9), "Etanol", "SP", "Campinas", "222", 4.00, 30.0),
+        (datetime(2024, 2, 3, 12), "Gasolina", "RJ", "Niterói", "333", 6.50, 20.0),
+    ]
+    for collection_date, fuel_type, state, city, store_id, price, volume in rows:
+        session.add(FuelCollection(**{
+            **sample_collection_data,
+            "collection_date": collection_date,
+            "fuel_type": fuel_type,
+            "state": state,
+            "city": city,
+            "store_id": store_id,
+            "sale_price": price,
+            "volume_sold": volume,
+        }))
+    session.commit()
+
+
+def test_aggregate_by_state_from_rollups(session, aggregate_collections):
+    """Testa agregação por estado respondida pelos rollups"""
+    # Arrange
+    query = build_aggregate_query(["state"], ["avg:sale_price", "count", "sum:volume_sold"], order_by="count")
+
+    # Act
+    result = get_aggregate(session, query)
+
+    # Assert
+    assert result.source == "rollup"
+    assert result.dimensions == ["state"]
+    assert result.rows == [
+        {"state": "SP", "avg_sale_price": 5.0, "count": 3, "sum_volume_sold": 130.0},
+        {"state": "RJ", "avg_sale_price": 6.5, "count": 1, "sum_volume_sold": 20.0},
+    ]
+    assert result.truncated is False
+
+
+def test_aggregate_rollup_matches_collections(session, aggregate_collections):
+    """Testa que rollups e tabela de coletas dão o mesmo resultado"""
+    # Arrange
+    query = build_aggregate_query(
+        ["fuel_type"], ["avg:sale_price", "count", "sum:volume_sold"],
+        bucket="month", start=date(2024, 1, 1), end=date(2024, 2, 29), order_by="count"
+    )
+    dialect = session.get_bind().dialect.name
+
+    # Act
+    from_rollups = get_aggregate(session, query)
+    from_collections = session.exec(_collections_statement(query, dialect).group_by("bucket", "fuel_type")).all()
+
+    # Assert
+    assert from_rollups.source == "rollup"
+    assert sorted(from_rollups.rows, key=str) == sorted(
+        _aggregate_response(query, from_collections, "collections").rows, key=str
+    )
+    assert from_rollups.rows[0] == {
+        "bucket": date(2024, 1, 1), "fuel_type": "Gasolina",
+        "avg_sale_price": 5.5, "count": 2, "sum_volume_sold": 100.0,
+    }
+
+
+@pytest.mark.parametrize("start, end, granularity", [
+    (date(2024, 1, 1), date(2024, 3, 31), "month"),
+    (date(2024, 1, 1), date(2024, 1, 14), "week"),
+    (date(2024, 1, 2), date(2024, 2, 29), "day"),
+    (None, None, "month"),
+])
+def test_aggregate_picks_coarsest_aligned_rollup(start, end, granularity):
+    """Testa a escolha da granularidade de rollup alinhada ao intervalo"""
+    # Act
+    query = build_aggregate_query(["state"], ["count"], start=start, end=end)
+
+    # Assert
+    assert _rollup_granularity(query) == granularity
+
+
+def test_aggregate_falls_back_to_collections(session, aggregate_collections):
+    """Testa que dimensões e métricas fora dos rollups leem as coletas"""
+    # Act
+    by_store = get_aggregate(session, build_aggregate_query(["store_id"], ["count"]))
+    spend = get_aggregate(session, build_aggregate_query(["state"], ["sum:spend"]))
+
+    # Assert
+    assert by_store.source == "collections"
+    assert spend.source == "collections"
+
+
+def test_aggregate_spend_and_extremes_by_store(session, aggregate_collections):
+    """Testa gasto (preço x volume), mínimo e máximo por posto com filtro"""
+    # Arrange
+    query = build_aggregate_query(
+        ["store_id"], ["max:sale_price", "min:sale_price", "sum:spend"],
+        filters={"state": "SP", "city": None}, order_by="sum:spend"
+    )
+
+    # Act
+    result = get_aggregate(session, query)
+
+    # Assert
+    assert result.source == "collections"
+    assert result.rows == [
+        {"store_id": "111", "max_sale_price": 6.0, "min_sale_price": 5.0, "sum_spend": 540.0},
+        {"store_id": "222", "max_sale_price": 4.0, "min_sale_price": 4.0, "sum_spend": 120.0},
+    ]
+
+
+def test_aggregate_keeps_city_at_collection_time(session, aggregate_collections, sample_collection_data):
+    """Testa que um posto que muda de cidade conta as coletas antigas na cidade anterior"""
+    # Arrange
+    session.add(FuelCollection(**{
+        **sample_collection_data,
+        "collection_date": datetime(2024, 2, 10),
+        "store_id": "222",
+        "city": "Sorocaba",
+        "sale_price": 4.50,
+    }))
+    session.commit()
+    query = build_aggregate_query(["store_id"], ["count", "avg:sale_price"], filters={"state": "SP"})
+
+    # Act
+    by_store = get_aggregate(session, query)
+    by_city = get_aggregate(session, build_aggregate_query(["city"], ["count"], filters={"store_id": "222"}))
+
+    # Assert
+    assert by_store.source == by_city.source == "collections"
+    assert {"store_id": "222", "count": 2, "avg_sale_price": 4.25} in by_store.rows
+    assert sorted((row["city"], row["count"]) for row in by_city.rows) == [("Campinas", 1), ("Sorocaba", 1)]
+
+
+def test_aggregate_top_n_marks_truncated(session, aggregate_collections):
+    """Testa o top-N com indicação de corte"""
+    # Arrange
+    query = build_aggregate_query(["city"], ["count"], limit=1)
+
+    # Act
+    result = get_aggregate(session, query)
+
+    # Assert
+    assert result.rows == [{"city": "São Paulo", "count": 2}]
+    assert result.truncated is True
+
+
+def test_aggregate_global_without_rows(session):
+    """Testa o agregado global sem coletas"""
+    # Act
+    result = get_aggregate(session, build_aggregate_query([], ["count", "avg:sale_price"]))
+
+    # Assert
+    assert result.rows == []
+
+
+def test_aggregate_query_normalized(session):
+    """Testa que consultas equivalentes têm a mesma chave de cache"""
+    # Act
+    first = build_aggregate_query(["state", "fuel_type"], ["count", "avg:sale_price"], filters={"city": " Campinas "})
+    second = build_aggregate_query(["fuel_type", "state"], ["avg:sale_price", "count"], filters={"city": "Campinas", "store_id": ""})
+
+    # Assert
+    assert first == second
+    assert str(first) == str(second)
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"dimensions": ["driver_cpf"], "metrics": ["count"]},
+    {"dimensions": [], "metrics": ["avg:driver_cpf"]},
+    {"dimensions": [], "metrics": []},
+    {"dimensions": ["city", "store_id"], "metrics": ["count"]},
+    {"dimensions": ["city"], "metrics": ["count"], "bucket": "day", "start": date(2024, 1, 1), "end": date(2024, 1, 31)},
+    {"dimensions": ["state"], "metrics": ["count"], "bucket": "day"},
+    {"dimensions": [], "metrics": ["count"], "bucket": "day", "start": date(2000, 1, 1), "end": date(2024, 1, 1)},
+    {"dimensions": ["state"], "metrics": ["count"], "order_by": "sum:spend"},
+    {"dimensions": ["state"], "metrics": ["count"], "filters": {"driver_cpf": "123"}},
+])
+def test_aggregate_rejects_invalid_or_unbounded_queries(kwargs):
+    """Testa a rejeição de consultas inválidas ou de cardinalidade ilimitada"""
+    # Act & Assert
+    with pytest.raises(HTTPException) as exc:
+        build_aggregate_query(**kwargs)
+    assert exc.value.status_code == 400
+
+
+def test_aggregate_json_matches_model(session, aggregate_collections):
+    """Testa que a versão pré-serializada tem o mesmo conteúdo"""
+    # Arrange
+    query = build_aggregate_query(["vehicle_type"], ["count"], bucket="week", start=date(2024, 1, 1), end=date(2024, 2, 29))
+
+    # Act
+    body = json.loads(get_aggregate_json(session, query))
+
+    # Assert
+    assert body == get_aggregate(session, query).model_dump(mode="json")
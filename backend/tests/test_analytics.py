@@ -0,0 +1,179 @@
+import asyncio
+import pytest
+from datetime import date, datetime
+from sqlmodel import SQLModel, Session, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from app.analytics import ColumnarSnapshot
+from app.migrations import apply_migrations
+from app.models import FuelCollection
+from app.services.aggregate_service import build_aggregate_query, get_aggregate, get_aggregate_async
+from app.services.aggregate_service import _aggregate_from_snapshot, _aggregate_response
+
+
+@pytest.fixture
+def collections(session, sample_collection_data):
+    """Coletas em dias, semanas e meses diferentes"""
+    rows = [
+        (datetime(2024, 1, 15, 10), "Gasolina", "Carro", "SP", "São Paulo", 6.00, 40.0),
+        (datetime(2024, 1, 15, 18), "Gasolina", "Carreta", "SP", "São Paulo", 5.00, 60.0),
+        (datetime(2024, 1, 16, 9), "Etanol", "Moto", "SP", "Campinas", 4.00, 30.0),
+        (datetime(2024, 2, 3, 12), "Gasolina", "Carro", "RJ", "Niterói", 6.50, 20.0),
+        (datetime(2024, 3, 31, 23), "Diesel S10", "Carreta", "RJ", "Niterói", 6.10, 150.0),
+    ]
+    for collection_date, fuel_type, vehicle_type, state, city, price, volume in rows:
+        session.add(FuelCollection(**{
+            **sample_collection_data,
+            "collection_date": collection_date,
+            "fuel_type": fuel_type,
+            "vehicle_type": vehicle_type,
+            "state": state,
+            "city": city,
+            "sale_price": price,
+            "volume_sold": volume,
+        }))
+    session.commit()
+
+
+@pytest.fixture
+def snapshot(monkeypatch):
+    """Ativa o snapshot colunar (ANALYTICS_ENGINE=numpy) com um snapshot vazio"""
+    snapshot = ColumnarSnapshot()
+    monkeypatch.setattr("app.analytics._snapshot", snapshot)
+    return snapshot
+
+
+def _sql_then_snapshot(monkeypatch, func, *args, **kwargs):
+    """Resultado da função pelo caminho SQL e pelo snapshot"""
+    monkeypatch.setattr("app.analytics._snapshot", None)
+    from_sql = func(*args, **kwargs)
+    monkeypatch.setattr("app.analytics._snapshot", ColumnarSnapshot())
+    return from_sql, func(*args, **kwargs)
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"dimensions": ["fuel_type", "city"], "metrics": ["min:sale_price", "max:volume_sold", "sum:spend"], "limit": 2},
+    {"dimensions": ["state"], "metrics": ["sum:spend"], "bucket": "week", "start": date(2024, 1, 10), "end": date(2024, 2, 5)},
+    {"dimensions": [], "metrics": ["avg:spend"], "filters": {"state": "SP"}},
+    {"dimensions": ["vehicle_type"], "metrics": ["max:sale_price"], "filters": {"city": "Recife"}},
+    {"dimensions": ["store_id"], "metrics": ["max:sale_price", "count"]},
+])
+def test_snapshot_aggregate_matches_sql(session, collections, monkeypatch, kwargs):
+    """Testa que a agregação do snapshot é igual ao GROUP BY nas coletas"""
+    # Arrange
+    query = build_aggregate_query(**kwargs)
+
+    # Act
+    from_sql, from_snapshot = _sql_then_snapshot(monkeypatch, get_aggregate, session, query)
+
+    # Assert
+    assert from_sql.source == "collections"
+    assert from_snapshot.source == "snapshot"
+    assert from_snapshot.rows == from_sql.rows
+    assert from_snapshot.truncated == from_sql.truncated
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"dimensions": ["state"], "metrics": ["count", "avg:sale_price", "sum:volume_sold"]},
+    {"dimensions": ["fuel_type"], "metrics": ["avg:sale_price"], "bucket": "month", "start": date(2024, 1, 1), "end": date(2024, 3, 31)},
+    {"dimensions": ["state", "vehicle_type"], "metrics": ["count"], "bucket": "week", "start": date(2024, 1, 8), "end": date(2024, 2, 4), "limit": 3},
+])
+def test_snapshot_matches_rollups(session, collections, snapshot, kwargs):
+    """Testa que o snapshot calcula o mesmo que os rollups (que continuam respondendo)"""
+    # Arrange
+    query = build_aggregate_query(**kwargs)
+
+    # Act
+    from_rollups = get_aggregate(session, query)
+    rows = _aggregate_from_snapshot(snapshot.refresh(session), query)
+
+    # Assert
+    assert from_rollups.source == "rollup"
+    assert _aggregate_response(query, rows, "snapshot").rows == from_rollups.rows
+
+
+def test_snapshot_appends_new_rows_incrementally(session, collections, snapshot, sample_collection_data):
+    """Testa que o refresh lê apenas as coletas novas"""
+    # Arrange
+    snapshot.refresh(session)
+    loaded = snapshot.stats()
+    session.add(FuelCollection(**sample_collection_data))
+    session.commit()
+
+    # Act
+    snapshot.refresh(session)
+
+    # Assert
+    assert loaded["rows"] == 5
+    assert snapshot.stats()["rows"] == 6
+    assert snapshot.stats()["last_id"] == loaded["last_id"] + 1
+
+
+def test_snapshot_reloads_when_tail_missed_rows(session, collections, snapshot, sample_collection_data):
+    """Testa a recarga quando uma coleta com id menor confirmou depois do tail"""
+    # Arrange: simula um tail que viu a segunda coleta nova, mas não a primeira
+    snapshot.refresh(session)
+    first = FuelCollection(**sample_collection_data)
+    second = FuelCollection(**{**sample_collection_data, "fuel_type": "Etanol"})
+    session.add_all([first, second])
+    session.commit()
+    snapshot._columns.append([(second.id, second.collection_date, "Etanol", "Carro", "SP", "São Paulo", 5.89, 45.5)])
+
+    # Act
+    snapshot.refresh(session)
+
+    # Assert
+    assert snapshot.stats()["rows"] == 7
+    assert snapshot.aggregate([], [("count", None)], filters={"fuel_type": "Gasolina"}) == [(4,)]
+
+
+def test_snapshot_widens_dictionary_codes(session, snapshot, sample_collection_data):
+    """Testa que os códigos do dicionário crescem de 1 para 2 bytes"""
+    # Arrange
+    for i in range(300):
+        session.add(FuelCollection(**{**sample_collection_data, "city": f"Cidade {i}"}))
+    session.commit()
+
+    # Act
+    snapshot.refresh(session)
+    stats = snapshot.stats()
+
+    # Assert
+    assert stats["dictionaries"]["city"] == 300
+    assert snapshot._columns.arrays["city"].dtype.itemsize == 2
+    # 4 dimensões de 1 byte (inclui o posto), cidade com 2 e três colunas de 8 bytes
+    assert stats["bytes_per_million_rows"] == 30_000_000
+    assert len(snapshot.aggregate(["city"], [("count", None)])) == 300
+
+
+def test_snapshot_async_matches_sync(tmp_path, sample_collection_data, monkeypatch):
+    """Testa o refresh e a agregação do snapshot com AsyncSession"""
+    # Arrange
+    url = f"sqlite:///{tmp_path / 'analytics.db'}"
+    engine = create_engine(url)
+    SQLModel.metadata.create_all(engine)
+    apply_migrations(engine)
+    query = build_aggregate_query(["fuel_type"], ["max:sale_price", "sum:spend"])
+    with Session(engine) as session:
+        for fuel_type, price in [("Gasolina", 6.0), ("Gasolina", 5.0), ("Etanol", 4.0)]:
+            session.add(FuelCollection(**{**sample_collection_data, "fuel_type": fuel_type, "sale_price": price}))
+        session.commit()
+        expected = get_aggregate(session, query)
+    monkeypatch.setattr("app.analytics._snapshot", ColumnarSnapshot())
+
+    async def run():
+        async_engine = create_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://"), poolclass=NullPool)
+        try:
+            async with AsyncSession(async_engine) as async_session:
+                return await get_aggregate_async(async_session, query)
+        finally:
+            await async_engine.dispose()
+
+    # Act
+    result = asyncio.run(run())
+    engine.dispose()
+
+    # Assert
+    assert result.source == "snapshot"
+    assert result.rows == expected.rows
@@ -0,0 +1,241 @@
+import statistics
+import threading
+import pytest
+from datetime import date, datetime, timedelta
+from sqlmodel import select
+from app.anomalies import ANOMALY_MIN_SAMPLES, CHECKS, RunningStats, _stats, group_stats, load_group_stats, reload_group_stats
+from app.models import PriceAnomaly
+from app.partitions import apply_retention
+from app.schemas.fuel_collection import VEHICLE_TYPES
+from app.services.bulk_ingest_service import load_rows
+from app.services.ingest_service import insert_collections
+from app.services.report_service import get_anomalies
+
+
+def _rows(sample_collection_data, count: int, start: datetime, **overrides) -> list[dict]:
+    """Coletas normais: preço entre 5,80 e 5,99 e volume entre 30 e 59 litros"""
+    return [
+        {
+            **sample_collection_data,
+            "sale_price": 5.80 + (i % 20) / 100,
+            "volume_sold": 30.0 + i % 30,
+            "collection_date": start + timedelta(hours=i),
+            **overrides,
+        }
+        for i in range(count)
+    ]
+
+
+def _ingest(session, rows: list[dict]) -> list[dict]:
+    insert_collections(session, rows)
+    session.commit()
+    return rows
+
+
+def _flags(session) -> list[PriceAnomaly]:
+    return session.exec(select(PriceAnomaly).order_by(PriceAnomaly.id)).all()
+
+
+def test_running_stats_match_batch_statistics():
+    """Testa que Welford e a junção de Chan reproduzem média e desvio do lote"""
+    # Arrange
+    values = [5.8 + (i * 7 % 13) / 10 for i in range(50)]
+    first, second = RunningStats(), RunningStats()
+
+    # Act
+    for value in values[:20]:
+        first.add(value)
+    for value in values[20:]:
+        second.add(value)
+    first.merge(second)
+
+    # Assert
+    assert first.count == 50
+    assert first.mean == pytest.approx(statistics.mean(values))
+    assert first.stddev == pytest.approx(statistics.stdev(values))
+
+
+def test_outlier_price_is_flagged(session, sample_collection_data):
+    """Testa que um preço fora da norma do posto e da cidade é sinalizado"""
+    # Arrange
+    _ingest(session, _rows(sample_collection_data, ANOMALY_MIN_SAMPLES + 10, datetime(2024, 1, 1)))
+
+    # Act
+    _ingest(session, [{**sample_collection_data, "sale_price": 9.99, "collection_date": datetime(2024, 1, 5)}])
+
+    # Assert
+    flags = _flags(session)
+    assert sorted(flag.kind for flag in flags) == ["price_city", "price_store"]
+    assert flags[0].value == 9.99
+    assert flags[0].expected == pytest.approx(5.89, abs=0.01)
+    assert flags[0].z_score > 10
+    assert flags[0].samples == ANOMALY_MIN_SAMPLES + 10
+
+
+def test_no_flags_before_min_samples(session, sample_collection_data):
+    """Testa que grupos com poucas coletas não sinalizam"""
+    # Act
+    _ingest(session, _rows(sample_collection_data, ANOMALY_MIN_SAMPLES - 1, datetime(2024, 1, 1)))
+    _ingest(session, [{**sample_collection_data, "sale_price": 9.99, "volume_sold": 900.0}])
+
+    # Assert
+    assert _flags(session) == []
+
+
+def test_absurd_volume_in_bulk_load(session, sample_collection_data):
+    """Testa que a carga em massa sinaliza volumes absurdos para o tipo de veículo"""
+    # Arrange
+    _ingest(session, _rows(sample_collection_data, ANOMALY_MIN_SAMPLES, datetime(2024, 1, 1)))
+    row = tuple(sample_collection_data[column] for column in [
+        "store_id", "store_name", "city", "state", "fuel_type", "driver_name",
+        "driver_cpf", "vehicle_plate", "vehicle_type",
+    ])
+
+    # Act
+    load_rows(session, [
+        row + (5.89, 40.0, datetime(2024, 2, 1)),
+        row + (5.89, 900.0, datetime(2024, 2, 2)),
+        row[:8] + (VEHICLE_TYPES[1],) + (5.89, 900.0, datetime(2024, 2, 3)),
+    ])
+    session.commit()
+
+    # Assert
+    flags = _flags(session)
+    assert [(flag.kind, flag.value, flag.vehicle_type) for flag in flags] == [
+        ("volume_vehicle", 900.0, sample_collection_data["vehicle_type"])
+    ]
+
+
+def test_rolled_back_rows_do_not_enter_stats(session, sample_collection_data):
+    """Testa que coletas de uma transação desfeita não entram nas estatísticas"""
+    # Arrange
+    _ingest(session, _rows(sample_collection_data, 10, datetime(2024, 1, 1)))
+    group = CHECKS[0].group(sample_collection_data)
+    before = group_stats(session.get_bind()).get(group)
+
+    # Act
+    insert_collections(session, _rows(sample_collection_data, 10, datetime(2024, 2, 1), sale_price=9.0))
+    session.rollback()
+
+    # Assert
+    after = group_stats(session.get_bind()).get(group)
+    assert (after.count, after.mean) == (before.count, before.mean) == (10, pytest.approx(5.845))
+
+
+def test_stats_warm_start_from_table(session, sample_collection_data):
+    """Testa que load_group_stats carrega do banco as estatísticas de um processo novo"""
+    # Arrange
+    rows = _ingest(session, _rows(sample_collection_data, ANOMALY_MIN_SAMPLES + 5, datetime(2024, 1, 1)))
+    _stats.pop(session.get_bind())
+
+    # Act
+    load_group_stats(session.get_bind())
+    _ingest(session, [{**sample_collection_data, "sale_price": 9.99}])
+
+    # Assert
+    stats = group_stats(session.get_bind()).get(CHECKS[1].group(sample_collection_data))
+    prices = [row["sale_price"] for row in rows] + [9.99]
+    assert stats.count == len(prices)
+    assert stats.mean == pytest.approx(statistics.mean(prices))
+    assert stats.stddev == pytest.approx(statistics.stdev(prices))
+    assert len(_flags(session)) == 2
+
+
+def test_report_filters_and_paginates(session, sample_collection_data):
+    """Testa os filtros e a paginação por cursor de /reports/anomalies"""
+    # Arrange: base grande o bastante para as três sinalizações
+    _ingest(session, _rows(sample_collection_data, 3 * ANOMALY_MIN_SAMPLES, datetime(2024, 1, 1)))
+    _ingest(session, [
+        {**sample_collection_data, "sale_price": 9.99, "collection_date": datetime(2024, 1, 10 + i)}
+        for i in range(3)
+    ])
+
+    # Act
+    first = get_anomalies(session, kind="price_store", page_size=2)
+    second = get_anomalies(session, kind="price_store", page_size=2, cursor=first.next_cursor)
+
+    # Assert
+    dates = [flag.collection_date.day for flag in first.data + second.data]
+    assert dates == [12, 11, 10]
+    assert second.next_cursor is None
+    assert get_anomalies(session, fuel_type="Etanol").data == []
+    assert len(get_anomalies(session, start_date=datetime(2024, 1, 11)).data) == 4
+    assert get_anomalies(session, min_z_score=1000).data == []
+
+
+def test_retention_removes_flags(session, sample_collection_data):
+    """Testa que a retenção apaga as sinalizações dos meses removidos"""
+    # Arrange
+    _ingest(session, _rows(sample_collection_data, ANOMALY_MIN_SAMPLES, datetime(2024, 1, 1)))
+    _ingest(session, [
+        {**sample_collection_data, "sale_price": 9.99, "collection_date": datetime(2024, month, 15)}
+        for month in (1, 3)
+    ])
+
+    # Act
+    apply_retention(session.get_bind(), keep_months=1, today=date(2024, 3, 20))
+    session.expire_all()
+
+    # Assert
+    assert {flag.collection_date.month for flag in _flags(session)} == {3}
+
+
+def test_loaded_variance_is_stable_for_large_values(session, sample_collection_data):
+    """Testa que a variância carregada não perde precisão com média alta e desvio pequeno"""
+    # Arrange
+    volumes = [1e8 + 0.1 * (i % 3) for i in range(ANOMALY_MIN_SAMPLES)]
+    _ingest(session, [
+        {**sample_collection_data, "collection_date": datetime(2024, 1, 1), "volume_sold": volume}
+        for volume in volumes
+    ])
+    _stats.pop(session.get_bind())
+
+    # Act
+    load_group_stats(session.get_bind())
+
+    # Assert
+    stats = group_stats(session.get_bind()).get(CHECKS[2].group(sample_collection_data))
+    assert stats.count == len(volumes)
+    assert stats.stddev == pytest.approx(statistics.stdev(volumes), rel=1e-6)
+
+
+def test_reload_drops_months_removed_by_retention(session, sample_collection_data):
+    """Testa que a recarga das estatísticas deixa de contar os meses removidos pela retenção"""
+    # Arrange
+    _ingest(session, _rows(sample_collection_data, ANOMALY_MIN_SAMPLES, datetime(2024, 1, 1)))
+    _ingest(session, _rows(sample_collection_data, 10, datetime(2024, 3, 1), sale_price=7.0))
+    apply_retention(session.get_bind(), keep_months=1, today=date(2024, 3, 20))
+    group = CHECKS[1].group(sample_collection_data)
+    before = group_stats(session.get_bind()).get(group)
+
+    # Act
+    reloaded = reload_group_stats(session.get_bind())
+
+    # Assert
+    after = group_stats(session.get_bind()).get(group)
+    assert reloaded
+    assert before.count == ANOMALY_MIN_SAMPLES + 10
+    assert (after.count, after.mean) == (10, pytest.approx(7.0))
+
+
+def test_commit_schedules_reload_after_interval(session, sample_collection_data, monkeypatch):
+    """Testa que, passado o intervalo, um commit de ingestão agenda a recarga em background"""
+    # Arrange
+    engine = session.get_bind()
+    _stats.pop(engine, None)
+    load_group_stats(engine)
+    reloads = []
+    monkeypatch.setattr("app.anomalies._reload_in_background", reloads.append)
+    _ingest(session, _rows(sample_collection_data, 1, datetime(2024, 1, 1)))
+    assert reloads == []
+
+    # Act
+    monkeypatch.setattr("app.anomalies.ANOMALY_STATS_RELOAD_SECONDS", 0.001)
+    group_stats(engine).loaded_at -= 1
+    _ingest(session, _rows(sample_collection_data, 1, datetime(2024, 1, 2)))
+
+    # Assert
+    for thread in threading.enumerate():
+        if thread.name == "anomaly-stats-reload":
+            thread.join(timeout=5)
+    assert reloads == [engine]
@@ -0,0 +1,326 @@
+import asyncio
+import os
+import pytest
+from datetime import date, datetime, timedelta
+from sqlmodel import SQLModel, Session, create_engine, select, func
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from app.analytics import ColumnarSnapshot
+from app.archive import archive_collections
+from app.migrations import apply_migrations
+from app.models import ArchivedFile, FuelCollection, FuelTypeSummary, KpiRollup
+from app.services.aggregate_service import build_aggregate_query, get_aggregate, get_aggregate_async
+from app.services.collection_service import get_collections, get_collections_async
+from app.services.report_service import get_driver_report, get_driver_report_async
+from app.services.summary_service import check_summaries_consistency, rebuild_rollups, rebuild_summaries
+
+ARCHIVE_BEFORE = date(2024, 3, 1)
+
+
+@pytest.fixture
+def archive_dir(tmp_path, monkeypatch):
+    """Ativa o arquivo frio em um diretório temporário"""
+    monkeypatch.setattr("app.archive.ARCHIVE_DIR", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def dated_collections(session, sample_collection_data):
+    """40 coletas de janeiro a abril de 2024, com dois motoristas e três combustíveis"""
+    drivers = [("João Silva", "12345678901"), ("Maria Souza", "98765432100")]
+    for i in range(40):
+        driver_name, driver_cpf = drivers[i % 2]
+        session.add(FuelCollection(**{
+            **sample_collection_data,
+            "collection_date": datetime(2024, 1, 1, 8) + timedelta(days=3 * i, hours=i % 5),
+            "fuel_type": ["Gasolina", "Etanol", "Diesel S10"][i % 3],
+            "city": "São Paulo" if i % 4 else "Campinas",
+            "state": "SP" if i % 4 else "MG",
+            "sale_price": 5.0 + i / 10,
+            "volume_sold": 10.0 + i,
+            "driver_name": driver_name,
+            "driver_cpf": driver_cpf,
+        }))
+    session.commit()
+    return session
+
+
+def _archive(session) -> list[ArchivedFile]:
+    """Arquiva os meses anteriores a março e descarta o estado da sessão"""
+    archived = archive_collections(session.get_bind(), ARCHIVE_BEFORE)
+    session.expire_all()
+    return archived
+
+
+def _all_pages(session, **filters) -> list[list[int]]:
+    """Ids de todas as páginas (OFFSET) da listagem"""
+    pages = []
+    page = 1
+    while True:
+        response = get_collections(session, page=page, page_size=7, include_total=False, **filters)
+        pages.append([row.id for row in response.data])
+        if not response.next_cursor:
+            return pages
+        page += 1
+
+
+def _cursor_pages(session, **filters) -> tuple[list[list[int]], list[list[int]]]:
+    """Ids das páginas por cursor, indo até o fim (next) e voltando (prev)"""
+    response = get_collections(session, page_size=7, include_total=False, **filters)
+    forward = [[row.id for row in response.data]]
+    while response.next_cursor:
+        response = get_collections(session, page_size=7, include_total=False, cursor=response.next_cursor, **filters)
+        forward.append([row.id for row in response.data])
+    backward = []
+    while response.prev_cursor:
+        response = get_collections(session, page_size=7, include_total=False, cursor=response.prev_cursor, **filters)
+        backward.append([row.id for row in response.data])
+    return forward, backward
+
+
+def test_archive_moves_old_months_to_parquet(dated_collections, archive_dir):
+    """Testa que os meses antigos saem da tabela para arquivos registrados no manifesto"""
+    # Arrange
+    session = dated_collections
+
+    # Act
+    archived = _archive(session)
+
+    # Assert
+    assert [entry.month for entry in archived] == [date(2024, 1, 1), date(2024, 2, 1)]
+    manifest = session.exec(select(ArchivedFile).order_by(ArchivedFile.month)).all()
+    assert [entry.row_count for entry in manifest] == [11, 9]
+    assert all(os.path.exists(archive_dir / entry.path) and entry.path.endswith(".parquet") for entry in manifest)
+    assert manifest[0].min_date == datetime(2024, 1, 1, 8)
+    assert session.exec(select(func.min(FuelCollection.collection_date))).one() >= datetime(2024, 3, 1)
+    assert session.exec(select(func.count(FuelCollection.id))).one() == 20
+    # Rodar de novo não encontra mais meses para arquivar
+    assert archive_collections(session.get_bind(), ARCHIVE_BEFORE) == []
+
+
+@pytest.mark.parametrize("filters", [{}, {"fuel_type": "Etanol"}, {"city": "sao paulo"}])
+def test_listing_crosses_archive_boundary(dated_collections, archive_dir, filters):
+    """Testa que a listagem por página e por cursor é a mesma antes e depois do arquivamento"""
+    # Arrange
+    session = dated_collections
+    expected_pages = _all_pages(session, **filters)
+    expected_cursor_pages = _cursor_pages(session, **filters)
+
+    # Act
+    _archive(session)
+
+    # Assert
+    assert _all_pages(session, **filters) == expected_pages
+    assert _cursor_pages(session, **filters) == expected_cursor_pages
+
+
+@pytest.mark.parametrize("filters", [{}, {"fuel_type": "Etanol", "vehicle_type": "Carro"}, {"city": "campinas"}])
+def test_count_includes_archived(dated_collections, archive_dir, filters):
+    """Testa que o total da listagem inclui as coletas arquivadas"""
+    # Arrange
+    session = dated_collections
+    expected = get_collections(session, **filters).total
+
+    # Act
+    _archive(session)
+    total = get_collections(session, **filters).total
+
+    # Assert
+    assert total == expected
+
+
+@pytest.mark.parametrize("search", ["12345678901", "maria"])
+def test_driver_report_includes_archived(dated_collections, archive_dir, search):
+    """Testa que o relatório por motorista soma tabela e arquivo e pagina através dele"""
+    # Arrange
+    session = dated_collections
+    expected = get_driver_report(search, session, page_size=6)
+    expected_next = get_driver_report(search, session, page_size=6, cursor=expected.next_cursor)
+    expected_window = get_driver_report(
+        search, session, start_date=datetime(2024, 2, 1), end_date=datetime(2024, 3, 10)
+    )
+
+    # Act
+    _archive(session)
+    report = get_driver_report(search, session, page_size=6)
+    report_next = get_driver_report(search, session, page_size=6, cursor=report.next_cursor)
+    window = get_driver_report(search, session, start_date=datetime(2024, 2, 1), end_date=datetime(2024, 3, 10))
+
+    # Assert
+    assert report == expected
+    assert report_next == expected_next
+    assert window.total_refuels == expected_window.total_refuels
+    assert window.total_spent == expected_window.total_spent
+
+
+def test_driver_report_only_in_archive(dated_collections, archive_dir):
+    """Testa o relatório de um período que está todo no arquivo frio"""
+    # Arrange
+    session = dated_collections
+    expected = get_driver_report("joão", session, end_date=datetime(2024, 1, 31))
+
+    # Act
+    _archive(session)
+    report = get_driver_report("joão", session, end_date=datetime(2024, 1, 31))
+
+    # Assert
+    assert report.total_refuels == expected.total_refuels == 5
+    assert report.driver_name == "João Silva"
+    assert [r.id for r in report.refuels] == [r.id for r in expected.refuels]
+
+
+@pytest.mark.parametrize("dimensions, metrics, kwargs", [
+    (["state"], ["max:sale_price", "min:volume_sold", "count"], {}),
+    (["fuel_type"], ["avg:spend", "sum:volume_sold"], {"start": date(2024, 2, 10), "end": date(2024, 3, 20)}),
+    ([], ["max:sale_price", "avg:volume_sold", "count"], {"bucket": "week", "start": date(2024, 1, 3), "end": date(2024, 3, 12)}),
+    (["store_id"], ["sum:spend"], {"filters": {"fuel_type": "Gasolina"}}),
+])
+def test_aggregate_matches_before_archive(dated_collections, archive_dir, dimensions, metrics, kwargs):
+    """Testa que as agregações sobre as coletas somam tabela e arquivo com o mesmo resultado"""
+    # Arrange
+    session = dated_collections
+    query = build_aggregate_query(dimensions, metrics, **kwargs)
+    expected = get_aggregate(session, query)
+
+    # Act
+    _archive(session)
+    result = get_aggregate(session, query)
+
+    # Assert
+    assert result.source == "collections+archive"
+    assert result.rows == expected.rows
+
+
+def test_aggregate_from_rollups_ignores_archive(dated_collections, archive_dir):
+    """Testa que consultas que cabem nos rollups continuam neles, sem ler o arquivo"""
+    # Arrange
+    session = dated_collections
+    query = build_aggregate_query(["fuel_type"], ["count", "avg:sale_price"])
+    expected = get_aggregate(session, query)
+
+    # Act
+    _archive(session)
+    result = get_aggregate(session, query)
+
+    # Assert
+    assert result.source == "rollup"
+    assert result.rows == expected.rows
+
+
+def test_aggregate_after_archive_range(dated_collections, archive_dir):
+    """Testa que intervalos sem arquivos no manifesto leem só a tabela"""
+    # Arrange
+    session = dated_collections
+    _archive(session)
+
+    # Act
+    result = get_aggregate(session, build_aggregate_query(["state"], ["max:sale_price"], start=date(2024, 3, 5)))
+
+    # Assert
+    assert result.source == "collections"
+
+
+def test_summaries_and_rollups_keep_archived(dated_collections, archive_dir):
+    """Testa que os agregados seguem contando as coletas arquivadas, inclusive ao recalcular"""
+    # Arrange
+    session = dated_collections
+    _archive(session)
+    summaries = {s.fuel_type: s.total_records for s in session.exec(select(FuelTypeSummary)).all()}
+    rollups = {
+        (r.granularity, r.bucket, r.fuel_type, r.state, r.city, r.vehicle_type):
+            (r.total_records, round(r.sum_price, 6), round(r.sum_volume, 6))
+        for r in session.exec(select(KpiRollup)).all()
+    }
+
+    # Act
+    mismatches = check_summaries_consistency(session)
+    rebuild_summaries(session)
+    rebuild_rollups(session)
+
+    # Assert
+    assert mismatches == []
+    assert sum(summaries.values()) == 40
+    assert {s.fuel_type: s.total_records for s in session.exec(select(FuelTypeSummary)).all()} == summaries
+    assert {
+        (r.granularity, r.bucket, r.fuel_type, r.state, r.city, r.vehicle_type):
+            (r.total_records, round(r.sum_price, 6), round(r.sum_volume, 6))
+        for r in session.exec(select(KpiRollup)).all()
+    } == rollups
+
+
+def test_snapshot_drops_archived_rows(dated_collections, archive_dir):
+    """Testa que o snapshot colunar recarrega sem as coletas arquivadas e depois só faz tail"""
+    # Arrange
+    session = dated_collections
+    snapshot = ColumnarSnapshot()
+    snapshot.refresh(session)
+    session.commit()
+
+    # Act
+    _archive(session)
+    snapshot.refresh(session)
+    loaded = snapshot.stats()["rows"]
+    snapshot.refresh(session)
+
+    # Assert
+    assert loaded == snapshot.stats()["rows"] == 20
+
+
+def test_archive_requires_archive_dir(dated_collections, monkeypatch):
+    """Testa que o arquivamento exige ARCHIVE_DIR e que as consultas o ignoram sem ele"""
+    # Arrange
+    monkeypatch.setattr("app.archive.ARCHIVE_DIR", "")
+
+    # Act & Assert
+    with pytest.raises(ValueError):
+        archive_collections(dated_collections.get_bind(), ARCHIVE_BEFORE)
+    assert get_collections(dated_collections, page_size=50).total == 40
+
+
+def test_async_services_read_archive(tmp_path, archive_dir, sample_collection_data):
+    """Testa que as versões assíncronas da listagem, do relatório e da agregação leem o arquivo"""
+    # Arrange
+    url = f"sqlite:///{tmp_path / 'archive.db'}"
+    engine = create_engine(url)
+    SQLModel.metadata.create_all(engine)
+    apply_migrations(engine)
+    with Session(engine) as session:
+        for i in range(12):
+            session.add(FuelCollection(**{
+                **sample_collection_data,
+                "collection_date": datetime(2024, 1, 5) + timedelta(days=10 * i),
+                "fuel_type": "Etanol" if i % 2 else "Gasolina",
+                "sale_price": 5.0 + i,
+            }))
+        session.commit()
+    archive_collections(engine, ARCHIVE_BEFORE)
+    query = build_aggregate_query(["fuel_type"], ["max:sale_price", "avg:spend"])
+    with Session(engine) as session:
+        expected = (
+            get_collections(session, page=2, page_size=4, fuel_type="Etanol"),
+            get_driver_report("12345678901", session, page_size=5),
+            get_aggregate(session, query),
+        )
+
+    async def run():
+        async_engine = create_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://"), poolclass=NullPool)
+        try:
+            async with AsyncSession(async_engine) as async_session:
+                return (
+                    await get_collections_async(async_session, page=2, page_size=4, fuel_type="Etanol"),
+                    await get_driver_report_async("12345678901", async_session, page_size=5),
+                    await get_aggregate_async(async_session, query),
+                )
+        finally:
+            await async_engine.dispose()
+
+    # Act
+    result = asyncio.run(run())
+    engine.dispose()
+
+    # Assert
+    assert result == expected
+    assert result[0].total == 6
+    assert result[1].total_refuels == 12
+    assert result[2].source == "collections+archive"
@@ -0,0 +1,129 @@
+import asyncio
+import pytest
+from sqlmodel import SQLModel, Session, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from fastapi import HTTPException
+from app.models import FuelCollection
+from app.migrations import apply_migrations
+from app.search import setup_search, register_search_engine
+from app.services.collection_service import get_collections, get_collections_async
+from app.services.kpi_service import get_avg_price_by_fuel, get_avg_price_by_fuel_async, get_volume_by_vehicle_async
+from app.services.report_service import get_driver_report, get_driver_report_async
+
+
+@pytest.fixture(name="db_file")
+def db_file_fixture(tmp_path, sample_collection_data):
+    """
+    Banco SQLite em arquivo com dados de exemplo, acessado pelos engines
+    síncrono (sqlite) e assíncrono (aiosqlite), como em API_MODE=async.
+    """
+    url = f"sqlite:///{tmp_path / 'async.db'}"
+    engine = create_engine(url)
+    SQLModel.metadata.create_all(engine)
+    setup_search(engine)
+    apply_migrations(engine)
+    
+    with Session(engine) as session:
+        for city, fuel_type, vehicle_type in [
+            ("São Paulo", "Gasolina", "Carro"),
+            ("Rio de Janeiro", "Etanol", "Moto"),
+            ("São Paulo", "Diesel S10", "Carreta"),
+        ]:
+            session.add(FuelCollection(**{
+                **sample_collection_data,
+                "city": city,
+                "fuel_type": fuel_type,
+                "vehicle_type": vehicle_type,
+            }))
+        session.commit()
+    
+    yield url, engine
+    engine.dispose()
+
+
+def run_async(url: str, func, *args, **kwargs):
+    """Executa uma função de serviço assíncrona com uma AsyncSession nova"""
+    async def runner():
+        async_engine = create_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://"), poolclass=NullPool)
+        register_search_engine(async_engine.sync_engine)
+        try:
+            async with AsyncSession(async_engine, expire_on_commit=False) as session:
+                return await func(session, *args, **kwargs)
+        finally:
+            await async_engine.dispose()
+    return asyncio.run(runner())
+
+
+def test_get_collections_async_matches_sync(db_file):
+    """Testa que a listagem assíncrona devolve o mesmo resultado da síncrona"""
+    # Arrange
+    url, engine = db_file
+    
+    # Act
+    result = run_async(url, get_collections_async, page_size=2, city="sao paulo")
+    with Session(engine) as session:
+        expected = get_collections(session, page_size=2, city="sao paulo")
+    
+    # Assert
+    assert result.total == 2
+    assert result.model_dump() == expected.model_dump()
+
+
+def test_get_collections_async_cursor(db_file):
+    """Testa a paginação por cursor na versão assíncrona"""
+    # Arrange
+    url, _ = db_file
+    first = run_async(url, get_collections_async, page_size=2, include_total=False)
+    
+    # Act
+    second = run_async(url, get_collections_async, page_size=2, cursor=first.next_cursor, include_total=False)
+    
+    # Assert
+    assert len(first.data) == 2
+    assert len(second.data) == 1
+    assert second.next_cursor is None
+
+
+def test_get_kpis_async(db_file):
+    """Testa os KPIs assíncronos"""
+    # Arrange
+    url, engine = db_file
+    
+    # Act
+    avg_price = run_async(url, get_avg_price_by_fuel_async)
+    volume = run_async(url, get_volume_by_vehicle_async)
+    with Session(engine) as session:
+        expected = get_avg_price_by_fuel(session)
+    
+    # Assert
+    assert [item.fuel_type for item in avg_price] == [item.fuel_type for item in expected]
+    assert {item.vehicle_type for item in volume} == {"Carro", "Moto", "Carreta"}
+
+
+def test_get_driver_report_async(db_file):
+    """Testa o relatório de motorista assíncrono"""
+    # Arrange
+    url, engine = db_file
+    
+    # Act
+    result = run_async(url, lambda session: get_driver_report_async("joao", session, page_size=2))
+    with Session(engine) as session:
+        expected = get_driver_report("joao", session, page_size=2)
+    
+    # Assert
+    assert result.total_refuels == 3
+    assert result.model_dump() == expected.model_dump()
+
+
+def test_get_driver_report_async_not_found(db_file):
+    """Testa erro 404 na versão assíncrona"""
+    # Arrange
+    url, _ = db_file
+    
+    # Act & Assert
+    with pytest.raises(HTTPException) as exc_info:
+        run_async(url, lambda session: get_driver_report_async("99999999999", session))
+    
+    assert exc_info.value.status_code == 404
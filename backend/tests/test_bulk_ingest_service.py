@@ -0,0 +1,186 @@
+import io
+import json
+import pytest
+from app.services.bulk_ingest_service import load_stream, validate_columns, LOAD_COLUMNS
+from app.models import FuelCollection
+from sqlmodel import select
+
+CSV_HEADER = "store_id,store_name,city,state,fuel_type,sale_price,volume_sold,driver_name,driver_cpf,vehicle_plate,vehicle_type,collection_date\n"
+
+
+def _csv_line(**overrides):
+    """Monta uma linha CSV válida com campos opcionalmente alterados"""
+    values = {
+        "store_id": "12345678000190",
+        "store_name": "Posto Teste",
+        "city": "São Paulo",
+        "state": "SP",
+        "fuel_type": "Gasolina",
+        "sale_price": "5.89",
+        "volume_sold": "45.5",
+        "driver_name": "João Silva",
+        "driver_cpf": "12345678901",
+        "vehicle_plate": "ABC1234",
+        "vehicle_type": "Carro",
+        "collection_date": "2023-05-01T10:00:00",
+    }
+    values.update(overrides)
+    return ",".join(values[column] for column in CSV_HEADER.strip().split(",")) + "\n"
+
+
+def test_load_stream_csv_success(session):
+    """Testa carga de CSV válido em múltiplos blocos"""
+    # Arrange
+    content = CSV_HEADER + "".join(_csv_line() for _ in range(250))
+    
+    # Act
+    summary = load_stream(session, io.StringIO(content), "csv", chunk_size=100)
+    
+    # Assert
+    assert summary.total_rows == 250
+    assert summary.inserted == 250
+    assert summary.rejected == 0
+    assert summary.rows_per_second > 0
+    assert len(session.exec(select(FuelCollection)).all()) == 250
+
+
+def test_load_stream_csv_rejects_invalid_rows(session):
+    """Testa que linhas inválidas são rejeitadas e gravadas no arquivo de rejeições"""
+    # Arrange
+    content = (
+        CSV_HEADER
+        + _csv_line()
+        + _csv_line(driver_cpf="123")
+        + _csv_line(fuel_type="GNV")
+        + _csv_line(sale_price="-1")
+        + _csv_line(volume_sold="abc")
+        + _csv_line(sale_price='"6,10"')
+    )
+    reject_file = io.StringIO()
+    
+    # Act
+    summary = load_stream(session, io.StringIO(content), "csv", reject_file=reject_file)
+    
+    # Assert
+    assert summary.inserted == 2  # Inclui o preço com vírgula decimal
+    assert summary.rejected == 4
+    assert [error.line for error in summary.sample_errors] == [3, 4, 5, 6]
+    assert "CPF" in summary.sample_errors[0].reason
+    rejected_lines = reject_file.getvalue().strip().splitlines()
+    assert len(rejected_lines) == 5  # Cabeçalho + 4 rejeições
+    prices = sorted(r.sale_price for r in session.exec(select(FuelCollection)).all())
+    assert prices == [5.89, 6.10]
+
+
+def test_load_stream_rejects_non_finite_numbers(session):
+    """Testa que NaN e infinito são rejeitados (float() os aceita)"""
+    # Arrange
+    content = (
+        CSV_HEADER
+        + _csv_line(sale_price="nan")
+        + _csv_line(volume_sold="inf")
+        + _csv_line(sale_price="-inf")
+        + _csv_line()
+    )
+    reject_file = io.StringIO()
+    
+    # Act
+    summary = load_stream(session, io.StringIO(content), "csv", reject_file=reject_file)
+    
+    # Assert
+    assert summary.inserted == 1
+    assert summary.rejected == 3
+    assert all("finito" in error.reason for error in summary.sample_errors)
+    assert len(reject_file.getvalue().strip().splitlines()) == 4
+
+
+def test_load_stream_ndjson(session, sample_collection_data):
+    """Testa carga de NDJSON com linha malformada"""
+    # Arrange
+    content = "\n".join([
+        json.dumps(sample_collection_data),
+        "{nao e json",
+        json.dumps({**sample_collection_data, "vehicle_type": "Avião"}),
+        json.dumps(sample_collection_data),
+    ])
+    
+    # Act
+    summary = load_stream(session, io.StringIO(content), "ndjson")
+    
+    # Assert
+    assert summary.total_rows == 4
+    assert summary.inserted == 2
+    assert summary.rejected == 2
+    assert [error.line for error in summary.sample_errors] == [2, 3]
+
+
+def test_load_stream_keeps_collection_date(session):
+    """Testa que a data histórica do arquivo é preservada"""
+    # Act
+    load_stream(session, io.StringIO(CSV_HEADER + _csv_line()), "csv")
+    
+    # Assert
+    record = session.exec(select(FuelCollection)).one()
+    assert record.collection_date.year == 2023
+
+
+def test_validate_columns_masks():
+    """Testa a validação colunar isoladamente"""
+    # Arrange
+    columns = {column: [] for column in LOAD_COLUMNS}
+    for cpf in ["12345678901", "1234567890a"]:
+        for column in LOAD_COLUMNS:
+            columns[column].append(None)
+        columns["store_id"][-1] = "1"
+        columns["store_name"][-1] = "Posto"
+        columns["city"][-1] = "Recife"
+        columns["state"][-1] = "PE"
+        columns["fuel_type"][-1] = "Etanol"
+        columns["sale_price"][-1] = 4.2
+        columns["volume_sold"][-1] = 10
+        columns["driver_name"][-1] = "Ana"
+        columns["driver_cpf"][-1] = cpf
+        columns["vehicle_plate"][-1] = "AAA0000"
+        columns["vehicle_type"][-1] = "Moto"
+    
+    # Act
+    normalized, reasons = validate_columns(columns)
+    
+    # Assert
+    assert reasons[0] is None
+    assert "CPF" in reasons[1]
+    assert normalized["volume_sold"] == [10.0, 10.0]
+    assert normalized["collection_date"][0] is not None
+
+
+def test_load_stream_unknown_format(session):
+    """Testa erro para formato desconhecido"""
+    with pytest.raises(ValueError):
+        load_stream(session, io.StringIO(""), "xml")
+
+
+def test_load_stream_invalidates_caches_when_a_chunk_fails(session, monkeypatch):
+    """Testa que, se um bloco falha, os caches são invalidados pelos blocos já confirmados"""
+    # Arrange
+    from app.services import bulk_ingest_service
+    content = CSV_HEADER + "".join(_csv_line() for _ in range(200))
+    load_rows = bulk_ingest_service.load_rows
+    calls, invalidations = [], []
+
+    def fail_second_chunk(session, rows):
+        calls.append(len(rows))
+        if len(calls) == 2:
+            raise RuntimeError("banco indisponível")
+        load_rows(session, rows)
+
+    monkeypatch.setattr(bulk_ingest_service, "load_rows", fail_second_chunk)
+    monkeypatch.setattr(bulk_ingest_service, "invalidate_data_caches", lambda: invalidations.append("data"))
+    monkeypatch.setattr(bulk_ingest_service, "invalidate_driver_profiles", lambda cpfs: invalidations.append(cpfs))
+
+    # Act
+    with pytest.raises(RuntimeError):
+        load_stream(session, io.StringIO(content), "csv", chunk_size=100)
+
+    # Assert
+    assert len(session.exec(select(FuelCollection)).all()) == 100
+    assert invalidations == ["data", {"12345678901"}]
@@ -0,0 +1,469 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from fastapi.encoders import jsonable_encoder
+from app.cache import (
+    GENERATION_KEY_PREFIX,
+    RECOMPUTE_LOCK_PREFIX,
+    async_cached,
+    cache_namespace,
+    cached,
+    cached_response,
+    encode_response,
+    invalidate_cache,
+    served_stale,
+    invalidate_data_caches,
+    invalidate_entries,
+    invalidate_namespace,
+    local_cache,
+    wait_background_refreshes,
+    wait_background_refreshes_async,
+)
+
+
+def _counting_function(prefix: str):
+    """Cria uma função cacheada que conta quantas vezes foi executada"""
+    calls = []
+    
+    @cached(prefix, ttl=60)
+    def compute(value):
+        calls.append(value)
+        return {"value": value, "calls": len(calls)}
+    
+    return compute, calls
+
+
+def test_cache_namespace():
+    """Testa a extração do namespace a partir do prefixo"""
+    assert cache_namespace("kpi:avg_price") == "kpi"
+    assert cache_namespace("count:collections") == "count"
+    assert cache_namespace("report") == "report"
+
+
+def test_cached_hit_uses_generation_key(fake_redis):
+    """Testa que a segunda chamada vem do cache e a chave embute a geração"""
+    # Arrange
+    compute, calls = _counting_function("kpi:test")
+    
+    # Act
+    first = compute(1)
+    second = compute(1)
+    
+    # Assert
+    assert first == second == {"value": 1, "calls": 1}
+    assert calls == [1]
+    generation = fake_redis.data[f"{GENERATION_KEY_PREFIX}kpi"]
+    assert f"kpi:test:g{generation}:1" in fake_redis.data
+
+
+def test_invalidate_namespace_is_single_incr(fake_redis):
+    """Testa que invalidar um namespace é um INCR, sem varrer nem apagar chaves"""
+    # Arrange
+    compute, calls = _counting_function("kpi:test")
+    for value in range(50):
+        compute(value)
+    
+    # Act
+    invalidate_namespace("kpi")
+    compute(0)
+    
+    # Assert
+    assert fake_redis.calls["incr"] == 1
+    assert "scan" not in fake_redis.calls
+    assert "unlink" not in fake_redis.calls
+    assert calls.count(0) == 2
+
+
+def test_invalidate_data_caches_keeps_other_namespaces(fake_redis):
+    """Testa que a ingestão invalida KPIs e contagens, mas não outros namespaces"""
+    # Arrange
+    kpi, kpi_calls = _counting_function("kpi:test")
+    other, other_calls = _counting_function("report:test")
+    kpi(1)
+    other(1)
+    
+    # Act
+    invalidate_data_caches()
+    kpi(1)
+    other(1)
+    
+    # Assert
+    assert kpi_calls == [1, 1]
+    assert other_calls == [1]
+
+
+def test_invalidate_entries_keeps_other_keys(fake_redis):
+    """Testa que invalidar entradas específicas não afeta as demais do namespace"""
+    # Arrange
+    compute, calls = _counting_function("driver:test")
+    compute(1)
+    compute(2)
+    
+    # Act
+    removed = invalidate_entries("driver:test", [(1,)])
+    compute(1)
+    compute(2)
+    
+    # Assert
+    assert removed == 1
+    assert calls == [1, 2, 1]
+    assert "incr" not in fake_redis.calls
+    assert fake_redis.published == [("cache:invalidate", "driver:test:1")]
+
+
+def test_missing_generation_is_seeded(fake_redis, monkeypatch):
+    """Testa que uma geração perdida é recriada com nova semente, sem reler entradas antigas"""
+    # Arrange
+    monkeypatch.setattr("app.cache._initial_generation", iter([1000, 2000]).__next__)
+    compute, calls = _counting_function("kpi:test")
+    compute(1)
+    
+    # Act - geração removida (flush parcial, eviction), vista por outro worker
+    fake_redis.data.pop(f"{GENERATION_KEY_PREFIX}kpi")
+    local_cache.clear()
+    result = compute(1)
+    
+    # Assert
+    assert "kpi:test:g1000:1" in fake_redis.data
+    assert "kpi:test:g2000:1" in fake_redis.data
+    assert result["calls"] == 2
+
+
+def test_invalidate_cache_uses_scan_and_protects_queue(fake_redis):
+    """Testa a limpeza manual por padrão via SCAN, preservando a fila de ingestão"""
+    # Arrange
+    fake_redis.data.update({
+        "kpi:a": "1",
+        "kpi:b": "2",
+        "count:a": "3",
+        "ingest:stream": "fila",
+    })
+    
+    # Act
+    removed_kpi = invalidate_cache("kpi:*")
+    removed_all = invalidate_cache("*")
+    
+    # Assert
+    assert removed_kpi == 2
+    assert removed_all == 1
+    assert list(fake_redis.data) == ["ingest:stream"]
+
+
+def test_l1_hit_skips_redis(fake_redis):
+    """Testa que acertos no L1 não fazem round trip ao Redis"""
+    # Arrange
+    compute, calls = _counting_function("kpi:test")
+    compute(1)
+    redis_gets = fake_redis.calls["get"]
+    
+    # Act
+    for _ in range(10):
+        compute(1)
+    
+    # Assert
+    assert fake_redis.calls["get"] == redis_gets
+    stats = local_cache.stats()["prefixes"]["kpi:test"]
+    assert stats["l1_hits"] == 10
+    assert stats["l2_misses"] == 1
+
+
+def test_l2_hit_fills_l1(fake_redis):
+    """Testa que um acerto no Redis (outro worker calculou) preenche o L1"""
+    # Arrange
+    compute, calls = _counting_function("kpi:test")
+    compute(1)
+    local_cache.clear()  # L1 vazio, como em outro worker
+    
+    # Act
+    compute(1)
+    compute(1)
+    
+    # Assert
+    assert calls == [1]
+    stats = local_cache.stats()["prefixes"]["kpi:test"]
+    assert stats["l2_hits"] == 1
+    assert stats["l1_hits"] == 1
+
+
+def test_invalidation_is_published_to_other_workers(fake_redis):
+    """Testa que a invalidação publica a mensagem para os demais workers"""
+    # Act
+    invalidate_data_caches()
+    
+    # Assert
+    assert fake_redis.published == [
+        ("cache:invalidate", "kpi:*"),
+        ("cache:invalidate", "count:*"),
+        ("cache:invalidate", "collections:*"),
+        ("cache:invalidate", "data:*"),
+    ]
+
+
+def _slow_function(prefix: str, delay: float = 0.2, stale_ttl: int = 0):
+    """Cria uma função cacheada lenta que registra cada execução"""
+    calls = []
+    
+    @cached(prefix, ttl=60, stale_ttl=stale_ttl)
+    def compute(value):
+        calls.append(value)
+        time.sleep(delay)
+        return {"value": value, "version": len(calls)}
+    
+    return compute, calls
+
+
+def _expire_entries(fake_redis, prefix: str):
+    """Marca as entradas do prefixo como expiradas logicamente (ainda no Redis)"""
+    for key, raw in list(fake_redis.data.items()):
+        if key.startswith(prefix):
+            entry = json.loads(raw)
+            entry["expires_at"] = time.time() - 1
+            fake_redis.data[key] = json.dumps(entry)
+    local_cache.clear()
+
+
+def test_concurrent_misses_run_function_once(fake_redis):
+    """Testa que N falhas simultâneas executam a função uma única vez"""
+    # Arrange
+    compute, calls = _slow_function("kpi:herd")
+    
+    # Act
+    with ThreadPoolExecutor(max_workers=20) as pool:
+        results = list(pool.map(lambda _: compute(1), range(20)))
+    
+    # Assert
+    assert calls == [1]
+    assert all(result == {"value": 1, "version": 1} for result in results)
+
+
+def test_waits_for_value_computed_by_other_worker(fake_redis):
+    """Testa que, com o lock de outro worker, a chamada espera o valor em vez de recalcular"""
+    # Arrange
+    compute, calls = _slow_function("kpi:worker")
+    compute(1)
+    generation = fake_redis.data[f"{GENERATION_KEY_PREFIX}kpi"]
+    key = f"kpi:worker:g{generation}:1"
+    fake_redis.data.pop(key)
+    local_cache.clear()
+    fake_redis.data[f"{RECOMPUTE_LOCK_PREFIX}{key}"] = "outro-worker"
+    
+    def other_worker():
+        time.sleep(0.1)
+        fake_redis.data[key] = json.dumps({"value": {"value": 1, "version": 99}, "expires_at": time.time() + 60, "delta": 0.2})
+    
+    # Act
+    thread = threading.Thread(target=other_worker)
+    thread.start()
+    result = compute(1)
+    thread.join()
+    
+    # Assert
+    assert calls == [1]
+    assert result["version"] == 99
+
+
+def test_stale_while_revalidate_after_expiration(fake_redis):
+    """Testa que, após a expiração, todas as chamadas recebem o valor antigo na hora e o recálculo roda em background"""
+    # Arrange
+    compute, calls = _slow_function("kpi:swr", stale_ttl=60)
+    compute(1)
+    _expire_entries(fake_redis, "kpi:swr")
+    
+    # Act
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        results = list(pool.map(lambda _: compute(1), range(10)))
+    elapsed = time.perf_counter() - start
+    wait_background_refreshes(timeout=5)
+    
+    # Assert
+    assert elapsed < 0.2  # Nenhuma chamada esperou o recálculo (0,2 s)
+    assert all(result["version"] == 1 for result in results)
+    assert calls == [1, 1]
+    assert compute(1)["version"] == 2
+
+
+def test_async_stale_value_is_refreshed_in_background(fake_redis):
+    """Testa que a versão assíncrona devolve o valor antigo e recalcula em uma task"""
+    # Arrange
+    calls = []
+    
+    @async_cached("kpi:async_swr", ttl=60, stale_ttl=60)
+    async def compute(value):
+        calls.append(value)
+        await asyncio.sleep(0.1)
+        return {"value": value, "version": len(calls)}
+    
+    async def scenario():
+        await compute(1)
+        _expire_entries(fake_redis, "kpi:async_swr")
+        stale = await asyncio.gather(*(compute(1) for _ in range(10)))
+        await wait_background_refreshes_async(timeout=5)
+        return stale, await compute(1)
+    
+    # Act
+    stale, fresh = asyncio.run(scenario())
+    
+    # Assert
+    assert all(result["version"] == 1 for result in stale)
+    assert calls == [1, 1]
+    assert fresh["version"] == 2
+
+
+def test_stale_while_revalidate_after_invalidation(fake_redis):
+    """Testa que, após uma ingestão, o valor da geração anterior é servido enquanto outro worker recalcula"""
+    # Arrange
+    compute, calls = _slow_function("kpi:swr_inv", stale_ttl=60)
+    compute(1)
+    invalidate_namespace("kpi")
+    generation = fake_redis.data[f"{GENERATION_KEY_PREFIX}kpi"]
+    fake_redis.data[f"{RECOMPUTE_LOCK_PREFIX}kpi:swr_inv:g{generation}:1"] = "outro-worker"
+    
+    # Act
+    result = compute(1)
+    wait_background_refreshes(timeout=5)
+    
+    # Assert
+    assert calls == [1]
+    assert result == {"value": 1, "version": 1}
+    assert served_stale()
+
+
+def test_without_stale_ttl_invalidation_recomputes(fake_redis):
+    """Testa que, sem stale_ttl, a geração anterior nunca é servida"""
+    # Arrange
+    compute, calls = _slow_function("kpi:fresh", delay=0)
+    compute(1)
+    
+    # Act
+    invalidate_namespace("kpi")
+    result = compute(1)
+    
+    # Assert
+    assert calls == [1, 1]
+    assert result["version"] == 2
+
+
+def test_probabilistic_early_expiration(fake_redis, monkeypatch):
+    """Testa o recálculo antecipado perto da expiração (XFetch)"""
+    # Arrange
+    compute, calls = _slow_function("kpi:early", delay=0)
+    compute(1)
+    for key, raw in list(fake_redis.data.items()):
+        if key.startswith("kpi:early"):
+            entry = json.loads(raw)
+            entry["expires_at"] = time.time() + 1
+            entry["delta"] = 0.5
+            fake_redis.data[key] = json.dumps(entry)
+    
+    # Act - sorteio desfavorável: 1 - random() ~ 0, log muito negativo
+    local_cache.clear()
+    monkeypatch.setattr("app.cache.random.random", lambda: 0.999999)
+    compute(1)
+    wait_background_refreshes(timeout=5)
+    # Desativada (beta = 0): não antecipa
+    local_cache.clear()
+    monkeypatch.setattr("app.cache.EARLY_EXPIRATION_BETA", 0.0)
+    compute(1)
+    
+    # Assert
+    assert calls == [1, 1]
+
+
+def test_async_concurrent_misses_run_function_once(fake_redis):
+    """Testa o single-flight da versão assíncrona"""
+    # Arrange
+    calls = []
+    
+    @async_cached("kpi:async_herd", ttl=60)
+    async def compute(value):
+        calls.append(value)
+        await asyncio.sleep(0.1)
+        return {"value": value}
+    
+    async def fire():
+        return await asyncio.gather(*(compute(1) for _ in range(20)))
+    
+    # Act
+    results = asyncio.run(fire())
+    
+    # Assert
+    assert calls == [1]
+    assert all(result == {"value": 1} for result in results)
+
+
+def test_encode_response_matches_fastapi_serialization(session, create_sample_collections):
+    """Testa que o corpo pré-serializado é o mesmo JSON que o FastAPI geraria"""
+    # Arrange
+    from app.services.collection_service import get_collections
+    result = get_collections(session, page_size=3)
+    
+    # Act
+    body = encode_response(result)
+    
+    # Assert
+    assert isinstance(body, bytes)
+    assert json.loads(body) == jsonable_encoder(result)
+
+
+def test_response_mode_stores_and_returns_body(fake_redis):
+    """Testa que o modo de resposta guarda o corpo JSON pronto e o devolve sem parse"""
+    # Arrange
+    calls = []
+    
+    @cached("kpi:body", ttl=60, response=True)
+    def compute(value):
+        calls.append(value)
+        return [{"value": value, "at": datetime(2024, 1, 15, 10, 30)}]
+    
+    # Act
+    first = compute(1)
+    local_cache.clear()
+    second = compute(1)
+    
+    # Assert
+    assert calls == [1]
+    assert first == second == b'[{"value":1,"at":"2024-01-15T10:30:00"}]'
+    entry = next(raw for key, raw in fake_redis.data.items() if key.startswith("kpi:body"))
+    assert entry.startswith("raw:")
+    assert entry.endswith(first.decode())
+
+
+def test_response_mode_without_redis_still_returns_body(monkeypatch):
+    """Testa que, sem Redis, o modo de resposta continua devolvendo bytes"""
+    # Arrange
+    import redis
+    
+    def unavailable():
+        raise redis.ConnectionError("indisponível")
+    
+    monkeypatch.setattr("app.cache.get_redis_client", unavailable)
+    
+    @cached("kpi:offline", ttl=60, response=True)
+    def compute():
+        return {"ok": True}
+    
+    # Act
+    result = compute()
+    
+    # Assert
+    assert result == b'{"ok":true}'
+
+
+def test_cached_response_wraps_original_function(fake_redis):
+    """Testa que a variante de resposta cacheia os bytes sem passar pelo cache da função original"""
+    # Arrange
+    compute, calls = _counting_function("kpi:variant")
+    compute_json = cached_response(compute, "kpi:variant_json", ttl=60)
+    
+    # Act
+    first = compute_json(1)
+    second = compute_json(1)
+    
+    # Assert
+    assert first == second == b'{"value":1,"calls":1}'
+    assert calls == [1]
+    assert not any(key.startswith("kpi:variant:") for key in fake_redis.data)
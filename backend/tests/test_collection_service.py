@@ -109,3 +109,134 @@ def test_get_collections_cpf_masked(session, create_sample_collections):
     for item in result.data:
         assert "***" in item.driver_cpf_masked
         assert len(item.driver_cpf_masked) == 14  # XXX.***.***.XX
+
+
+@pytest.fixture
+def dated_collections(session):
+    """Cria 7 coletas com datas repetidas para testar o desempate por id"""
+    from datetime import datetime
+    from app.models import FuelCollection
+    
+    dates = [datetime(2024, 1, day) for day in (1, 2, 2, 3, 3, 3, 4)]
+    for i, collection_date in enumerate(dates):
+        session.add(FuelCollection(
+            store_id="12345678000190",
+            store_name="Posto A",
+            city="São Paulo",
+            state="SP",
+            collection_date=collection_date,
+            fuel_type="Gasolina",
+            sale_price=6.00 + i,
+            volume_sold=50.0,
+            driver_name="João Silva",
+            driver_cpf="12345678901",
+            vehicle_plate="ABC1234",
+            vehicle_type="Carro"
+        ))
+    session.commit()
+
+
+def test_get_collections_cursor_walks_all_pages(session, dated_collections):
+    """Testa navegação completa por cursor, sem repetições nem lacunas"""
+    # Act
+    first = get_collections(session, page_size=3)
+    second = get_collections(session, page_size=3, cursor=first.next_cursor)
+    third = get_collections(session, page_size=3, cursor=second.next_cursor)
+    
+    # Assert
+    keys = [(item.collection_date, item.id) for page in (first, second, third) for item in page.data]
+    assert len(keys) == 7
+    assert keys == sorted(keys, reverse=True)
+    assert second.page is None
+    assert third.next_cursor is None
+    assert second.prev_cursor is not None
+
+
+def test_get_collections_cursor_prev_returns_previous_page(session, dated_collections):
+    """Testa voltar uma página com prev_cursor"""
+    # Arrange
+    first = get_collections(session, page_size=3)
+    second = get_collections(session, page_size=3, cursor=first.next_cursor)
+    
+    # Act
+    back = get_collections(session, page_size=3, cursor=second.prev_cursor)
+    
+    # Assert
+    assert [item.id for item in back.data] == [item.id for item in first.data]
+    assert back.prev_cursor is None  # Já é a primeira página
+    assert back.next_cursor is not None
+
+
+def test_get_collections_cursor_matches_offset_pages(session, dated_collections):
+    """Testa que o keyset devolve a mesma sequência da paginação por número"""
+    # Act
+    by_page = get_collections(session, page=2, page_size=3)
+    by_cursor = get_collections(session, page_size=3, cursor=get_collections(session, page_size=3).next_cursor)
+    
+    # Assert
+    assert [item.id for item in by_cursor.data] == [item.id for item in by_page.data]
+
+
+def test_get_collections_without_total(session, dated_collections):
+    """Testa que include_total=false omite a contagem"""
+    # Act
+    result = get_collections(session, page_size=3, include_total=False)
+    
+    # Assert
+    assert result.total is None
+    assert len(result.data) == 3
+
+
+def test_get_collections_invalid_cursor(session):
+    """Testa erro 400 para cursor inválido"""
+    from fastapi import HTTPException
+    
+    # Act & Assert
+    with pytest.raises(HTTPException) as exc_info:
+        get_collections(session, cursor="nao-e-um-cursor")
+    
+    assert exc_info.value.status_code == 400
+
+
+def test_get_collections_total_from_summaries(session, create_sample_collections):
+    """Testa totais exatos lidos dos agregados (sem COUNT sobre a tabela)"""
+    # Act
+    unfiltered = get_collections(session, page_size=1)
+    by_fuel = get_collections(session, page_size=1, fuel_type="Etanol")
+    by_vehicle = get_collections(session, page_size=1, vehicle_type="Avião")
+    
+    # Assert
+    assert (unfiltered.total, unfiltered.total_is_exact) == (3, True)
+    assert by_fuel.total == 1
+    assert by_vehicle.total == 0
+
+
+def test_get_collections_total_with_combined_filters(session, create_sample_collections):
+    """Testa contagem exata para filtros não cobertos pelos agregados"""
+    # Act
+    result = get_collections(session, page_size=1, fuel_type="Gasolina", city="  São Paulo ")
+    
+    # Assert
+    assert result.total == 1
+    assert result.total_is_exact is True
+
+
+def test_get_collections_estimate_falls_back_to_exact(session, create_sample_collections):
+    """Testa que o modo estimate usa contagem exata fora do PostgreSQL"""
+    # Act
+    result = get_collections(session, page_size=1, city="Rio", count_mode="estimate")
+    
+    # Assert
+    assert result.total == 1
+    assert result.total_is_exact is True
+
+
+def test_normalize_filters():
+    """Testa a normalização dos filtros usada na chave de cache"""
+    from app.services.count_service import normalize_filters
+    
+    # Act
+    filters = normalize_filters(fuel_type=" Gasolina ", city="  Recife ", vehicle_type="")
+    
+    # Assert
+    assert filters == {"fuel_type": "Gasolina", "city": "recife", "vehicle_type": None}
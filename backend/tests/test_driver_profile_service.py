@@ -0,0 +1,190 @@
+import pytest
+from datetime import date, datetime, timedelta
+from sqlalchemy import event, select as sql_select
+from app.archive import archive_collections
+from app.models import DriverProfile, FuelCollection
+from app.partitions import apply_retention
+from app.schemas.fuel_collection import FUEL_TYPES, VEHICLE_TYPES
+from app.services.bulk_ingest_service import load_rows
+from app.services.driver_profile_service import rebuild_driver_profiles
+from app.services.ingest_service import create_fuel_collections_batch, insert_collections
+from app.services.report_service import get_driver_report
+
+SUMMARY_FIELDS = [
+    "driver_name", "driver_cpf_masked", "total_refuels", "total_spent", "total_volume",
+    "favorite_fuel", "first_refuel", "last_refuel",
+]
+
+
+def _summary(report) -> dict:
+    return {field: getattr(report, field) for field in SUMMARY_FIELDS}
+
+
+def _scan_summary(session, cpf: str) -> dict:
+    """Resumo calculado sobre as coletas (com período, o relatório não usa o perfil)"""
+    return _summary(get_driver_report(cpf, session, start_date=datetime(2000, 1, 1)))
+
+
+def _profiles(session) -> list[tuple]:
+    table = DriverProfile.__table__
+    return [tuple(row) for row in session.exec(sql_select(table).order_by(table.c.driver_cpf)).all()]
+
+
+class _Statements:
+    """Captura os comandos SQL executados no engine"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.executed = []
+
+    def _capture(self, conn, cursor, statement, parameters, context, executemany):
+        self.executed.append(statement)
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._capture)
+        return self.executed
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._capture)
+
+
+@pytest.fixture
+def dated_collections(session, sample_collection_data):
+    """30 coletas de janeiro a março de 2024; o CPF 3 só abastece em janeiro"""
+    for i in range(30):
+        cpf = f"{i % 3 + 1:011d}" if i < 10 else f"{i % 2 + 1:011d}"
+        session.add(FuelCollection(**{
+            **sample_collection_data,
+            "collection_date": datetime(2024, 1, 1, 8) + timedelta(days=3 * i),
+            "fuel_type": FUEL_TYPES[i % 3],
+            "sale_price": 5.0 + i / 10,
+            "volume_sold": 10.0 + i,
+            "driver_name": f"Motorista {cpf[-1]}",
+            "driver_cpf": cpf,
+        }))
+    session.commit()
+    return session
+
+
+def test_profile_matches_scan_for_all_ingest_paths(session, sample_collection_data):
+    """Testa que ORM, INSERT em lote e carga em massa mantêm o perfil igual ao cálculo completo"""
+    # Arrange
+    session.add(FuelCollection(**sample_collection_data, collection_date=datetime(2024, 1, 5)))
+    session.commit()
+    insert_collections(session, [
+        {**sample_collection_data, "fuel_type": "Etanol", "collection_date": datetime(2024, 1, 2)},
+        {**sample_collection_data, "driver_cpf": "98765432100", "driver_name": "Maria"},
+    ])
+    session.commit()
+
+    # Act
+    load_rows(session, [
+        (
+            "12345678000190", "Posto", "Campinas", "SP", FUEL_TYPES[i % 3], f"João {i}",
+            "12345678901" if i % 2 else "98765432100", "ABC1234", VEHICLE_TYPES[0],
+            5.0 + i / 10, 10.0 + i, datetime(2024, 2, 1) + timedelta(hours=i),
+        )
+        for i in range(12)
+    ])
+    session.commit()
+
+    # Assert
+    for cpf in ("12345678901", "98765432100"):
+        assert _summary(get_driver_report(cpf, session)) == _scan_summary(session, cpf)
+    assert get_driver_report("12345678901", session).total_refuels == 8
+
+
+def test_latest_name_and_favorite_fuel(session, sample_collection_data):
+    """Testa que o nome é o da coleta mais recente e o favorito desempata pela data"""
+    # Arrange: a coleta mais antiga chega por último
+    for fuel_type, day, name in [
+        ("Gasolina", 2, "João"), ("Etanol", 3, "João"), ("Etanol", 5, "João S."),
+        ("Gasolina", 4, "João"), ("Diesel S10", 1, "Jão"),
+    ]:
+        session.add(FuelCollection(**{
+            **sample_collection_data,
+            "fuel_type": fuel_type,
+            "driver_name": name,
+            "collection_date": datetime(2024, 1, day),
+        }))
+        session.commit()
+
+    # Act
+    report = get_driver_report("12345678901", session)
+
+    # Assert
+    assert report.driver_name == "João S."
+    assert report.favorite_fuel == "Etanol"
+    assert report.first_refuel == datetime(2024, 1, 1)
+    assert report.last_refuel == datetime(2024, 1, 5)
+    assert _summary(report) == _scan_summary(session, "12345678901")
+
+
+def test_cpf_report_reads_profile_row(dated_collections):
+    """Testa que o resumo por CPF é uma leitura do perfil, sem agrupar as coletas"""
+    # Arrange
+    session = dated_collections
+
+    # Act
+    with _Statements(session.get_bind()) as executed:
+        report = get_driver_report("00000000001", session)
+
+    # Assert
+    assert report.total_refuels == 14
+    assert not [s for s in executed if "GROUP BY" in s]
+    assert len([s for s in executed if "FROM driver_profile" in s]) == 1
+
+
+def test_cached_summary_invalidated_only_for_ingested_cpf(dated_collections, sample_collection_data, fake_redis):
+    """Testa que a ingestão invalida só o resumo cacheado dos CPFs gravados"""
+    # Arrange
+    session = dated_collections
+    get_driver_report("00000000001", session)
+    get_driver_report("00000000002", session)
+
+    # Act
+    create_fuel_collections_batch([{**sample_collection_data, "driver_cpf": "00000000002"}], session)
+    with _Statements(session.get_bind()) as executed:
+        first = get_driver_report("00000000001", session)
+        second = get_driver_report("00000000002", session)
+
+    # Assert
+    assert len([s for s in executed if "FROM driver_profile" in s]) == 1
+    assert first.total_refuels == 14
+    assert second.total_refuels == 13 + 1
+    assert ("cache:invalidate", "driver:profile:00000000002") in fake_redis.published
+
+
+def test_retention_discounts_profiles(dated_collections):
+    """Testa que a retenção desconta os meses removidos dos perfis"""
+    # Arrange
+    session = dated_collections
+
+    # Act
+    apply_retention(session.get_bind(), keep_months=1, today=date(2024, 3, 15))
+    session.expire_all()
+
+    # Assert
+    for cpf in ("00000000001", "00000000002"):
+        assert _summary(get_driver_report(cpf, session)) == _scan_summary(session, cpf)
+    assert [row[0] for row in _profiles(session)] == ["00000000001", "00000000002"]
+
+
+def test_rebuild_matches_incremental_profiles(dated_collections, tmp_path, monkeypatch):
+    """Testa que o recálculo (migração 6) reproduz os perfis, inclusive com o arquivo frio"""
+    # Arrange
+    session = dated_collections
+    monkeypatch.setattr("app.archive.ARCHIVE_DIR", str(tmp_path))
+    archive_collections(session.get_bind(), date(2024, 2, 1))
+    session.expire_all()
+    expected = _profiles(session)
+
+    # Act
+    with session.get_bind().begin() as connection:
+        rebuild_driver_profiles(connection)
+
+    # Assert
+    actual = _profiles(session)
+    assert [row[:3] + row[5:] for row in actual] == [row[:3] + row[5:] for row in expected]
+    assert [row[3:5] for row in actual] == [pytest.approx(row[3:5]) for row in expected]
+    assert _summary(get_driver_report("00000000003", session)) == _scan_summary(session, "00000000003")
@@ -0,0 +1,131 @@
+import csv
+import gzip
+import io
+import json
+from datetime import datetime, timedelta
+import pyarrow.parquet as pq
+from app.models import FuelCollection
+from app.services.collection_service import filter_conditions
+from app.services.count_service import normalize_filters
+from app.services.export_service import (
+    EXPORT_COLUMNS,
+    export_collections,
+    export_file_name,
+    iter_export_batches,
+)
+
+
+def _create_collections(session, count: int):
+    """Cria `count` coletas com datas crescentes, alternando combustível"""
+    start = datetime(2024, 1, 1)
+    for i in range(count):
+        session.add(FuelCollection(
+            store_id="12345678000190",
+            store_name="Posto A",
+            city="São Paulo" if i % 2 else "Rio de Janeiro",
+            state="SP",
+            collection_date=start + timedelta(hours=i),
+            fuel_type="Gasolina" if i % 2 else "Etanol",
+            sale_price=5.0,
+            volume_sold=10.0 + i,
+            driver_name="João Silva",
+            driver_cpf="12345678901",
+            vehicle_plate="ABC1234",
+            vehicle_type="Carro"
+        ))
+    session.commit()
+
+
+def _conditions(session, **filters):
+    start_date = filters.pop("start_date", None)
+    end_date = filters.pop("end_date", None)
+    return filter_conditions(session.get_bind(), normalize_filters(**filters), start_date, end_date)
+
+
+def test_iter_export_batches_resumes_across_segments(session):
+    """Testa que a leitura em segmentos por keyset não repete nem perde linhas"""
+    # Arrange
+    _create_collections(session, 23)
+
+    # Act
+    batches = list(iter_export_batches(
+        session.get_bind(), _conditions(session), batch_size=4, segment_size=10
+    ))
+
+    # Assert
+    ids = [row[0] for batch in batches for row in batch]
+    assert len(ids) == 23
+    assert len(set(ids)) == 23
+    assert all(len(batch) <= 4 for batch in batches)
+    dates = [row[EXPORT_COLUMNS.index("collection_date")] for batch in batches for row in batch]
+    assert dates == sorted(dates)
+
+
+def test_export_csv_with_filters(session):
+    """Testa exportação CSV com filtro de combustível e período"""
+    # Arrange
+    _create_collections(session, 20)
+    conditions = _conditions(
+        session, fuel_type="Gasolina", start_date=datetime(2024, 1, 1, 5), end_date=datetime(2024, 1, 1, 14)
+    )
+
+    # Act
+    content = b"".join(export_collections(session.get_bind(), conditions, file_format="csv"))
+
+    # Assert
+    rows = list(csv.DictReader(io.StringIO(content.decode())))
+    assert [int(r["volume_sold"].split(".")[0]) - 10 for r in rows] == [5, 7, 9, 11, 13]
+    assert all(r["fuel_type"] == "Gasolina" for r in rows)
+    assert rows[0]["collection_date"] == "2024-01-01T05:00:00"
+
+
+def test_export_ndjson_gzip(session):
+    """Testa exportação NDJSON comprimida em gzip"""
+    # Arrange
+    _create_collections(session, 5)
+
+    # Act
+    content = b"".join(export_collections(
+        session.get_bind(), _conditions(session, city="sao paulo"), file_format="ndjson", gzip=True
+    ))
+
+    # Assert
+    records = [json.loads(line) for line in gzip.decompress(content).decode().splitlines()]
+    assert len(records) == 2
+    assert set(records[0].keys()) == set(EXPORT_COLUMNS)
+    assert records[0]["city"] == "São Paulo"
+
+
+def test_export_parquet(session):
+    """Testa exportação Parquet com vários row groups"""
+    # Arrange
+    _create_collections(session, 12)
+
+    # Act
+    content = b"".join(export_collections(
+        session.get_bind(), _conditions(session), file_format="parquet", batch_size=5
+    ))
+
+    # Assert
+    parquet_file = pq.ParquetFile(io.BytesIO(content))
+    table = parquet_file.read()
+    assert parquet_file.metadata.num_row_groups == 3
+    assert table.num_rows == 12
+    assert table.column_names == EXPORT_COLUMNS
+    assert table.column("volume_sold").to_pylist()[-1] == 21.0
+
+
+def test_export_empty_result(session):
+    """Testa exportação sem linhas (apenas o cabeçalho no CSV)"""
+    # Act
+    content = b"".join(export_collections(session.get_bind(), _conditions(session), file_format="csv"))
+
+    # Assert
+    assert content.decode().strip() == ",".join(EXPORT_COLUMNS)
+
+
+def test_export_file_name():
+    """Testa o nome sugerido do arquivo"""
+    now = datetime(2024, 3, 1, 12, 30)
+    assert export_file_name("csv", now=now) == "coletas_20240301123000.csv"
+    assert export_file_name("ndjson", gzip=True, now=now) == "coletas_20240301123000.ndjson.gz"
@@ -0,0 +1,140 @@
+import time
+import pytest
+import redis
+from email.utils import formatdate
+from fastapi import Depends, FastAPI, Response
+from fastapi.testclient import TestClient
+from typing import Optional
+
+from app.cache import get_data_version, invalidate_data_caches, local_cache
+from app.http_cache import DataVersion, _etag_matches, check_not_modified, conditional_headers
+
+
+@pytest.fixture(name="client")
+def client_fixture():
+    """Aplicação mínima com uma rota condicional que conta as execuções do handler"""
+    app = FastAPI()
+    app.state.calls = 0
+    
+    @app.get("/kpis")
+    def kpis(version: Optional[DataVersion] = Depends(check_not_modified)):
+        app.state.calls += 1
+        return Response(content=b"[]", media_type="application/json", headers=conditional_headers(version))
+    
+    return TestClient(app)
+
+
+def test_response_has_validators(fake_redis, client):
+    """Testa que a resposta traz ETag, Last-Modified e Cache-Control"""
+    # Arrange
+    invalidate_data_caches()
+    
+    # Act
+    response = client.get("/kpis")
+    
+    # Assert
+    assert response.status_code == 200
+    assert response.headers["etag"].startswith('W/"')
+    assert response.headers["cache-control"] == "no-cache"
+    assert "last-modified" in response.headers
+
+
+def test_if_none_match_returns_304_without_running_handler(fake_redis, client):
+    """Testa que a versão atual no If-None-Match responde 304 sem executar o handler"""
+    # Arrange
+    etag = client.get("/kpis").headers["etag"]
+    
+    # Act
+    response = client.get("/kpis", headers={"If-None-Match": etag})
+    
+    # Assert
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+    assert client.app.state.calls == 1
+
+
+def test_ingest_changes_etag(fake_redis, client):
+    """Testa que uma ingestão muda a versão e o cliente volta a receber 200"""
+    # Arrange
+    etag = client.get("/kpis").headers["etag"]
+    
+    # Act
+    invalidate_data_caches()
+    response = client.get("/kpis", headers={"If-None-Match": etag})
+    
+    # Assert
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+
+def test_if_modified_since(fake_redis, client):
+    """Testa If-Modified-Since contra o instante da última ingestão"""
+    # Arrange
+    invalidate_data_caches()
+    
+    # Act
+    future = client.get("/kpis", headers={"If-Modified-Since": formatdate(time.time() + 60, usegmt=True)})
+    past = client.get("/kpis", headers={"If-Modified-Since": formatdate(time.time() - 3600, usegmt=True)})
+    
+    # Assert
+    assert future.status_code == 304
+    assert past.status_code == 200
+
+
+def test_data_version_is_read_from_local_cache(fake_redis):
+    """Testa que a versão fica no L1 até a próxima ingestão"""
+    # Arrange
+    first = get_data_version()
+    calls = fake_redis.calls.copy()
+    
+    # Act
+    second = get_data_version()
+    invalidate_data_caches()
+    third = get_data_version()
+    
+    # Assert
+    assert first == second
+    assert fake_redis.calls.get("get", 0) >= calls.get("get", 0)
+    assert int(third[0]) == int(first[0]) + 1
+    assert local_cache.stats()["prefixes"]["data:version"]["l1_hits"] == 1
+
+
+def test_without_redis_no_validators(monkeypatch, client):
+    """Testa que, sem Redis, a rota responde normalmente e sem validadores"""
+    # Arrange
+    def unavailable():
+        raise redis.ConnectionError("indisponível")
+    
+    monkeypatch.setattr("app.cache.get_redis_client", unavailable)
+    
+    # Act
+    response = client.get("/kpis", headers={"If-None-Match": "*"})
+    
+    # Assert
+    assert response.status_code == 200
+    assert "etag" not in response.headers
+
+
+def test_stale_response_has_no_validators(monkeypatch):
+    """Testa que um valor antigo servido pelo cache não recebe o ETag da versão atual"""
+    # Arrange
+    monkeypatch.setattr("app.http_cache.served_stale", lambda: True)
+    
+    # Act
+    headers = conditional_headers(DataVersion("7", time.time()))
+    
+    # Assert
+    assert headers == {}
+
+
+@pytest.mark.parametrize("header,expected", [
+    ('W/"7"', True),
+    ('"7"', True),
+    ('W/"6", W/"7"', True),
+    ("*", True),
+    ('W/"6"', False),
+])
+def test_etag_matches(header, expected):
+    """Testa a comparação fraca do If-None-Match"""
+    assert _etag_matches(header, 'W/"7"') is expected
@@ -0,0 +1,163 @@
+import asyncio
+import threading
+import time
+import pytest
+from pydantic import ValidationError
+from sqlmodel import select
+from app.ingest_queue import SQLiteQueue, IngestFlusher, get_queue_metrics, flush_metrics
+from app.services.ingest_service import enqueue_fuel_collection, flush_ingest_queue
+from app.schemas import FuelCollectionCreate
+from app.models import FuelCollection, FuelFact
+
+
+@pytest.fixture
+def queue(tmp_path):
+    """Fila SQLite isolada por teste"""
+    return SQLiteQueue(str(tmp_path / "queue.db"))
+
+
+def test_enqueue_returns_tracking_id(queue, sample_collection_data):
+    """Testa que a coleta é enfileirada sem tocar o banco"""
+    # Act
+    accepted = enqueue_fuel_collection(FuelCollectionCreate(**sample_collection_data), queue)
+    
+    # Assert
+    assert accepted.status == "queued"
+    assert len(accepted.tracking_id) == 32
+    assert queue.depth() == 1
+
+
+def test_flush_ingest_queue_writes_batch(queue, session, sample_collection_data):
+    """Testa que o flush grava os itens em lote e esvazia a fila"""
+    # Arrange
+    for _ in range(5):
+        enqueue_fuel_collection(FuelCollectionCreate(**sample_collection_data), queue)
+    
+    # Act
+    first = flush_ingest_queue(queue, session, max_items=3)
+    second = flush_ingest_queue(queue, session, max_items=3)
+    third = flush_ingest_queue(queue, session, max_items=3)
+    
+    # Assert
+    assert (first, second, third) == (3, 2, 0)
+    assert queue.depth() == 0
+    rows = session.exec(select(FuelCollection)).all()
+    assert len(rows) == 5
+    assert all(row.driver_cpf == "12345678901" for row in rows)
+
+
+def test_flush_ingest_queue_releases_on_failure(queue, session, sample_collection_data):
+    """Testa que itens voltam para a fila quando a gravação falha"""
+    # Arrange
+    enqueue_fuel_collection(FuelCollectionCreate(**sample_collection_data), queue)
+    FuelFact.__table__.drop(session.get_bind())
+    
+    # Act & Assert
+    with pytest.raises(Exception):
+        flush_ingest_queue(queue, session)
+    
+    assert queue.depth() == 1
+    assert len(queue.read_batch(10, 0)) == 1
+
+
+def test_poison_item_goes_to_dead_letter(queue, session, sample_collection_data):
+    """Testa que um item recusado pelo banco vai para a fila de mortos sem travar os demais"""
+    # Arrange: payload fora do schema (preço nulo viola o NOT NULL)
+    enqueue_fuel_collection(FuelCollectionCreate(**sample_collection_data), queue)
+    queue.enqueue({**sample_collection_data, "sale_price": None, "collection_date": "2024-01-01T10:00:00"})
+    enqueue_fuel_collection(FuelCollectionCreate(**sample_collection_data), queue)
+    queue.enqueue({**sample_collection_data})  # sem collection_date: ilegível
+    
+    # Act
+    flushed = flush_ingest_queue(queue, session)
+    
+    # Assert
+    assert flushed == 2
+    assert queue.depth() == 0
+    assert queue.dead_letter_depth() == 2
+    assert len(session.exec(select(FuelCollection)).all()) == 2
+    assert get_queue_metrics(queue)["dead_letter"] == 2
+
+
+def test_stale_claim_is_redelivered(tmp_path, sample_collection_data):
+    """Testa que itens lidos por um worker que caiu voltam a ser entregues após o prazo"""
+    # Arrange
+    path = str(tmp_path / "queue.db")
+    crashed = SQLiteQueue(path, claim_idle_seconds=0.05)
+    enqueue_fuel_collection(FuelCollectionCreate(**sample_collection_data), crashed)
+    assert len(crashed.read_batch(10, 0)) == 1
+    restarted = SQLiteQueue(path, claim_idle_seconds=0.05)
+    
+    # Act
+    before_timeout = restarted.read_batch(10, 0)
+    time.sleep(0.1)
+    after_timeout = restarted.read_batch(10, 0)
+    
+    # Assert
+    assert before_timeout == []
+    assert [entry.deliveries for entry in after_timeout] == [2]
+
+
+def test_empty_queue_read_waits_for_block_timeout(queue, sample_collection_data):
+    """Testa que a leitura da fila vazia espera até o timeout e devolve itens que chegam"""
+    # Arrange
+    timer = threading.Timer(0.1, enqueue_fuel_collection, (FuelCollectionCreate(**sample_collection_data), queue))
+
+    # Act
+    started = time.monotonic()
+    empty = queue.read_batch(10, 0.2)
+    waited = time.monotonic() - started
+    timer.start()
+    arrived = queue.read_batch(10, 2)
+    timer.join()
+
+    # Assert
+    assert empty == [] and waited >= 0.2
+    assert len(arrived) == 1
+
+
+def test_schema_enforces_column_lengths(sample_collection_data):
+    """Testa que a validação recusa valores maiores que as colunas do banco"""
+    # Act & Assert
+    for field, value in (("store_id", "1" * 51), ("vehicle_plate", "ABC12345678")):
+        with pytest.raises(ValidationError):
+            FuelCollectionCreate(**{**sample_collection_data, field: value})
+
+
+def test_queue_metrics_report_depth_and_lag(queue, session, sample_collection_data):
+    """Testa as métricas de profundidade, atraso e latência"""
+    # Arrange
+    enqueue_fuel_collection(FuelCollectionCreate(**sample_collection_data), queue)
+    batches_before = flush_metrics["batches"]
+    
+    # Act
+    pending = get_queue_metrics(queue)
+    flush_ingest_queue(queue, session)
+    drained = get_queue_metrics(queue)
+    
+    # Assert
+    assert pending["depth"] == 1
+    assert pending["lag_seconds"] >= 0
+    assert drained["depth"] == 0
+    assert drained["lag_seconds"] == 0.0
+    assert drained["batches"] == batches_before + 1
+
+
+def test_flusher_drains_queue_on_stop(queue, session, sample_collection_data):
+    """Testa o worker em background iniciado/parado como no lifespan"""
+    # Arrange
+    for _ in range(3):
+        enqueue_fuel_collection(FuelCollectionCreate(**sample_collection_data), queue)
+    
+    async def run():
+        flusher = IngestFlusher(lambda: flush_ingest_queue(queue, session, block_seconds=0), interval_seconds=0.01)
+        flusher.start()
+        await asyncio.sleep(0.05)
+        await flusher.stop()
+    
+    # Act
+    asyncio.run(run())
+    
+    # Assert
+    assert queue.depth() == 0
+    assert len(session.exec(select(FuelCollection)).all()) == 3
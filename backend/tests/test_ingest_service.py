@@ -1,5 +1,5 @@
 import pytest
-from app.services.ingest_service import create_fuel_collection
+from app.services.ingest_service import create_fuel_collection, create_fuel_collections_batch
 from app.schemas import FuelCollectionCreate
 from app.models import FuelCollection
 from fastapi import HTTPException
@@ -89,3 +89,60 @@ def test_create_fuel_collection_negative_price(session):
     # Act & Assert
     with pytest.raises(Exception):  # Pydantic ValidationError
         FuelCollectionCreate(**invalid_data)
+
+
+def test_create_fuel_collection_infinite_volume(sample_collection_data):
+    """Testa que volume infinito é recusado (ge=0 não o barra)"""
+    # Act & Assert
+    with pytest.raises(Exception):  # Pydantic ValidationError
+        FuelCollectionCreate(**{**sample_collection_data, "volume_sold": float("inf")})
+
+
+def test_create_fuel_collections_batch_success(session, sample_collection_data):
+    """Testa inserção de um lote com todos os itens válidos"""
+    # Arrange
+    second = {**sample_collection_data, "driver_cpf": "98765432109", "fuel_type": "Etanol"}
+    
+    # Act
+    result = create_fuel_collections_batch([sample_collection_data, second], session)
+    
+    # Assert
+    assert result.received == 2
+    assert result.inserted == 2
+    assert result.rejected == 0
+    assert all(item.id is not None for item in result.data)
+    assert all(item.collection_date is not None for item in result.data)
+    assert result.data[1].fuel_type == "Etanol"
+    assert session.get(FuelCollection, result.data[1].id).driver_cpf == "98765432109"
+
+
+def test_create_fuel_collections_batch_partial_errors(session, sample_collection_data):
+    """Testa que itens inválidos não abortam a inserção dos válidos"""
+    # Arrange
+    invalid_cpf = {**sample_collection_data, "driver_cpf": "123"}
+    invalid_fuel = {**sample_collection_data, "fuel_type": "GNV"}
+    
+    # Act
+    result = create_fuel_collections_batch(
+        [invalid_cpf, sample_collection_data, invalid_fuel], session
+    )
+    
+    # Assert
+    assert result.inserted == 1
+    assert result.rejected == 2
+    assert [error.index for error in result.errors] == [0, 2]
+    assert result.errors[1].errors[0]["loc"] == ["fuel_type"]
+    assert session.get(FuelCollection, result.data[0].id) is not None
+
+
+def test_create_fuel_collections_batch_too_large(session, sample_collection_data):
+    """Testa rejeição de lotes acima do limite"""
+    # Arrange
+    from app.services import ingest_service
+    payloads = [sample_collection_data] * (ingest_service.MAX_BATCH_SIZE + 1)
+    
+    # Act & Assert
+    with pytest.raises(HTTPException) as exc_info:
+        create_fuel_collections_batch(payloads, session)
+    
+    assert exc_info.value.status_code == 413
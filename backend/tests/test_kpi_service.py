@@ -1,5 +1,10 @@
+import json
 import pytest
-from app.services.kpi_service import get_avg_price_by_fuel, get_volume_by_vehicle
+from datetime import date, datetime
+from fastapi import HTTPException
+from app.models import FuelCollection
+from app.services.kpi_service import get_avg_price_by_fuel, get_volume_by_vehicle, get_timeseries
+from app.services.kpi_service import get_avg_price_by_fuel_json, get_volume_by_vehicle_json, get_timeseries_json
 
 
 def test_get_avg_price_by_fuel_empty_database(session):
@@ -132,3 +137,103 @@ def test_get_volume_by_vehicle_ordering(session, create_sample_collections):
     # Assert
     volumes = [item.total_volume for item in result]
     assert volumes == sorted(volumes, reverse=True)  # Deve estar em ordem decrescente
+
+
+def test_json_variants_match_models(session, create_sample_collections):
+    """Testa que as versões pré-serializadas produzem o mesmo conteúdo dos modelos"""
+    # Act
+    avg_price = json.loads(get_avg_price_by_fuel_json(session))
+    volume = json.loads(get_volume_by_vehicle_json(session))
+    
+    # Assert
+    assert avg_price == [item.model_dump() for item in get_avg_price_by_fuel(session)]
+    assert volume == [item.model_dump() for item in get_volume_by_vehicle(session)]
+
+
+@pytest.fixture
+def timeseries_collections(session, sample_collection_data):
+    """Coletas em dias e meses diferentes, em dois estados"""
+    rows = [
+        (datetime(2024, 1, 15, 10), "Gasolina", "SP", "São Paulo", 6.00, 40.0),
+        (datetime(2024, 1, 15, 18), "Gasolina", "SP", "São Paulo", 5.00, 60.0),
+        (datetime(2024, 1, 16, 9), "Etanol", "SP", "Campinas", 4.00, 30.0),
+        (datetime(2024, 2, 3, 12), "Gasolina", "RJ", "Niterói", 6.50, 20.0),
+    ]
+    for collection_date, fuel_type, state, city, price, volume in rows:
+        session.add(FuelCollection(**{
+            **sample_collection_data,
+            "collection_date": collection_date,
+            "fuel_type": fuel_type,
+            "state": state,
+            "city": city,
+            "sale_price": price,
+            "volume_sold": volume,
+        }))
+    session.commit()
+
+
+def test_timeseries_daily_totals(session, timeseries_collections):
+    """Testa a série diária sem agrupamento"""
+    # Act
+    result = get_timeseries(session, start=date(2024, 1, 1), end=date(2024, 1, 31))
+    
+    # Assert
+    assert [(p.bucket, p.total_records) for p in result] == [(date(2024, 1, 15), 2), (date(2024, 1, 16), 1)]
+    assert result[0].avg_price == 5.50
+    assert result[0].total_volume == 100.0
+    assert result[0].fuel_type is None
+
+
+def test_timeseries_monthly_grouped_and_filtered(session, timeseries_collections):
+    """Testa a série mensal agrupada por estado e filtrada por combustível"""
+    # Act
+    result = get_timeseries(
+        session, start=date(2024, 1, 20), end=date(2024, 2, 28),
+        granularity="month", group_by=["state"], fuel_type="Gasolina"
+    )
+    
+    # Assert - o mês que contém start é incluído por inteiro
+    assert [(p.bucket, p.state, p.total_records, p.avg_price) for p in result] == [
+        (date(2024, 1, 1), "SP", 2, 5.50),
+        (date(2024, 2, 1), "RJ", 1, 6.50),
+    ]
+
+
+def test_timeseries_weekly(session, timeseries_collections):
+    """Testa a série semanal agrupada por combustível"""
+    # Act
+    result = get_timeseries(
+        session, start=date(2024, 1, 1), end=date(2024, 2, 29),
+        granularity="week", group_by=["fuel_type"]
+    )
+    
+    # Assert
+    assert [(p.bucket, p.fuel_type, p.total_records) for p in result] == [
+        (date(2024, 1, 15), "Etanol", 1),
+        (date(2024, 1, 15), "Gasolina", 2),
+        (date(2024, 1, 29), "Gasolina", 1),
+    ]
+
+
+def test_timeseries_rejects_invalid_ranges(session):
+    """Testa a validação do intervalo"""
+    # Act & Assert
+    with pytest.raises(HTTPException) as inverted:
+        get_timeseries(session, start=date(2024, 2, 1), end=date(2024, 1, 1))
+    with pytest.raises(HTTPException) as too_long:
+        get_timeseries(session, start=date(2000, 1, 1), end=date(2024, 1, 1))
+    
+    assert inverted.value.status_code == 400
+    assert too_long.value.status_code == 400
+
+
+def test_timeseries_json_matches_models(session, timeseries_collections):
+    """Testa que a versão pré-serializada tem o mesmo conteúdo"""
+    # Arrange
+    params = {"start": date(2024, 1, 1), "end": date(2024, 2, 29), "granularity": "month", "group_by": ["city"]}
+    
+    # Act
+    body = json.loads(get_timeseries_json(session, **params))
+    
+    # Assert
+    assert body == [p.model_dump(mode="json") for p in get_timeseries(session, **params)]
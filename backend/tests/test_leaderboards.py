@@ -0,0 +1,166 @@
+import pytest
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from app.leaderboards import BOARDS, rebuild_leaderboards, record_collections, top, window_keys
+from app.schemas.fuel_collection import FUEL_TYPES, VEHICLE_TYPES
+from app.services.bulk_ingest_service import load_stream, LOAD_COLUMNS
+from app.services.ingest_service import create_fuel_collections_batch, insert_collections
+from app.services.leaderboard_service import get_leaderboard
+
+TODAY = datetime.utcnow().date()
+
+
+def _at(days_ago: int) -> datetime:
+    """Coleta às 8h de `days_ago` dias atrás (UTC)"""
+    return datetime.combine(TODAY - timedelta(days=days_ago), datetime.min.time()) + timedelta(hours=8)
+
+
+@pytest.fixture
+def recent_collections(session, sample_collection_data):
+    """40 coletas nos últimos 40 dias (a ingestão pela API data no recebimento)"""
+    rows = [
+        {
+            **sample_collection_data,
+            "store_id": f"{i % 4:014d}",
+            "store_name": f"Posto {i % 4}",
+            "fuel_type": FUEL_TYPES[i % 3],
+            "driver_cpf": f"{i % 3 + 1:011d}",
+            "driver_name": f"Motorista {i % 3 + 1}",
+            "vehicle_plate": f"ABC{i % 2:04d}",
+            "sale_price": 5.0 + i / 10,
+            "volume_sold": 10.0 + i,
+            "collection_date": _at(i),
+        }
+        for i in range(40)
+    ]
+    insert_collections(session, rows)
+    session.commit()
+    record_collections(rows)
+    return rows
+
+
+def _expected(rows, member: str, value, window_days: int, aggregate=sum) -> dict:
+    """Ranking calculado direto sobre as coletas da janela"""
+    values: dict[str, list] = {}
+    for row in rows:
+        if row["collection_date"].date() > TODAY - timedelta(days=window_days):
+            values.setdefault(row[member], []).append(value(row))
+    return {key: pytest.approx(aggregate(items)) for key, items in values.items()}
+
+
+def test_ingest_feeds_windows(recent_collections):
+    """Testa que a ingestão alimenta os rankings e as janelas juntam os dias"""
+    # Arrange
+    rows = recent_collections
+
+    # Act
+    spend = {window: dict(top("drivers-spend", window, 10)) for window in ("today", "7d", "30d")}
+    volume = top("vehicles-volume", "30d", 10)
+
+    # Assert
+    for window, days in (("today", 1), ("7d", 7), ("30d", 30)):
+        assert spend[window] == _expected(rows, "driver_cpf", lambda r: r["sale_price"] * r["volume_sold"], days)
+    assert dict(volume) == _expected(rows, "vehicle_plate", lambda r: r["volume_sold"], 30)
+    assert [value for _, value in volume] == sorted((value for _, value in volume), reverse=True)
+
+
+def test_batch_ingest_feeds_today(session, sample_collection_data):
+    """Testa que o lote gravado pela API entra no ranking do dia"""
+    # Act
+    create_fuel_collections_batch([
+        {**sample_collection_data, "volume_sold": 10.0},
+        {**sample_collection_data, "volume_sold": 20.0, "vehicle_plate": "XYZ9876"},
+    ], session)
+
+    # Assert
+    assert top("vehicles-volume", "today", 5) == [("XYZ9876", 20.0), ("ABC1234", 10.0)]
+    assert top("stations-price", "today", 5, fuel_type="Gasolina") == [("12345678000190", 5.89)]
+
+
+def test_station_price_is_max_per_fuel(recent_collections):
+    """Testa que o ranking de preço guarda o maior preço por combustível"""
+    # Arrange
+    rows = [row for row in recent_collections if row["fuel_type"] == "Etanol"]
+
+    # Act
+    ranking = top("stations-price", "30d", 10, fuel_type="Etanol")
+
+    # Assert
+    assert dict(ranking) == _expected(rows, "store_id", lambda r: r["sale_price"], 30, max)
+    assert top("stations-price", "30d", 10, fuel_type="GNV") == []
+
+
+def test_limit_and_invalid_window(recent_collections):
+    """Testa o limite do top N e a rejeição de janelas desconhecidas"""
+    # Act
+    ranking = top("stations-volume", "30d", 2)
+
+    # Assert
+    assert len(ranking) == 2
+    assert ranking[0][1] >= ranking[1][1]
+    with pytest.raises(ValueError):
+        window_keys(BOARDS["stations-volume"], "90d")
+
+
+def test_bulk_load_feeds_rankings(session):
+    """Testa que a carga em massa alimenta os rankings por bloco"""
+    # Arrange
+    lines = [",".join(LOAD_COLUMNS)] + [
+        ",".join(map(str, [
+            f"{i % 2:014d}", "Posto", "Campinas", "SP", "Gasolina", "Maria", "98765432100",
+            "XYZ9876", VEHICLE_TYPES[0], 6.0, 10.0, _at(i % 3).isoformat(),
+        ]))
+        for i in range(9)
+    ]
+
+    # Act
+    load_stream(session, iter(lines), chunk_size=4)
+
+    # Assert
+    assert top("vehicles-volume", "7d", 5) == [("XYZ9876", pytest.approx(90.0))]
+    assert top("drivers-spend", "today", 5) == [("98765432100", pytest.approx(180.0))]
+
+
+def test_rebuild_matches_incremental(session, recent_collections, leaderboard_store):
+    """Testa que o recálculo a partir do banco reproduz os rankings incrementais"""
+    # Arrange
+    windows = [(name, window) for name in BOARDS for window in ("today", "7d", "30d")]
+    fuel = {"stations-price": "Gasolina"}
+    expected = {key: top(key[0], key[1], 50, fuel.get(key[0])) for key in windows}
+    leaderboard_store.clear()
+
+    # Act
+    written = rebuild_leaderboards(session)
+
+    # Assert
+    assert written > 0
+    for key in windows:
+        actual = top(key[0], key[1], 50, fuel.get(key[0]))
+        assert [member for member, _ in actual] == [member for member, _ in expected[key]]
+        assert [value for _, value in actual] == pytest.approx([value for _, value in expected[key]])
+
+
+def test_old_collections_are_ignored(session, sample_collection_data):
+    """Testa que coletas fora da maior janela não entram nos rankings"""
+    # Act
+    record_collections([{**sample_collection_data, "collection_date": _at(45)}])
+
+    # Assert
+    assert top("drivers-spend", "30d", 5) == []
+
+
+def test_service_resolves_names_and_masks_cpf(session, recent_collections):
+    """Testa que o serviço traz nomes e cidades e mascara o CPF"""
+    # Act
+    drivers = get_leaderboard(session, "drivers-spend", "30d", 3)
+    stations = get_leaderboard(session, "stations-volume", "7d", 1)
+
+    # Assert
+    assert [entry.rank for entry in drivers.entries] == [1, 2, 3]
+    assert drivers.entries[0].key.startswith("000.***.***.")
+    assert drivers.entries[0].name.startswith("Motorista ")
+    assert stations.entries[0].name.startswith("Posto ")
+    assert stations.entries[0].city == "São Paulo"
+    with pytest.raises(HTTPException) as exc:
+        get_leaderboard(session, "stations-price", "7d", 10)
+    assert exc.value.status_code == 400
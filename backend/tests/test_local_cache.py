@@ -0,0 +1,102 @@
+import time
+from app.local_cache import LocalCache, MISSING
+
+
+def test_get_missing_and_hit():
+    """Testa falha e acerto no L1"""
+    # Arrange
+    cache = LocalCache()
+    
+    # Act
+    missing = cache.get("kpi:a", "kpi:a:1")
+    cache.set("kpi:a", "kpi:a:1", [1, 2], size=10)
+    hit = cache.get("kpi:a", "kpi:a:1")
+    
+    # Assert
+    assert missing is MISSING
+    assert hit == [1, 2]
+    stats = cache.stats()["prefixes"]["kpi:a"]
+    assert stats["l1_hits"] == 1
+    assert stats["l1_misses"] == 1
+    assert stats["l1_hit_ratio"] == 0.5
+
+
+def test_lru_eviction_by_entries():
+    """Testa que a entrada menos usada é removida ao exceder o limite"""
+    # Arrange
+    cache = LocalCache(max_entries=2)
+    cache.set("p", "p:a", "a", size=1)
+    cache.set("p", "p:b", "b", size=1)
+    cache.get("p", "p:a")  # "a" passa a ser a mais recente
+    
+    # Act
+    cache.set("p", "p:c", "c", size=1)
+    
+    # Assert
+    assert cache.get("p", "p:b") is MISSING
+    assert cache.get("p", "p:a") == "a"
+    assert cache.stats()["prefixes"]["p"]["evictions"] == 1
+
+
+def test_eviction_by_bytes():
+    """Testa o limite de bytes"""
+    # Arrange
+    cache = LocalCache(max_bytes=100)
+    cache.set("p", "p:a", "a", size=60)
+    
+    # Act
+    cache.set("p", "p:b", "b", size=60)
+    cache.set("p", "p:big", "big", size=500)  # Maior que o L1: ignorada
+    
+    # Assert
+    stats = cache.stats()
+    assert stats["entries"] == 1
+    assert stats["bytes"] == 60
+    assert cache.get("p", "p:a") is MISSING
+    assert cache.get("p", "p:big") is MISSING
+
+
+def test_ttl_expiration():
+    """Testa a expiração pelo TTL (limitado ao TTL do L1)"""
+    # Arrange
+    cache = LocalCache(ttl=0.05)
+    cache.set("p", "p:a", "a", size=1, ttl=600)
+    
+    # Act
+    time.sleep(0.06)
+    result = cache.get("p", "p:a")
+    
+    # Assert
+    assert result is MISSING
+    assert cache.stats()["prefixes"]["p"]["expirations"] == 1
+
+
+def test_invalidate_pattern():
+    """Testa a invalidação por padrão glob"""
+    # Arrange
+    cache = LocalCache()
+    cache.set("kpi:a", "kpi:a:1", 1, size=1)
+    cache.set("kpi:b", "kpi:b:1", 2, size=1)
+    cache.set("count:c", "count:c:1", 3, size=1)
+    
+    # Act
+    removed = cache.invalidate("kpi:*")
+    
+    # Assert
+    assert removed == 2
+    assert cache.get("count:c", "count:c:1") == 3
+    assert cache.stats()["prefixes"]["kpi:a"]["invalidations"] == 1
+
+
+def test_set_discarded_after_invalidation():
+    """Testa que um valor calculado antes de uma invalidação não é guardado"""
+    # Arrange
+    cache = LocalCache()
+    epoch = cache.epoch
+    
+    # Act - invalidação chega enquanto o valor era calculado
+    cache.invalidate("kpi:*")
+    cache.set("kpi:a", "kpi:a:1", "antigo", size=1, epoch=epoch)
+    
+    # Assert
+    assert cache.get("kpi:a", "kpi:a:1") is MISSING
@@ -0,0 +1,126 @@
+import pytest
+from datetime import date, datetime
+from sqlmodel import select, func
+from app.analytics import ColumnarSnapshot
+from app.models import FuelCollection, FuelTypeSummary, KpiRollup
+from app.partitions import add_months, apply_retention, ensure_partitions, month_start, partition_name
+from app.services.summary_service import check_summaries_consistency, rebuild_rollups
+
+
+@pytest.fixture
+def monthly_collections(session, sample_collection_data):
+    """Coletas de janeiro a abril de 2024, com uma semana que cruza fevereiro e março"""
+    rows = [
+        (datetime(2024, 1, 10, 8), "Gasolina", "Carro", 6.00, 40.0),
+        (datetime(2024, 1, 31, 23, 59), "Etanol", "Moto", 4.00, 10.0),
+        (datetime(2024, 2, 28, 12), "Gasolina", "Carreta", 5.50, 100.0),
+        (datetime(2024, 3, 1, 9), "Gasolina", "Carreta", 5.60, 80.0),
+        (datetime(2024, 4, 15, 18), "Diesel S10", "Carreta", 6.10, 150.0),
+    ]
+    for collection_date, fuel_type, vehicle_type, price, volume in rows:
+        session.add(FuelCollection(**{
+            **sample_collection_data,
+            "collection_date": collection_date,
+            "fuel_type": fuel_type,
+            "vehicle_type": vehicle_type,
+            "sale_price": price,
+            "volume_sold": volume,
+        }))
+    session.commit()
+    return session
+
+
+def _rollups(session) -> dict:
+    """Linhas de kpi_rollup indexadas pela chave"""
+    return {
+        (r.granularity, r.bucket, r.fuel_type, r.state, r.city, r.vehicle_type):
+            (r.total_records, round(r.sum_price, 6), round(r.sum_volume, 6))
+        for r in session.exec(select(KpiRollup)).all()
+    }
+
+
+def test_month_helpers():
+    """Testa o cálculo de meses e o nome das partições"""
+    # Assert
+    assert month_start(datetime(2024, 2, 29, 23)) == date(2024, 2, 1)
+    assert add_months(date(2024, 11, 1), 3) == date(2025, 2, 1)
+    assert add_months(date(2024, 1, 1), -1) == date(2023, 12, 1)
+    assert partition_name(date(2024, 3, 1)) == "fuel_fact_y2024m03"
+
+
+def test_retention_removes_expired_months(monthly_collections):
+    """Testa que a retenção remove os meses antigos e mantém a janela"""
+    # Arrange
+    session = monthly_collections
+
+    # Act
+    removed = apply_retention(session.get_bind(), keep_months=2, today=date(2024, 5, 10))
+
+    # Assert
+    assert removed == [date(2024, 1, 1), date(2024, 2, 1)]
+    remaining = session.exec(select(FuelCollection.collection_date).order_by(FuelCollection.collection_date)).all()
+    assert remaining == [datetime(2024, 3, 1, 9), datetime(2024, 4, 15, 18)]
+
+
+def test_retention_keeps_summaries_and_rollups_consistent(monthly_collections):
+    """Testa que os agregados e rollups descontam exatamente as coletas removidas"""
+    # Arrange
+    session = monthly_collections
+
+    # Act
+    apply_retention(session.get_bind(), keep_months=2, today=date(2024, 5, 10))
+    session.expire_all()
+    incremental = _rollups(session)
+    rebuild_rollups(session)
+
+    # Assert
+    assert check_summaries_consistency(session) == []
+    assert session.get(FuelTypeSummary, "Etanol") is None
+    assert incremental == _rollups(session)
+    # Semana de 26/02 perdeu a coleta de fevereiro e manteve a de março
+    assert incremental[("week", date(2024, 2, 26), "Gasolina", "SP", "São Paulo", "Carreta")][0] == 1
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"keep_months": 0},
+    {"keep_months": 6},
+])
+def test_retention_without_expired_months(monthly_collections, kwargs):
+    """Testa que a retenção desativada ou com janela larga não remove nada"""
+    # Act
+    removed = apply_retention(monthly_collections.get_bind(), today=date(2024, 5, 10), **kwargs)
+
+    # Assert
+    assert removed == []
+    assert monthly_collections.exec(select(func.count(FuelCollection.id))).one() == 5
+
+
+@pytest.mark.parametrize("mode", ["archive", "detach"])
+def test_retention_rejects_unsupported_mode(session, mode):
+    """Testa a rejeição de modo inválido e de detach sem particionamento"""
+    # Act & Assert
+    with pytest.raises(ValueError):
+        apply_retention(session.get_bind(), keep_months=1, mode=mode)
+
+
+def test_ensure_partitions_without_partitioning(session):
+    """Testa que a criação de partições não faz nada fora do PostgreSQL"""
+    # Act & Assert
+    assert ensure_partitions(session.get_bind()) == []
+
+
+def test_snapshot_reloads_after_retention(monthly_collections):
+    """Testa que o snapshot colunar descarta as coletas removidas pela retenção"""
+    # Arrange
+    session = monthly_collections
+    snapshot = ColumnarSnapshot()
+    snapshot.refresh(session)
+    session.commit()
+
+    # Act
+    apply_retention(session.get_bind(), keep_months=2, today=date(2024, 5, 10))
+    snapshot.refresh(session)
+
+    # Assert
+    assert snapshot.stats()["rows"] == 2
+    assert sorted(snapshot.aggregate(["fuel_type"], [("count", None)])) == [("Diesel S10", 1), ("Gasolina", 1)]
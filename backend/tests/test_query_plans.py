@@ -0,0 +1,151 @@
+import random
+import pytest
+from datetime import date, datetime, timedelta
+from sqlalchemy import event, text
+from app.analytics import ColumnarSnapshot
+from app.migrations import MIGRATIONS, apply_migrations
+from app.services.aggregate_service import build_aggregate_query, get_aggregate
+from app.services.bulk_ingest_service import load_rows
+from app.services.collection_service import get_collections, filter_conditions
+from app.services.count_service import normalize_filters
+from app.services.export_service import iter_export_batches
+from app.services.kpi_service import get_timeseries
+from app.services.report_service import get_driver_report
+
+LARGE_FIXTURE_ROWS = 5000
+
+
+@pytest.fixture
+def large_table(session):
+    """Tabela de coletas grande o bastante para o planejador preferir índices"""
+    rng = random.Random(42)
+    start = datetime(2024, 1, 1)
+    rows = [
+        (
+            f"{i % 500:014d}", "Posto", "São Paulo" if i % 7 else "Campinas", "SP",
+            rng.choice(["Gasolina", "Etanol", "Diesel S10"]),
+            f"Motorista {i % 300}", f"{i % 300:011d}", "ABC1234",
+            rng.choice(["Carro", "Moto", "Carreta", "Ônibus", "Caminhão Leve"]),
+            5.0, 10.0, start + timedelta(minutes=i),
+        )
+        for i in range(LARGE_FIXTURE_ROWS)
+    ]
+    load_rows(session, rows)
+    session.commit()
+    session.exec(text("ANALYZE"))
+    return session
+
+
+@pytest.fixture
+def query_plans(large_table):
+    """Captura os SELECTs executados e devolve o plano (EXPLAIN) de cada um"""
+    engine = large_table.get_bind()
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and not executemany:
+            captured.append((statement, parameters))
+
+    def plans():
+        with engine.connect() as connection:
+            return {
+                statement: [row[3] for row in connection.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)]
+                for statement, parameters in captured
+            }
+
+    event.listen(engine, "before_cursor_execute", capture)
+    yield captured, plans
+    event.remove(engine, "before_cursor_execute", capture)
+
+
+def _sequential_scans(plan: list[str]) -> list[str]:
+    """Linhas do plano que varrem a tabela de coletas (ou o fato) sem índice"""
+    return [
+        line for line in plan
+        if line.startswith(("SCAN fuelcollection", "SCAN fuel_fact")) and "USING" not in line and "VIRTUAL" not in line
+    ]
+
+
+SERVICE_QUERIES = {
+    "listagem": lambda s: get_collections(s, include_total=False),
+    "listagem por combustível": lambda s: get_collections(s, fuel_type="Etanol"),
+    "listagem por veículo": lambda s: get_collections(s, vehicle_type="Moto", page=3),
+    "listagem por combustível e veículo": lambda s: get_collections(s, fuel_type="Etanol", vehicle_type="Moto"),
+    "listagem por cidade": lambda s: get_collections(s, city="campinas"),
+    "listagem por cursor": lambda s: get_collections(
+        s, fuel_type="Etanol", cursor=get_collections(s, fuel_type="Etanol").next_cursor
+    ),
+    "relatório por CPF": lambda s: get_driver_report(
+        f"{7:011d}", s, start_date=datetime(2024, 1, 2), end_date=datetime(2024, 1, 5)
+    ),
+    "relatório por nome": lambda s: get_driver_report("Motorista 7", s),
+    "exportação": lambda s: list(iter_export_batches(
+        s.get_bind(), filter_conditions(s.get_bind(), normalize_filters("Etanol")), segment_size=1000
+    )),
+    "agregação por intervalo": lambda s: get_aggregate(
+        s, build_aggregate_query(["state"], ["max:sale_price"], start=date(2024, 1, 3), end=date(2024, 1, 4))
+    ),
+    "série temporal": lambda s: get_timeseries(s, start=date(2024, 1, 1), end=date(2024, 1, 31)),
+    "tail do snapshot": lambda s: ColumnarSnapshot().refresh(s),
+}
+
+
+@pytest.mark.parametrize("name", list(SERVICE_QUERIES))
+def test_service_queries_use_indexes(large_table, query_plans, name):
+    """Testa que as consultas dos serviços não varrem a tabela de coletas"""
+    # Arrange
+    captured, plans = query_plans
+
+    # Act
+    SERVICE_QUERIES[name](large_table)
+    explained = plans()
+
+    # Assert
+    assert explained, "nenhuma consulta capturada"
+    for statement, plan in explained.items():
+        assert not _sequential_scans(plan), f"{name}: {plan}\n{statement}"
+
+
+def test_listing_by_filter_uses_composite_index(large_table, query_plans):
+    """Testa que filtro + ordenação por data saem do índice composto"""
+    # Arrange
+    captured, plans = query_plans
+
+    # Act
+    get_collections(large_table, fuel_type="Etanol", vehicle_type="Moto", include_total=False)
+
+    # Assert
+    [plan] = plans().values()
+    assert any("ix_fuel_fact_fuel_vehicle_date_id" in line for line in plan)
+    assert not any("TEMP B-TREE" in line for line in plan)
+
+
+def test_migrations_are_recorded_and_idempotent(session):
+    """Testa o registro das migrações, os índices do fato e a troca da tabela larga pela view"""
+    # Arrange
+    engine = session.get_bind()
+
+    # Act
+    reapplied = apply_migrations(engine)
+    with engine.connect() as connection:
+        versions = connection.execute(text("SELECT version FROM schema_migrations ORDER BY version")).scalars().all()
+        indexes = set(connection.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'fuel_fact'"
+        )).scalars())
+        kinds = dict(connection.execute(text(
+            "SELECT name, type FROM sqlite_master WHERE name IN ('fuelcollection', 'fuelcollection_star')"
+        )).all())
+
+    # Assert
+    assert reapplied == []
+    assert versions == [migration.version for migration in MIGRATIONS]
+    assert {
+        "ix_fuel_fact_collection_date_id",
+        "ix_fuel_fact_driver_date_id",
+        "ix_fuel_fact_fuel_vehicle_date_id",
+    } <= indexes
+    # (collection_date) é prefixo de (collection_date, id)
+    assert "ix_fuel_fact_collection_date" not in indexes
+    # BRIN só existe no PostgreSQL
+    assert "ix_fuel_fact_collection_date_brin" not in indexes
+    assert kinds == {"fuelcollection": "view"}
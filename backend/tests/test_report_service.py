@@ -1,4 +1,5 @@
 import pytest
+from datetime import datetime, timedelta
 from app.services.report_service import get_driver_report
 from app.models import FuelCollection
 from fastapi import HTTPException
@@ -177,3 +178,81 @@ def test_get_driver_report_favorite_fuel_calculation(session):
     # Assert
     assert result.favorite_fuel == "Etanol"  # Mais frequente
     assert result.total_refuels == 3
+
+
+def _create_driver_history(session, count: int, cpf: str = "22222222222"):
+    """Cria `count` abastecimentos diários do mesmo motorista, a partir de 01/01/2024"""
+    start = datetime(2024, 1, 1)
+    for i in range(count):
+        session.add(FuelCollection(
+            store_id="12345678000190",
+            store_name="Posto A",
+            city="São Paulo",
+            state="SP",
+            collection_date=start + timedelta(days=i),
+            fuel_type="Diesel S10" if i % 3 else "Gasolina",
+            sale_price=5.00,
+            volume_sold=10.0,
+            driver_name="Pedro Frota",
+            driver_cpf=cpf,
+            vehicle_plate="FRT1234",
+            vehicle_type="Carreta"
+        ))
+    session.commit()
+
+
+def test_get_driver_report_paginates_history(session):
+    """Testa que o histórico é paginado por cursor e os totais cobrem tudo"""
+    # Arrange
+    _create_driver_history(session, 25)
+    
+    # Act
+    first = get_driver_report("22222222222", session, page_size=10)
+    second = get_driver_report("22222222222", session, page_size=10, cursor=first.next_cursor)
+    last = get_driver_report("22222222222", session, page_size=10, cursor=second.next_cursor)
+    
+    # Assert
+    assert first.total_refuels == 25
+    assert first.total_spent == 1250.0  # 25 * 5.00 * 10.0
+    assert first.favorite_fuel == "Diesel S10"
+    assert len(first.refuels) == 10
+    assert first.refuels[0].collection_date == datetime(2024, 1, 25)
+    assert first.prev_cursor is None
+    assert second.refuels[0].collection_date == datetime(2024, 1, 15)
+    assert len(last.refuels) == 5
+    assert last.next_cursor is None
+    
+    ids = [r.id for page in (first, second, last) for r in page.refuels]
+    assert len(set(ids)) == 25
+
+
+def test_get_driver_report_date_range(session):
+    """Testa que o período restringe totais e histórico"""
+    # Arrange
+    _create_driver_history(session, 30)
+    
+    # Act
+    result = get_driver_report(
+        "22222222222",
+        session,
+        start_date=datetime(2024, 1, 10),
+        end_date=datetime(2024, 1, 19)
+    )
+    
+    # Assert
+    assert result.total_refuels == 10
+    assert result.total_volume == 100.0
+    assert len(result.refuels) == 10
+    assert all(datetime(2024, 1, 10) <= r.collection_date <= datetime(2024, 1, 19) for r in result.refuels)
+
+
+def test_get_driver_report_date_range_without_refuels(session):
+    """Testa erro quando não há abastecimentos no período"""
+    # Arrange
+    _create_driver_history(session, 5)
+    
+    # Act & Assert
+    with pytest.raises(HTTPException) as exc_info:
+        get_driver_report("22222222222", session, start_date=datetime(2025, 1, 1))
+    
+    assert exc_info.value.status_code == 404
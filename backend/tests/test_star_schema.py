@@ -0,0 +1,182 @@
+from datetime import date, datetime, timedelta
+from sqlalchemy import event, insert, select as sql_select
+from sqlalchemy.pool import StaticPool
+from sqlmodel import SQLModel, Session, create_engine, select, func
+from app.migrations import MIGRATIONS, apply_migrations
+from app.models import DriverDimension, FuelCollection, FuelFact, FuelTypeCode, StoreDimension, VehicleTypeCode
+from app.partitions import apply_retention
+from app.schemas.fuel_collection import FUEL_TYPES, VEHICLE_TYPES
+from app.services.bulk_ingest_service import LOAD_COLUMNS, load_rows
+from app.services.ingest_service import insert_collections
+from app.star_schema import DIMENSIONS, id_cache
+
+
+def _bulk_rows(count: int, start: datetime, drivers: int = 5):
+    """Linhas na ordem de LOAD_COLUMNS com poucos postos, motoristas e placas"""
+    return [
+        (
+            f"{i % 3:014d}", f"Posto {i % 3}", "Campinas" if i % 3 else "São Paulo", "SP",
+            FUEL_TYPES[i % 3], f"Motorista {i % drivers}", f"{i % drivers:011d}", f"ABC{i % 4:04d}",
+            VEHICLE_TYPES[i % 5], 5.0 + i / 100, 10.0 + i, start + timedelta(days=i),
+        )
+        for i in range(count)
+    ]
+
+
+def _wide_rows(session) -> list[dict]:
+    """Coletas lidas da view fuelcollection"""
+    table = FuelCollection.__table__
+    return [dict(row._mapping) for row in session.exec(sql_select(table).order_by(table.c.id)).all()]
+
+
+def _expected_rows(rows: list[tuple], first_id: int = 1) -> list[dict]:
+    """Linhas de _bulk_rows no formato da view, com ids sequenciais"""
+    return [{"id": first_id + i, **dict(zip(LOAD_COLUMNS, row))} for i, row in enumerate(rows)]
+
+
+def test_ingest_paths_fill_star_schema(session, sample_collection_data):
+    """Testa que ORM, INSERT em lote e carga em massa gravam o esquema estrela"""
+    # Arrange
+    session.add(FuelCollection(**sample_collection_data, collection_date=datetime(2024, 1, 1)))
+    session.commit()
+    insert_collections(session, [{**sample_collection_data, "driver_cpf": "98765432100", "driver_name": "Maria"}])
+    session.commit()
+
+    # Act
+    load_rows(session, _bulk_rows(30, datetime(2024, 2, 1)))
+    session.commit()
+
+    # Assert
+    wide = _wide_rows(session)
+    assert [row["driver_name"] for row in wide[:2]] == [sample_collection_data["driver_name"], "Maria"]
+    assert wide[2:] == _expected_rows(_bulk_rows(30, datetime(2024, 2, 1)), first_id=3)
+    assert session.exec(select(func.count(FuelFact.id))).one() == 32
+    assert session.exec(select(func.count(StoreDimension.id))).one() == 4
+    assert session.exec(select(func.count(DriverDimension.id))).one() == 7
+
+
+def test_type_codes_follow_known_order(session, sample_collection_data):
+    """Testa que os códigos dos tipos conhecidos são estáveis (ordem da lista)"""
+    # Act
+    session.add(FuelCollection(**{**sample_collection_data, "fuel_type": "Etanol", "vehicle_type": "Moto"}))
+    session.commit()
+
+    # Assert
+    assert [c.name for c in session.exec(select(FuelTypeCode).order_by(FuelTypeCode.id)).all()] == FUEL_TYPES
+    assert [c.name for c in session.exec(select(VehicleTypeCode).order_by(VehicleTypeCode.id)).all()] == VEHICLE_TYPES
+    fact = session.exec(select(FuelFact)).one()
+    assert (fact.fuel_code, fact.vehicle_type_code) == (FUEL_TYPES.index("Etanol") + 1, VEHICLE_TYPES.index("Moto") + 1)
+
+
+def test_cached_ids_skip_dimension_lookups(session):
+    """Testa que, com as chaves no cache, a ingestão não consulta as dimensões"""
+    # Arrange
+    engine = session.get_bind()
+    load_rows(session, _bulk_rows(20, datetime(2024, 1, 1)))
+    session.commit()
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", capture)
+
+    # Act
+    try:
+        load_rows(session, _bulk_rows(20, datetime(2024, 3, 1)))
+        session.commit()
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    # Assert
+    assert not [s for s in statements if "dim_" in s]
+    expected = _bulk_rows(20, datetime(2024, 1, 1)) + _bulk_rows(20, datetime(2024, 3, 1))
+    assert _wide_rows(session) == _expected_rows(expected)
+
+
+def test_rollback_does_not_cache_ids(session, sample_collection_data):
+    """Testa que ids de uma transação desfeita não entram no cache"""
+    # Arrange
+    engine = session.get_bind()
+    store = DIMENSIONS[0]
+    data = {**sample_collection_data, "store_id": "99999999000199"}
+    session.add(FuelCollection(**data))
+    session.flush()
+    session.rollback()
+
+    # Act
+    cached = id_cache(engine, store).get(store.version(data))
+    session.add(FuelCollection(**data))
+    session.commit()
+
+    # Assert
+    assert cached is None
+    assert id_cache(engine, store).get(store.version(data)) is not None
+    assert [row["store_id"] for row in _wide_rows(session)] == [data["store_id"]]
+
+
+def test_changed_attributes_keep_collection_time_values(session, sample_collection_data):
+    """Testa que atributos alterados criam uma linha nova e a view mantém os anteriores"""
+    # Arrange
+    session.add(FuelCollection(**sample_collection_data))
+    session.commit()
+
+    # Act
+    session.add(FuelCollection(**{**sample_collection_data, "driver_name": "João da Silva", "city": "Campinas"}))
+    session.commit()
+
+    # Assert
+    drivers = session.exec(select(DriverDimension).order_by(DriverDimension.id)).all()
+    assert [driver.name for driver in drivers] == [sample_collection_data["driver_name"], "João da Silva"]
+    assert session.exec(select(func.count(StoreDimension.id))).one() == 2
+    assert [(row["driver_name"], row["city"]) for row in _wide_rows(session)] == [
+        (sample_collection_data["driver_name"], sample_collection_data["city"]), ("João da Silva", "Campinas")
+    ]
+
+
+def test_migration_moves_wide_table_into_star_schema(monkeypatch, sample_collection_data):
+    """Testa que a migração 8 copia as coletas da tabela larga e a troca pela view"""
+    # Arrange
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    monkeypatch.setattr("app.migrations.MIGRATIONS", MIGRATIONS[:7])
+    apply_migrations(engine)
+    wide = [
+        {
+            **sample_collection_data, "id": 10 + i, "collection_date": datetime(2024, 1, 1) + timedelta(days=i),
+            "driver_cpf": f"{i % 3:011d}", "driver_name": f"Motorista {i % 3}",
+        }
+        for i in range(6)
+    ]
+    with engine.begin() as connection:
+        connection.execute(insert(FuelCollection.__table__), wide)
+    monkeypatch.setattr("app.migrations.MIGRATIONS", MIGRATIONS)
+
+    # Act
+    applied = apply_migrations(engine)
+    with Session(engine) as session:
+        session.add(FuelCollection(**sample_collection_data))
+        session.commit()
+        rows = _wide_rows(session)
+        drivers = session.exec(select(func.count(DriverDimension.id))).one()
+
+    # Assert
+    assert applied == [8, 9]
+    assert rows[:6] == wide
+    assert rows[6]["id"] == 16
+    assert drivers == 4
+
+
+def test_retention_removes_facts(session):
+    """Testa que os meses removidos pela retenção também saem do fato"""
+    # Arrange
+    load_rows(session, _bulk_rows(90, datetime(2024, 1, 1)))
+    session.commit()
+
+    # Act
+    apply_retention(session.get_bind(), keep_months=1, today=date(2024, 3, 15))
+    session.expire_all()
+
+    # Assert
+    assert session.exec(select(func.count(FuelFact.id))).one() == 59
+    assert len(_wide_rows(session)) == 59
@@ -0,0 +1,160 @@
+import io
+import pytest
+from datetime import date, datetime
+from sqlmodel import select
+from app.models import FuelCollection, FuelTypeSummary, VehicleTypeSummary, KpiRollup
+from app.services.summary_service import (
+    rebuild_summaries,
+    rebuild_rollups,
+    bucket_start,
+    check_summaries_consistency,
+    ensure_summaries_initialized,
+)
+from app.services.ingest_service import create_fuel_collections_batch
+from app.services.bulk_ingest_service import load_stream
+
+
+def test_summaries_updated_on_orm_insert(session, create_sample_collections):
+    """Testa que inserções via session.add atualizam os agregados"""
+    # Act
+    gasolina = session.get(FuelTypeSummary, "Gasolina")
+    carreta = session.get(VehicleTypeSummary, "Carreta")
+    
+    # Assert
+    assert gasolina.total_records == 1
+    assert gasolina.sum_price == 6.00
+    assert carreta.sum_volume == 150.0
+    assert check_summaries_consistency(session) == []
+
+
+def test_summaries_updated_on_batch_insert(session, sample_collection_data):
+    """Testa que o INSERT em lote atualiza os agregados na mesma transação"""
+    # Arrange
+    payloads = [sample_collection_data, {**sample_collection_data, "sale_price": 6.11}]
+    
+    # Act
+    create_fuel_collections_batch(payloads, session)
+    
+    # Assert
+    gasolina = session.get(FuelTypeSummary, "Gasolina")
+    assert gasolina.total_records == 2
+    assert gasolina.sum_price == pytest.approx(5.89 + 6.11)
+    assert check_summaries_consistency(session) == []
+
+
+def test_summaries_updated_on_bulk_load(session):
+    """Testa que a carga em massa atualiza os agregados"""
+    # Arrange
+    content = (
+        "store_id,store_name,city,state,fuel_type,sale_price,volume_sold,driver_name,driver_cpf,vehicle_plate,vehicle_type\n"
+        + "1,P,Recife,PE,Etanol,4.0,10,Ana,12345678901,AAA0000,Moto\n" * 3
+    )
+    
+    # Act
+    load_stream(session, io.StringIO(content), "csv")
+    
+    # Assert
+    moto = session.get(VehicleTypeSummary, "Moto")
+    assert moto.total_records == 3
+    assert moto.sum_volume == 30.0
+    assert check_summaries_consistency(session) == []
+
+
+def test_check_summaries_detects_and_rebuild_fixes_drift(session, create_sample_collections):
+    """Testa a verificação de consistência e o rebuild"""
+    # Arrange - Corrompe um agregado
+    etanol = session.get(FuelTypeSummary, "Etanol")
+    etanol.total_records = 99
+    session.add(etanol)
+    session.commit()
+    
+    # Act
+    mismatches = check_summaries_consistency(session)
+    rebuild_summaries(session)
+    
+    # Assert
+    assert mismatches == [{
+        "table": "fuel_type_summary",
+        "fuel_type": "Etanol",
+        "column": "total_records",
+        "expected": 1,
+        "actual": 99,
+    }]
+    assert check_summaries_consistency(session) == []
+    assert session.get(FuelTypeSummary, "Etanol").total_records == 1
+
+
+def test_ensure_summaries_initialized_rebuilds_empty_tables(session, create_sample_collections):
+    """Testa a inicialização dos agregados quando a tabela já tinha coletas"""
+    # Arrange
+    for summary in session.exec(select(FuelTypeSummary)).all():
+        session.delete(summary)
+    for summary in session.exec(select(VehicleTypeSummary)).all():
+        session.delete(summary)
+    session.commit()
+    
+    # Act
+    ensure_summaries_initialized(session)
+    
+    # Assert
+    assert len(session.exec(select(FuelTypeSummary)).all()) == 3
+    assert check_summaries_consistency(session) == []
+
+
+def _rollups(session) -> dict:
+    """Conteúdo da tabela de rollups indexado pela chave"""
+    return {
+        (r.granularity, r.bucket, r.fuel_type, r.state, r.city, r.vehicle_type):
+            (r.total_records, pytest.approx(r.sum_price), pytest.approx(r.sum_volume))
+        for r in session.exec(select(KpiRollup)).all()
+    }
+
+
+@pytest.mark.parametrize("granularity,expected", [
+    ("day", date(2024, 3, 14)),
+    ("week", date(2024, 3, 11)),
+    ("month", date(2024, 3, 1)),
+])
+def test_bucket_start(granularity, expected):
+    """Testa o início do período (semana começa na segunda-feira)"""
+    assert bucket_start(datetime(2024, 3, 14, 23, 59), granularity) == expected
+
+
+def test_rollups_updated_incrementally_match_rebuild(session, sample_collection_data):
+    """Testa que os rollups incrementais (ORM e lote) batem com o rebuild no banco"""
+    # Arrange - datas em dias, semanas e meses diferentes (inclusive um domingo)
+    dates = [datetime(2024, 3, 10, 8), datetime(2024, 3, 11, 9), datetime(2024, 3, 11, 18), datetime(2024, 4, 2, 7)]
+    for i, collection_date in enumerate(dates):
+        session.add(FuelCollection(**{**sample_collection_data, "collection_date": collection_date, "sale_price": 5 + i}))
+    session.commit()
+    create_fuel_collections_batch(
+        [{**sample_collection_data, "city": "Campinas", "vehicle_type": "Moto"}], session
+    )
+    incremental = _rollups(session)
+    
+    # Act
+    rebuild_rollups(session)
+    
+    # Assert
+    assert _rollups(session) == incremental
+    week = session.get(KpiRollup, ("week", date(2024, 3, 4), "Gasolina", "SP", "São Paulo", "Carro"))
+    assert week.total_records == 1  # 10/03 é domingo: semana de 04/03
+    month = session.get(KpiRollup, ("month", date(2024, 3, 1), "Gasolina", "SP", "São Paulo", "Carro"))
+    assert month.total_records == 3
+    assert month.sum_price == pytest.approx(5 + 6 + 7)
+
+
+def test_ensure_summaries_initialized_backfills_rollups(session, create_sample_collections):
+    """Testa o backfill dos rollups quando a tabela já tinha coletas"""
+    # Arrange
+    expected = _rollups(session)
+    for rollup in session.exec(select(KpiRollup)).all():
+        session.delete(rollup)
+    session.commit()
+    
+    # Act
+    ensure_summaries_initialized(session)
+    
+    # Assert
+    assert _rollups(session) == expected
+    assert len(expected) == 9  # 3 coletas x 3 granularidades
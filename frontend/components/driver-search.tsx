@@ -131,7 +131,7 @@ export function DriverSearch() {
                 <CollapsibleTrigger asChild>
                   <Button variant="outline" className="w-full bg-transparent">
                     <ChevronDown className="h-4 w-4 mr-2" />
-                    Ver Histórico de Abastecimentos ({report.refuels.length})
+                    Ver Histórico de Abastecimentos ({report.total_refuels})
                   </Button>
                 </CollapsibleTrigger>
                 <CollapsibleContent className="mt-4">
@@ -20,6 +20,8 @@ export interface CollectionsResponse {
   page: number
   page_size: number
   data: FuelCollection[]
+  next_cursor?: string | null
+  prev_cursor?: string | null
 }
 
 export interface AvgPriceByFuel {
@@ -42,4 +44,6 @@ export interface DriverReport {
   total_volume: number
   favorite_fuel: string
   refuels: FuelCollection[]
+  next_cursor?: string | null
+  prev_cursor?: string | null
 }